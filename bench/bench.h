@@ -0,0 +1,153 @@
+/* Common definitions for the benchmark workloads.
+ *
+ * The workloads run bare on tb_mr_cpu_top:  loaded at physical address 0
+ * with low vectors, entered at the reset vector (0x100) in real mode, and
+ * finish by writing the debug SPR (which dumps registers and exits the
+ * simulation).  Console output is also via the debug SPR.
+ *
+ * Each prints its results as "<name> <hex>" lines; tools/bench.py keeps a
+ * digest of the console output, so a change in results between revisions is
+ * noticed as well as a change in performance.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef BENCH_H
+#define BENCH_H
+
+#define SPR_DEBUG	1023		/* 0x00XX exit(XX), 0x01XX putch(XX) */
+
+#define STACK_TOP	0x000ff000
+
+#define LOAD32(r, v)	lis r, (v)@h ; ori r, r, (v)@l
+
+/* Exit the simulation with a status, clobbering r3 */
+#define EXIT(status)	li r3, (status) ; mtspr SPR_DEBUG, r3
+
+/* Simulator services (tb_mr_cpu_top's MMIO window, verilator/simsvc.h):
+ * word registers, accessed uncached (here, in real mode).  SIM_SNAP marks a
+ * perf counter snapshot for Vwrapper_top -R; the events between two tags
+ * are a region of interest's.  These clobber r3 and r4.
+ */
+#define SIMSVC_BASE	0xf0000000
+#define SIMSVC_EXIT	0x00
+#define SIMSVC_PUTC	0x04
+#define SIMSVC_TIME	0x08
+#define SIMSVC_TIME_HI	0x0c
+#define SIMSVC_CYCLES	0x10
+#define SIMSVC_CYCLES_HI 0x14
+#define SIMSVC_SNAP	0x18
+#define SIMSVC_TRACE	0x1c
+#define SIMSVC_RUN	0x20	/* Packed runs (tools/pack_tests.py) */
+#define SIMSVC_RUN_STATUS 0x24
+#define SIMSVC_RUN_END	0x28
+#define SIMSVC_RUN_CYCLES 0x2c
+#define SIMSVC_RUN_INSTRS 0x30
+
+#define SIM_WRITE(reg, v) lis r4, SIMSVC_BASE@h ; li r3, (v) ; stw r3, (reg)(r4)
+#define SIM_EXIT(status)  SIM_WRITE(SIMSVC_EXIT, status)
+#define SIM_SNAP(tag)	  SIM_WRITE(SIMSVC_SNAP, tag)
+#define SIM_TRACE(on)	  SIM_WRITE(SIMSVC_TRACE, on)
+
+/* Low vectors:  reset goes to _start, and anything unexpected exits with
+ * the vector number (0x300 => 3) as status.  The syscall vector can be
+ * given a handler.
+ */
+.macro	vectors sc=fatal
+	.org	0x100
+	b	_start
+	.org	0x200
+	li	r3, 0x02
+	b	fatal
+	.org	0x300
+	li	r3, 0x03
+	b	fatal
+	.org	0x400
+	li	r3, 0x04
+	b	fatal
+	.org	0x500
+	li	r3, 0x05
+	b	fatal
+	.org	0x600
+	li	r3, 0x06
+	b	fatal
+	.org	0x700
+	li	r3, 0x07
+	b	fatal
+	.org	0x800
+	li	r3, 0x08
+	b	fatal
+	.org	0x900
+	li	r3, 0x09
+	b	fatal
+	.org	0xc00
+	.ifc	\sc, fatal
+	li	r3, 0x0c
+	.endif
+	b	\sc
+	.org	0xd00
+	li	r3, 0x0d
+	b	fatal
+	.org	0xf00
+	li	r3, 0x0f
+	b	fatal
+	.org	0x1000
+.endm
+
+/* Support routines:  puthex (r3 as 8 hex digits), puts (NUL-terminated
+ * string at r3), result (puts r3, then puthex r4 and a newline) and fatal.
+ * They use r3-r7, CTR and (result) r8/LR.
+ */
+.macro	support
+puthex:
+	li	r5, 8
+	mtctr	r5
+1:	rotlwi	r3, r3, 4
+	andi.	r4, r3, 0xf
+	addi	r4, r4, 0x30		/* '0' */
+	cmpwi	r4, 0x39
+	ble	2f
+	addi	r4, r4, 0x61 - 0x3a	/* 'a' */
+2:	ori	r4, r4, 0x100
+	mtspr	SPR_DEBUG, r4
+	bdnz	1b
+	blr
+
+puts:
+	addi	r5, r3, -1
+1:	lbzu	r4, 1(r5)
+	cmpwi	r4, 0
+	beqlr
+	ori	r4, r4, 0x100
+	mtspr	SPR_DEBUG, r4
+	b	1b
+
+result:
+	mflr	r8
+	mr	r7, r4
+	bl	puts
+	mr	r3, r7
+	bl	puthex
+	li	r4, 0x10a		/* putch('\n') */
+	mtspr	SPR_DEBUG, r4
+	mtlr	r8
+	blr
+
+	/* r3 = vector/0x100 */
+fatal:
+	mtspr	SPR_DEBUG, r3
+	b	fatal
+.endm
+
+#endif
@@ -929,6 +929,60 @@ module cache(input wire         clk,
       end
    end
 
+`ifdef SIM
+   ///////////////////////////////////////////////////////////////////////////
+   /* Visibility for the Verilator harness's cache access trace, used by
+    * tools/cache_sim.py.  A lookup is any enabled cycle in LOOKUP; an alloc
+    * is the cycle before the edge that writes a newly-filled (or zeroed)
+    * line's tag and moves destination_way on by cycle_count.
+    *
+    * trace_new strobes on the lookup that accepts a new request, as opposed
+    * to re-lookups of one that missed (or went uncached) and is still held
+    * by the requester.  A request is outstanding from a LOOKUP cycle that
+    * didn't complete it until a cycle with valid=1/stall=0 (or a CONSUME,
+    * which is the last chance to change it), so genuine back-to-back
+    * requests to the same address are each counted.
+    *
+    * Dropping enable withdraws the request, and returns the FSM to LOOKUP
+    * whatever it was doing:  trace_cancel strobes when that abandons a
+    * request's fill, spill or CMO part-way (so it has no effect on the tags).
+    * If the request is made again, it's a new one.
+    */
+   reg         trace_busy;
+   reg [31:0]  trace_busy_address;
+   reg [3:0]   trace_busy_request;
+
+   always @(posedge clk) begin
+      if (reset) begin
+	 trace_busy <= 0;
+      end else if (state == `STATE_LOOKUP) begin
+	 trace_busy <= enable && !valid_out;
+	 trace_busy_address <= address;
+	 trace_busy_request <= request_type;
+      end else if (!enable || state == `STATE_CONSUME || state == `STATE_CMO_CONSUME) begin
+	 trace_busy <= 0;
+      end
+   end
+
+   wire        trace_lookup /*verilator public*/ = enable && state == `STATE_LOOKUP;
+   wire        trace_new /*verilator public*/ = trace_lookup &&
+               (!trace_busy || address != trace_busy_address ||
+                request_type != trace_busy_request);
+   wire        trace_cancel /*verilator public*/ = !enable && trace_busy &&
+               state != `STATE_LOOKUP && state != `STATE_CONSUME &&
+               state != `STATE_CMO_CONSUME;
+   wire        trace_hit /*verilator public*/ = hit;
+   wire [31:0] trace_address /*verilator public*/ = address;
+   wire [3:0]  trace_request /*verilator public*/ = request_type;
+   wire        trace_alloc /*verilator public*/ = enable &&
+               ((state == `STATE_FILL_TRANSFER && emi_if_valid &&
+                 burst_counter == ((1 << (`CL_L2SIZE - 3))-1)) ||
+                (state == `STATE_FILL_ZERO && internal_burst_counter >= 3));
+   wire [L2WAYS-1:0] trace_way /*verilator public*/ =
+                     (state == `STATE_FILL_ZERO) ? zero_way : destination_way;
+   wire [L2WAYS-1:0] trace_cycle_count /*verilator public*/ = cycle_count;
+`endif
+
    ///////////////////////////////////////////////////////////////////////////
    // Assign outputs
 
@@ -253,7 +253,12 @@ module decode(input wire                        clk,
    end
 
    always @(posedge clk) begin
-      if (debug_strobe)
+      /* Not in reset:  main.cpp holds the CPU in reset between packed
+       * tests while the exiting test's mtspr is still in WB, and that
+       * write mustn't fire debug_written() again, or it'd $finish before
+       * the next packed test can start.
+       */
+      if (debug_strobe && !reset)
 	debug_written(writeback_spr_value);
    end
 `endif
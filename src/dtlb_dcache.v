@@ -87,6 +87,12 @@ module dtlb_dcache(input wire                     clk,
     */
    parameter                          IO_REGION = 2'b11;
    parameter			      MMU_STYLE = 2;
+   /* Geometry:  log2 of D-cache size in bytes and of its associativity, and
+    * DTLB entries:
+    */
+   parameter			      CACHE_L2SIZE = 14;
+   parameter			      CACHE_L2WAYS = 2;
+   parameter			      TLB_ENTRIES = 16;
 
    /////////////////////////////////////////////////////////////////////////////
    // Translation
@@ -117,7 +123,8 @@ module dtlb_dcache(input wire                     clk,
     */
    mmu #(.INSTRUCTION(0),
 	 .IO_REGION(IO_REGION),
-         .MMU_STYLE(MMU_STYLE)
+         .MMU_STYLE(MMU_STYLE),
+	 .TLB_ENTRIES(TLB_ENTRIES)
 	 )
        DMMU(.clk(clk),
 	    .reset(reset),
@@ -332,7 +339,9 @@ module dtlb_dcache(input wire                     clk,
    // Note for TLBI, it both acts locally and externally, and we flag stall
    // until both are done (stall=0 valid=1 on final cycle)
 
-   cache DCACHE(.clk(clk),
+   cache #(.L2SIZE(CACHE_L2SIZE),
+	   .L2WAYS(CACHE_L2WAYS))
+   DCACHE(.clk(clk),
 		.reset(reset),
 
 		.address(cache_address),
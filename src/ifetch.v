@@ -111,6 +111,9 @@ module ifetch(input wire                     clk,
    /* Reset with MSR_IP=1 or 0, PC fff00100 or 100. */
    parameter                     HIGH_VECTORS = 0;
    parameter			 MMU_STYLE = 2;
+   parameter			 ICACHE_L2SIZE = 14;
+   parameter			 ICACHE_L2WAYS = 2;
+   parameter			 ITLB_ENTRIES = 16;
 
    /////////////////////////////////////////////////////////////////////////////
    // State held in IF:
@@ -440,7 +443,10 @@ module ifetch(input wire                     clk,
    wire pctr_mmu_ptws;
 
    itlb_icache #(.IO_REGION(IO_REGION),
-                 .MMU_STYLE(MMU_STYLE))
+                 .MMU_STYLE(MMU_STYLE),
+                 .CACHE_L2SIZE(ICACHE_L2SIZE),
+                 .CACHE_L2WAYS(ICACHE_L2WAYS),
+                 .TLB_ENTRIES(ITLB_ENTRIES))
                ITC(.clk(clk),
 		   .reset(reset),
 
@@ -70,6 +70,12 @@ module itlb_icache(input wire                     clk,
     */
    parameter                          IO_REGION = 2'b11;
    parameter			      MMU_STYLE = 2;
+   /* Geometry:  log2 of I-cache size in bytes and of its associativity, and
+    * ITLB entries:
+    */
+   parameter			      CACHE_L2SIZE = 14;
+   parameter			      CACHE_L2WAYS = 2;
+   parameter			      TLB_ENTRIES = 16;
 
    /////////////////////////////////////////////////////////////////////////////
    // Translation
@@ -100,7 +106,8 @@ module itlb_icache(input wire                     clk,
     */
    mmu #(.INSTRUCTION(1),
 	 .IO_REGION(IO_REGION),
-         .MMU_STYLE(MMU_STYLE)
+         .MMU_STYLE(MMU_STYLE),
+	 .TLB_ENTRIES(TLB_ENTRIES)
 	 )
        IMMU(.clk(clk),
 	    .reset(reset),
@@ -287,7 +294,9 @@ module itlb_icache(input wire                     clk,
 		  .cache_valid(cache_valid)
 		  );
 
-   cache ICACHE(.clk(clk),
+   cache #(.L2SIZE(CACHE_L2SIZE),
+	   .L2WAYS(CACHE_L2WAYS))
+   ICACHE(.clk(clk),
 		.reset(reset),
 
 		.address(cache_address),
@@ -105,6 +105,9 @@ module memory(input wire                       clk,
 
    parameter                                   IO_REGION = 2'b11;
    parameter			     	       MMU_STYLE = 2;
+   parameter			     	       DCACHE_L2SIZE = 14;
+   parameter			     	       DCACHE_L2WAYS = 2;
+   parameter			     	       DTLB_ENTRIES = 16;
 
    reg [`DEC_SIGS_SIZE-1:0]                    memory_ibundle_out_r;
    `DEC_SIGS_DECLARE;
@@ -184,7 +187,10 @@ module memory(input wire                       clk,
    // may be cleaner to have all caches external and assemble at top level.
 
    dtlb_dcache #(.IO_REGION(IO_REGION),
-                 .MMU_STYLE(MMU_STYLE))
+                 .MMU_STYLE(MMU_STYLE),
+                 .CACHE_L2SIZE(DCACHE_L2SIZE),
+                 .CACHE_L2WAYS(DCACHE_L2WAYS),
+                 .TLB_ENTRIES(DTLB_ENTRIES))
                DTC(.clk(clk),
                    .reset(reset),
 
@@ -440,6 +440,31 @@ module mmu(input wire                     clk,
 			  !tlb_hit && !inval_req && state == `MMU_IDLE;  // TLB miss caused PTW
    // FIXME: TLB hit is harder to measure as there are cycles that don't represent a new fetch, but leave enable asserted.
 
+`ifdef SIM
+   ///////////////////////////////////////////////////////////////////////////
+   /* Visibility for the Verilator harness's MMU trace, used by
+    * tools/tlb_replay.py.  A lookup is a cycle in which the TLB/BAT result
+    * is acted upon (IDLE, translating, not invalidating); a walk is done when
+    * the PTW acks; an insert is the cycle before the edge loading the TLB
+    * entry.
+    */
+   wire        trace_lookup /*verilator public*/ = MMU_STYLE > 1 && translation_en &&
+               !inval_req && state == `MMU_IDLE;
+   wire [31:0] trace_vaddress /*verilator public*/ = vaddress;
+   wire        trace_privileged /*verilator public*/ = privileged;
+   wire        trace_RnW /*verilator public*/ = RnW;
+   wire        trace_bat_hit /*verilator public*/ = bat_valid;
+   wire        trace_tlb_hit /*verilator public*/ = tlb_hit;
+   wire        trace_ptw /*verilator public*/ = pctr_mmu_ptws;
+   wire        trace_walk_done /*verilator public*/ = state == `MMU_FETCH && ptw_ack;
+   wire [1:0]  trace_walk_fault /*verilator public*/ = ptw_fault;
+   wire        trace_insert /*verilator public*/ = tlb_load;
+   wire [31:0] trace_req_addr /*verilator public*/ = captured_req_addr;
+   wire        trace_inval /*verilator public*/ = inval_ack;
+   wire        trace_inval_all /*verilator public*/ = inval_type;
+   wire [31:0] trace_inval_addr /*verilator public*/ = inval_addr;
+`endif
+
    assign paddress = paddress_lookup;
    assign cacheable_access = cacheable_access_lookup;
    assign fault_type = (state == `MMU_FAULT) ? mapped_ptw_fault : fault_type_lookup;
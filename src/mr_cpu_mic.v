@@ -66,6 +66,13 @@ module mr_cpu_mic(input wire         clk,
    parameter                         IO_REGION = 2'b11;
    parameter                         HIGH_VECTORS = 0;
    parameter			     MMU_STYLE = 2;
+   /* Cache geometry (log2 of size in bytes, log2 of ways) and TLB sizes: */
+   parameter			     ICACHE_L2SIZE = 14;
+   parameter			     ICACHE_L2WAYS = 2;
+   parameter			     DCACHE_L2SIZE = 14;
+   parameter			     DCACHE_L2WAYS = 2;
+   parameter			     ITLB_ENTRIES = 16;
+   parameter			     DTLB_ENTRIES = 16;
 
    reg [1:0] 			     state;
 `define BIF_STATE_IDLE 0
@@ -140,7 +147,13 @@ module mr_cpu_mic(input wire         clk,
    /* CPU */
    mr_cpu_top #(.IO_REGION(IO_REGION),
 		.HIGH_VECTORS(HIGH_VECTORS),
-                .MMU_STYLE(MMU_STYLE)
+                .MMU_STYLE(MMU_STYLE),
+		.ICACHE_L2SIZE(ICACHE_L2SIZE),
+		.ICACHE_L2WAYS(ICACHE_L2WAYS),
+		.DCACHE_L2SIZE(DCACHE_L2SIZE),
+		.DCACHE_L2WAYS(DCACHE_L2WAYS),
+		.ITLB_ENTRIES(ITLB_ENTRIES),
+		.DTLB_ENTRIES(DTLB_ENTRIES)
 		)
               CPU(.clk(clk),
 		  .reset(reset),
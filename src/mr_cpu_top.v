@@ -55,6 +55,13 @@ module mr_cpu_top(input wire         clk,
     * 			2 = BATs and TLB/HTAB
     */
    parameter			     MMU_STYLE = 2;
+   /* Cache geometry (log2 of size in bytes, log2 of ways) and TLB sizes: */
+   parameter			     ICACHE_L2SIZE = 14;
+   parameter			     ICACHE_L2WAYS = 2;
+   parameter			     DCACHE_L2SIZE = 14;
+   parameter			     DCACHE_L2WAYS = 2;
+   parameter			     ITLB_ENTRIES = 16;
+   parameter			     DTLB_ENTRIES = 16;
 
    wire                              decode_stall;
    wire                              execute_stall;
@@ -112,7 +119,10 @@ module mr_cpu_top(input wire         clk,
 
    ifetch #(.IO_REGION(IO_REGION),
 	    .HIGH_VECTORS(HIGH_VECTORS),
-            .MMU_STYLE(MMU_STYLE))
+            .MMU_STYLE(MMU_STYLE),
+            .ICACHE_L2SIZE(ICACHE_L2SIZE),
+            .ICACHE_L2WAYS(ICACHE_L2WAYS),
+            .ITLB_ENTRIES(ITLB_ENTRIES))
           IF(.clk(clk),
              .reset(reset),
 
@@ -171,7 +181,7 @@ module mr_cpu_top(input wire         clk,
 
    wire                              decode_valid /* verilator public */;
    wire [3:0]                        decode_fault;
-   wire [`REGSZ-1:0] 		     decode_pc;
+   wire [`REGSZ-1:0] 		     decode_pc /* verilator public */;
    wire [31:0]                       decode_msr;
    wire [31:0]                       decode_instr;
 
@@ -396,7 +406,10 @@ module mr_cpu_top(input wire         clk,
    wire [`REGSZ-1:0] 		     mem_addr;
 
    memory #(.IO_REGION(IO_REGION),
-            .MMU_STYLE(MMU_STYLE))
+            .MMU_STYLE(MMU_STYLE),
+            .DCACHE_L2SIZE(DCACHE_L2SIZE),
+            .DCACHE_L2WAYS(DCACHE_L2WAYS),
+            .DTLB_ENTRIES(DTLB_ENTRIES))
           MEM(.clk(clk),
               .reset(reset),
 
@@ -546,4 +559,31 @@ module mr_cpu_top(input wire         clk,
 		  pctr_mem_cacheable_unaligned_CL
 		  };
 
+`ifdef SIM
+   ///////////////////////////////////////////////////////////////////////////
+   // Pipeline latches, for the harness' occupancy trace (verilator/pipe_trace.h):
+   // bit/entry n is the instruction entering DE, EXE, MEM, WB.  Latch n loads
+   // unless stall bit n was set the cycle before (WB's never stalls).
+   wire [3:0]                        trace_pipe_valid /*verilator public*/ =
+                                     {memory_valid, execute_valid, decode_valid, ifetch_valid};
+   wire [3:0]                        trace_pipe_stall /*verilator public*/ =
+                                     {1'b0, memory_stall, execute_stall, decode_stall};
+   wire [31:0]                       trace_pipe_pc0 /*verilator public*/ = ifetch_pc;
+   wire [31:0]                       trace_pipe_pc1 /*verilator public*/ = decode_pc;
+   wire [31:0]                       trace_pipe_pc2 /*verilator public*/ = execute_pc;
+   wire [31:0]                       trace_pipe_pc3 /*verilator public*/ = memory_pc;
+   wire [31:0]                       trace_pipe_instr0 /*verilator public*/ = ifetch_instr;
+   wire [31:0]                       trace_pipe_instr1 /*verilator public*/ = decode_instr;
+   wire [31:0]                       trace_pipe_instr2 /*verilator public*/ = execute_instr;
+   wire [31:0]                       trace_pipe_instr3 /*verilator public*/ = memory_instr;
+   wire                              trace_pipe_fault /*verilator public*/ = memory_fault != 0;
+
+   // Debug SPR writes, as decode's SIM task sees them (for the harness'
+   // console log, verilator/boot_log.h):  valid the cycle before the edge
+   // that writes it.
+   wire                              trace_debug_wr /*verilator public*/ =
+                                     writeback_spr_en && writeback_spr_reg == `DE_spr_DEBUG;
+   wire [31:0]                       trace_debug_value /*verilator public*/ = writeback_spr_value;
+`endif
+
 endmodule // mr_cpu_top
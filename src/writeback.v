@@ -26,18 +26,18 @@
 module writeback(input wire                         clk,
                  input wire 			    reset,
 
-                 input wire 			    memory_valid,
-                 input wire [3:0] 		    memory_fault,
-                 input wire [31:0] 		    memory_instr,
-                 input wire [`REGSZ-1:0] 	    memory_pc,
-                 input wire [31:0] 		    memory_msr,
+                 input wire 			    memory_valid /*verilator public*/,
+                 input wire [3:0] 		    memory_fault /*verilator public*/,
+                 input wire [31:0] 		    memory_instr /*verilator public*/,
+                 input wire [`REGSZ-1:0] 	    memory_pc /*verilator public*/,
+                 input wire [31:0] 		    memory_msr /*verilator public*/,
                  input wire [`DEC_SIGS_SIZE-1:0]    memory_ibundle_in,
 
                  input wire [`REGSZ-1:0] 	    memory_R0,
                  input wire [`REGSZ-1:0] 	    memory_R1,
                  input wire [`XERCRSZ-1:0] 	    memory_RC,
                  input wire [`REGSZ-1:0] 	    memory_res,
-                 input wire [`REGSZ-1:0] 	    memory_addr,
+                 input wire [`REGSZ-1:0] 	    memory_addr /*verilator public*/,
 
                  output wire [`REGSZ-1:0] 	    writeback_newpc,
                  output wire [31:0] 		    writeback_newmsr,
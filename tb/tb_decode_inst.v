@@ -39,8 +39,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_decode_inst.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_decode_inst.vcd");
+	   $dumpvars(0, top);
+	end
 
 	inst <= 0;
 	#1;
@@ -75,8 +75,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_dp_ram.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_dp_ram.vcd");
+	   $dumpvars(0, top);
+	end
 
 	clk <= 0;
 	reset <= 1;
@@ -33,8 +33,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_execute_clz.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_execute_clz.vcd");
+	   $dumpvars(0, top);
+	end
 
 	#1;
 
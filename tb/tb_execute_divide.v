@@ -62,8 +62,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_execute_divide.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_execute_divide.vcd");
+	   $dumpvars(0, top);
+	end
 
 	clk    <= 0;
 	reset  <= 1;
@@ -84,8 +84,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_itlb_icache.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_itlb_icache.vcd");
+	   $dumpvars(0, top);
+	end
 
 	clk <= 0;
 	reset <= 1;
@@ -20,10 +20,36 @@
 `include "decode_signals.vh"
 `include "decode_enums.vh"
 
-`define MEMSIZEL2       20 // 1MB
+`ifndef MEMSIZEL2
+`define MEMSIZEL2       20 // 1MB; bigger (e.g. 25 for Linux) with -DMEMSIZEL2=n
+`endif
 
-module tb_mr_cpu_top(input wire clk,
-		     input wire reset);
+/* Simulator services:  a 4KB window of word registers, at a physical address
+ * above the RAM, serviced by the Verilator harness (verilator/simsvc.h).
+ * Guests access it uncached (real mode, or an I=1 mapping) with stw/lwz.
+ */
+`define SIMSVC_BASE     20'hf0000 // Address[31:12]
+
+module tb_mr_cpu_top(input wire       clk,
+		     input wire       reset,
+		     /* From the Verilator harness's memory timing model
+		      * (verilator/mem_model.h), replacing the random stalls
+		      * when mem_timing_ext is set; {D, I}:
+		      */
+		     input wire       mem_timing_ext,
+		     input wire [1:0] mem_stall_ext,
+		     /* Read data for the simulator services window, set by
+		      * the harness before the edge that reads it:
+		      */
+		     input wire [31:0] simsvc_rdata);
+
+   /* Passed to the CPU, so builds can vary its geometry: */
+   parameter            ICACHE_L2SIZE = 14;
+   parameter            ICACHE_L2WAYS = 2;
+   parameter            DCACHE_L2SIZE = 14;
+   parameter            DCACHE_L2WAYS = 2;
+   parameter            ITLB_ENTRIES = 16;
+   parameter            DTLB_ENTRIES = 16;
 
    wire [15:0]          random;
 
@@ -49,8 +75,12 @@ module tb_mr_cpu_top(input wire clk,
    reg                  emi_d_first;
    reg [`MEMSIZEL2-1:3] emi_d_addr_r;
    wire [`MEMSIZEL2-1:3] ram_daddr = emi_d_first ? emi_d_address[`MEMSIZEL2-1:3] : emi_d_addr_r;
-   wire                  memoryi_stall = random[7];
-   wire                  memoryd_stall = random[3];
+   wire                  memoryi_stall = mem_timing_ext ? mem_stall_ext[0] : random[7];
+   wire                  memoryd_stall = mem_timing_ext ? mem_stall_ext[1] : random[3];
+   wire                  emi_d_simsvc = emi_d_address[31:12] == `SIMSVC_BASE && emi_d_size != 2'b11;
+   // Byte n of a doubleword is in [8n+7:8n], so a big-endian word is swapped:
+   wire [31:0]           simsvc_rdata_lanes = {simsvc_rdata[7:0], simsvc_rdata[15:8],
+                                               simsvc_rdata[23:16], simsvc_rdata[31:24]};
 
    assign emi_d_read_data = emi_d_mem_read_data;
 
@@ -78,12 +108,13 @@ module tb_mr_cpu_top(input wire clk,
                end
 
                if (emi_d_rnw) begin
-                  emi_d_mem_read_data <= memory[ram_daddr];
+                  emi_d_mem_read_data <= emi_d_simsvc ? {simsvc_rdata_lanes, simsvc_rdata_lanes} :
+                                         memory[ram_daddr];
                   // Data valid is delayed 1 cycle, just like the data
                   // itself:
                   emi_d_valid_r <= 1;
 
-               end else begin // Write
+               end else if (!emi_d_simsvc) begin // Write
                   // Data write, with byte strobes:
                   if (emi_d_bws[0])
                     memory[ram_daddr][7:0] <= emi_d_write_data[7:0];
@@ -177,6 +208,58 @@ module tb_mr_cpu_top(input wire clk,
    assign emi_i_valid = emi_i_req && emi_i_valid_r;
 
 
+   ////////////////////////////////////////////////////////////////////////////////
+   // Simulator services:  an access the harness services this cycle, before
+   // the edge (a read may be seen more than once, while it waits for valid).
+   // Word accesses, the word at offset 4 of a doubleword in [63:32].
+   wire                 simsvc_req /* verilator public */ =
+                        emi_d_req && emi_d_simsvc && !memoryd_stall;
+   wire [11:0]          simsvc_offset /* verilator public */ = emi_d_address[11:0];
+   wire [31:0]          simsvc_wlanes = emi_d_address[2] ? emi_d_write_data[63:32] :
+                                        emi_d_write_data[31:0];
+   wire [31:0]          simsvc_wdata /* verilator public */ =
+                        {simsvc_wlanes[7:0], simsvc_wlanes[15:8],
+                         simsvc_wlanes[23:16], simsvc_wlanes[31:24]};
+
+`ifndef VERILATOR
+   // Without the harness (iverilog, tb/tb_top.v), exit and the console:
+   always @(posedge clk) begin
+      if (!reset && simsvc_req && !emi_d_rnw) begin
+         if (simsvc_offset == 12'h000) begin
+            $display("EXIT = %d", simsvc_wdata);
+            $finish;
+         end else if (simsvc_offset == 12'h004) begin
+            $write("%c", simsvc_wdata[7:0]);
+         end
+      end
+   end
+`endif
+
+
+   ////////////////////////////////////////////////////////////////////////////////
+   // Perf counters, and their per-cycle event bits (for harness sampling)
+   wire [63:0]          pctrs /* verilator public */;
+
+   mr_pctrs PCTRS(.clk(clk),
+                  .reset(reset),
+                  .pctrs(pctrs)
+                  );
+
+
+   ////////////////////////////////////////////////////////////////////////////////
+   // EMI activity, for the harness's bus transaction trace
+   wire                 trace_emi_i_req /* verilator public */ = emi_i_req;
+   wire                 trace_emi_i_valid /* verilator public */ = emi_i_valid;
+   wire [1:0]           trace_emi_i_size /* verilator public */ = emi_i_size;
+   wire [31:0]          trace_emi_i_address /* verilator public */ = emi_i_address;
+   wire                 trace_emi_d_req /* verilator public */ = emi_d_req;
+   wire                 trace_emi_d_valid /* verilator public */ = emi_d_valid;
+   wire [1:0]           trace_emi_d_size /* verilator public */ = emi_d_size;
+   wire                 trace_emi_d_rnw /* verilator public */ = emi_d_rnw;
+   wire [7:0]           trace_emi_d_bws /* verilator public */ = emi_d_bws;
+   wire [31:0]          trace_emi_d_address /* verilator public */ = emi_d_address;
+
+
    rng #(.S(16'hcafe)) RNG(.clk(clk),
                            .reset(reset),
                            .rng_o(random)
@@ -185,7 +268,14 @@ module tb_mr_cpu_top(input wire clk,
 
    ////////////////////////////////////////////////////////////////////////////////
    // DUT
-   mr_cpu_top CPU(.clk(clk),
+   mr_cpu_top #(.ICACHE_L2SIZE(ICACHE_L2SIZE),
+		.ICACHE_L2WAYS(ICACHE_L2WAYS),
+		.DCACHE_L2SIZE(DCACHE_L2SIZE),
+		.DCACHE_L2WAYS(DCACHE_L2WAYS),
+		.ITLB_ENTRIES(ITLB_ENTRIES),
+		.DTLB_ENTRIES(DTLB_ENTRIES)
+		)
+              CPU(.clk(clk),
 		  .reset(reset),
 
 		  .IRQ(1'b0),
@@ -203,7 +293,9 @@ module tb_mr_cpu_top(input wire clk,
                   .d_emi_RnW(emi_d_rnw),
                   .d_emi_bws(emi_d_bws),
                   .d_emi_req(emi_d_req),
-                  .d_emi_valid(emi_d_valid)
+                  .d_emi_valid(emi_d_valid),
+
+                  .pctrs(pctrs)
 		  );
 
 endmodule
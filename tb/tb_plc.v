@@ -194,8 +194,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_plc.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_plc.vcd");
+	   $dumpvars(0, top);
+	end
 
 	clk <= 0;
 	reset <= 1;
@@ -58,8 +58,10 @@ module top();
 
    initial
      begin
-	$dumpfile("tb_rotatemask.vcd");
-	$dumpvars(0, top);
+	if (!$test$plusargs("NO_VCD")) begin
+	   $dumpfile("tb_rotatemask.vcd");
+	   $dumpvars(0, top);
+	end
 
 	#1;
 
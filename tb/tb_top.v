@@ -66,7 +66,11 @@ module tb_top(input wire clk,
    ////////////////////////////////////////////////////////////////////////////////
 
    tb_mr_cpu_top TMCT(.clk(clk),
-		      .reset(reset)
+		      .reset(reset),
+		      /* Random stalls; the Verilator harness can model timing */
+		      .mem_timing_ext(1'b0),
+		      .mem_stall_ext(2'b00),
+		      .simsvc_rdata(32'h0)
 		      );
 
    ////////////////////////////////////////////////////////////////////////////////
@@ -23,14 +23,37 @@
 `define SIM 1
 
 /* verilator lint_off DECLFILENAME */
-module tb_top(input wire clk,
-              input wire reset);
+module tb_top(input wire       clk,
+              input wire       reset,
+              /* Memory timing model stalls, from the harness: */
+              input wire       mem_timing_ext,
+              input wire [1:0] mem_stall_ext,
+              /* Simulator services read data, from the harness: */
+              input wire [31:0] simsvc_rdata);
 /* lint_on */
 
+   /* CPU geometry; the Verilator build sets these with -G: */
+   parameter ICACHE_L2SIZE = 14;
+   parameter ICACHE_L2WAYS = 2;
+   parameter DCACHE_L2SIZE = 14;
+   parameter DCACHE_L2WAYS = 2;
+   parameter ITLB_ENTRIES = 16;
+   parameter DTLB_ENTRIES = 16;
+
    ////////////////////////////////////////////////////////////////////////////////
 
-   tb_mr_cpu_top TMCT(.clk(clk),
-		      .reset(reset)
+   tb_mr_cpu_top #(.ICACHE_L2SIZE(ICACHE_L2SIZE),
+		   .ICACHE_L2WAYS(ICACHE_L2WAYS),
+		   .DCACHE_L2SIZE(DCACHE_L2SIZE),
+		   .DCACHE_L2WAYS(DCACHE_L2WAYS),
+		   .ITLB_ENTRIES(ITLB_ENTRIES),
+		   .DTLB_ENTRIES(DTLB_ENTRIES)
+		   )
+                 TMCT(.clk(clk),
+		      .reset(reset),
+		      .mem_timing_ext(mem_timing_ext),
+		      .mem_stall_ext(mem_stall_ext),
+		      .simsvc_rdata(simsvc_rdata)
 		      );
 
    ////////////////////////////////////////////////////////////////////////////////
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+#
+# Basic-block vector profiling, and SimPoint-style clustering of intervals,
+# to pick a few representative regions of a long run to simulate in detail.
+#
+# Input is a commit trace from the Verilator harness (Vwrapper_top -c), or a
+# text PC trace from a functional run (see mr_trace.py).  The committed
+# instruction stream is chopped into fixed-size intervals, and each interval
+# gets a BBV:  instructions executed per basic block.  BBVs are randomly
+# projected down to a few dimensions (as SimPoint does) and clustered with
+# k-means; k is chosen by BIC.  Output is one representative interval per
+# cluster, its weight, and a start-of-interval checkpoint:  the committed
+# instruction count, cycle and PC at which the interval begins.
+#
+# (The RTL can't be loaded with architectural state, so a checkpoint here is a
+# fast-forward marker, not a state image.)
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import json
+import sys
+
+import numpy as np
+
+import mr_trace
+
+
+################################################################################
+
+def ends_block(instr):
+    """Vectorised:  True for instructions that end a basic block."""
+    op = instr >> 26
+    xo = (instr >> 1) & 0x3ff
+    return ((op == 16) | (op == 17) | (op == 18) |
+            ((op == 19) & ((xo == 16) | (xo == 528) | (xo == 50) | (xo == 150))))
+
+
+def block_leaders(pcs, instrs=None):
+    """Returns, for each instruction, the PC of the basic block containing it.
+
+    A block starts wherever the PC isn't sequential, or after a branch-type
+    instruction (when instruction words are known, e.g. a not-taken branch).
+    """
+    n = len(pcs)
+    start = np.ones(n, dtype=bool)
+    start[1:] = pcs[1:] != (pcs[:-1] + 4)
+    if instrs is not None:
+        start[1:] |= ends_block(instrs[:-1])
+    leader_idx = np.maximum.accumulate(np.where(start, np.arange(n), 0))
+    return pcs[leader_idx]
+
+
+def projected_bbvs(block_pcs, interval, dims, rng):
+    """Builds randomly-projected, normalised BBVs, one row per interval.
+
+    Returns (bbvs, lengths, block_ids, nblocks), where lengths[i] is the number
+    of instructions in interval i (the last one may be short).
+    """
+    n = len(block_pcs)
+    nint = (n + interval - 1) // interval
+    (_, bid) = np.unique(block_pcs, return_inverse=True)
+    nblocks = int(bid.max()) + 1 if n else 0
+    iid = np.arange(n) // interval
+
+    proj = rng.uniform(-1.0, 1.0, size=(nblocks, dims))
+    lengths = np.bincount(iid, minlength=nint).astype(np.float64)
+    bbvs = np.empty((nint, dims))
+    for d in range(dims):
+        bbvs[:, d] = np.bincount(iid, weights=proj[bid, d], minlength=nint)
+    bbvs /= lengths[:, None]
+    return (bbvs, lengths, bid, nblocks)
+
+
+def kmeans(x, k, rng, iters=100):
+    """Plain Lloyd's k-means with k-means++ seeding.  Returns (centres, labels)."""
+    n = len(x)
+    centres = np.empty((k, x.shape[1]))
+    centres[0] = x[rng.integers(n)]
+    d2 = ((x - centres[0]) ** 2).sum(axis=1)
+    for c in range(1, k):
+        if d2.sum() > 0:
+            centres[c] = x[rng.choice(n, p=d2 / d2.sum())]
+        else:
+            centres[c] = x[rng.integers(n)]
+        d2 = np.minimum(d2, ((x - centres[c]) ** 2).sum(axis=1))
+
+    labels = None
+    for i in range(iters):
+        dist = ((x[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2)
+        new_labels = dist.argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for c in range(k):
+            members = x[labels == c]
+            if len(members):
+                centres[c] = members.mean(axis=0)
+    return (centres, labels)
+
+
+def bic(x, centres, labels):
+    """BIC score of a clustering, as used by SimPoint (spherical Gaussians)."""
+    (n, d) = x.shape
+    k = len(centres)
+    sse = ((x - centres[labels]) ** 2).sum()
+    if n <= k:
+        # A cluster per interval fits trivially, and the variance is undefined
+        return -np.inf
+    if sse == 0:
+        return np.inf
+    var = sse / (d * (n - k))
+    ll = 0.0
+    for c in range(k):
+        nc = np.count_nonzero(labels == c)
+        if nc == 0:
+            continue
+        ll += (nc * np.log(nc) - nc * np.log(n) -
+               nc * d / 2.0 * np.log(2.0 * np.pi * var) -
+               (nc - 1) * d / 2.0)
+    return ll - (k * (d + 1)) / 2.0 * np.log(n)
+
+
+def choose_clustering(x, max_k, rng, bic_frac=0.9):
+    """Tries k = 1..max_k; picks the smallest k scoring within bic_frac of the
+    best BIC range, as SimPoint does."""
+    results = []
+    for k in range(1, min(max_k, len(x)) + 1):
+        (centres, labels) = kmeans(x, k, rng)
+        results.append((k, centres, labels, bic(x, centres, labels)))
+
+    scores = np.array([r[3] for r in results])
+    finite = scores[np.isfinite(scores)]
+    if len(finite) == 0:
+        return results[0]
+    # An infinite score means a perfect fit; take the first such.
+    for r in results:
+        if r[3] == np.inf:
+            return r
+    thresh = finite.min() + bic_frac * (finite.max() - finite.min())
+    for r in results:
+        if r[3] >= thresh:
+            return r
+    return results[-1]
+
+
+def write_simpoint_bb(path, block_pcs, bid, nblocks, interval):
+    """Writes full (unprojected) BBVs in SimPoint's .bb text format."""
+    iid = np.arange(len(bid)) // interval
+    (keys, counts) = np.unique(iid.astype(np.int64) * nblocks + bid,
+                               return_counts=True)
+    with open(path, 'w') as f:
+        cur = -1
+        line = ""
+        for (key, cnt) in zip(keys, counts):
+            (i, b) = divmod(int(key), nblocks)
+            if i != cur:
+                if cur >= 0:
+                    f.write("T%s\n" % line)
+                cur = i
+                line = ""
+            line += ":%d:%d " % (b + 1, cnt)
+        if cur >= 0:
+            f.write("T%s\n" % line)
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options] <commit trace | PC trace>\n" % sys.argv[0])
+    print("\t-i <n>\t\tInterval size, in committed instructions (default 1000000)")
+    print("\t-k <n>\t\tMaximum number of clusters (default 10)")
+    print("\t-d <n>\t\tProjected BBV dimensions (default 15)")
+    print("\t-s <n>\t\tRandom seed (default 1)")
+    print("\t-o <file>\tWrite representative intervals/checkpoints as JSON")
+    print("\t-b <file>\tWrite full BBVs in SimPoint .bb format")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "i:k:d:s:o:b:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    interval = 1000000
+    max_k = 10
+    dims = 15
+    seed = 1
+    json_out = None
+    bb_out = None
+    for (o, a) in opts:
+        if o == '-i':
+            interval = int(a, 0)
+        elif o == '-k':
+            max_k = int(a, 0)
+        elif o == '-d':
+            dims = int(a, 0)
+        elif o == '-s':
+            seed = int(a, 0)
+        elif o == '-o':
+            json_out = a
+        elif o == '-b':
+            bb_out = a
+        else:
+            usage()
+    if len(args) != 1:
+        usage()
+
+    # Commit traces give instruction words and cycles; PC traces don't.
+    try:
+        t = mr_trace.read_commit_trace(args[0], commits_only=True)
+        pcs = np.asarray(t['pc'])
+        instrs = np.asarray(t['instr'])
+        cycles = np.asarray(t['cycle'])
+    except ValueError:
+        pcs = mr_trace.read_pc_trace(args[0])
+        instrs = None
+        cycles = None
+
+    if len(pcs) == 0:
+        print("Empty trace!")
+        sys.exit(1)
+
+    rng = np.random.default_rng(seed)
+    block_pcs = block_leaders(pcs, instrs)
+    (bbvs, lengths, bid, nblocks) = projected_bbvs(block_pcs, interval, dims, rng)
+
+    # A short trailing interval would distort the clustering; cluster only
+    # full-length ones unless that's all there is.
+    full = lengths == interval
+    if not full.any():
+        full[:] = True
+    idx = np.flatnonzero(full)
+
+    (k, centres, labels, score) = choose_clustering(bbvs[idx], max_k, rng)
+
+    print("%d instructions, %d basic blocks, %d intervals of %d; chose k=%d" %
+          (len(pcs), nblocks, len(idx), interval, k))
+
+    total = lengths[idx].sum()
+    points = []
+    for c in range(k):
+        members = idx[labels == c]
+        if len(members) == 0:
+            continue
+        dist = ((bbvs[members] - centres[c]) ** 2).sum(axis=1)
+        rep = int(members[dist.argmin()])
+        start = rep * interval
+        points.append({'interval': rep,
+                       'weight': float(lengths[members].sum() / total),
+                       'members': int(len(members)),
+                       'start_icount': int(start),
+                       'start_cycle': int(cycles[start]) if cycles is not None else None,
+                       'start_pc': int(pcs[start])})
+    points.sort(key=lambda p: -p['weight'])
+
+    print("%8s %8s %8s %14s %14s %10s" %
+          ("Interval", "Weight", "Members", "Start icount", "Start cycle", "Start PC"))
+    for p in points:
+        print("%8d %8.4f %8d %14d %14s %10s" %
+              (p['interval'], p['weight'], p['members'], p['start_icount'],
+               "-" if p['start_cycle'] is None else str(p['start_cycle']),
+               "%08x" % p['start_pc']))
+
+    if json_out:
+        with open(json_out, 'w') as f:
+            json.dump({'trace': args[0], 'interval': interval, 'k': k,
+                       'instructions': int(len(pcs)), 'points': points},
+                      f, indent=2)
+        print("Wrote %s" % json_out)
+
+    if bb_out:
+        write_simpoint_bb(bb_out, block_pcs, bid, nblocks, interval)
+        print("Wrote %s" % bb_out)
@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+#
+# Benchmark runner and performance regression check:  runs the workloads
+# listed in bench/suite.txt on the Verilator build, records cycles, committed
+# instructions, every perf counter event total and host simulation speed in a
+# SQLite database keyed by git revision, and compares revisions:
+#
+#   make verilate_tb_top bench_images
+#   ./tools/bench.py -r                     # Run, record, check vs. baseline
+#   ./tools/bench.py -r -n 5 -w intkern,memstr
+#   ./tools/bench.py -c v1.0                # Compare HEAD's results to v1.0's
+#   ./tools/bench.py -c v1.0 -R 1a2b3c4     # ...or another revision's
+#   ./tools/bench.py -t                     # IPC trend over the history
+#   ./tools/bench.py -t -m mem_stall -w mmu_thrash
+#
+# Results are keyed by the HEAD commit, plus (if there are uncommitted changes
+# to the RTL, harness or workloads) a hash of the diff, so a change can be
+# checked before it's committed.  The baseline is then HEAD's own results;
+# for a clean tree, it's the nearest ancestor with results.  A run exits with
+# status 1 if it regresses against the baseline, so it can gate a commit.
+#
+# The simulation is deterministic (the testbench's memory stalls come from a
+# fixed-seed RNG), so the architectural metrics of repeated runs of a
+# revision are identical; the check warns if they aren't.  A change in IPC
+# beyond the threshold (-T, percent) is a regression; per-instruction changes
+# in each perf counter beyond it are listed to show where the cycles went.  A
+# change in a workload's console output (its results) or exit status is a
+# failure whatever the performance.  Host simulation speed is noisy, so runs
+# are repeated (-n; at least 4 each side for the test to reach p < 0.05) and
+# the speed samples compared with a permutation test on their means; a
+# significant slowdown beyond -S percent is reported, and is a failure with
+# -s.  Speeds are only comparable between runs on the same host
+# with -j 1.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import hashlib
+import itertools
+import multiprocessing
+import os
+import platform
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import mr_trace
+
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITE_PATH = os.path.join(TOP, 'bench', 'suite.txt')
+DB_PATH = os.path.join(TOP, 'bench', 'results.db')
+EXE_PATH = os.path.join(TOP, 'verilator', 'obj_dir', 'Vwrapper_top')
+
+# Uncommitted changes here make a run "dirty"
+TRACKED = ['src', 'include', 'tb', 'verilator', 'bench', 'tools/PPC.csv',
+           'Makefile']
+GENERATED = ('.elf', '.bin', '.hex', '.db', '.pyc')
+
+IPC_THRESHOLD = 1.0             # Percent
+SPEED_THRESHOLD = 5.0           # Percent
+SPEED_P = 0.05
+PERMUTATIONS = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    rev TEXT NOT NULL,
+    dirty TEXT NOT NULL,
+    commit_time INTEGER,
+    subject TEXT,
+    workload TEXT NOT NULL,
+    image TEXT,
+    exe TEXT,
+    host TEXT,
+    started REAL,
+    status INTEGER,
+    output TEXT,
+    cycles INTEGER,
+    instrs INTEGER,
+    wall REAL
+);
+CREATE INDEX IF NOT EXISTS runs_rev ON runs (rev, dirty, workload);
+CREATE TABLE IF NOT EXISTS counters (
+    run INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (run, name)
+);
+"""
+
+COMPLETE_RE = re.compile(r'Complete:\s+Committed (\d+) instructions, (\d+) stall '
+                         r'cycles, (\d+) cycles total')
+EXIT_RE = re.compile(r'^EXIT =\s*(\d+)')
+
+
+################################################################################
+# Suite and revisions
+
+class Workload:
+    def __init__(self, name, image, max_cycles, desc):
+        self.name = name
+        self.image = image
+        self.max_cycles = max_cycles
+        self.desc = desc
+
+
+def read_suite(path):
+    """Each line:  <name> <image> <max cycles, 0 to run to exit> <description>"""
+    suite = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            p = line.split(None, 3)
+            if len(p) < 3:
+                raise ValueError("%s: bad line '%s'" % (path, line))
+            image = p[1] if os.path.isabs(p[1]) else os.path.join(TOP, p[1])
+            suite.append(Workload(p[0], image, int(p[2], 0),
+                                  p[3] if len(p) > 3 else ''))
+    return suite
+
+
+def git(*args):
+    return subprocess.run(['git', '-C', TOP] + list(args), check=True,
+                          stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def resolve(rev):
+    return git('rev-parse', '--verify', rev + '^{commit}')
+
+
+def current_rev():
+    """Returns (rev, dirty hash or '', commit time, subject) for the tree."""
+    rev = resolve('HEAD')
+    (ct, subject) = git('log', '-1', '--format=%ct %s', rev).split(' ', 1)
+    h = hashlib.sha1()
+    h.update(git('diff', 'HEAD', '--', *TRACKED).encode())
+    # New files count too, but not build products or results
+    for f in git('ls-files', '--others', '--exclude-standard', '--',
+                 *TRACKED).split():
+        if not f.endswith(GENERATED):
+            h.update(f.encode())
+            h.update(file_hash(os.path.join(TOP, f)).encode())
+    dirty = h.hexdigest() if h.digest() != hashlib.sha1().digest() else ''
+    return (rev, dirty, int(ct), subject)
+
+
+def label(rev, dirty):
+    return rev[:10] + ('+' + dirty[:6] if dirty else '')
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(1 << 20), b''):
+            h.update(b)
+    return h.hexdigest()
+
+
+################################################################################
+# Running
+
+def console_output(stdout):
+    """The workload's own output:  harness messages and the debug exit's
+    register dump (which can include timer values) are dropped."""
+    out = []
+    for line in stdout.splitlines():
+        if line.startswith('GPR0 ') or line.startswith('Complete:') or \
+           line.startswith('*** Branch to self') or \
+           line.startswith('*** Simulator exit') or \
+           line.startswith('*** Cycle limit'):
+            break
+        if line.startswith('Writing '):
+            continue
+        out.append(line)
+    return '\n'.join(out)
+
+
+def run_sim(cmd, what="Simulation"):
+    """Runs a Vwrapper_top command line; returns (output, COMPLETE_RE match,
+    wall seconds).  Raises RuntimeError if the harness was killed or didn't
+    finish; a nonzero exit is the guest's EXIT status, not a failure."""
+    t0 = time.perf_counter()
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                       universal_newlines=True, errors='replace')
+    wall = time.perf_counter() - t0
+    m = COMPLETE_RE.search(p.stdout)
+    if p.returncode < 0 or not m:
+        raise RuntimeError("%s failed (status %d):\n%s" %
+                           (what, p.returncode, p.stdout[-2000:]))
+    return (p.stdout, m, wall)
+
+
+def run_one(args):
+    """Runs one workload; returns a dict of results, or an error string."""
+    (exe, w) = args
+    with tempfile.TemporaryDirectory() as tmp:
+        totals_path = os.path.join(tmp, 'pctrs.txt')
+        cmd = [exe, '-C', totals_path]
+        if w.max_cycles:
+            cmd += ['-n', str(w.max_cycles)]
+        cmd.append('+INPUT_FILE=' + w.image)
+        try:
+            (stdout, m, wall) = run_sim(cmd, "%s: simulation" % w.name)
+        except RuntimeError as e:
+            return str(e)
+        totals = mr_trace.read_pctr_totals(totals_path)
+
+    status = 0
+    for line in stdout.splitlines():
+        e = EXIT_RE.match(line)
+        if e:
+            status = int(e.group(1))
+    return {'workload': w.name, 'status': status,
+            'output': hashlib.sha1(console_output(stdout).encode()).hexdigest(),
+            'instrs': int(m.group(1)), 'cycles': int(m.group(3)),
+            'wall': wall, 'counters': totals}
+
+
+def run_suite(db, suite, reps, jobs, exe):
+    (rev, dirty, ct, subject) = current_rev()
+    exe_hash = file_hash(exe)
+    host = platform.node()
+    todo = []
+    for w in suite:
+        if not os.path.exists(w.image):
+            print("Skipping %s:  no image %s" % (w.name, w.image))
+            continue
+        todo += [w] * reps
+    if jobs > 1:
+        print("Note:  running %d at a time; host speeds will be pessimistic" % jobs)
+    print("Running %d workload runs at %s\n" % (len(todo), label(rev, dirty)))
+
+    images = dict((w.name, file_hash(w.image)) for w in set(todo))
+    started = time.time()
+    with multiprocessing.Pool(jobs) as pool:
+        results = pool.map(run_one, [(exe, w) for w in todo])
+
+    failed = 0
+    for r in results:
+        if isinstance(r, str):
+            print(r)
+            failed += 1
+            continue
+        c = db.execute("INSERT INTO runs (rev, dirty, commit_time, subject, "
+                       "workload, image, exe, host, started, status, output, "
+                       "cycles, instrs, wall) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (rev, dirty, ct, subject, r['workload'],
+                        images[r['workload']], exe_hash, host, started,
+                        r['status'], r['output'], r['cycles'], r['instrs'],
+                        r['wall']))
+        db.executemany("INSERT INTO counters (run, name, value) VALUES (?, ?, ?)",
+                       [(c.lastrowid, k, v) for (k, v) in r['counters'].items()
+                        if k != 'cycles'])
+        print("%-12s %12d cycles %12d instrs  IPC %.4f  %8.1f kHz" %
+              (r['workload'], r['cycles'], r['instrs'],
+               r['instrs'] / max(r['cycles'], 1),
+               r['cycles'] / r['wall'] / 1000))
+    db.commit()
+    return (rev, dirty, failed)
+
+
+################################################################################
+# Results
+
+class Results:
+    """A revision's runs of one workload."""
+    def __init__(self, rows, counters):
+        self.n = len(rows)
+        self.cycles = np.array([r['cycles'] for r in rows], dtype=np.float64)
+        self.instrs = np.array([r['instrs'] for r in rows], dtype=np.float64)
+        self.speed = self.cycles / np.array([r['wall'] for r in rows])
+        self.status = set(r['status'] for r in rows)
+        self.output = set(r['output'] for r in rows)
+        self.image = set(r['image'] for r in rows)
+        self.host = set(r['host'] for r in rows)
+        self.counters = counters
+        self.deterministic = len(set(zip(self.cycles, self.instrs))) == 1
+
+    def ipc(self):
+        return float(np.median(self.instrs / np.maximum(self.cycles, 1)))
+
+    def metric(self, name):
+        if name == 'ipc':
+            return self.ipc()
+        if name == 'cycles':
+            return float(np.median(self.cycles))
+        if name == 'instrs':
+            return float(np.median(self.instrs))
+        if name == 'speed':
+            return float(np.median(self.speed))
+        return self.counters.get(name)
+
+    def per_instr(self, name):
+        return self.counters[name] / max(float(np.median(self.instrs)), 1)
+
+
+def select(db, rev, dirty='', table='runs'):
+    """A results table's rows for a revision, oldest first (synth.py keeps
+    its results in this DB too, in a table of its own)"""
+    return db.execute("SELECT * FROM %s WHERE rev = ? AND dirty = ? "
+                      "ORDER BY id" % table, (rev, dirty)).fetchall()
+
+
+def load(db, rev, dirty=''):
+    """Returns {workload: Results} for a revision."""
+    by_w = {}
+    for r in select(db, rev, dirty):
+        by_w.setdefault(r['workload'], []).append(r)
+    res = {}
+    for (w, rs) in by_w.items():
+        # Counters are as deterministic as cycles; take the medians
+        counters = {}
+        for (name, ) in db.execute("SELECT DISTINCT name FROM counters WHERE run = ?",
+                                   (rs[0]['id'], )):
+            v = [x for (x, ) in db.execute(
+                "SELECT value FROM counters WHERE name = ? AND run IN (%s)" %
+                ','.join('?' * len(rs)), [name] + [r['id'] for r in rs])]
+            counters[name] = float(np.median(v))
+        res[w] = Results(rs, counters)
+    return res
+
+
+def has_results(db, rev, dirty='', table='runs'):
+    return db.execute("SELECT 1 FROM %s WHERE rev = ? AND dirty = ? LIMIT 1" % table,
+                      (rev, dirty)).fetchone() is not None
+
+
+def find_baseline(db, rev, dirty, table='runs'):
+    """HEAD's own results for a dirty tree, else the nearest ancestor's."""
+    for r in git('rev-list', '--first-parent', '--max-count=1000',
+                 '--skip=%d' % (0 if dirty else 1), rev).split():
+        if has_results(db, r, table=table):
+            return r
+    return None
+
+
+def permutation_p(a, b):
+    """Two-sided p-value for a difference in means of samples a and b."""
+    x = np.concatenate([a, b])
+    (n, na) = (len(x), len(a))
+    observed = abs(a.mean() - b.mean())
+    if n > 16:
+        rng = np.random.default_rng(0)
+        idx = np.array([rng.permutation(n)[:na] for _ in range(PERMUTATIONS)])
+    else:
+        idx = np.array(list(itertools.combinations(range(n), na)))
+    mask = np.zeros((len(idx), n), dtype=bool)
+    np.put_along_axis(mask, idx, True, axis=1)
+    sa = (mask * x).sum(axis=1) / na
+    sb = (~mask * x).sum(axis=1) / (n - na)
+    return float(np.mean(np.abs(sa - sb) >= observed - 1e-12))
+
+
+def pct(new, old):
+    return 100.0 * (new - old) / old if old else 0.0
+
+
+def compare(base, new, base_label, new_label, ipc_thresh, speed_thresh, speed_fatal):
+    """Prints a comparison; returns the number of failures."""
+    print("\nComparing %s against baseline %s\n" % (new_label, base_label))
+    print("%-12s %10s %10s %8s  %10s %10s %8s %7s" %
+          ("Workload", "Base IPC", "IPC", "Change", "Base kHz", "kHz",
+           "Change", "p"))
+    fails = []
+    notes = []
+    ratios = []
+    for w in sorted(new):
+        n = new[w]
+        if w not in base:
+            print("%-12s %10s %10.4f" % (w, "-", n.ipc()))
+            continue
+        b = base[w]
+        d_ipc = pct(n.ipc(), b.ipc())
+        d_speed = pct(np.median(n.speed), np.median(b.speed))
+        p = permutation_p(n.speed, b.speed) if n.n > 1 and b.n > 1 else None
+        print("%-12s %10.4f %10.4f %+7.2f%%  %10.1f %10.1f %+7.2f%% %7s" %
+              (w, b.ipc(), n.ipc(), d_ipc, np.median(b.speed) / 1000,
+               np.median(n.speed) / 1000, d_speed,
+               "%.3f" % p if p is not None else "-"))
+        ratios.append(n.ipc() / b.ipc())
+
+        if n.image != b.image:
+            notes.append("%s: image differs from the baseline's" % w)
+        if not n.deterministic or not b.deterministic:
+            notes.append("%s: repeated runs differ in cycles/instructions" % w)
+        if n.output != b.output:
+            fails.append("%s: console output changed" % w)
+        if n.status != b.status:
+            fails.append("%s: exit status %s, was %s" %
+                         (w, sorted(n.status), sorted(b.status)))
+        if d_ipc < -ipc_thresh:
+            fails.append("%s: IPC down %.2f%%" % (w, -d_ipc))
+        if d_speed < -speed_thresh and p is not None and p < SPEED_P:
+            msg = "%s: host speed down %.1f%% (p = %.3f)" % (w, -d_speed, p)
+            if n.host != b.host:
+                msg += ", on different hosts"
+            (fails if speed_fatal else notes).append(msg)
+
+        if abs(d_ipc) > ipc_thresh:
+            # Where did the cycles go?  Events per 1000 instructions:
+            for name in mr_trace.PCTR_NAMES:
+                if name not in n.counters or name not in b.counters:
+                    continue
+                (pn, pb) = (n.per_instr(name) * 1000, b.per_instr(name) * 1000)
+                if abs(pct(pn, pb)) > ipc_thresh and abs(pn - pb) > 0.1:
+                    print("%14s %-28s %10.2f -> %10.2f per 1k instrs" %
+                          ("", name, pb, pn))
+
+    if ratios:
+        print("\nGeomean IPC change:  %+.2f%%" %
+              (100.0 * (np.exp(np.mean(np.log(ratios))) - 1)))
+    for m in notes:
+        print("Note:  " + m)
+    for m in fails:
+        print("REGRESSION:  " + m)
+    if not fails:
+        print("No regressions")
+    return len(fails)
+
+
+def trend(db, metric, workloads, thresh, count):
+    """Prints <metric> per workload for the revisions (on HEAD's first-parent
+    history) which have results, oldest first."""
+    revs = [r for r in git('rev-list', '--first-parent', '--max-count=10000',
+                           'HEAD').split() if has_results(db, r)][:count]
+    revs.reverse()
+    results = [(r, '', load(db, r)) for r in revs]
+    (rev, dirty, _, _) = current_rev()
+    if dirty and has_results(db, rev, dirty):
+        results.append((rev, dirty, load(db, rev, dirty)))
+    if not results:
+        print("No results on this branch")
+        return
+    names = sorted(set(w for (_, _, res) in results for w in res))
+    if workloads:
+        names = [w for w in names if w in workloads]
+    print("%s per revision (! marks a change for the worse of more than %.1f%%, "
+          "* for the better)\n" % (metric, thresh))
+    print("%-17s %-28s " % ("Revision", "Subject") +
+          " ".join("%14s" % w[:14] for w in names))
+    prev = {}
+    for (rev, dirty, res) in results:
+        if dirty:
+            subject = "(uncommitted changes)"
+        else:
+            subject = db.execute("SELECT subject FROM runs WHERE rev = ? LIMIT 1",
+                                 (rev, )).fetchone()[0] or ''
+        cols = []
+        for w in names:
+            v = res[w].metric(metric) if w in res else None
+            if v is None:
+                cols.append("%14s" % "-")
+                continue
+            mark = ' '
+            if w in prev:
+                d = pct(v, prev[w])
+                worse = -d if metric in ('ipc', 'speed') else d
+                if abs(d) > thresh:
+                    mark = '!' if worse > 0 else '*'
+            prev[w] = v
+            cols.append(("%13.4f" if metric == 'ipc' else "%13.0f") % v + mark)
+        print("%-17s %-28s " % (label(rev, dirty), subject[:28]) + " ".join(cols))
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options]\n" % sys.argv[0])
+    print("\t-r\t\tRun the suite on the working tree, record and check it")
+    print("\t-c <rev>\tCompare results against those of <rev>")
+    print("\t-R <rev>\tRevision to compare (default: the working tree)")
+    print("\t-t\t\tTrend report over HEAD's history")
+    print("\t-m <metric>\tTrend metric:  ipc, cycles, instrs, speed, or a pctr "
+          "(default ipc)")
+    print("\t-l <n>\t\tTrend over the last <n> revisions with results (default 30)")
+    print("\t-w <names>\tComma-separated workloads (default all)")
+    print("\t-n <reps>\tRuns of each workload (default 1)")
+    print("\t-j <jobs>\tParallel runs (default 1)")
+    print("\t-T <pct>\tIPC regression threshold (default %.1f)" % IPC_THRESHOLD)
+    print("\t-S <pct>\tHost speed regression threshold (default %.1f)" %
+          SPEED_THRESHOLD)
+    print("\t-s\t\tA host speed regression fails the check")
+    print("\t-d <file>\tResults database (default bench/results.db)")
+    print("\t-e <file>\tVwrapper_top to run")
+    print("\t-f <file>\tSuite file (default bench/suite.txt)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "rc:R:tm:l:w:n:j:T:S:sd:e:f:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    do_run = False
+    base_rev = None
+    new_rev = None
+    do_trend = False
+    metric = 'ipc'
+    count = 30
+    workloads = None
+    reps = 1
+    jobs = 1
+    ipc_thresh = IPC_THRESHOLD
+    speed_thresh = SPEED_THRESHOLD
+    speed_fatal = False
+    db_path = DB_PATH
+    exe = EXE_PATH
+    suite_path = SUITE_PATH
+    try:
+        for (o, a) in opts:
+            if o == '-r':
+                do_run = True
+            elif o == '-c':
+                base_rev = a
+            elif o == '-R':
+                new_rev = a
+            elif o == '-t':
+                do_trend = True
+            elif o == '-m':
+                metric = a
+            elif o == '-l':
+                count = int(a, 0)
+            elif o == '-w':
+                workloads = a.split(',')
+            elif o == '-n':
+                reps = int(a, 0)
+            elif o == '-j':
+                jobs = int(a, 0)
+            elif o == '-T':
+                ipc_thresh = float(a)
+            elif o == '-S':
+                speed_thresh = float(a)
+            elif o == '-s':
+                speed_fatal = True
+            elif o == '-d':
+                db_path = a
+            elif o == '-e':
+                exe = a
+            elif o == '-f':
+                suite_path = a
+            else:
+                usage()
+    except ValueError as e:
+        print(e)
+        usage()
+    if args or not (do_run or base_rev or do_trend) or reps < 1 or jobs < 1:
+        usage()
+    if metric not in ['ipc', 'cycles', 'instrs', 'speed'] + mr_trace.PCTR_NAMES:
+        print("Unknown metric '%s'" % metric)
+        usage()
+
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+
+    def subset(res):
+        return dict((w, r) for (w, r) in res.items()
+                    if workloads is None or w in workloads)
+
+    fails = 0
+    if do_run:
+        suite = read_suite(suite_path)
+        if workloads:
+            suite = [w for w in suite if w.name in workloads]
+        if not os.path.exists(exe):
+            print("No %s; make verilate_tb_top first" % exe)
+            sys.exit(1)
+        (rev, dirty, fails) = run_suite(db, suite, reps, jobs, exe)
+        base = resolve(base_rev) if base_rev else find_baseline(db, rev, dirty)
+        if base is None:
+            print("\nNo baseline results to compare against")
+        else:
+            fails += compare(subset(load(db, base)), subset(load(db, rev, dirty)),
+                             label(base, ''), label(rev, dirty),
+                             ipc_thresh, speed_thresh, speed_fatal)
+    elif base_rev:
+        if new_rev:
+            (rev, dirty) = (resolve(new_rev), '')
+        else:
+            (rev, dirty, _, _) = current_rev()
+        base = resolve(base_rev)
+        for (r, d) in [(base, ''), (rev, dirty)]:
+            if not has_results(db, r, d):
+                print("No results for %s" % label(r, d))
+                sys.exit(1)
+        fails += compare(subset(load(db, base)), subset(load(db, rev, dirty)),
+                         label(base, ''), label(rev, dirty),
+                         ipc_thresh, speed_thresh, speed_fatal)
+
+    if do_trend:
+        trend(db, metric, workloads,
+              speed_thresh if metric == 'speed' else ipc_thresh, count)
+
+    db.close()
+    sys.exit(1 if fails else 0)
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+#
+# Trace-driven branch predictor evaluation, to choose a design before writing
+# any RTL:
+#
+#   ./verilator/obj_dir/Vwrapper_top -c commit.trace
+#   ./tools/bp_eval.py commit.trace
+#   ./tools/bp_eval.py -s btfn -s gshare:4096:12+btb:64+ras:8 a.trace b.trace
+#
+# Branch outcomes come from the commit trace (a branch is taken if the next
+# instruction isn't at PC+4), and are replayed through each scheme.  A scheme
+# is a direction predictor, optionally with a BTB and/or return stack:
+#
+#   nt                  Static not-taken, as MR does today (the baseline)
+#   btfn                Backward taken, forward not-taken
+#   bimodal:<n>         <n> 2-bit counters indexed by PC
+#   gshare:<n>:<h>      <n> 2-bit counters indexed by PC ^ <h> bits of history
+#   ...+btb:<n>         Direct-mapped, PC-tagged BTB, filled by taken branches
+#   ...+ras:<n>         <n>-entry circular return stack
+#
+# Costs:  MR resolves branches in EXE, annulling the shadow; a taken branch
+# costs the annul penalty P, measured from the trace (the extra commit gap
+# after a taken conditional branch, compared to a not-taken one) unless given
+# with -P.  A prediction made at IF (BTB hit, correct target) is free; a
+# taken prediction without a BTB target is redirected by DE, costing -D
+# cycles (1), and needs the target to be known there:  direct branches, or
+# returns with a correct RAS entry.  Anything else wrongly predicted costs P.
+#
+# The predictors are vectorised with NumPy:  a table of saturating counters is
+# evaluated by sorting branches by counter index, then a segmented parallel
+# prefix over the (composable) clamped-add updates; BTB and RAS lookups are
+# "last write to this slot" queries, answered by a sort and a running max.
+# The trace is processed in chunks, carrying predictor state over.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+import mr_trace
+
+
+DEFAULT_SCHEMES = ['nt', 'btfn', 'bimodal:1024', 'gshare:4096:12',
+                   'bimodal:1024+btb:64', 'gshare:4096:12+btb:64+ras:8']
+
+DEFAULT_PENALTY = 3             # If it can't be measured
+DECODE_REDIRECT = 1
+CHUNK = 1 << 22                 # Commit records per chunk
+GAP_HIST = 64                   # Commit gaps above this are stalls; ignored
+
+# Branch kinds
+BR_DIRECT = 0                   # b, bc
+BR_LR = 1                       # bclr
+BR_CTR = 2                      # bcctr
+
+
+################################################################################
+# Branch extraction
+
+def decode_branches(pcs, instrs):
+    """Vectorised:  returns (is_branch, kind, conditional, link, target).
+
+    target is only meaningful for BR_DIRECT.
+    """
+    op = instrs >> 26
+    xo = (instrs >> 1) & 0x3ff
+    bo = (instrs >> 21) & 0x1f
+    aa = (instrs >> 1) & 1
+    link = (instrs & 1).astype(bool)
+
+    is_b = op == 18
+    is_bc = op == 16
+    is_lr = (op == 19) & (xo == 16)
+    is_ctr = (op == 19) & (xo == 528)
+
+    kind = np.where(is_lr, BR_LR, np.where(is_ctr, BR_CTR, BR_DIRECT))
+    # BO = 1z1zz is "branch always"
+    conditional = ~is_b & ((bo & 0x14) != 0x14)
+
+    li = (instrs & 0x03fffffc).astype(np.int64)
+    li = np.where(li & 0x02000000, li - 0x04000000, li)
+    bd = (instrs & 0xfffc).astype(np.int64)
+    bd = np.where(bd & 0x8000, bd - 0x10000, bd)
+    disp = np.where(is_b, li, bd)
+    target = (np.where(aa, 0, pcs.astype(np.int64)) + disp) & 0xffffffff
+
+    return (is_b | is_bc | is_lr | is_ctr, kind, conditional, link,
+            target.astype(np.uint32))
+
+
+class Branches:
+    """One chunk's worth of branches, in commit order."""
+
+    def __init__(self, pc, kind, conditional, link, target, taken, next_pc):
+        self.pc = pc
+        self.kind = kind
+        self.conditional = conditional
+        self.link = link
+        self.target = target
+        self.taken = taken
+        self.next_pc = next_pc
+        self.n = len(pc)
+
+
+def branch_chunks(trace, gaps):
+    """Yields Branches per chunk of a commit trace.
+
+    gaps[0]/gaps[1] accumulate histograms of the commit gap following
+    not-taken/taken conditional direct branches, for measuring the penalty.
+    """
+    n = len(trace)
+    for start in range(0, max(n - 1, 0), CHUNK):
+        end = min(start + CHUNK + 1, n)
+        t = trace[start:end]
+        pcs = np.asarray(t['pc'])
+        instrs = np.asarray(t['instr'])
+        faults = np.asarray(t['fault'])
+        cycles = np.asarray(t['cycle'])
+
+        (is_br, kind, cond, link, target) = decode_branches(pcs[:-1], instrs[:-1])
+        sel = np.nonzero(is_br & (faults[:-1] == 0))[0]
+        nxt = pcs[sel + 1]
+        seq = nxt == pcs[sel] + 4
+        direct = kind[sel] == BR_DIRECT
+        # A direct branch going neither way was interrupted; drop it.
+        ok = ~direct | seq | (nxt == target[sel])
+        sel = sel[ok]
+        (nxt, seq, direct) = (nxt[ok], seq[ok], direct[ok])
+
+        cd = cond[sel] & direct & (faults[sel + 1] == 0)
+        gap = np.minimum(cycles[sel + 1] - cycles[sel], GAP_HIST).astype(np.int64)
+        gaps[0] += np.bincount(gap[cd & seq], minlength=GAP_HIST + 1)
+        gaps[1] += np.bincount(gap[cd & ~seq], minlength=GAP_HIST + 1)
+
+        yield Branches(pcs[sel], kind[sel], cond[sel], link[sel], target[sel],
+                       ~seq, nxt)
+
+
+def hist_median(h):
+    c = np.cumsum(h[:GAP_HIST])
+    if c[-1] == 0:
+        return None
+    return int(np.searchsorted(c, (c[-1] + 1) // 2))
+
+
+def measured_penalty(gaps):
+    (nt, t) = (hist_median(gaps[0]), hist_median(gaps[1]))
+    if nt is None or t is None:
+        return None
+    return max(t - nt, 0)
+
+
+################################################################################
+# Vectorised building blocks
+
+def segments(keys_sorted):
+    """For keys sorted into groups, the index of each element's group start."""
+    n = len(keys_sorted)
+    new = np.ones(n, dtype=bool)
+    new[1:] = keys_sorted[1:] != keys_sorted[:-1]
+    return np.maximum.accumulate(np.where(new, np.arange(n), 0))
+
+
+def saturating_counters(idx, taken, state, bits=2):
+    """Predicts (counter >= half) then updates the counters in state.
+
+    Each update is f(x) = clamp(x +/- 1, 0, max); clamps compose into clamps,
+    so each counter's history is a segmented inclusive scan of
+    (add, lo, hi) triples.
+    """
+    n = len(idx)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    cmax = (1 << bits) - 1
+    order = np.argsort(idx, kind='stable')
+    k = idx[order]
+    gs = segments(k)
+
+    a = np.where(taken[order], 1, -1).astype(np.int32)
+    lo = np.zeros(n, dtype=np.int32)
+    hi = np.full(n, cmax, dtype=np.int32)
+    s = 1
+    longest = np.max(np.arange(n) - gs) + 1
+    while s < longest:
+        j = np.arange(s, n)
+        j = j[j - s >= gs[j]]
+        e = j - s
+        # Earlier prefix first, then this one:
+        (a2, l2, h2) = (a[j], lo[j], hi[j])
+        nl = np.minimum(np.maximum(lo[e] + a2, l2), h2)
+        nh = np.minimum(np.maximum(hi[e] + a2, l2), h2)
+        a[j] = a[e] + a2
+        lo[j] = nl
+        hi[j] = nh
+        s *= 2
+
+    x0 = state[k].astype(np.int32)
+    before = x0.copy()
+    inner = np.arange(n) != gs
+    p = np.nonzero(inner)[0] - 1
+    before[inner] = np.minimum(np.maximum(x0[inner] + a[p], lo[p]), hi[p])
+
+    last = np.ones(n, dtype=bool)
+    last[:-1] = k[1:] != k[:-1]
+    state[k[last]] = np.minimum(np.maximum(x0[last] + a[last], lo[last]), hi[last])
+
+    pred = np.empty(n, dtype=bool)
+    pred[order] = before > (cmax >> 1)
+    return pred
+
+
+def last_writes(keys, writes):
+    """For each element, the index of the last earlier write to the same key,
+    or -1.
+    """
+    n = len(keys)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    gs = segments(keys[order])
+    acc = np.maximum.accumulate(np.where(writes[order], np.arange(n), -1))
+    prev = np.full(n, -1, dtype=np.int64)
+    prev[1:] = acc[:-1]
+    prev[prev < gs] = -1
+    res = np.full(n, -1, dtype=np.int64)
+    res[order] = np.where(prev >= 0, order[np.maximum(prev, 0)], -1)
+    return res
+
+
+################################################################################
+# Predictors
+
+class NotTaken:
+    def direction(self, br):
+        return np.zeros(br.n, dtype=bool)
+
+
+class BTFN:
+    def direction(self, br):
+        return ~br.conditional | ((br.kind == BR_DIRECT) & (br.target < br.pc))
+
+
+class Bimodal:
+    def __init__(self, entries):
+        self.mask = entries - 1
+        self.state = np.full(entries, 1, dtype=np.int8)
+
+    def index(self, br, sel):
+        return (br.pc[sel] >> 2) & self.mask
+
+    def direction(self, br):
+        pred = np.ones(br.n, dtype=bool)
+        sel = np.nonzero(br.conditional)[0]
+        pred[sel] = saturating_counters(self.index(br, sel), br.taken[sel],
+                                        self.state)
+        return pred
+
+
+class GShare(Bimodal):
+    def __init__(self, entries, hbits):
+        Bimodal.__init__(self, entries)
+        self.hbits = hbits
+        self.tail = np.zeros(hbits, dtype=np.uint32)
+
+    def index(self, br, sel):
+        outcomes = np.concatenate([self.tail, br.taken[sel].astype(np.uint32)])
+        h = self.hbits
+        hist = np.zeros(len(sel), dtype=np.uint32)
+        for b in range(h):
+            hist |= outcomes[h - 1 - b:len(outcomes) - 1 - b] << b
+        if h:
+            self.tail = outcomes[-h:]
+        return ((br.pc[sel] >> 2) ^ hist) & self.mask
+
+
+class BTB:
+    """Direct-mapped, tagged by PC, written by taken branches."""
+
+    def __init__(self, entries):
+        self.mask = entries - 1
+        self.pcs = np.zeros(0, dtype=np.uint32)
+        self.targets = np.zeros(0, dtype=np.uint32)
+
+    def lookup(self, br):
+        """Returns True where the BTB gives the right target at fetch."""
+        # Prepend current contents as writes, then query the chunk.
+        pcs = np.concatenate([self.pcs, br.pc])
+        tgts = np.concatenate([self.targets, br.next_pc])
+        m = len(self.pcs)
+        writes = np.concatenate([np.ones(m, dtype=bool), br.taken])
+        slots = (pcs >> 2) & self.mask
+        lw = last_writes(slots, writes)[m:]
+        found = lw >= 0
+        w = np.maximum(lw, 0)
+        ok = found & (pcs[w] == br.pc) & (tgts[w] == br.next_pc)
+
+        # Carry over the last write to each slot
+        wi = np.nonzero(writes)[0]
+        if len(wi):
+            (_, li) = np.unique(slots[wi][::-1], return_index=True)
+            keep = wi[len(wi) - 1 - li]
+            (self.pcs, self.targets) = (pcs[keep], tgts[keep])
+        return ok
+
+
+class RAS:
+    """Circular return stack; a call pushes PC+4, a return pops."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.sp = 0
+        self.slots = np.zeros(0, dtype=np.int64)
+        self.values = np.zeros(0, dtype=np.uint32)
+
+    def returns_ok(self, br):
+        """Returns True for returns whose popped address is right."""
+        call = br.link & br.taken
+        ret = (br.kind == BR_LR) & ~br.link & br.taken
+        ev = np.nonzero(call | ret)[0]
+        is_call = call[ev]
+        # Stack pointer before each event
+        delta = np.where(is_call, 1, -1)
+        sp = self.sp + np.concatenate([[0], np.cumsum(delta)[:-1]])
+        slot = np.where(is_call, sp, sp - 1) % self.entries
+        value = (br.pc[ev] + 4).astype(np.uint32)
+
+        m = len(self.slots)
+        slots = np.concatenate([self.slots, slot])
+        values = np.concatenate([self.values, value])
+        writes = np.concatenate([np.ones(m, dtype=bool), is_call])
+        lw = last_writes(slots, writes)[m:]
+
+        ok = np.zeros(br.n, dtype=bool)
+        r = ~is_call
+        ok[ev[r]] = (lw[r] >= 0) & (values[np.maximum(lw[r], 0)] == br.next_pc[ev[r]])
+
+        if len(ev):
+            self.sp = int(sp[-1] + delta[-1])
+        wi = np.nonzero(writes)[0]
+        if len(wi):
+            (_, li) = np.unique(slots[wi][::-1], return_index=True)
+            keep = wi[len(wi) - 1 - li]
+            (self.slots, self.values) = (slots[keep], values[keep])
+        return ok
+
+
+class Scheme:
+    def __init__(self, spec):
+        self.spec = spec
+        self.btb = None
+        self.ras = None
+        parts = spec.split('+')
+        d = parts[0].split(':')
+        if d[0] == 'nt':
+            self.dir = NotTaken()
+        elif d[0] == 'btfn':
+            self.dir = BTFN()
+        elif d[0] == 'bimodal':
+            self.dir = Bimodal(pow2(d[1]))
+        elif d[0] == 'gshare':
+            self.dir = GShare(pow2(d[1]), int(d[2]))
+        else:
+            raise ValueError("Unknown predictor '%s'" % d[0])
+        for p in parts[1:]:
+            (name, n) = p.split(':')
+            if name == 'btb':
+                self.btb = BTB(pow2(n))
+            elif name == 'ras':
+                self.ras = RAS(int(n))
+            else:
+                raise ValueError("Unknown component '%s'" % name)
+        self.branches = 0
+        self.mispredicts = 0
+        self.redirects = 0
+
+    def outcomes(self, br):
+        """Returns (mispredicted, redirected at DE) flags per branch."""
+        pred = self.dir.direction(br)
+        at_fetch = self.btb.lookup(br) if self.btb else np.zeros(br.n, dtype=bool)
+        ras_ok = self.ras.returns_ok(br) if self.ras else np.zeros(br.n, dtype=bool)
+
+        wrong_dir = pred != br.taken
+        tt = pred & br.taken
+        free = tt & at_fetch
+        at_de = tt & ~free & ((br.kind == BR_DIRECT) | ras_ok)
+        late = tt & ~free & ~at_de
+        return (wrong_dir | late, at_de)
+
+    def run(self, br):
+        """Returns (mispredicts, DE redirects) for a chunk."""
+        (m, r) = self.outcomes(br)
+        mis = int(np.count_nonzero(m))
+        red = int(np.count_nonzero(r))
+        self.branches += br.n
+        self.mispredicts += mis
+        self.redirects += red
+        return (mis, red)
+
+
+def pow2(s):
+    n = int(s, 0)
+    if n < 1 or n & (n - 1):
+        raise ValueError("%d isn't a power of 2" % n)
+    return n
+
+
+################################################################################
+
+def evaluate(path, specs, penalty, redirect):
+    trace = mr_trace.read_commit_trace(path)
+    schemes = [Scheme(s) for s in specs]
+    gaps = [np.zeros(GAP_HIST + 1, dtype=np.int64) for _ in range(2)]
+    nbr = ntaken = ncond = 0
+    for br in branch_chunks(trace, gaps):
+        nbr += br.n
+        ntaken += int(np.count_nonzero(br.taken))
+        ncond += int(np.count_nonzero(br.conditional))
+        for s in schemes:
+            s.run(br)
+
+    cycles = int(trace['cycle'][-1] - trace['cycle'][0]) if len(trace) else 0
+    mp = measured_penalty(gaps)
+    if penalty is None:
+        penalty = mp if mp is not None else DEFAULT_PENALTY
+    print("%s: %d instructions, %d cycles, %d branches (%d conditional, %.1f%% taken)" %
+          (path, len(trace), cycles, nbr, ncond,
+           100.0 * ntaken / nbr if nbr else 0.0))
+    print("Annul penalty %d cycles (measured: %s), DE redirect %d cycles\n" %
+          (penalty, "%d" % mp if mp is not None else "n/a", redirect))
+
+    print("%-32s %10s %8s %10s %12s %12s %8s" %
+          ("Scheme", "Mispred", "Rate", "Redirects", "Cycles", "Saved", "% run"))
+    base = None
+    for s in schemes:
+        c = s.mispredicts * penalty + s.redirects * redirect
+        if base is None:
+            base = ntaken * penalty     # What static not-taken costs
+        print("%-32s %10d %7.2f%% %10d %12d %12d %7.2f%%" %
+              (s.spec[:32], s.mispredicts,
+               100.0 * s.mispredicts / s.branches if s.branches else 0.0,
+               s.redirects, c, base - c,
+               100.0 * (base - c) / cycles if cycles else 0.0))
+    print("")
+
+
+def usage():
+    print("Syntax:\n\t %s [options] <commit trace> [<commit trace> ...]\n" % sys.argv[0])
+    print("\t-s <scheme>\tAdd a scheme (repeatable), e.g. gshare:4096:12+btb:64+ras:8")
+    print("\t\t\t(default: %s)" % ", ".join(DEFAULT_SCHEMES))
+    print("\t-P <cycles>\tAnnul penalty of a taken/mispredicted branch (default: measured)")
+    print("\t-D <cycles>\tCost of a taken prediction redirected from DE (default %d)" %
+          DECODE_REDIRECT)
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "s:P:D:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    specs = []
+    penalty = None
+    redirect = DECODE_REDIRECT
+    for (o, a) in opts:
+        if o == '-s':
+            specs.append(a)
+        elif o == '-P':
+            penalty = int(a, 0)
+        elif o == '-D':
+            redirect = int(a, 0)
+        else:
+            usage()
+    if len(args) < 1:
+        usage()
+    if not specs:
+        specs = DEFAULT_SCHEMES
+
+    try:
+        [Scheme(s) for s in specs]
+    except (ValueError, IndexError) as e:
+        print("Bad scheme: %s" % e)
+        usage()
+
+    for path in args:
+        evaluate(path, specs, penalty, redirect)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#
+# Memory system analysis from a bus transaction trace, for sizing the memory
+# system under real load:
+#
+#   ./verilator/obj_dir/Vwrapper_top -b bus.bin
+#   ./tools/bus_analyse.py bus.bin
+#   ./tools/bus_analyse.py -f 50 -i 5000 bus.bin      # MB/s at 50MHz
+#   ./tools/bus_analyse.py -d bus.bin | less          # List transactions
+#
+# The trace (verilator/bus_trace.h) has one record per EMI transaction
+# between the caches and the testbench memory:  requester, address, size,
+# direction, and the cycles of the request, first and last beat.  Reported:
+#
+# - Traffic by kind (I/D line fills, D line writebacks, and single-beat,
+#   i.e. uncached, reads and writes):  count, bytes and bandwidth.
+# - Latency from request to first and last beat, and burst efficiency (a
+#   line's beats over the cycles from its first to last beat).
+# - Utilisation:  the fraction of cycles each EMI has a transaction in
+#   flight, and of its data beats; and the peak and 95th percentile of
+#   bandwidth over intervals of the run.
+# - Arbitration:  the testbench serves EMI-I and EMI-D from dual-ported
+#   memory, so they never wait for each other here.  The cycles both are busy
+#   show the contention; and the transactions are replayed through a model of
+#   mr_cpu_mic.v's arbiter onto one MIC channel (D has priority; one cycle
+#   from IDLE to a request state; each transaction taking as long as it did
+#   here; a requester's later requests delayed as much as its earlier ones
+#   were) to estimate how often, and how long, D requests wait for I ones
+#   (docs/emi_mic_interface.json's "D req waits") and vice versa.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+import mr_trace
+from mr_trace import BUS_I, BUS_D, BUS_SIZE_CL, BUS_BEAT_BYTES
+
+REQUESTERS = ['I', 'D']
+# (name, requester, write, line)
+KINDS = [('I fill', BUS_I, 0, True),
+         ('I read', BUS_I, 0, False),
+         ('D fill', BUS_D, 0, True),
+         ('D writeback', BUS_D, 1, True),
+         ('D read', BUS_D, 0, False),
+         ('D write', BUS_D, 1, False)]
+LINE_BEATS = 4
+
+
+def kind_masks(t):
+    line = t['size'] == BUS_SIZE_CL
+    return [(name, (t['requester'] == r) & (t['write'] == w) & (line == l))
+            for (name, r, w, l) in KINDS]
+
+
+def pct(a, p):
+    return float(np.percentile(a, p)) if len(a) else 0.0
+
+
+def busy_cycles(t):
+    """Cycles a transaction is in flight, as (starts, ends) (inclusive)"""
+    s = t['cycle'].astype(np.int64)
+    return s, s + t['last'].astype(np.int64)
+
+
+def overlap(a, b):
+    """Cycles in both of two sets of disjoint intervals"""
+    times = np.concatenate([a[0], a[1] + 1, b[0], b[1] + 1])
+    deltas = np.concatenate([np.ones(len(a[0]), np.int64), -np.ones(len(a[0]), np.int64),
+                             np.ones(len(b[0]), np.int64), -np.ones(len(b[0]), np.int64)])
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    level = np.cumsum(deltas[order])
+    return int(np.sum(np.diff(times)[level[:-1] == 2])) if len(times) else 0
+
+
+def mic_model(t):
+    """Replays transactions through mr_cpu_mic's arbitration; returns the
+    wait (cycles) of each transaction, and the extra cycles in total."""
+    arrive = [t['cycle'][t['requester'] == r].astype(np.int64).tolist() for r in (BUS_I, BUS_D)]
+    dur = [(t['last'][t['requester'] == r].astype(np.int64) + 1).tolist() for r in (BUS_I, BUS_D)]
+    idx = [0, 0]
+    delay = [0, 0]
+    waits = [[], []]
+    free = 0
+    inf = float('inf')
+    while idx[0] < len(arrive[0]) or idx[1] < len(arrive[1]):
+        a = [arrive[r][idx[r]] + delay[r] if idx[r] < len(arrive[r]) else inf
+             for r in (BUS_I, BUS_D)]
+        now = max(free, min(a))
+        r = BUS_D if a[BUS_D] <= now else BUS_I
+        w = now - a[r]
+        waits[r].append(w)
+        # IDLE sees the request, then REQx for the transaction; back to IDLE
+        # the cycle after its last beat.
+        delay[r] += w + 1
+        free = now + 1 + dur[r][idx[r]]
+        idx[r] += 1
+    return [np.array(w, dtype=np.int64) for w in waits], delay
+
+
+def dump(t):
+    for r in t:
+        print("%12d %s %-5s %08x size %d bws %02x beats %d first +%d last +%d" %
+              (r['cycle'], REQUESTERS[r['requester']], 'write' if r['write'] else 'read',
+               r['address'], r['size'], r['bws'], r['beats'], r['first'], r['last']))
+
+
+def report(hdr, t, mhz, interval):
+    cycles = int(hdr['cycles']) or (int(t['cycle'][-1] + t['last'][-1]) + 1 if len(t) else 0)
+    done = t[t['beats'] == np.where(t['size'] == BUS_SIZE_CL, LINE_BEATS, 1)]
+    print("%d transactions over %d cycles%s" %
+          (len(t), cycles, (", %d incomplete (ignored)" % (len(t) - len(done)))
+           if len(done) != len(t) else ""))
+    if not len(done) or not cycles:
+        return
+    t = done
+
+    print("\n%-12s %8s %10s %8s%s %8s %6s %6s %8s %6s" %
+          ('Kind', 'Count', 'Bytes', 'B/cycle', ' %8s' % 'MB/s' if mhz else '',
+           'Lat1st', 'p95', 'Max', 'LatLast', 'Burst'))
+    for name, m in kind_masks(t):
+        k = t[m]
+        if not len(k):
+            continue
+        nbytes = len(k) * (LINE_BEATS * BUS_BEAT_BYTES if k['size'][0] == BUS_SIZE_CL else
+                           BUS_BEAT_BYTES)
+        first = k['first'].astype(np.int64)
+        span = (k['last'] - k['first']).astype(np.int64) + 1
+        eff = (LINE_BEATS * len(k) / float(np.sum(span))) if k['size'][0] == BUS_SIZE_CL else 1.0
+        print("%-12s %8d %10d %8.3f%s %8.1f %6d %6d %8.1f %5.0f%%" %
+              (name, len(k), nbytes, nbytes / float(cycles),
+               ' %8.1f' % (nbytes / float(cycles) * mhz) if mhz else '',
+               np.mean(first), pct(first, 95), np.max(first),
+               np.mean(k['last'].astype(np.int64)), 100.0 * eff))
+
+    wr = t[(t['requester'] == BUS_D) & (t['write'] == 1)]
+    d = t[t['requester'] == BUS_D]
+    wb = np.count_nonzero((wr['size'] == BUS_SIZE_CL))
+    print("\nD writes:  %d of %d D transactions (%d line writebacks, %.1f%% of D beats)" %
+          (len(wr), len(d), wb, 100.0 * np.sum(wr['beats']) / max(1, np.sum(d['beats']))))
+
+    print("\nUtilisation:")
+    busy = []
+    for r in (BUS_I, BUS_D):
+        k = t[t['requester'] == r]
+        b = busy_cycles(k)
+        busy.append(b)
+        print("  EMI-%s:  busy %5.1f%% of cycles, data beats %5.1f%%" %
+              (REQUESTERS[r], 100.0 * np.sum(b[1] - b[0] + 1) / cycles,
+               100.0 * np.sum(k['beats']) / cycles))
+    both = overlap(busy[0], busy[1])
+    print("  Both busy %d cycles (%.1f%%); one shared channel would carry %.1f%% beats" %
+          (both, 100.0 * both / cycles, 100.0 * np.sum(t['beats']) / cycles))
+
+    if interval and cycles > interval:
+        nwin = (cycles + interval - 1) // interval
+        end = (t['cycle'] + t['last']).astype(np.int64) // interval
+        beats = np.bincount(end, weights=t['beats'], minlength=nwin)[:nwin]
+        util = 100.0 * beats / interval
+        print("  Over %d-cycle intervals:  beats peak %.1f%%, p95 %.1f%%, median %.1f%%" %
+              (interval, np.max(util), pct(util, 95), pct(util, 50)))
+
+    waits, delay = mic_model(t)
+    print("\nShared MIC channel (mr_cpu_mic arbitration model):")
+    for r in (BUS_D, BUS_I):
+        w = waits[r]
+        nw = np.count_nonzero(w)
+        other = REQUESTERS[1 - r]
+        print("  %s req waits for %s:  %d of %d (%.1f%%), mean %.1f cycles when waiting, max %d" %
+              (REQUESTERS[r], other, nw, len(w), 100.0 * nw / max(1, len(w)),
+               np.mean(w[w > 0]) if nw else 0.0, np.max(w) if len(w) else 0))
+    print("  Added cycles (waits plus IDLE->REQ):  I %d, D %d; %.1f%% of run" %
+          (delay[BUS_I], delay[BUS_D], 100.0 * max(delay) / cycles))
+
+
+def usage():
+    print("Syntax:\n\t %s [-f <MHz>] [-i <interval cycles>] [-d] <bus trace>" % sys.argv[0])
+    print("\t-f:  Clock, for bandwidth in MB/s")
+    print("\t-i:  Interval for peak/percentile bandwidth (default 10000, 0 for none)")
+    print("\t-d:  List the transactions")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    mhz = None
+    interval = 10000
+    do_dump = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'f:i:dh')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    for o, a in opts:
+        if o == '-f':
+            mhz = float(a)
+        elif o == '-i':
+            interval = int(a)
+        elif o == '-d':
+            do_dump = True
+        else:
+            usage()
+
+    if len(args) != 1:
+        usage()
+
+    try:
+        hdr, t = mr_trace.read_bus_trace(args[0])
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    if do_dump:
+        dump(t)
+    else:
+        report(hdr, t, mhz, interval)
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+#
+# Trace-driven model of src/cache.v, for cache design-space exploration:
+#
+#   ./verilator/obj_dir/Vwrapper_top -a cache.bin
+#   ./tools/cache_sim.py -v cache.bin
+#   ./tools/cache_sim.py -c d -s 8k,16k,32k -w 1,2,4,8 -l 32,64 cache.bin
+#
+# The trace holds each cache's LOOKUP cycles (address, request, hit) and the
+# fills/dcbz allocations.  cache.v flags the lookup that accepts each new
+# request; re-lookups of a request held across a stall, or retried after a
+# fill, aren't, so each request is replayed once against a model of the tag
+# RAM (back-to-back requests to the same address included).  A request the
+# requester withdrew part-way through its fill, spill or CMO (dropping
+# enable, which cache.v marks with a CANCEL event) costs its lookup but
+# leaves the tags alone, as in the RTL.
+#
+# The replay is sequential, in plain Python:  in the "rtl" policy every set
+# shares one destination_way, so an access's victim depends on every earlier
+# allocation in any set and the sets can't be replayed independently.  NumPy
+# does the trace decoding and the checking.
+#
+# The model follows cache.v, including its quirks:
+# - Replacement isn't per-set:  each cache has one destination_way, which moves
+#   on by the free-running cycle_count whenever a fill or a dcbz completes.  In
+#   the "rtl" policy, cycle_count is taken from the trace's allocation events
+#   (so a replay of the RTL's configuration should match it exactly) and
+#   otherwise from the cycle of the access.  "lru" and "random" are also
+#   provided for comparison.
+# - CLEAN writes back a dirty line but leaves it marked dirty.
+# - dcbz (ZERO) allocates on a miss, without a fill.
+# - INV_SET invalidates a whole set (by address).
+#
+# -v replays the trace with the RTL's configuration and checks the model's
+# hits and allocation ways against the RTL's.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import itertools
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+import mr_trace
+from mr_trace import C_REQ_UC_READ, C_REQ_UC_WRITE, C_REQ_C_READ, \
+    C_REQ_C_WRITE, C_REQ_INV, C_REQ_CLEAN_INV, C_REQ_CLEAN, C_REQ_ZERO, \
+    C_REQ_INV_SET
+
+
+# The RTL's configuration (mr_cpu_top/itlb_icache/dtlb_dcache defaults)
+RTL_SIZE = 16384
+RTL_WAYS = 4
+RTL_LINE = 32
+
+# cycle_count is held at 0 through the harness' 4 reset ticks, and counts from
+# there; the value recorded after tick N is therefore N - 4.
+CC_RESET_TICKS = 4
+
+POLICIES = ['rtl', 'lru', 'random']
+
+STATS = ['accesses', 'reads', 'writes', 'hits', 'misses', 'fills', 'spills',
+         'cmos', 'uncached', 'cancelled']
+
+
+def accesses(trace, cache):
+    """Returns (cycle, address, req, rtl_hit, cancelled) arrays of the
+    requests accepted, plus the (cycle, way, cycle_count) arrays of the RTL's
+    allocations.
+    """
+    t = trace[trace['cache'] == cache]
+    lk = t[t['event'] == mr_trace.CACHE_EV_LOOKUP]
+    al = t[t['event'] == mr_trace.CACHE_EV_ALLOC]
+    cn = t[t['event'] == mr_trace.CACHE_EV_CANCEL]
+
+    addr = np.asarray(lk['address'])
+    req = np.asarray(lk['req'])
+    info = np.asarray(lk['info'])
+    # A request held over a stall, or retried after its fill, is looked up
+    # repeatedly:  only the first lookup (and its hit flag) counts.
+    new = (info & mr_trace.CACHE_LOOKUP_NEW) != 0
+    cyc = np.asarray(lk['cycle'])[new]
+    # A cancel abandons the latest new request before it.
+    cancelled = np.zeros(len(cyc), dtype=bool)
+    idx = np.searchsorted(cyc, np.asarray(cn['cycle']), side='right') - 1
+    cancelled[idx[idx >= 0]] = True
+    return (cyc, addr[new], req[new],
+            (info[new] & mr_trace.CACHE_LOOKUP_HIT) != 0, cancelled,
+            np.asarray(al['cycle']), np.asarray(al['req']),
+            np.asarray(al['info']))
+
+
+class CacheModel:
+    def __init__(self, size, ways, line, policy='rtl', alloc_ccs=None, seed=0):
+        self.ways = ways
+        self.l2line = line.bit_length() - 1
+        self.nsets = size // (ways * line)
+        if self.nsets < 1 or (1 << self.l2line) != line or \
+           self.nsets & (self.nsets - 1) or ways & (ways - 1):
+            raise ValueError("Bad cache geometry %d/%d/%d" % (size, ways, line))
+        self.policy = policy
+        # Per set: line number in each way (or -1 if invalid), dirty flags,
+        # and (for LRU) ways in order of use, MRU last.
+        self.tags = [[-1] * ways for _ in range(self.nsets)]
+        self.dirty = [[False] * ways for _ in range(self.nsets)]
+        self.order = [list(range(ways)) for _ in range(self.nsets)]
+        self.destination_way = 0
+        self.alloc_ccs = alloc_ccs if alloc_ccs is not None else []
+        self.nallocs = 0
+        self.alloc_ways = []
+        self.alloc_cycles = []
+        self.rng = random.Random(seed)
+        self.stats = dict((s, 0) for s in STATS)
+
+    def _find(self, s, ln):
+        tags = self.tags[s]
+        for w in range(self.ways):
+            if tags[w] == ln:
+                return w
+        return -1
+
+    def _touch(self, s, w):
+        o = self.order[s]
+        o.remove(w)
+        o.append(w)
+
+    def _victim(self, s):
+        if self.policy == 'lru':
+            return self.order[s][0]
+        elif self.policy == 'random':
+            return self.rng.randrange(self.ways)
+        return self.destination_way
+
+    def _allocated(self, s, w, cycle):
+        """A fill/dcbz completed into way w; move destination_way on."""
+        self.alloc_ways.append(w)
+        self.alloc_cycles.append(cycle)
+        if self.nallocs < len(self.alloc_ccs):
+            cc = int(self.alloc_ccs[self.nallocs])
+        else:
+            cc = int(cycle) - CC_RESET_TICKS
+        self.nallocs += 1
+        self.destination_way = (self.destination_way + cc) % self.ways
+        self._touch(s, w)
+
+    def _spill(self, s, w):
+        if self.tags[s][w] >= 0 and self.dirty[s][w]:
+            self.stats['spills'] += 1
+            return True
+        return False
+
+    def access(self, cycle, addr, req, cancelled=False):
+        """Performs one access; returns True if it hit.  A cancelled access
+        doesn't change the tags if it misses (or is a CMO)."""
+        st = self.stats
+        ln = addr >> self.l2line
+        s = ln & (self.nsets - 1)
+        st['accesses'] += 1
+
+        if req == C_REQ_UC_READ or req == C_REQ_UC_WRITE:
+            st['uncached'] += 1
+            return False
+        if cancelled:
+            st['cancelled'] += 1
+        if req == C_REQ_INV_SET:
+            st['cmos'] += 1
+            if not cancelled:
+                self.tags[s] = [-1] * self.ways
+                self.dirty[s] = [False] * self.ways
+            return False
+
+        w = self._find(s, ln)
+        hit = w >= 0
+
+        if req == C_REQ_C_READ or req == C_REQ_C_WRITE:
+            st['reads' if req == C_REQ_C_READ else 'writes'] += 1
+            if hit:
+                st['hits'] += 1
+            else:
+                st['misses'] += 1
+                if cancelled:
+                    return False
+                w = self._victim(s)
+                self._spill(s, w)
+                st['fills'] += 1
+                self.tags[s][w] = ln
+                self.dirty[s][w] = False
+                self._allocated(s, w, cycle)
+            if req == C_REQ_C_WRITE:
+                self.dirty[s][w] = True
+            if self.policy == 'lru':
+                self._touch(s, w)
+            return hit
+
+        st['cmos'] += 1
+        if cancelled:
+            return hit
+        if req == C_REQ_ZERO:
+            if not hit:
+                w = self._victim(s)
+                self._spill(s, w)
+            self.tags[s][w] = ln
+            self.dirty[s][w] = True
+            self._allocated(s, w, cycle)
+        elif hit:
+            if req == C_REQ_INV:
+                self.tags[s][w] = -1
+                self.dirty[s][w] = False
+            elif req == C_REQ_CLEAN_INV:
+                self._spill(s, w)
+                self.tags[s][w] = -1
+                self.dirty[s][w] = False
+            elif req == C_REQ_CLEAN:
+                # As cache.v:  written back, but the dirty bit stays set.
+                self._spill(s, w)
+        return hit
+
+
+def run(cyc, addr, req, cancelled, size, ways, line, policy, alloc_ccs=None):
+    """Replays accesses; returns (model, per-access hit flags)."""
+    m = CacheModel(size, ways, line, policy, alloc_ccs)
+    acc = m.access
+    hits = np.fromiter((acc(c, a, r, x) for (c, a, r, x) in
+                        zip(cyc.tolist(), addr.tolist(), req.tolist(),
+                            cancelled.tolist())),
+                       dtype=bool, count=len(cyc))
+    return (m, hits)
+
+
+################################################################################
+# Sweeps run in a pool of workers, which inherit the accesses through fork.
+
+_sweep_acc = {}
+
+
+def _sweep_one(cfg):
+    (cache, size, ways, line, policy) = cfg
+    (cyc, addr, req, _, cancelled, al_cyc, _, al_cc) = _sweep_acc[cache]
+    ccs = al_cc if (size, ways, line, policy) == (RTL_SIZE, RTL_WAYS, RTL_LINE,
+                                                 'rtl') else None
+    try:
+        (m, _) = run(cyc, addr, req, cancelled, size, ways, line, policy, ccs)
+    except ValueError:
+        return (cfg, None)
+    return (cfg, m.stats)
+
+
+def parse_size(s):
+    s = s.strip().lower()
+    mul = 1
+    if s.endswith('k'):
+        (s, mul) = (s[:-1], 1024)
+    elif s.endswith('m'):
+        (s, mul) = (s[:-1], 1024 * 1024)
+    return int(s, 0) * mul
+
+
+def print_stats_header():
+    print("%-2s %8s %4s %4s %-6s %10s %10s %8s %8s %8s %8s" %
+          ("", "Size", "Ways", "Line", "Policy", "Accesses", "Misses",
+           "Miss%", "Fills", "Spills", "MPKA"))
+
+
+def print_stats(cache, size, ways, line, policy, st):
+    cached = st['reads'] + st['writes']
+    print("%-2s %8d %4d %4d %-6s %10d %10d %7.3f%% %8d %8d %8.2f" %
+          ("ID"[cache], size, ways, line, policy, cached, st['misses'],
+           100.0 * st['misses'] / cached if cached else 0.0,
+           st['fills'], st['spills'],
+           1000.0 * st['misses'] / cached if cached else 0.0))
+
+
+def validate(trace, cache):
+    (cyc, addr, req, rtl_hit, cancelled, al_cyc, al_way, al_cc) = \
+        accesses(trace, cache)
+    name = "ID"[cache] + "$"
+    if len(cyc) == 0:
+        print("%s: no accesses" % name)
+        return True
+
+    # The recorded cycle_count should be the cycle-derived one; if it isn't,
+    # replays of other configurations (which can't use the recorded values)
+    # would be skewed.
+    exp_cc = (al_cyc.astype(np.int64) - CC_RESET_TICKS) % RTL_WAYS
+    cc_bad = np.count_nonzero(exp_cc != al_cc % RTL_WAYS)
+
+    (m, hits) = run(cyc, addr, req, cancelled, RTL_SIZE, RTL_WAYS, RTL_LINE,
+                    'rtl', al_cc)
+    cached = (req >= C_REQ_C_READ) & (req <= C_REQ_C_WRITE)
+    diff = np.nonzero(cached & (hits != rtl_hit))[0]
+    # A fill still in progress when the trace ends has no RTL allocation:
+    # the model's allocations at lookups after the RTL's last one.
+    last = al_cyc[-1] if len(al_cyc) else -1
+    unfinished = sum(1 for c in m.alloc_cycles if c > last)
+    nways = min(len(m.alloc_ways), len(al_way))
+    way_diff = np.count_nonzero(np.array(m.alloc_ways[:nways]) !=
+                                al_way[:nways])
+
+    print("%s: %d accesses (%d cached, %d cancelled); RTL %d misses, "
+          "model %d misses" %
+          (name, len(cyc), np.count_nonzero(cached),
+           np.count_nonzero(cancelled),
+           np.count_nonzero(cached & ~rtl_hit), m.stats['misses']))
+    print("    %d hit/miss mismatches, %d allocations (RTL %d, %d unfinished), "
+          "%d way mismatches, %d cycle_count mismatches" %
+          (len(diff), m.nallocs, len(al_way), unfinished, way_diff, cc_bad))
+    for i in diff[:10]:
+        print("    cycle %d: %s %08x: RTL %s, model %s" %
+              (cyc[i], mr_trace.C_REQ_NAMES[req[i]], addr[i],
+               "hit" if rtl_hit[i] else "miss", "hit" if hits[i] else "miss"))
+    return len(diff) == 0 and way_diff == 0 and m.nallocs - unfinished == len(al_way)
+
+
+def usage():
+    print("Syntax:\n\t %s [options] <cache trace>\n" % sys.argv[0])
+    print("\t-v\t\tValidate the model against the RTL's hits/allocations")
+    print("\t-c i|d|id\tCache(s) to model (default id)")
+    print("\t-s <sizes>\tComma-separated sizes, e.g. 8k,16k (default 16k)")
+    print("\t-w <ways>\tComma-separated associativities (default 4)")
+    print("\t-l <lines>\tComma-separated line sizes in bytes (default 32)")
+    print("\t-p <policies>\tComma-separated of %s (default rtl)" % "/".join(POLICIES))
+    print("\t-j <n>\t\tParallel jobs for sweeps (default: CPU count)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "vc:s:w:l:p:j:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    do_validate = False
+    caches = [mr_trace.CACHE_I, mr_trace.CACHE_D]
+    sizes = [RTL_SIZE]
+    ways = [RTL_WAYS]
+    lines = [RTL_LINE]
+    policies = ['rtl']
+    jobs = None
+    for (o, a) in opts:
+        if o == '-v':
+            do_validate = True
+        elif o == '-c':
+            caches = [{'i': mr_trace.CACHE_I, 'd': mr_trace.CACHE_D}[c]
+                      for c in a.lower()]
+        elif o == '-s':
+            sizes = [parse_size(x) for x in a.split(',')]
+        elif o == '-w':
+            ways = [int(x, 0) for x in a.split(',')]
+        elif o == '-l':
+            lines = [int(x, 0) for x in a.split(',')]
+        elif o == '-p':
+            policies = a.split(',')
+            if any(p not in POLICIES for p in policies):
+                usage()
+        elif o == '-j':
+            jobs = int(a, 0)
+        else:
+            usage()
+    if len(args) != 1:
+        usage()
+
+    trace = np.asarray(mr_trace.read_cache_trace(args[0]))
+
+    if do_validate:
+        ok = True
+        for c in caches:
+            ok = validate(trace, c) and ok
+        sys.exit(0 if ok else 1)
+
+    for c in caches:
+        _sweep_acc[c] = accesses(trace, c)
+    cfgs = list(itertools.product(caches, sizes, ways, lines, policies))
+
+    if len(cfgs) > 1 and jobs != 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_sweep_one, cfgs)
+    else:
+        results = [_sweep_one(cfg) for cfg in cfgs]
+
+    print_stats_header()
+    for (cfg, st) in results:
+        if st is None:
+            print("%-2s %8d %4d %4d %-6s  (bad geometry)" %
+                  (("ID"[cfg[0]],) + cfg[1:]))
+        else:
+            print_stats(*cfg, st)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+#
+# Coverage-driven regression selection:  from per-test coverage, a minimal
+# subset of the tests with the same coverage, and a "smoke" ordering that
+# reaches the most coverage per simulated cycle, for a quick pre-merge run:
+#
+#   ./tools/cov_select.py -r -d cov/                    # Run bench/suite.txt
+#   ./tools/cov_select.py -r -d cov/ -s regress.txt -j 8
+#   ./tools/cov_select.py cov/*.cov                     # Minimal set & order
+#   ./tools/cov_select.py -B 5000000 -o smoke.txt cov/*.cov
+#
+# -r runs each workload of a suite file (bench.py's format:  name, image, max
+# cycles, description) with "Vwrapper_top -V", in parallel, writing
+# <dir>/<name>.cov.  Otherwise the arguments are coverage files, one per
+# test, named <test>.cov (see tools/coverage.py).
+#
+# A test's coverage is the set of features it hits at least -k times (default
+# 1):  decoder leaves (one per decoded PPC.csv row, plus "not decoded"),
+# pipeline corners, fault types and perf counter events.  Its cost is the
+# cycles it simulated.
+#
+# - The minimal subset is a greedy set cover (each step takes the test
+#   adding the most uncovered features, cheapest first on a tie), then
+#   pruned of any test whose features the others all cover, costliest first.
+# - The smoke ordering is greedy on new features per cycle, so its prefix
+#   at any cycle budget (-B) is a good quick run; each step shows the
+#   cumulative coverage and cycles.
+#
+# Features only one test covers are listed (the tests that can't be
+# dropped).  -o writes the smoke tests (within -B), or with -m the minimal
+# set, as a suite file:  the suite's lines for them if -s gives it, otherwise
+# their names.  The full suite remains the nightly run.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+import bench
+import coverage
+import mr_trace
+
+COV_EXT = '.cov'
+
+
+################################################################################
+# Collecting
+
+def run_one(args):
+    """Runs a workload with coverage; returns an error string or None"""
+    (exe, w, path) = args
+    cmd = [exe, '-V', path]
+    if w.max_cycles:
+        cmd += ['-n', str(w.max_cycles)]
+    cmd.append('+INPUT_FILE=' + w.image)
+    try:
+        bench.run_sim(cmd, "%s: simulation" % w.name)
+    except RuntimeError as e:
+        return str(e)
+    return None
+
+
+def collect(suite, exe, out_dir, jobs):
+    os.makedirs(out_dir, exist_ok=True)
+    work = [(exe, w, os.path.join(out_dir, w.name + COV_EXT)) for w in suite
+            if os.path.isfile(w.image)]
+    for w in suite:
+        if not os.path.isfile(w.image):
+            print("%s: no image %s, skipped" % (w.name, w.image))
+    failed = 0
+    with multiprocessing.Pool(jobs) as pool:
+        for (args, err) in zip(work, pool.imap(run_one, work)):
+            if err:
+                print(err)
+                failed += 1
+            else:
+                print("%-20s %s" % (args[1].name, args[2]))
+    return failed
+
+
+################################################################################
+# Selecting
+
+def features(cov, min_hits):
+    """(names, hit) for a coverage dict:  every feature, and whether the run
+    hit it min_hits times"""
+    names = []
+    for l in cov['leaves']:
+        names.append('leaf:%s' % l['name'].decode() +
+                     ('#%d' % l['csv_row'] if l['csv_row'] >= 0 else ''))
+    names += ['corner:%s' % n for n in cov['corner_names']]
+    names += ['fault:%s' % n for n in coverage.FAULT_NAMES[:len(cov['faults'])]]
+    names += ['pctr:%s' % n for n in mr_trace.PCTR_NAMES[:len(cov['pctrs'])]]
+    names += ['pctr:%d' % i for i in range(len(mr_trace.PCTR_NAMES), len(cov['pctrs']))]
+    counts = np.concatenate([cov['leaf_counts'], cov['corners'], cov['faults'], cov['pctrs']])
+    hit = counts >= min_hits
+    # The "none" fault code isn't a fault:
+    hit[len(cov['leaves']) + len(cov['corners'])] = False
+    return (names, hit)
+
+
+def load_tests(paths, min_hits):
+    """Returns (test names, feature names, hit matrix [test, feature],
+    cycles per test)"""
+    (tests, rows, cycles) = ([], [], [])
+    fnames = None
+    for p in paths:
+        cov = mr_trace.read_coverage(p)
+        (names, hit) = features(cov, min_hits)
+        if fnames is None:
+            fnames = names
+        elif names != fnames:
+            raise ValueError("%s: coverage from a different build" % p)
+        tests.append(os.path.basename(p)[:-len(COV_EXT)] if p.endswith(COV_EXT)
+                     else os.path.basename(p))
+        rows.append(hit)
+        cycles.append(max(1, int(cov['hdr']['cycles'])))
+    return (tests, fnames, np.array(rows, dtype=bool), np.array(cycles, dtype=np.int64))
+
+
+def minimal_set(hit, cycles):
+    """Greedy set cover of everything hit, then redundant tests pruned"""
+    need = hit.any(axis=0)
+    chosen = []
+    while need.any():
+        gain = (hit & need).sum(axis=1)
+        best = max(range(len(gain)), key=lambda t: (gain[t], -cycles[t]))
+        chosen.append(best)
+        need &= ~hit[best]
+    for t in sorted(chosen, key=lambda t: -cycles[t]):
+        others = [o for o in chosen if o != t]
+        if others and not (hit[t] & ~hit[others].any(axis=0)).any():
+            chosen = others
+    return chosen
+
+
+def smoke_order(hit, cycles):
+    """Greedy on new features per cycle; tests adding nothing come last,
+    cheapest first"""
+    need = hit.any(axis=0)
+    left = list(range(len(cycles)))
+    order = []
+    while left and need.any():
+        best = max(left, key=lambda t: ((hit[t] & need).sum() / float(cycles[t]), -cycles[t]))
+        if not (hit[best] & need).any():
+            break
+        order.append(best)
+        left.remove(best)
+        need &= ~hit[best]
+    return order + sorted(left, key=lambda t: cycles[t])
+
+
+def report(tests, fnames, hit, cycles, budget):
+    total = hit.any(axis=0)
+    ntotal = int(total.sum())
+    print("%d tests, %d cycles; %d of %d features covered" %
+          (len(tests), cycles.sum(), ntotal, len(fnames)))
+
+    chosen = minimal_set(hit, cycles)
+    print("\nMinimal set:  %d tests, %d cycles (%.1f%% of the suite's)" %
+          (len(chosen), cycles[chosen].sum(), 100.0 * cycles[chosen].sum() / cycles.sum()))
+    for t in sorted(chosen, key=lambda t: cycles[t]):
+        print("  %-24s %12d cycles %5d features" % (tests[t], cycles[t], hit[t].sum()))
+
+    order = smoke_order(hit, cycles)
+    print("\nSmoke ordering:")
+    print("  %-24s %12s %12s %9s" % ('Test', 'Cycles', 'Cumulative', 'Coverage'))
+    have = np.zeros(len(fnames), dtype=bool)
+    cum = 0
+    for t in order:
+        cum += cycles[t]
+        have |= hit[t]
+        print("  %-24s %12d %12d %8.1f%%%s" %
+              (tests[t], cycles[t], cum, 100.0 * have.sum() / max(1, ntotal),
+               '' if not budget or cum <= budget else '   (over budget)'))
+
+    uniq = (hit.sum(axis=0) == 1)
+    if uniq.any():
+        print("\nCovered by one test only:")
+        for t in range(len(tests)):
+            f = [fnames[i] for i in np.nonzero(uniq & hit[t])[0]]
+            if f:
+                print("  %-24s %s" % (tests[t], ' '.join(f)))
+    return (chosen, order)
+
+
+def within(order, cycles, budget):
+    if not budget:
+        return order
+    (out, cum) = ([], 0)
+    for t in order:
+        if cum + cycles[t] > budget and out:
+            break
+        cum += cycles[t]
+        out.append(t)
+    return out
+
+
+def write_selection(path, names, suite_path):
+    """The selected tests as a suite file:  the suite's own lines, if known"""
+    lines = dict()
+    if suite_path:
+        with open(suite_path, 'r') as f:
+            for l in f:
+                p = l.split()
+                if p and not p[0].startswith('#'):
+                    lines[p[0]] = l.rstrip('\n')
+    with open(path, 'w') as f:
+        f.write("# Selected by cov_select.py; one test per line, in order\n")
+        for n in names:
+            f.write(lines.get(n, n) + '\n')
+
+
+def usage():
+    print("Syntax:\n\t %s -r -d <coverage dir> [-s <suite>] [-e <exe>] [-j <jobs>]\n"
+          "\t %s [-k <min hits>] [-B <smoke cycle budget>] [-o <output suite> [-m]] "
+          "[-s <suite>] <test>.cov [...]" % (sys.argv[0], sys.argv[0]))
+    print("\t-r:  Run the suite (default %s) with coverage, into -d" %
+          os.path.relpath(bench.SUITE_PATH))
+    print("\t-o:  Write the smoke tests (within -B), or with -m the minimal set")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    do_run = False
+    out_dir = None
+    suite_path = None
+    exe = bench.EXE_PATH
+    jobs = None
+    min_hits = 1
+    budget = 0
+    out = None
+    out_minimal = False
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "rd:s:e:j:k:B:o:mh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    for (o, a) in opts:
+        if o == '-r':
+            do_run = True
+        elif o == '-d':
+            out_dir = a
+        elif o == '-s':
+            suite_path = a
+        elif o == '-e':
+            exe = a
+        elif o == '-j':
+            jobs = int(a)
+        elif o == '-k':
+            min_hits = int(a)
+        elif o == '-B':
+            budget = int(float(a))
+        elif o == '-o':
+            out = a
+        elif o == '-m':
+            out_minimal = True
+        else:
+            usage()
+
+    if do_run:
+        if not out_dir or args:
+            usage()
+        if not os.path.isfile(exe):
+            print("No %s; make verilate_tb_top first" % exe)
+            sys.exit(1)
+        try:
+            suite = bench.read_suite(suite_path or bench.SUITE_PATH)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(1 if collect(suite, exe, out_dir, jobs) else 0)
+
+    if not args:
+        usage()
+    try:
+        (tests, fnames, hit, cycles) = load_tests(args, min_hits)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    (chosen, order) = report(tests, fnames, hit, cycles, budget)
+    if out:
+        sel = chosen if out_minimal else within(order, cycles, budget)
+        write_selection(out, [tests[t] for t in sel], suite_path)
+        print("\nWrote %d tests to %s" % (len(sel), out))
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+#
+# Merges decode/pipeline-corner coverage counters from simulation runs, and
+# reports them against tools/PPC.csv:
+#
+#   ./verilator/obj_dir/Vwrapper_top -V /dev/shm/cov.test1 +INPUT_FILE=...
+#   ./tools/coverage.py /dev/shm/cov.*                 # Report
+#   ./tools/coverage.py -o regress.cov /dev/shm/cov.*  # ...and save the sum
+#   ./tools/coverage.py -l regress.cov                 # Every row's count
+#
+# "Vwrapper_top -V" (verilator/coverage.h) counts each decoder leaf reached
+# at WB (one per PPC.csv row the RTL decodes, from the same tree mk_decode.py
+# generates the decoder from), faults by type, the corners of
+# docs/test_plan.txt (faults in branch/isync shadows, exceptions at page
+# ends, stores squashed behind faults and taken branches, ...) and perf
+# counter events, into a shared-memory file.  Run in parallel, each run
+# writes its own; this sums any number of them (or of earlier sums, -o) and
+# reports:
+#
+# - The CSV rows, by class, that the RTL decodes and the runs executed; and
+#   a list of those never executed.  Rows the RTL doesn't decode (ISS-only,
+#   Subdec=0; no opcode; or shadowed by an earlier match) are listed with
+#   -a.
+# - Hits of the "not decoded" leaf (illegal instructions executed).
+# - Each corner's and fault type's count, and perf events never seen.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import csv
+import getopt
+import os
+import sys
+
+import numpy as np
+
+import mr_trace
+
+TOP = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+CSV_PATH = os.path.join(TOP, 'tools', 'PPC.csv')
+
+# include/decode_enums.vh FC_*
+FAULT_NAMES = ['none', 'irq', 'dec', 'prog_ill', 'sc', 'fp', 'prog_trap', 'mem_align',
+               'isi_tf', 'isi_pf', 'isi_nx', 'prog_priv',
+               'dsi_tf_r', 'dsi_tf_w', 'dsi_pf_r', 'dsi_pf_w']
+
+
+def read_csv_rows(path=CSV_PATH):
+    """PPC.csv's data rows, indexed as mk_decode.py does (blank lines
+    skipped), so a leaf's csv_row indexes this list."""
+    with open(path, 'r') as f:
+        return list(csv.DictReader(l for l in f if l.rstrip() != ''))
+
+
+def merge(covs):
+    """Sums coverage dicts (from mr_trace.read_coverage); their leaf and
+    corner tables must match."""
+    m = None
+    for c in covs:
+        if m is None:
+            m = dict((k, v.copy() if hasattr(v, 'copy') else v) for k, v in c.items())
+            continue
+        if not np.array_equal(c['leaves'], m['leaves']) or \
+           c['corner_names'] != m['corner_names'] or \
+           len(c['faults']) != len(m['faults']) or len(c['pctrs']) != len(m['pctrs']):
+            raise ValueError("Coverage from different builds (decoder leaves or corners differ)")
+        for k in ('runs', 'cycles', 'records'):
+            m['hdr'][k] += c['hdr'][k]
+        for k in ('leaf_counts', 'corners', 'faults', 'pctrs'):
+            m[k] += c[k]
+    return m
+
+
+def load(paths):
+    return merge(mr_trace.read_coverage(p) for p in paths)
+
+
+def write(path, cov):
+    """Writes a coverage dict in Vwrapper_top -V's format"""
+    nl = cov['hdr']['name_len']
+    with open(path, 'wb') as f:
+        f.write(cov['hdr'].tobytes())
+        f.write(cov['leaves'].tobytes())
+        f.write(np.array([n.encode() for n in cov['corner_names']], dtype='S%d' % nl).tobytes())
+        for k in ('leaf_counts', 'corners', 'faults', 'pctrs'):
+            f.write(cov[k].astype('<u8').tobytes())
+
+
+def row_counts(cov, nrows):
+    """Executions of each CSV row (-1 for rows with no decoder leaf)"""
+    counts = np.full(nrows, -1, dtype=np.int64)
+    for leaf, n in zip(cov['leaves'], cov['leaf_counts']):
+        r = int(leaf['csv_row'])
+        if r >= 0:
+            counts[r] = max(counts[r], 0) + int(n)
+    return counts
+
+
+def describe(row):
+    s = "op %s" % row['Opcode']
+    if row['XO']:
+        s += "/%s" % row['XO']
+    if row['Subdec'] == '1':
+        s += (" BO %s" % row['BO']) if row['BO'] else (" spr %s" % row['spr'])
+    return s
+
+
+def not_decoded_reason(row):
+    if row['Subdec'] == '0':
+        return "ISS-only (Subdec 0)"
+    if row['Form'] == '' or row['Opcode'] == '':
+        return "no opcode"
+    return "shadowed by an earlier decode"
+
+
+def report(cov, rows, list_all, show_undecoded):
+    hdr = cov['hdr']
+    counts = row_counts(cov, len(rows))
+    named = [i for i, r in enumerate(rows) if r['Name'] != '']
+    decoded = [i for i in named if counts[i] >= 0]
+    hit = [i for i in decoded if counts[i] > 0]
+
+    print("%d runs, %d cycles, %d records at WB" % (hdr['runs'], hdr['cycles'], hdr['records']))
+    print("PPC.csv:  %d rows; %d decoded by the RTL, %d executed (%.1f%%), %d never executed" %
+          (len(named), len(decoded), len(hit), 100.0 * len(hit) / max(1, len(decoded)),
+           len(decoded) - len(hit)))
+    if cov['leaf_counts'][0]:
+        print("Undecoded (illegal) instructions executed:  %d" % cov['leaf_counts'][0])
+
+    classes = sorted(set(rows[i]['Class'] or '(none)' for i in decoded))
+    print("\n%-12s %6s %6s %7s" % ('Class', 'Rows', 'Hit', '%'))
+    for cl in classes:
+        d = [i for i in decoded if (rows[i]['Class'] or '(none)') == cl]
+        h = [i for i in d if counts[i] > 0]
+        print("%-12s %6d %6d %6.1f%%" % (cl, len(d), len(h), 100.0 * len(h) / len(d)))
+
+    if list_all:
+        print("\n%5s %-16s %-12s %-24s %12s" % ('Row', 'Name', 'Class', 'Decode', 'Count'))
+        for i in decoded:
+            print("%5d %-16s %-12s %-24s %12d" % (i, rows[i]['Name'], rows[i]['Class'],
+                                                  describe(rows[i]), counts[i]))
+    else:
+        print("\nNever executed:")
+        for i in decoded:
+            if counts[i] == 0:
+                print("  %5d %-16s %-12s %s" % (i, rows[i]['Name'], rows[i]['Class'],
+                                                describe(rows[i])))
+
+    if show_undecoded:
+        print("\nNot decoded by the RTL:")
+        for i in named:
+            if counts[i] < 0:
+                print("  %5d %-16s %s" % (i, rows[i]['Name'], not_decoded_reason(rows[i])))
+
+    print("\nCorners:")
+    for name, n in zip(cov['corner_names'], cov['corners']):
+        print("  %-24s %10d%s" % (name, n, '' if n else '   <-- never'))
+
+    print("\nFaults:")
+    for code, n in enumerate(cov['faults']):
+        if code:
+            print("  %-24s %10d%s" % (FAULT_NAMES[code] if code < len(FAULT_NAMES) else code,
+                                      n, '' if n else '   <-- never'))
+
+    never = [mr_trace.PCTR_NAMES[i] for i, n in enumerate(cov['pctrs'])
+             if n == 0 and i < len(mr_trace.PCTR_NAMES)]
+    print("\nPerf events never active:  %s" % (', '.join(never) if never else 'none'))
+
+
+def usage():
+    print("Syntax:\n\t %s [-o <merged output>] [-c <PPC.csv>] [-l] [-a] [-q] "
+          "<coverage file> [...]" % sys.argv[0])
+    print("\t-o:  Write the summed counters, as a coverage file")
+    print("\t-l:  List every decoded row's count")
+    print("\t-a:  Also list the rows the RTL doesn't decode")
+    print("\t-q:  No report (just merge)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    out = None
+    csv_path = CSV_PATH
+    list_all = False
+    show_undecoded = False
+    quiet = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:c:laqh')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    for o, a in opts:
+        if o == '-o':
+            out = a
+        elif o == '-c':
+            csv_path = a
+        elif o == '-l':
+            list_all = True
+        elif o == '-a':
+            show_undecoded = True
+        elif o == '-q':
+            quiet = True
+        else:
+            usage()
+
+    if not args:
+        usage()
+
+    try:
+        cov = load(args)
+        rows = read_csv_rows(csv_path)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    if out:
+        write(out, cov)
+    if not quiet:
+        report(cov, rows, list_all, show_undecoded)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+#
+# Static pipeline-hazard analysis of a workload's text, to see where MR's
+# in-order pipeline will stall (and try out code changes) without running the
+# RTL:
+#
+#   ./tools/hazard_analyse.py workload.elf
+#   ./tools/hazard_analyse.py -f memcpy -f strlen workload.elf
+#   ./tools/hazard_analyse.py -c commit.trace -n 20 workload.elf
+#
+# Instructions are decoded with tools/PPC.csv (via mr_isa.py), using its
+# In/InImpl/Out/OutImpl/Lock columns for what each instruction reads and
+# writes.  Within each basic block, every operand is chained to its producer
+# and the issue cycle of each instruction from DE is estimated:
+#
+#   operands    GPR/XERCR RAW on a value not yet bypassable:  load data is
+#               forwarded from WB (2-cycle load-to-use), as are R1 results
+#               (mfcr, mfmsr, mfxer).  EXE results bypass for free.
+#   spr         LR/CTR/SPRGn don't bypass:  reads (and writes) wait until the
+#               producer has written back.
+#   lock        An instruction using the generic lock (Lock=1:  most SPRs,
+#               SRs) holds up everything behind it until it reaches WB.
+#   mul         2-cycle multiply occupies EXE for an extra cycle.
+#   div         The iterative divider occupies EXE for ~35 cycles.
+#
+# The first three are what the pctr_de_stall_operands event counts; mul/div
+# are exe_stall.  The model assumes no cache/TLB misses, and that nothing is
+# in flight at the start of a block following a branch (it carries state
+# through straight-line code, so fall-through into a branch target is
+# modelled).  lmw/stmw are cracked into one access per cycle.
+#
+# Output is a per-function stall table, i.e. a heatmap by category; with -f,
+# an annotated listing of the function with a bar per instruction.  By default
+# every static instruction counts once; with -c, stalls are weighted by how
+# many times each instruction committed in a trace.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+import mr_elf
+import mr_isa
+import mr_trace
+from mr_isa import AVAIL_EXE, AVAIL_WB, AVAIL_REGFILE, EXE_MUL, EXE_DIV, \
+    NR_RES, R_LR
+
+
+# Cycles from a producer issuing from DE until a consumer can issue, by where
+# the result is available:  EXE bypass is same-cycle; WB is 3 stages on (the
+# WB->DE shortcut); the regfile is read the cycle after WB.
+AVAIL_LATENCY = {AVAIL_EXE: 1, AVAIL_WB: 3, AVAIL_REGFILE: 4}
+
+# Cycles in EXE (see execute.v/execute_divide.v:  IDLE, 33 BUSY, DONE)
+EXE_CYCLES = {mr_isa.EXE_SINGLE: 1, EXE_MUL: 2, EXE_DIV: 35}
+
+CAT_OPERANDS = 0
+CAT_SPR = 1
+CAT_LOCK = 2
+CAT_MUL = 3
+CAT_DIV = 4
+CATS = ['operands', 'spr', 'lock', 'mul', 'div']
+
+BAR_WIDTH = 40
+
+
+################################################################################
+
+def block_starts(addrs, insns, sym_addrs):
+    """Returns a bool per instruction:  True where in-flight state is reset,
+    i.e. after anything ending a basic block and at function entry."""
+    n = len(insns)
+    start = np.zeros(n, dtype=bool)
+    if n:
+        start[0] = True
+    ends = np.array([i is not None and i.ends_block for i in insns], dtype=bool)
+    start[1:] |= ends[:-1]
+    start |= np.isin(addrs, sym_addrs)
+    return start
+
+
+def analyse(insns, starts):
+    """Estimates DE issue stalls for a sequence of instructions.
+
+    Returns (stall, cat, cycles) arrays:  the stall cycles before each
+    instruction issues, the category of the constraint that bound it, and
+    the cycles it occupies DE for (stall plus its issue cycles).
+    """
+    n = len(insns)
+    stall = np.zeros(n, dtype=np.int64)
+    cat = np.zeros(n, dtype=np.int8)
+    cycles = np.zeros(n, dtype=np.int64)
+
+    t = -1
+    for (j, i) in enumerate(insns):
+        if starts[j]:
+            ready = [0] * NR_RES
+            ready_cat = [CAT_OPERANDS] * NR_RES
+            exe_free = 0
+            exe_cat = CAT_MUL
+            lock_until = 0
+
+        base = t + 1
+        if i is None:
+            t = base
+            cycles[j] = 1
+            continue
+
+        # Sub-ops:  lmw/stmw issue one register per cycle.
+        if i.multiple:
+            addr_reads = [r for r in i.reads if r not in i.multiple]
+            ops = []
+            for (k, r) in enumerate(i.multiple):
+                reads = addr_reads if k == 0 else []
+                if i.writes:
+                    ops.append((reads, [i.writes[k]]))
+                else:
+                    ops.append((reads + [r], []))
+        else:
+            ops = [(i.reads, i.writes)]
+
+        first = base
+        exe = EXE_CYCLES[i.exe]
+        for (reads, writes) in ops:
+            need = base
+            c = CAT_OPERANDS
+            # Non-bypassed SPRs also stall for WAW.
+            for r in reads + [r for (r, a) in writes if a == AVAIL_REGFILE]:
+                if ready[r] > need:
+                    need = ready[r]
+                    c = ready_cat[r]
+            if exe_free > need:
+                need = exe_free
+                c = exe_cat
+            if lock_until > need:
+                need = lock_until
+                c = CAT_LOCK
+            if need > base:
+                if need - base > stall[j] or stall[j] == 0:
+                    cat[j] = c
+                stall[j] += need - base
+
+            for (r, a) in writes:
+                ready[r] = need + exe - 1 + AVAIL_LATENCY[a]
+                if a == AVAIL_EXE and i.exe != mr_isa.EXE_SINGLE:
+                    ready_cat[r] = CAT_MUL if i.exe == EXE_MUL else CAT_DIV
+                elif r >= R_LR:
+                    ready_cat[r] = CAT_SPR
+                else:
+                    ready_cat[r] = CAT_OPERANDS
+            t = need
+            base = need + 1
+
+        if exe > 1:
+            exe_free = t + exe
+            exe_cat = CAT_MUL if i.exe == EXE_MUL else CAT_DIV
+        if i.genlock:
+            lock_until = t + exe - 1 + AVAIL_LATENCY[AVAIL_REGFILE]
+        cycles[j] = t - first + 1
+    return (stall, cat, cycles)
+
+
+def commit_counts(path, addrs):
+    """Returns the number of times each address committed in a trace."""
+    t = mr_trace.read_commit_trace(path, commits_only=True)
+    (pcs, counts) = np.unique(np.asarray(t['pc']), return_counts=True)
+    if len(pcs) == 0:
+        return np.zeros(len(addrs), dtype=np.int64)
+    idx = np.minimum(np.searchsorted(pcs, addrs), len(pcs) - 1)
+    return np.where(pcs[idx] == addrs, counts[idx], 0)
+
+
+def function_table(elf, funcs, weight, stall, cat, cycles, top):
+    """Prints stall cycles per function, split by category."""
+    nf = len(elf.sym_names) + 1
+    fid = np.where(funcs < 0, nf - 1, funcs)
+    w_cycles = np.bincount(fid, weights=weight * cycles, minlength=nf)
+    w_instrs = np.bincount(fid, weights=weight, minlength=nf)
+    by_cat = np.zeros((nf, len(CATS)))
+    for c in range(len(CATS)):
+        by_cat[:, c] = np.bincount(fid, weights=weight * stall * (cat == c),
+                                   minlength=nf)
+    total = by_cat.sum(axis=1)
+    order = np.argsort(-total, kind='stable')
+    grand = total.sum()
+
+    print("%-32s %10s %10s %7s %6s " % ("Function", "Instrs", "Cycles",
+                                        "Stall%", "Share") +
+          " ".join("%9s" % c for c in CATS))
+    for f in order[:top]:
+        if total[f] == 0:
+            break
+        name = elf.sym_names[f] if f < nf - 1 else "(unknown)"
+        print("%-32s %10d %10d %6.1f%% %5.1f%% " %
+              (name[:32], w_instrs[f], w_cycles[f],
+               100.0 * total[f] / max(w_cycles[f], 1),
+               100.0 * total[f] / max(grand, 1)) +
+              " ".join("%9d" % v for v in by_cat[f]))
+    print("%-32s %10d %10d %6.1f%% %6s " %
+          ("Total", w_instrs.sum(), w_cycles.sum(),
+           100.0 * grand / max(w_cycles.sum(), 1), "") +
+          " ".join("%9d" % v for v in by_cat.sum(axis=0)))
+
+
+def listing(name, sel, addrs, words, insns, weight, stall, cat, traced):
+    """Prints an annotated listing of one function, with a bar per instruction
+    proportional to its (weighted) stall cycles."""
+    w_stall = weight[sel] * stall[sel]
+    scale = BAR_WIDTH / max(w_stall.max(), 1) if len(w_stall) else 0
+    print("\n%s:" % name)
+    for (j, ws) in zip(np.flatnonzero(sel), w_stall):
+        i = insns[j]
+        if i is None:
+            desc = ".long"
+        else:
+            desc = "%-8s %s <- %s" % (i.name,
+                                      ",".join(mr_isa.RES_NAMES[r] for (r, _) in i.writes) or "-",
+                                      ",".join(mr_isa.RES_NAMES[r] for r in i.reads) or "-")
+        count = ("%10d " % weight[j]) if traced else ""
+        st = ("%3d %-8s" % (stall[j], CATS[cat[j]])) if stall[j] else (" " * 12)
+        print("  %08x %08x  %-40s %s%s %s" % (addrs[j], words[j], desc[:40],
+                                              count, st, "#" * int(round(ws * scale))))
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options] <elf>\n" % sys.argv[0])
+    print("\t-c <file>\tWeight by commit counts from a commit trace")
+    print("\t-f <name>\tList function <name> with per-instruction stalls (repeatable)")
+    print("\t-n <n>\t\tNumber of functions to report (default 30)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "c:f:n:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    trace = None
+    list_funcs = []
+    top = 30
+    for (o, a) in opts:
+        if o == '-c':
+            trace = a
+        elif o == '-f':
+            list_funcs.append(a)
+        elif o == '-n':
+            top = int(a, 0)
+        else:
+            usage()
+    if len(args) != 1:
+        usage()
+
+    elf = mr_elf.ELF(args[0])
+    isa = mr_isa.ISA()
+
+    all_addrs = []
+    all_words = []
+    all_insns = []
+    parts = []
+    for s in elf.text_sections():
+        (addrs, words) = elf.text_words(s)
+        insns = [isa.decode(w) for w in words]
+        starts = block_starts(addrs, insns, elf.sym_addrs)
+        parts.append(analyse(insns, starts))
+        all_addrs.append(addrs)
+        all_words.append(words)
+        all_insns += insns
+    if not parts:
+        print("No text sections!")
+        sys.exit(1)
+
+    addrs = np.concatenate(all_addrs)
+    words = np.concatenate(all_words)
+    stall = np.concatenate([p[0] for p in parts])
+    cat = np.concatenate([p[1] for p in parts])
+    cycles = np.concatenate([p[2] for p in parts])
+    (funcs, _) = elf.symbolise(addrs)
+
+    if trace:
+        weight = commit_counts(trace, addrs).astype(np.float64)
+        print("Weighted by commits in %s (%d of %d text instructions executed)\n" %
+              (trace, np.count_nonzero(weight), len(weight)))
+    else:
+        weight = np.ones(len(addrs))
+        print("Static:  each instruction counted once\n")
+
+    function_table(elf, funcs, weight, stall, cat, cycles, top)
+
+    for name in list_funcs:
+        if name not in elf.sym_names:
+            print("\nNo function '%s'" % name)
+            continue
+        sel = funcs == elf.sym_names.index(name)
+        listing(name, sel, addrs, words, all_insns, weight, stall, cat,
+                trace is not None)
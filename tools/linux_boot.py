@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+#
+# Linux boot benchmark:  boots a kernel (and initramfs) on the Verilator
+# build to a console string, timestamps the console output in simulated
+# cycles, and splits the boot into phases by its messages, with the perf
+# counter events of each:
+#
+#   ./tools/linux_boot.py -k bench/linux.hex               # To the shell prompt
+#   ./tools/linux_boot.py -k zImage.bin -i rootfs.cpio.gz -x 'login: '
+#   ./tools/linux_boot.py -r -k bench/linux.hex            # Record & check
+#   ./tools/linux_boot.py -r -c v1.0 -k bench/linux.hex    # ...against v1.0
+#   ./tools/linux_boot.py -l boot.log                      # Report a saved log
+#
+# The kernel is a $readmemh image, or a raw binary loaded at -K (default 0);
+# an initramfs (-i) is loaded at -I (default 0x1000000), where the kernel's
+# device tree or command line must say it is.  Unless an executable is given
+# (-e), a build with the RAM size for Linux (-m, log2 bytes, default 32MB) and
+# without tracing is made with tools/vbuild.py.  It runs with
+# "Vwrapper_top -L <log> -x <target>" (verilator/boot_log.h), which logs each
+# console line with the cycle and the perf counter totals at its newline, and
+# stops once the console output ends with the target (default a shell prompt,
+# '/ # ').
+#
+# The phases start at the first console line matching their marker, after
+# the previous phase's; the first starts at reset.  The defaults:
+#
+#   decompress     Reset; the boot wrapper decompressing the kernel
+#   early_mmu      Wrapper handoff:  head_32.S, MMU_init, early setup
+#   core_init      "Linux version":  start_kernel (memory, scheduler, timers)
+#   driver_init    "devtmpfs: initialized":  the initcalls
+#   userspace      "Run /init", "Freeing unused kernel":  init to the target
+#
+# or from a file (-p) of "<name> <regex>" lines, the first phase's regex being
+# ignored.  A phase whose marker never appears is folded into the one before.
+#
+# -r records the whole boot and each phase as workloads "boot" and
+# "boot:<phase>" in tools/bench.py's results database, keyed by revision
+# as bench.py's runs are, so bench.py -t tracks them with the suite, and
+# compares them against a baseline revision's (-c, default as bench.py's).
+# The console digest of each phase has printk timestamps and numbers removed,
+# so only a change in its messages (a panic, a missing driver) fails the
+# check; not reaching the target is an exit status of 1.  Host speeds are
+# the run's mean, apportioned by cycles.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import hashlib
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import bench
+import mr_hex
+import mr_trace
+
+TARGET = '/ # '
+MAX_CYCLES = 2000000000
+MEMSIZEL2 = 25
+KERNEL_ADDR = 0
+INITRD_ADDR = 0x1000000
+WORKLOAD = 'boot'
+
+PHASES = [('decompress', None),
+          ('early_mmu', r'Now booting the kernel|flat tree at'),
+          ('core_init', r'Linux version'),
+          ('driver_init', r'devtmpfs: initialized'),
+          ('userspace', r'Run /init|Run \S+ as init process|Freeing unused kernel')]
+
+PRINTK_TIME_RE = re.compile(r'^\[\s*\d+\.\d+\]\s?')
+NUMBER_RE = re.compile(r'(0x)?[0-9a-fA-F]*[0-9][0-9a-fA-F]*')
+TARGET_RE = re.compile(r'^\*\*\* Console target reached', re.M)
+
+
+################################################################################
+# Images and running
+
+def read_phases(path):
+    phases = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            p = line.split(None, 1)
+            if phases and len(p) < 2:
+                raise ValueError("%s: no marker in '%s'" % (path, line))
+            phases.append((p[0], re.compile(p[1]) if phases else None))
+    if not phases:
+        raise ValueError("%s: no phases" % path)
+    return phases
+
+
+def words(path):
+    """A raw binary as big-endian words (padded to a word)"""
+    with open(path, 'rb') as f:
+        b = f.read()
+    b += b'\0' * (-len(b) & 3)
+    return np.frombuffer(b, dtype='>u4').astype(np.uint32)
+
+
+def make_image(out, kernel, kernel_addr, initrd, initrd_addr):
+    segs = [(kernel_addr, words(kernel))]
+    if initrd:
+        if initrd_addr < kernel_addr + 4 * len(segs[0][1]):
+            raise ValueError("The initramfs at 0x%x overlaps the kernel" % initrd_addr)
+        segs.append((initrd_addr, words(initrd)))
+    with open(out, 'wb') as f:
+        f.write(mr_hex.to_hex(segs))
+    return max(a + 4 * len(w) for (a, w) in segs)
+
+
+def build(memsizel2):
+    import vbuild
+
+    cfg = vbuild.Config({'MEMSIZEL2': memsizel2, 'TRACE': 0})
+    err = cfg.check()
+    if err:
+        raise ValueError(err)
+    for r in vbuild.build_matrix([cfg], jobs=1):
+        if not r['ok']:
+            raise RuntimeError("%s: build FAILED, see %s" % (r['label'], r['log']))
+        return r['exe']
+
+
+def run(exe, image, log_path, target, max_cycles):
+    """Boots; returns (target reached, wall seconds, harness output)"""
+    cmd = [exe, '-L', log_path, '-n', str(max_cycles)]
+    if target:
+        cmd += ['-x', target]
+    cmd.append('+INPUT_FILE=' + image)
+    (stdout, _, wall) = bench.run_sim(cmd)
+    return (TARGET_RE.search(stdout) is not None, wall, stdout)
+
+
+################################################################################
+# Phases
+
+def read_boot_log(path):
+    """Returns (pctr names, [(cycle, counts, text)] per console line,
+    (cycle, counts) at the end) from a Vwrapper_top -L log"""
+    names = None
+    lines = []
+    end = None
+    with open(path, 'r', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if line.startswith('# MR boot log:'):
+                names = line.split()[5:]
+                continue
+            if names is None:
+                raise ValueError("%s: not a console log" % path)
+            n = len(names) + 2
+            p = line.split(' ', n)
+            if p[0] not in ('C', 'E') or len(p) < n:
+                raise ValueError("%s: bad line '%s'" % (path, line))
+            counts = np.array([int(x) for x in p[2:n]], dtype=np.int64)
+            if p[0] == 'C':
+                lines.append((int(p[1]), counts, p[n] if len(p) > n else ''))
+            else:
+                end = (int(p[1]), counts)
+    if names is None:
+        raise ValueError("%s: empty console log" % path)
+    if end is None:
+        # The run didn't finish writing it:  end at the last line
+        end = lines[-1][:2] if lines else (0, np.zeros(len(names), dtype=np.int64))
+    return names, lines, end
+
+
+class Phase:
+    def __init__(self, name, start, counts, first):
+        self.name = name
+        self.start = start
+        self.start_counts = counts
+        self.first = first              # Index of its first console line
+        self.lines = []
+
+
+def split(phases, lines, end, nr_events):
+    """The phases found in the console lines, with their lines, cycles and
+    event counts set"""
+    found = [Phase(phases[0][0], 0, np.zeros(nr_events, dtype=np.int64), 0)]
+    i = 0
+    for (name, marker) in phases[1:]:
+        for j in range(i, len(lines)):
+            if marker.search(lines[j][2]):
+                found.append(Phase(name, lines[j][0], lines[j][1], j))
+                i = j + 1
+                break
+    for (p, nxt) in zip(found, found[1:] + [None]):
+        (stop, stop_counts) = (nxt.start, nxt.start_counts) if nxt else end
+        p.lines = [l[2] for l in lines[p.first:nxt.first if nxt else len(lines)]]
+        p.cycles = stop - p.start
+        p.counts = stop_counts - p.start_counts
+    return found
+
+
+def digest(lines):
+    """Hash of a phase's messages, without timestamps or numbers"""
+    h = hashlib.sha1()
+    for l in lines:
+        h.update(NUMBER_RE.sub('#', PRINTK_TIME_RE.sub('', l)).encode() + b'\n')
+    return h.hexdigest()
+
+
+def report(found, names, end, reached, target, show_events):
+    total = end[0]
+    ic = names.index('inst_commit')
+    print("%-14s %14s %14s %6s %14s %8s" %
+          ('Phase', 'Start', 'Cycles', '%', 'Instrs', 'IPC'))
+    for p in found:
+        print("%-14s %14d %14d %5.1f%% %14d %8.4f" %
+              (p.name, p.start, p.cycles, 100.0 * p.cycles / max(total, 1),
+               p.counts[ic], p.counts[ic] / max(p.cycles, 1)))
+    print("%-14s %14s %14d %6s %14d %8.4f" %
+          ('Total', '', total, '', end[1][ic], end[1][ic] / max(total, 1)))
+    if not reached:
+        print("\nTarget %s not reached" % (repr(target) if target else '(none)'))
+
+    if show_events:
+        print("\nEvents per 1000 cycles:")
+        print("%-28s " % 'Event' + ' '.join('%12s' % p.name[:12] for p in found))
+        for (i, n) in enumerate(names):
+            if n == 'inst_commit':
+                continue
+            print("%-28s " % n + ' '.join('%12.2f' % (1000.0 * p.counts[i] / max(p.cycles, 1))
+                                          for p in found))
+
+
+################################################################################
+# Recording
+
+def record(db, found, names, end, reached, wall, image_hash, exe_hash):
+    """Inserts the boot and its phases as bench.py runs"""
+    (rev, dirty, ct, subject) = bench.current_rev()
+    host = platform.node()
+    started = time.time()
+    total = max(end[0], 1)
+    runs = [(WORKLOAD, end[0], end[1], sum((p.lines for p in found), []))]
+    runs += [('%s:%s' % (WORKLOAD, p.name), p.cycles, p.counts, p.lines) for p in found]
+    for (w, cycles, counts, lines) in runs:
+        c = db.execute("INSERT INTO runs (rev, dirty, commit_time, subject, "
+                       "workload, image, exe, host, started, status, output, "
+                       "cycles, instrs, wall) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (rev, dirty, ct, subject, w, image_hash, exe_hash, host,
+                        started, 0 if reached else 1, digest(lines), int(cycles),
+                        int(counts[names.index('inst_commit')]),
+                        max(wall * cycles / total, 1e-6)))
+        db.executemany("INSERT INTO counters (run, name, value) VALUES (?, ?, ?)",
+                       [(c.lastrowid, n, int(v)) for (n, v) in zip(names, counts)])
+    db.commit()
+    return (rev, dirty)
+
+
+def check(db, rev, dirty, base_rev, ipc_thresh):
+    base = bench.resolve(base_rev) if base_rev else bench.find_baseline(db, rev, dirty)
+    if base is None:
+        print("\nNo baseline results to compare against")
+        return 0
+
+    def boot(res):
+        return dict((w, r) for (w, r) in res.items()
+                    if w == WORKLOAD or w.startswith(WORKLOAD + ':'))
+
+    old = boot(bench.load(db, base))
+    if not old:
+        print("\nNo boot results for baseline %s" % bench.label(base, ''))
+        return 0
+    return bench.compare(old, boot(bench.load(db, rev, dirty)),
+                         bench.label(base, ''), bench.label(rev, dirty),
+                         ipc_thresh, bench.SPEED_THRESHOLD, False)
+
+
+def usage():
+    print("Syntax:\n\t %s -k <kernel .hex or binary> [-K <addr>] [-i <initramfs> "
+          "[-I <addr>]]\n\t\t[-x <target>] [-n <max cycles>] [-e <exe> | -m <MEMSIZEL2>] "
+          "[-L <log>] [-p <phase file>]\n\t\t[-r [-c <rev>] [-T <pct>] [-d <db>]] [-E]\n"
+          "\t %s -l <log> [-p <phase file>] [-E]" % (sys.argv[0], sys.argv[0]))
+    print("\t-x:  Console string to stop at (default %s; '' for none)" % repr(TARGET))
+    print("\t-L:  Keep the console log")
+    print("\t-r:  Record in the benchmark database (default %s), and check" %
+          os.path.relpath(bench.DB_PATH))
+    print("\t-E:  No per-phase event rates")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    kernel = None
+    kernel_addr = KERNEL_ADDR
+    initrd = None
+    initrd_addr = INITRD_ADDR
+    target = TARGET
+    max_cycles = MAX_CYCLES
+    exe = None
+    memsizel2 = MEMSIZEL2
+    keep_log = None
+    phases = [(n, re.compile(r) if r else None) for (n, r) in PHASES]
+    do_record = False
+    base_rev = None
+    ipc_thresh = bench.IPC_THRESHOLD
+    db_path = bench.DB_PATH
+    log_in = None
+    show_events = True
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'k:K:i:I:x:n:e:m:L:p:rc:T:d:l:Eh')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    try:
+        for o, a in opts:
+            if o == '-k':
+                kernel = a
+            elif o == '-K':
+                kernel_addr = int(a, 0)
+            elif o == '-i':
+                initrd = a
+            elif o == '-I':
+                initrd_addr = int(a, 0)
+            elif o == '-x':
+                target = a
+            elif o == '-n':
+                max_cycles = int(float(a))
+            elif o == '-e':
+                exe = a
+            elif o == '-m':
+                memsizel2 = int(a, 0)
+            elif o == '-L':
+                keep_log = a
+            elif o == '-p':
+                phases = read_phases(a)
+            elif o == '-r':
+                do_record = True
+            elif o == '-c':
+                base_rev = a
+            elif o == '-T':
+                ipc_thresh = float(a)
+            elif o == '-d':
+                db_path = a
+            elif o == '-l':
+                log_in = a
+            elif o == '-E':
+                show_events = False
+            else:
+                usage()
+    except (OSError, ValueError, re.error) as e:
+        print(e)
+        sys.exit(1)
+
+    if args or (kernel is None) == (log_in is None) or (log_in and do_record):
+        usage()
+
+    if log_in:
+        try:
+            names, lines, end = read_boot_log(log_in)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        reached = bool(target) and bool(lines) and lines[-1][2].endswith(target.rstrip('\n'))
+        report(split(phases, lines, end, len(names)), names, end, reached, target,
+               show_events)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if kernel.endswith('.hex'):
+                if initrd:
+                    print("An initramfs needs a binary kernel, not a .hex image")
+                    sys.exit(1)
+                image = kernel
+                top = 0
+            else:
+                image = os.path.join(tmp, 'boot.hex')
+                top = make_image(image, kernel, kernel_addr, initrd, initrd_addr)
+            if exe is None:
+                if top > (1 << memsizel2):
+                    print("The image (to 0x%x) doesn't fit in %d bytes of RAM" %
+                          (top, 1 << memsizel2))
+                    sys.exit(1)
+                print("Building (MEMSIZEL2=%d)" % memsizel2)
+                exe = build(memsizel2)
+            log_path = os.path.join(tmp, 'boot.log')
+            print("Booting %s%s, to %s" % (kernel, ' + ' + initrd if initrd else '',
+                                          repr(target) if target else 'the cycle limit'))
+            (reached, wall, _) = run(exe, image, log_path, target, max_cycles)
+            if keep_log:
+                shutil.copyfile(log_path, keep_log)
+            names, lines, end = read_boot_log(log_path)
+            image_hash = bench.file_hash(image)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(e)
+            sys.exit(1)
+
+    if names != mr_trace.PCTR_NAMES[:len(names)]:
+        print("Warning:  the log's perf counter events differ from mr_trace.PCTR_NAMES")
+    found = split(phases, lines, end, len(names))
+    print("%d console lines, %d cycles in %.1fs (%.1f kHz)\n" %
+          (len(lines), end[0], wall, end[0] / max(wall, 1e-6) / 1000))
+    report(found, names, end, reached, target, show_events)
+
+    fails = 0 if reached or not target else 1
+    if do_record:
+        db = sqlite3.connect(db_path)
+        db.row_factory = sqlite3.Row
+        db.executescript(bench.SCHEMA)
+        (rev, dirty) = record(db, found, names, end, reached, wall, image_hash,
+                              bench.file_hash(exe))
+        print("\nRecorded at %s" % bench.label(rev, dirty))
+        fails += check(db, rev, dirty, base_rev, ipc_thresh)
+        db.close()
+    sys.exit(1 if fails else 0)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+#
+# Memory timing configurations for the Verilator harness's memory model
+# (verilator/mem_model.h, "Vwrapper_top -M <file>"), and sweeps of them
+# against cache configurations:
+#
+#   ./tools/mem_timing.py -l                           # List the presets
+#   ./tools/mem_timing.py -P sdram sdram.mem           # Write one, to edit
+#   ./verilator/obj_dir/Vwrapper_top -M sdram.mem +INPUT_FILE=...
+#   ./tools/mem_timing.py -w bench/intkern.hex -n 2000000 -c sdram.mem \
+#       -s latency=0,4,8 -s beat_cycles=1,2 -m L2SIZE=12,13,14
+#
+# Without -M, the testbench memory stalls each EMI at random; with it, the
+# model gives the stalls:  a fixed latency, bank/row-buffer timing (open or
+# closed page), a bandwidth cap of a beat every beat_cycles, read/write
+# turnaround and refresh, with one controller queueing the I and D requests.
+# See mem_model.h for the details; a file is "name = value" lines, '#'
+# starting a comment, and names not given keep the defaults below (an ideal
+# memory, a beat every cycle).
+#
+# A sweep (-w) builds the cache configurations given as vbuild.py matrix
+# axes (-m; TRACE=0 is added), makes the cross product of the -s timing
+# values over the -c (or -P) base, runs every build with every timing
+# (in parallel, -j) and tabulates cycles and IPC, with each run's slowdown
+# against the first timing on the same build and the model's mean queue
+# waits.  sweep() does the same from Python, given executables and
+# MemTiming objects.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import itertools
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+
+import bench
+
+# Parameters, as mem_model.h reads them, and their defaults
+FIELDS = [('latency', 0),               # Cycles before the array access
+          ('beat_cycles', 1),           # Cycles per 64-bit beat
+          ('banks', 0),                 # 0 for no bank/row timing
+          ('row_bytes', 1024),
+          ('t_cas', 0),
+          ('t_rcd', 0),
+          ('t_rp', 0),
+          ('open_page', 1),
+          ('turnaround', 0),            # Read/write switch
+          ('refresh_interval', 0),      # 0 for no refresh
+          ('refresh_cycles', 0),
+          ('d_first', 1)]               # D requests first, else in order
+DEFAULTS = dict(FIELDS)
+
+PRESETS = {
+    'ideal':    {},
+    # Synchronous SRAM, a cycle's latency
+    'sram':     {'latency': 1},
+    # 16-bit SDR SDRAM at the CPU clock (e.g. 50MHz):  CL2, four beats of
+    # the bus per 64-bit beat, 7.8us refresh
+    'sdram':    {'latency': 1, 'beat_cycles': 4, 'banks': 4, 'row_bytes': 1024,
+                 't_cas': 2, 't_rcd': 2, 't_rp': 2, 'turnaround': 1,
+                 'refresh_interval': 390, 'refresh_cycles': 4},
+    # HyperRAM/PSRAM-like:  long fixed latency, no banks, x8 DDR
+    'psram':    {'latency': 12, 'beat_cycles': 4, 'turnaround': 2},
+}
+
+WAIT_RE = re.compile(r'Memory model:\s+(\d+) transactions.*mean queue wait I ([\d.]+), '
+                     r'D ([\d.]+) cycles')
+
+
+class MemTiming:
+    """A memory model configuration:  each of FIELDS as an attribute"""
+    def __init__(self, label='ideal', **kw):
+        self.label = label
+        for k, v in FIELDS:
+            setattr(self, k, v)
+        self.update(kw)
+
+    def update(self, kw):
+        for k, v in kw.items():
+            if k not in DEFAULTS:
+                raise ValueError("Unknown memory timing parameter '%s'" % k)
+            if int(v) < 0:
+                raise ValueError("%s must be 0+" % k)
+            setattr(self, k, int(v))
+
+    def params(self):
+        return dict((k, getattr(self, k)) for k, _ in FIELDS)
+
+    @classmethod
+    def preset(cls, name):
+        if name not in PRESETS:
+            raise ValueError("No preset '%s' (presets are %s)" % (name, ', '.join(sorted(PRESETS))))
+        return cls(name, **PRESETS[name])
+
+    @classmethod
+    def from_file(cls, path):
+        kw = {}
+        with open(path, 'r') as f:
+            for n, l in enumerate(f, 1):
+                l = l.split('#', 1)[0].strip()
+                if not l:
+                    continue
+                k, eq, v = l.partition('=')
+                if not eq:
+                    raise ValueError("%s:%d: bad line" % (path, n))
+                try:
+                    kw[k.strip()] = int(v.strip(), 0)
+                except ValueError:
+                    raise ValueError("%s:%d: bad value '%s'" % (path, n, v.strip()))
+        return cls(os.path.splitext(os.path.basename(path))[0], **kw)
+
+    def to_file(self, path):
+        with open(path, 'w') as f:
+            f.write("# Memory timing '%s', for Vwrapper_top -M\n" % self.label)
+            for k, _ in FIELDS:
+                f.write("%s = %d\n" % (k, getattr(self, k)))
+
+
+def expand(base, specs):
+    """Cross product of ['latency=0,4', ...] over a base MemTiming"""
+    axes = []
+    for s in specs:
+        k, _, vals = s.partition('=')
+        k = k.strip()
+        if k not in DEFAULTS or not vals:
+            raise ValueError("Bad parameter '%s' (parameters are %s)" %
+                             (s, ', '.join(DEFAULTS)))
+        axes.append([(k, int(v, 0)) for v in vals.split(',')])
+    out = []
+    for c in itertools.product(*axes):
+        label = '_'.join([base.label] + ['%s%d' % kv for kv in c])
+        t = MemTiming(label, **base.params())
+        t.update(dict(c))
+        out.append(t)
+    return out
+
+
+def run(args):
+    """Runs exe with a timing file; returns (instructions, cycles, I wait,
+    D wait)"""
+    exe, mem_file, image, cycles = args
+    cmd = [exe, '-M', mem_file, '+INPUT_FILE=' + image]
+    if cycles:
+        cmd[1:1] = ['-n', str(cycles)]
+    (stdout, m, _) = bench.run_sim(cmd, "%s -M %s" % (exe, mem_file))
+    w = WAIT_RE.search(stdout)
+    return (int(m.group(1)), int(m.group(3)),
+            float(w.group(2)) if w else 0.0, float(w.group(3)) if w else 0.0)
+
+
+def sweep(exes, timings, image, cycles=0, jobs=None):
+    """Runs each of exes ({label: path}) with each MemTiming; returns a list
+    of (exe label, timing label, instructions, cycles, I wait, D wait), in
+    order."""
+    with tempfile.TemporaryDirectory(prefix='mem_timing') as d:
+        files = []
+        for i, t in enumerate(timings):
+            files.append(os.path.join(d, '%d.mem' % i))
+            t.to_file(files[-1])
+        points = [(el, t.label, (exe, f, os.path.abspath(image), cycles))
+                  for el, exe in exes.items() for t, f in zip(timings, files)]
+        with multiprocessing.Pool(jobs) as pool:
+            res = pool.map(run, [p[2] for p in points])
+    return [(el, tl) + r for (el, tl, _), r in zip(points, res)]
+
+
+def report(results):
+    print("%-30s %-30s %10s %10s %6s %8s %7s %7s" %
+          ('Build', 'Memory', 'Instrs', 'Cycles', 'IPC', 'Slowdown', 'I wait', 'D wait'))
+    ref = {}
+    for (el, tl, instrs, cyc, iw, dw) in results:
+        # Runs to a cycle limit compare instructions per cycle instead:
+        cpi = cyc / float(max(1, instrs))
+        ref.setdefault(el, cpi)
+        print("%-30s %-30s %10d %10d %6.3f %7.2fx %7.2f %7.2f" %
+              (el, tl, instrs, cyc, instrs / float(max(1, cyc)), cpi / ref[el], iw, dw))
+
+
+def usage():
+    print("Syntax:\n\t %s -l\n"
+          "\t %s [-c <timing file> | -P <preset>] <output timing file>\n"
+          "\t %s -w <hex image> [-n <cycles>] [-c <timing file> | -P <preset>] "
+          "[-s <param>=<v>[,<v>...]] ... [-m <vbuild axis>=<v>[,<v>...]] ... [-j <jobs>]" %
+          (sys.argv[0], sys.argv[0], sys.argv[0]))
+    print("\t-l:  List the presets")
+    print("\t-c/-P:  Base timing (default ideal)")
+    print("\t-s:  Timing parameter values to sweep (%s)" % ', '.join(DEFAULTS))
+    print("\t-m:  Cache configurations to build, as vbuild.py -m")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    base = None
+    image = None
+    cycles = 0
+    tspecs = []
+    mspecs = []
+    jobs = None
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'lc:P:w:n:s:m:j:h')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    try:
+        for o, a in opts:
+            if o == '-l':
+                for name, p in sorted(PRESETS.items()):
+                    print("%-8s %s" % (name, ' '.join('%s=%d' % kv for kv in sorted(p.items()))
+                                       or '(defaults)'))
+                sys.exit(0)
+            elif o == '-c':
+                base = MemTiming.from_file(a)
+            elif o == '-P':
+                base = MemTiming.preset(a)
+            elif o == '-w':
+                image = a
+            elif o == '-n':
+                cycles = int(a)
+            elif o == '-s':
+                tspecs.append(a)
+            elif o == '-m':
+                mspecs.append(a)
+            elif o == '-j':
+                jobs = int(a)
+            else:
+                usage()
+        if base is None:
+            base = MemTiming()
+        timings = expand(base, tspecs)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    if not image:
+        if len(args) != 1 or tspecs or mspecs:
+            usage()
+        base.to_file(args[0])
+        sys.exit(0)
+
+    import vbuild
+
+    try:
+        configs = vbuild.parse_matrix(mspecs + ['TRACE=0'])
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    for c in configs:
+        err = c.check()
+        if err:
+            print("%s: %s" % (c.label, err))
+            sys.exit(1)
+
+    print("Building %d configurations" % len(configs))
+    exes = {}
+    try:
+        for r in vbuild.build_matrix(configs):
+            if not r['ok']:
+                print("%s: build FAILED, see %s" % (r['label'], r['log']))
+                sys.exit(1)
+            exes[r['label']] = r['exe']
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+
+    print("Running %d x %d timings" % (len(exes), len(timings)))
+    try:
+        report(sweep(exes, timings, image, cycles, jobs))
+    except RuntimeError as e:
+        print(e)
+        sys.exit(1)
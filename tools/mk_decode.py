@@ -73,6 +73,32 @@ de_fsm_triggers = {'state_lmw', 'state_stmw', 'state_dcbz', 'state_mfsrin'}
 subdecode_uses_spr = {'mfspr', 'mtspr', 'mftb'}
 subdecode_uses_bo = {'bc', 'bclr', 'bcctr'}
 
+# Disassembly table (-p):  suffix flags, for the mnemonic variants an
+# instruction word's Rc/OE/LK/AA bits select, and whether MR faults it:
+DIS_RC          = 1
+DIS_OE          = 2
+DIS_LK          = 4
+DIS_AA          = 8
+DIS_UNIMPL      = 16
+# ... and the PPC.csv columns carried for each decoded row, for the analysis
+# tools' operand/scoreboard decode (tools/mr_isa.py):
+DIS_ROW_COLUMNS = ['Name', 'Class', 'Form', 'Opcode', 'XO', 'Subdec', 'spr',
+                   'BO', 'In', 'InImpl', 'Out', 'OutImpl', 'Rc', 'SO', 'AA',
+                   'LK', 'Lock', 'DE_OP', 'EXE_OP', 'MEM_OP', 'WB_OP']
+
+# Coverage table (-c):  kinds of instruction the harness's coverage mode
+# (verilator/coverage.h) looks for around faults and branches:
+COV_BRANCH      = 1
+COV_LOAD        = 2
+COV_STORE       = 4
+COV_ISYNC       = 8
+COV_SYNC        = 16
+COV_ICBI        = 32
+COV_TLBI        = 64
+COV_MTMSR       = 128
+COV_KINDS       = ["COV_BRANCH", "COV_LOAD", "COV_STORE", "COV_ISYNC", "COV_SYNC",
+                   "COV_ICBI", "COV_TLBI", "COV_MTMSR"]
+
 signal_sizes = { "enable":1, "gpr_name":5, "sr_name":4, "spr_name":6,
                  "de_port._type":3, "de_depends_generic":1,
                  "de_gen_fault_type":4, "de_port.*checkz":1,
@@ -809,6 +835,68 @@ def determine_subdecode(subdec, name, spr, BO):
 
     return (field_name, (val, mask))
 
+# Disassembly of an instruction row:  (mnemonic, DIS_ flags, operands)
+# Operands are the Out fields not also inputs, then In, giving assembler
+# order (e.g. "stwu RS,D(RA)", "add RT,RA,RB") except for M-form, whose In
+# order follows the ports.  Sub-decoded rows with no In/Out (e.g. an ignored
+# mtspr) reuse the previous row's operands.
+def disasm_entry(row, de, last_operands):
+    name = row['Name']
+    suffixes = row['Suffix'].split(',')
+    flags = 0
+    if name.endswith('_rc'):
+        name = name[:-3] + '.'
+    elif row['Rc'] == 'A' and '.' in suffixes:
+        name += '.'
+    elif row['Rc'] == '1' and '.' in suffixes:
+        flags |= DIS_RC
+    if row['SO'] == '1' and 'o' in suffixes:
+        flags |= DIS_OE
+    if row['LK'] == '1' and 'l' in suffixes:
+        flags |= DIS_LK
+    if row['AA'] == '1' and 'a' in suffixes:
+        flags |= DIS_AA
+    if de == "FC_ILL_HYP":
+        flags |= DIS_UNIMPL
+
+    ins = [t for t in row['In'].split(',') if t != '' and t != 'AA']
+    ops = [t for t in row['Out'].split(',') if t != '' and t not in ins] + ins
+    if not ops and row['Subdec'] == "1":
+        ops = last_operands.get(row['Name'], [])
+    if row['Form'] == 'M':
+        order = ['RA', 'RS', 'RB', 'SH', 'MB', 'ME']
+        ops = sorted(ops, key = lambda t: order.index(t))
+    if 'D' in ops:
+        for ra in ['RA0', 'RA']:
+            if ra in ops:
+                ops.remove(ra)
+                ops[ops.index('D')] = "D(%s)" % (ra)
+    last_operands[row['Name']] = ops
+    return (name, flags, tuple(ops))
+
+
+def cover_kind(row):
+    name = row['Name']
+    mem = row['MEM_OP']
+    kind = 0
+    if row['Class'] == "Branch":
+        kind |= COV_BRANCH
+    if re.search(r"\bL(8|16|32)", mem):
+        kind |= COV_LOAD
+    if re.search(r"\bS(8|16|32)", mem) or "DC_BZ" in mem:
+        kind |= COV_STORE
+    if name == "isync":
+        kind |= COV_ISYNC
+    if name == "sync":
+        kind |= COV_SYNC
+    if name == "icbi":
+        kind |= COV_ICBI
+    if "TLBI" in mem:
+        kind |= COV_TLBI
+    if name == "mtmsr":
+        kind |= COV_MTMSR
+    return kind
+
 
 ################################################################################
 
@@ -824,6 +912,9 @@ class Instruction:
         self.mem_behaviours = mem_behaviours
         self.wb_behaviours = wb_behaviours
         self.form = form
+        self.disasm = None
+        self.csv_row = -1
+        self.cover_kind = 0
 
     def gen_verilog(self, indent, verbose = False):
         if verbose:
@@ -863,6 +954,9 @@ def parse_csv_input(csv_file, verbose = False):
     # The hierarchy of opcodes/decode is reflected in this tree.
     top_level_instrs = dict()
 
+    # Disassembly operands of the last row seen for each name:
+    disasm_operands = dict()
+
     for idx, row in enumerate(read_csv(csv_file)):
         name = row['Name']
         form = row['Form']
@@ -1005,6 +1099,9 @@ def parse_csv_input(csv_file, verbose = False):
             inst_obj = Instruction(name, inst_format, inst_comment, \
                                    de_behaviours, exe_behaviours, mem_behaviours, wb_behaviours, \
                                    form)
+            inst_obj.disasm = disasm_entry(row, de, disasm_operands)
+            inst_obj.csv_row = idx
+            inst_obj.cover_kind = cover_kind(row)
 
             # Rotate the inst_decode list, the instr's ordered decode fields, into a tree of
             # top-down decode values (which is later traversed to build the decoder):
@@ -1187,6 +1284,148 @@ def gen_verilog_decode_switch(itree, verbose = False):
 
 ################################################################################
 
+# The disassembly and coverage tables are the decode tree expanded to a
+# lookup per level:  each (start, len) span gets a list of nodes, one for
+# every value of those bits, found by matching in the same order as the
+# decoder's if/else chain (so the first of overlapping wildcarded sub-opcodes
+# wins, as in the RTL).  A node is an index into the entry list, where 0 is
+# "not decoded" (FC_PROG_ILL), or another (start, len, nodes) level.
+# entry_of gives an Instruction's entry; equal entries share an index.
+def gen_lookup_level(itree, opc_st, opc_len, entries, memo, entry_of):
+    matches = []
+    for opc in itree:
+        val = int(opc.replace('?', '0'), 2)
+        care = int(re.sub('[01]', '1', opc).replace('?', '0'), 2)
+        matches.append((val, care, itree[opc]))
+
+    nodes = []
+    for v in range(1 << opc_len):
+        node = 0
+        for (val, care, opc_entry) in matches:
+            if (v & care) == val:
+                if id(opc_entry) not in memo:
+                    if isinstance(opc_entry, Instruction):
+                        e = entry_of(opc_entry)
+                        if e not in entries:
+                            entries.append(e)
+                        memo[id(opc_entry)] = entries.index(e)
+                    else:
+                        ((new_opc_st, new_opc_len), new_l) = opc_entry
+                        memo[id(opc_entry)] = gen_lookup_level(new_l, new_opc_st, new_opc_len,
+                                                               entries, memo, entry_of)
+                node = memo[id(opc_entry)]
+                break
+        nodes.append(node)
+    return (opc_st, opc_len, nodes)
+
+def gen_disasm_node_repr(node, indent):
+    if not isinstance(node, tuple):
+        return "%d" % (node)
+    (st, ln, nodes) = node
+    s = "(%d, %d, [" % (st, ln)
+    line = ""
+    for n in nodes:
+        if isinstance(n, tuple):
+            if line:
+                s += "\n" + indent + "\t" + line.rstrip()
+                line = ""
+            s += "\n" + indent + "\t" + gen_disasm_node_repr(n, indent + "\t") + ","
+        else:
+            line += "%d, " % (n)
+            if len(line) > 64:
+                s += "\n" + indent + "\t" + line.rstrip()
+                line = ""
+    if line:
+        s += "\n" + indent + "\t" + line.rstrip()
+    return s + "])"
+
+def gen_disasm_table(itree, csv_file):
+    entries = [(".long", 0, (), -1)]
+    tree = gen_lookup_level(itree, 26, 6, entries, dict(),
+                            lambda i: i.disasm + (i.csv_row,))
+    csv_rows = list(read_csv(csv_file))
+
+    s = "# Generated by mk_decode.py from %s:  MR's decode, as a disassembly\n" % (csv_file)
+    s += "# table for tools/mr_disasm.py and tools/mr_isa.py.  Do not edit.\n\n"
+    for f in ["DIS_RC", "DIS_OE", "DIS_LK", "DIS_AA", "DIS_UNIMPL"]:
+        s += "%s = %d\n" % (f, globals()[f])
+    s += "\n# (mnemonic, DIS_ flags, operand fields, PPC.csv row)\n"
+    s += "ENTRIES = [\n"
+    for (i, (name, flags, ops, row)) in enumerate(entries):
+        s += "\t(%r, %d, %r, %d),\t# %d\n" % (name, flags, ops, row, i)
+    s += "]\n\n"
+    s += "# (start bit, length, [entry index or sub-level for each field value])\n"
+    s += "TREE = " + gen_disasm_node_repr(tree, "") + "\n\n"
+    s += "# The decoded PPC.csv rows (counting data rows from 0), by row\n"
+    s += "ROWS = {\n"
+    for row in sorted(set(e[3] for e in entries[1:])):
+        s += "\t%d: {" % (row)
+        s += ", ".join("%r: %r" % (c, csv_rows[row][c]) for c in DIS_ROW_COLUMNS)
+        s += "},\n"
+    s += "}\n"
+    return s
+
+# The lookup tree as arrays:  level l looks up
+# flat[base[l] + ((w >> shift[l]) & mask[l])], giving an entry index, or
+# -1 - the next level's index.
+def flatten_lookup(tree, shift, mask, base, flat):
+    (st, ln, nodes) = tree
+    l = len(shift)
+    shift.append(st)
+    mask.append((1 << ln) - 1)
+    base.append(len(flat))
+    flat.extend([0] * len(nodes))
+    for (v, n) in enumerate(nodes):
+        flat[base[l] + v] = n if not isinstance(n, tuple) else \
+                            -1 - flatten_lookup(n, shift, mask, base, flat)
+    return l
+
+def gen_c_array(ctype, name, vals):
+    s = "static const %s %s[%d] = {" % (ctype, name, len(vals))
+    line = ""
+    for v in vals:
+        line += "%d, " % (v)
+        if len(line) > 64:
+            s += "\n\t" + line.rstrip()
+            line = ""
+    if line:
+        s += "\n\t" + line.rstrip()
+    return s + "\n};\n\n"
+
+# Coverage table, for verilator/coverage.h:  one leaf per Instruction (i.e.
+# per decoded CSV row, or sub-decoded variant), with its CSV row (counting
+# data rows from 0, as read_csv() gives them) and COV_ kinds.
+def gen_cover_table(itree, csv_file):
+    leaves = [None]
+    tree = gen_lookup_level(itree, 26, 6, leaves, dict(), lambda i: i)
+    (shift, mask, base, flat) = ([], [], [], [])
+    flatten_lookup(tree, shift, mask, base, flat)
+
+    s = "/* Generated by mk_decode.py from %s:  MR's decode, as a table of\n" % (csv_file)
+    s += " * decoder leaves for verilator/coverage.h.  Do not edit.\n */\n\n"
+    s += "#ifndef AUTO_COVER_H\n#define AUTO_COVER_H\n\n#include <stdint.h>\n\n"
+    s += "#define COVER_NR_LEAVES\t%d\n\n" % (len(leaves))
+    for k in COV_KINDS:
+        s += "#define %s\t%d\n" % (k, globals()[k])
+    s += "\nstruct cover_leaf {\n\tconst char\t*name;\n\tint\t\tcsv_row;\n\tint\t\tkind;\n};\n\n"
+    s += "static const struct cover_leaf cover_leaves[COVER_NR_LEAVES] = {\n"
+    s += "\t{ \"(not decoded)\", -1, 0 },\n"
+    for (i, inst) in enumerate(leaves[1:], 1):
+        s += "\t{ \"%s\", %d, %d },\t/* %d */\n" % (inst.name, inst.csv_row, inst.cover_kind, i)
+    s += "};\n\n"
+    s += gen_c_array("uint8_t", "cover_shift", shift)
+    s += gen_c_array("uint16_t", "cover_mask", mask)
+    s += gen_c_array("uint16_t", "cover_base", base)
+    s += gen_c_array("int16_t", "cover_flat", flat)
+    s += "/* Returns the leaf an instruction decodes to */\n"
+    s += "static inline int cover_decode(uint32_t w)\n{\n\tint l = 0;\n\n"
+    s += "\tfor (;;) {\n"
+    s += "\t\tint v = cover_flat[cover_base[l] + ((w >> cover_shift[l]) & cover_mask[l])];\n\n"
+    s += "\t\tif (v >= 0)\n\t\t\treturn v;\n\t\tl = -1 - v;\n\t}\n}\n\n#endif\n"
+    return s
+
+################################################################################
+
 def help():
     print "Syntax: this.py [options] <defs.csv>"
     print "\t-h\t\t- Help"
@@ -1194,6 +1433,8 @@ def help():
     print "\t-i \"string\"\t- Includes added to generated files"
     print "\t-d <file>\t- Output Verilog decoder to file"
     print "\t-s <file>\t- Output Verilog signal definitions to file"
+    print "\t-p <file>\t- Output Python disassembly table to file"
+    print "\t-c <file>\t- Output C decode coverage table to file"
 
 
 ################################################################################
@@ -1208,9 +1449,11 @@ verbose = False
 include_string = ""
 verilog_decoder_file = ""
 verilog_sigdefs_file = ""
+disasm_table_file = ""
+cover_table_file = ""
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "hvi:d:s:")
+    opts, args = getopt.getopt(sys.argv[1:], "hvi:d:s:p:c:")
 except getopt.GetoptError as err:
     help()
     fatal("Invocation error: " + str(err))
@@ -1227,6 +1470,10 @@ for o, a in opts:
         verilog_decoder_file = a
     elif o == "-s":
         verilog_sigdefs_file = a
+    elif o == "-p":
+        disasm_table_file = a
+    elif o == "-c":
+        cover_table_file = a
     else:
         help()
         fatal("Unknown option?")
@@ -1321,4 +1568,12 @@ if verilog_sigdefs_file:
     with open(verilog_sigdefs_file, "w") as output:
         output.write(siglist)
 
+if disasm_table_file:
+    with open(disasm_table_file, "w") as output:
+        output.write(gen_disasm_table(instr_tree, input_file))
+
+if cover_table_file:
+    with open(cover_table_file, "w") as output:
+        output.write(gen_cover_table(instr_tree, input_file))
+
 ################################################################################
@@ -8,11 +8,42 @@
 # Inspired by http://fpgacpu.ca/fpga/Synthesis_Harness_Input.html
 # but auto-generated, so no bit-counting is required by the human.
 #
-# Important: Run with already-preprocessed input, e.g. iverilog -E in -o out
+#   ./tools/mk_harness.py src/execute_mul.v toplevel.v    # One module
+#   ./tools/mk_harness.py -m mask16 src/execute_rotatemask.v toplevel.v
+#   ./tools/mk_harness.py -a                              # All of src/
+#   ./tools/mk_harness.py -a -o /tmp/h -j 8 src/cache.v src/tlb.v
+#
+# Sources are preprocessed here (`include from include/ and -I, `define,
+# `ifdef and macros; -D defines), tokenised and parsed:  ANSI or non-ANSI
+# port lists, multi-name declarations, and parameter/localparam values
+# (e.g. TAG_ADDR_SIZE = 32-(L2SIZE-L2WAYS)) evaluated so that port widths
+# like [L2SIZE-L2WIDTH-1:0] resolve.
+#
+# -a makes a wrapper for every module in the given files (default src/*.v),
+# in parallel, as <out dir>/harness_<module>.v with top-level module
+# harness_<module> (default out dir synth/harness), and writes
+# <out dir>/manifest.json listing each module's source, harness, top,
+# parameter values, input/output bits and whether it has a clock, or why it
+# failed.  A module with no outputs (e.g. mr_pctrs) would be optimised away
+# entirely, so it gets no harness, its entry saying why ('skipped').  Run make
+# build_deps first:  ports use include/auto_*.vh.
+#
+# Sweeps (-s, repeated, or -S <file>) harness a module once per point of
+# the cross product of its parameter values instead, each instantiating it
+# with those parameters overridden and its ports sized for them:
+#
+#   ./tools/mk_harness.py -a -s cache:L2SIZE=12,13,14 -s tlb:TLB_ENTRIES=8,16
+#   ./tools/mk_harness.py -a -S sweep.txt
+#
+# A sweep file has a line per module, e.g. "tlb TLB_ENTRIES=8,16,32", '#'
+# starting a comment.  A point's harness and top are harness_<module>__<point>,
+# e.g. harness_cache__L2SIZE12, and its manifest entry gives its overrides.
+# Values a module can't be built with (SWEEP_ALLOWED, e.g. cache.v's L2WAYS,
+# which must be 2 as it only does 4 ways) are refused rather than harnessed.
 #
 # ME 23/3/2020
 #
-# Copyright 2020 Matt Evans
+# Copyright 2020-2022 Matt Evans
 #
 # Licensed under the Apache License, Version 2.0 (the "License");
 # you may not use this file except in compliance with the License.
@@ -27,217 +58,936 @@
 # limitations under the License.
 #
 
+import getopt
+import glob
+import itertools
+import json
+import multiprocessing
+import os
 import re
 import sys
 
+TOP = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+SRC_PATH = os.path.join(TOP, 'src')
+INC_PATH = os.path.join(TOP, 'include')
+OUT_PATH = os.path.join(TOP, 'synth', 'harness')
+MANIFEST = 'manifest.json'
+
+# Parameter values the RTL can be built with, where it's narrower than the
+# parameter's type (vbuild.py checks its configs against these too):
+# {module: {parameter: (values)}}.  cache.v's hit encoder and tag update are
+# 4-way only.
+SWEEP_ALLOWED = {'cache': {'L2WAYS': (2,)}}
 
 clk_net_name = "clk"  # FIXME, parameter
 
-################################################################################
 
-def read_file_chomp(path):
-    with open(path, 'r') as data:
-        d = []
-        for line in data:
-            line = line.rstrip()
-            # Remove //-style comments:
-            line = re.sub('//.*$', '', line)
-            if line != '':
-                d.append(line)
-        return d
+class VerilogError(Exception):
+    pass
 
 
-def find_module_decl(input_lines):
-    module = None
-    inputs = list()
-    outputs = list()
-
-    for l in input_lines:
-        # print(l)
-        r = re.match(r".*module\s([^ (]+)\((.*)\)", l)
-        if r:
-            module = r.group(1)
-            params = r.group(2)
-
-            print("Found module '%s':" % module)
-            # print("Module %s, params '%s'" % (module, params))
-            # OK, now split out dem inputs/outputs:
-            plist = params.split(',')
-
-            # Sanitise the list a little
-            plist = [x.strip() for x in plist]
-
-            for param in plist:
-                if param.find("input") != -1:
-                    inputs.append(param)
-                elif param.find("output") != -1 :
-                    outputs.append(param)
+################################################################################
+# Preprocessing
+
+IDENT_RE = re.compile(r'[a-zA-Z_][\w$]*')
+
+# Directives taking the rest of the line, which we ignore
+IGNORE_LINE = ('timescale', 'line', 'pragma', 'begin_keywords', 'end_keywords',
+               'default_nettype', 'unconnected_drive')
+IGNORE = ('resetall', 'celldefine', 'endcelldefine', 'nounconnected_drive',
+          'undefineall')
+
+
+def strip_comments(text):
+    """Removes // and /* */ comments (not in strings)"""
+    return re.sub(r'("(?:\\.|[^"\\])*")|//[^\n]*|/\*.*?\*/',
+                  lambda m: m.group(1) or ' ', text, flags=re.S)
+
+
+def split_args(text, i, where):
+    """Macro arguments from the '(' at text[i]; returns ([args], index after
+    the ')')"""
+    args, depth, start = [], 0, i + 1
+    while i < len(text):
+        c = text[i]
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+            if depth == 0:
+                args.append(text[start:i].strip())
+                return args, i + 1
+        elif c == ',' and depth == 1:
+            args.append(text[start:i].strip())
+            start = i + 1
+        elif c == '"':
+            i = text.index('"', i + 1)
+        i += 1
+    raise VerilogError("%s: unterminated macro arguments" % where)
+
+
+def define_end(text, i):
+    """A `define's body runs to the end of the line, \\ continuing it"""
+    while True:
+        eol = text.find('\n', i)
+        if eol < 0:
+            return len(text)
+        if not text[i:eol].rstrip().endswith('\\'):
+            return eol
+        i = eol + 1
+
+
+class Preprocessor:
+    """A Verilog preprocessor; defines (name: (params or None, body)) carry
+    from one file to the next, as they would in one compilation"""
+    def __init__(self, incdirs=(), defines=None):
+        self.incdirs = list(incdirs)
+        self.defines = {}
+        for k, v in (defines or {}).items():
+            self.defines[k] = (None, str(v))
+
+    def find_include(self, name, cur_dir):
+        for d in [cur_dir] + self.incdirs:
+            p = os.path.join(d, name)
+            if os.path.isfile(p):
+                return p
+        raise VerilogError("Can't find include '%s' (make build_deps?)" % name)
+
+    def file(self, path):
+        with open(path, 'r') as f:
+            return self.text(strip_comments(f.read()), os.path.dirname(path), path)
+
+    def text(self, text, cur_dir, where, depth=0):
+        if depth > 64:
+            raise VerilogError("%s: macro expansion too deep" % where)
+        out = []
+        conds = []              # [parent active, a branch taken, active]
+        active = True
+        i, n = 0, len(text)
+        while i < n:
+            j = text.find('`', i)
+            q = text.find('"', i)
+            if 0 <= q < j or (j < 0 and q >= 0):
+                # A string, copied whole:
+                e = q + 1
+                while e < n and text[e] != '"':
+                    e += 2 if text[e] == '\\' else 1
+                if active:
+                    out.append(text[i:e + 1])
+                i = e + 1
+                continue
+            if j < 0:
+                if active:
+                    out.append(text[i:])
+                break
+            if active:
+                out.append(text[i:j])
+            m = IDENT_RE.match(text, j + 1)
+            if not m:
+                raise VerilogError("%s: stray '`'" % where)
+            d = m.group(0)
+            i = m.end()
+            eol = text.find('\n', i)
+            eol = n if eol < 0 else eol
+
+            if d in ('ifdef', 'ifndef', 'elsif'):
+                name = IDENT_RE.search(text, i)
+                i = name.end()
+                defined = name.group(0) in self.defines
+                if d == 'elsif':
+                    if not conds:
+                        raise VerilogError("%s: `elsif without `ifdef" % where)
+                    c = conds[-1]
+                    c[2] = c[0] and not c[1] and defined
+                    c[1] = c[1] or c[2]
                 else:
-                    print("*** Unknown parameter type '%s', ignoring" % param)
-            break
-    return (module, inputs, outputs)
-
-
-def count_signals(signal_list):
-    total_size = 0
-    signal_out_list = list()
-    for i in signal_list:
-        r = re.match(r"(input|output)\s(wire|reg)\s(\[(.*):(.*)\]){,}\s(.*)", i)
-        if r:
-            vec = r.group(3)
-            vec_hi = r.group(4)
-            vec_lo = r.group(5)
-            name = r.group(6).strip()
-
-            if vec == None:
-                sigsize = 1
+                    t = defined if d == 'ifdef' else not defined
+                    conds.append([active, active and t, active and t])
+                active = conds[-1][2]
+            elif d == 'else':
+                if not conds:
+                    raise VerilogError("%s: `else without `ifdef" % where)
+                c = conds[-1]
+                c[2] = c[0] and not c[1]
+                c[1] = True
+                active = c[2]
+            elif d == 'endif':
+                if not conds:
+                    raise VerilogError("%s: `endif without `ifdef" % where)
+                active = conds.pop()[0]
+            elif not active:
+                if d == 'define':
+                    i = define_end(text, i)
+            elif d == 'define':
+                eol = define_end(text, i)
+                body = text[i:eol].replace('\\\n', ' ')
+                m = re.match(r'\s*([a-zA-Z_][\w$]*)(\(([^)]*)\))?(.*)$', body, re.S)
+                if not m:
+                    raise VerilogError("%s: bad `define" % where)
+                params = None
+                if m.group(2):
+                    params = [p.strip() for p in m.group(3).split(',')]
+                self.defines[m.group(1)] = (params, m.group(4).strip())
+                i = eol
+            elif d == 'undef':
+                name = IDENT_RE.search(text, i)
+                self.defines.pop(name.group(0), None)
+                i = name.end()
+            elif d == 'include':
+                m = re.compile(r'\s*"([^"]+)"').match(text, i)
+                if not m:
+                    raise VerilogError("%s: bad `include" % where)
+                p = self.find_include(m.group(1), cur_dir)
+                out.append(self.file(p))
+                i = m.end()
+            elif d in IGNORE_LINE:
+                i = eol
+            elif d in IGNORE:
+                pass
             else:
-                sigsize = eval(vec_hi) - eval(vec_lo) + 1
-
-            print("Signal %s\t size %d (%s)" % (name, sigsize, vec))
-            total_size += sigsize
-            signal_out_list.append((name, sigsize))
-        else:
-            print("Can't split signal '%s'!" % i)
-            return (None, None)
-    return (total_size, signal_out_list)
+                if d not in self.defines:
+                    raise VerilogError("%s: undefined macro `%s" % (where, d))
+                params, body = self.defines[d]
+                if params is not None:
+                    k = i
+                    while k < n and text[k].isspace():
+                        k += 1
+                    if k >= n or text[k] != '(':
+                        raise VerilogError("%s: `%s needs arguments" % (where, d))
+                    args, i = split_args(text, k, where)
+                    if len(args) != len(params):
+                        raise VerilogError("%s: `%s takes %d arguments" % (where, d, len(params)))
+                    for p, a in zip(params, args):
+                        body = re.sub(r'\b%s\b' % re.escape(p), lambda _: a, body)
+                body = body.replace('``', '')
+                out.append(' ' + self.text(body, cur_dir, where, depth + 1) + ' ')
+        if conds:
+            raise VerilogError("%s: `ifdef without `endif" % where)
+        return ''.join(out)
 
 
 ################################################################################
+# Tokens and expressions
+
+TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+) |
+    (?P<num>(?:\d[\d_]*\s*)?'[sS]?[bBoOdDhH]\s*[0-9a-fA-FxXzZ?_]+ |
+            \d[\d_]*(?:\.\d+)?(?:[eE][+-]?\d+)?) |
+    (?P<id>[a-zA-Z_][\w$]* | \$[\w$]+ | \\\S+) |
+    (?P<str>"(?:\\.|[^"\\])*") |
+    (?P<op><<<|>>>|===|!==|<<|>>|\*\*|==|!=|<=|>=|&&|\|\||~&|~\||~\^|\^~|\+:|-:|->|
+            [-+*/%<>!~&|^?:;,.\#@()\[\]{}='])
+''', re.X)
+
+
+def tokenize(text, where=''):
+    toks = []
+    i = 0
+    while i < len(text):
+        m = TOKEN_RE.match(text, i)
+        if not m:
+            raise VerilogError("%s: can't tokenise '%s'" % (where, text[i:i + 20]))
+        if m.lastgroup != 'ws':
+            toks.append(m.group(0))
+        i = m.end()
+    return toks
+
+
+def parse_number(tok):
+    """(value, width or None) of a literal"""
+    t = tok.replace('_', '').replace(' ', '')
+    if "'" not in t:
+        if '.' in t or 'e' in t.lower():
+            return int(float(t)), None
+        return int(t), None
+    size, _, rest = t.partition("'")
+    base = rest.lstrip('sS')[0].lower()
+    digits = rest.lstrip('sS')[1:]
+    if re.search(r'[xXzZ?]', digits):
+        raise VerilogError("Can't evaluate '%s'" % tok)
+    v = int(digits, {'b': 2, 'o': 8, 'd': 10, 'h': 16}[base])
+    w = int(size) if size else None
+    return (v & ((1 << w) - 1) if w else v), w
+
+
+BINARY = [('||',), ('&&',), ('|',), ('^', '~^', '^~'), ('&',),
+          ('==', '!=', '===', '!=='), ('<', '<=', '>', '>='),
+          ('<<', '>>', '<<<', '>>>'), ('+', '-'), ('*', '/', '%'), ('**',)]
+BINARY_PREC = dict((op, p) for p, ops in enumerate(BINARY) for op in ops)
+
+
+def int_div(a, b):
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def binop(op, a, b):
+    if op in ('/', '%') and b == 0:
+        raise VerilogError("Division by zero")
+    return {'||': lambda: int(bool(a) or bool(b)), '&&': lambda: int(bool(a) and bool(b)),
+            '|': lambda: a | b, '^': lambda: a ^ b, '~^': lambda: ~(a ^ b),
+            '^~': lambda: ~(a ^ b), '&': lambda: a & b,
+            '==': lambda: int(a == b), '!=': lambda: int(a != b),
+            '===': lambda: int(a == b), '!==': lambda: int(a != b),
+            '<': lambda: int(a < b), '<=': lambda: int(a <= b),
+            '>': lambda: int(a > b), '>=': lambda: int(a >= b),
+            '<<': lambda: a << b, '>>': lambda: a >> b,
+            '<<<': lambda: a << b, '>>>': lambda: a >> b,
+            '+': lambda: a + b, '-': lambda: a - b, '*': lambda: a * b,
+            '/': lambda: int_div(a, b), '%': lambda: a - b * int_div(a, b),
+            '**': lambda: a ** b}[op]()
+
+
+class Expr:
+    """Evaluates a constant expression's tokens; lookup(name) gives a
+    parameter's value"""
+    def __init__(self, toks, lookup):
+        self.toks = toks
+        self.i = 0
+        self.lookup = lookup
+
+    def peek(self):
+        return self.toks[self.i] if self.i < len(self.toks) else None
+
+    def take(self, want=None):
+        t = self.peek()
+        if t is None or (want and t != want):
+            raise VerilogError("Expected '%s' in '%s'" % (want or 'more', ' '.join(self.toks)))
+        self.i += 1
+        return t
+
+    def value(self):
+        v = self.ternary()[0]
+        if self.peek() is not None:
+            raise VerilogError("Junk after expression '%s'" % ' '.join(self.toks))
+        return v
+
+    def ternary(self):
+        c = self.binary(0)
+        if self.peek() == '?':
+            self.take()
+            a = self.ternary()
+            self.take(':')
+            b = self.ternary()
+            return a if c[0] else b
+        return c
+
+    def binary(self, prec):
+        lhs = self.unary()
+        while self.peek() in BINARY_PREC and BINARY_PREC[self.peek()] >= prec:
+            op = self.take()
+            p = BINARY_PREC[op]
+            rhs = self.binary(p if op == '**' else p + 1)
+            lhs = (binop(op, lhs[0], rhs[0]), None)
+        return lhs
+
+    def unary(self):
+        t = self.peek()
+        if t in ('+', '-', '!', '~', '&', '|', '^', '~&', '~|', '~^'):
+            self.take()
+            v, w = self.unary()
+            if t == '-':
+                return -v, None
+            if t == '!':
+                return int(not v), None
+            if t == '~':
+                return (~v & ((1 << w) - 1) if w else ~v), w
+            if t in ('&', '~&'):
+                r = int(w is not None and v == (1 << w) - 1)
+            elif t in ('|', '~|'):
+                r = int(v != 0)
+            elif t in ('^', '~^'):
+                r = bin(v).count('1') & 1
+            else:
+                return v, w
+            return (r ^ 1 if t.startswith('~') else r), 1
+        return self.primary()
+
+    def primary(self):
+        t = self.take()
+        if t == '(':
+            v = self.ternary()
+            self.take(')')
+            return v
+        if t == '{':
+            return self.concat()
+        if t == '$clog2':
+            self.take('(')
+            v = self.ternary()[0]
+            self.take(')')
+            return (max(0, v - 1).bit_length(), None)
+        if re.match(r"\d|'", t):
+            return parse_number(t)
+        if IDENT_RE.match(t):
+            return self.lookup(t), None
+        raise VerilogError("Unexpected '%s' in '%s'" % (t, ' '.join(self.toks)))
+
+    def concat(self):
+        first = self.ternary()
+        if self.peek() == '{':
+            # Replication:
+            self.take()
+            v, w = self.concat()
+            self.take('}')
+            r = 0
+            for _ in range(first[0]):
+                r = (r << w) | v
+            return r, w * first[0]
+        parts = [first]
+        while self.peek() == ',':
+            self.take()
+            parts.append(self.ternary())
+        self.take('}')
+        r, width = 0, 0
+        for v, w in parts:
+            if w is None:
+                raise VerilogError("Unsized value in concatenation")
+            r = (r << w) | (v & ((1 << w) - 1))
+            width += w
+        return r, width
+
+
+def split_commas(toks):
+    """Splits tokens at commas outside brackets"""
+    out, cur, depth = [], [], 0
+    for t in toks:
+        if t in ('(', '[', '{'):
+            depth += 1
+        elif t in (')', ']', '}'):
+            depth -= 1
+        if t == ',' and depth == 0:
+            out.append(cur)
+            cur = []
+        else:
+            cur.append(t)
+    if cur:
+        out.append(cur)
+    return out
+
+
+def matching(toks, i):
+    """Index of the bracket closing toks[i]"""
+    close = {'(': ')', '[': ']', '{': '}'}[toks[i]]
+    depth = 0
+    for j in range(i, len(toks)):
+        if toks[j] == toks[i]:
+            depth += 1
+        elif toks[j] == close:
+            depth -= 1
+            if depth == 0:
+                return j
+    raise VerilogError("Unbalanced '%s'" % toks[i])
 
-if len(sys.argv) == 3:
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-else:
-    print("Syntax:\n\t %s  <input.v> <output_toplevel.v>" % sys.argv[0])
-    sys.exit(1)
 
+################################################################################
+# Modules
+
+NET_TYPES = ('wire', 'reg', 'logic', 'tri', 'wand', 'wor', 'supply0', 'supply1',
+             'var', 'signed', 'unsigned')
+# Bodies whose declarations aren't the module's
+SKIP_BLOCKS = {'function': 'endfunction', 'task': 'endtask',
+               'generate': 'endgenerate', 'specify': 'endspecify'}
+
+
+class Port:
+    def __init__(self, direction, name, ranges):
+        self.direction = direction
+        self.name = name
+        self.ranges = ranges    # [(msb tokens, lsb tokens)], or 'integer'
+
+
+class Module:
+    """A parsed module:  its parameters (name, value tokens, overridable) in
+    order, and ports with unresolved ranges"""
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.params = []
+        self.ports = []
+
+    def param_names(self):
+        return [p[0] for p in self.params if p[2]]
+
+    def resolve(self, overrides=None):
+        """Returns ({parameter: value}, [(direction, name, width)]) with the
+        given parameter overrides"""
+        overrides = dict(overrides or {})
+        for k in overrides:
+            if k not in self.param_names():
+                raise VerilogError("%s has no parameter %s" % (self.name, k))
+        exprs = dict((p[0], p) for p in self.params)
+        values = {}
+        busy = set()
+
+        def lookup(name):
+            if name in values:
+                return values[name]
+            if name not in exprs:
+                raise VerilogError("%s: unknown identifier '%s'" % (self.name, name))
+            if name in busy:
+                raise VerilogError("%s: parameter %s depends on itself" % (self.name, name))
+            busy.add(name)
+            p = exprs[name]
+            values[name] = int(overrides[name]) if p[2] and name in overrides else \
+                Expr(p[1], lookup).value()
+            busy.discard(name)
+            return values[name]
+
+        ports = []
+        for p in self.ports:
+            if p.ranges == 'integer':
+                w = 32
+            else:
+                w = 1
+                for msb, lsb in p.ranges:
+                    w *= abs(Expr(msb, lookup).value() - Expr(lsb, lookup).value()) + 1
+            ports.append((p.direction, p.name, w))
+        # Every parameter that evaluates (some may need genvars, etc.):
+        for name in exprs:
+            try:
+                lookup(name)
+            except VerilogError:
+                pass
+        return dict((p[0], values[p[0]]) for p in self.params if p[0] in values), ports
+
+
+def parse_decl(toks, where):
+    """[net type] [signed] [ranges] name [= ...]:  returns (ranges, name)"""
+    i = 0
+    ranges = []
+    while i < len(toks) and toks[i] in NET_TYPES:
+        i += 1
+    if i < len(toks) and toks[i] == 'integer':
+        return 'integer', toks[i + 1]
+    while i < len(toks) and toks[i] == '[':
+        e = matching(toks, i)
+        r = toks[i + 1:e]
+        if ':' not in r:
+            raise VerilogError("%s: bad range [%s]" % (where, ' '.join(r)))
+        c = r.index(':')
+        ranges.append((r[:c], r[c + 1:]))
+        i = e + 1
+    if i >= len(toks) or not IDENT_RE.match(toks[i]):
+        raise VerilogError("%s: can't parse declaration '%s'" % (where, ' '.join(toks)))
+    if i + 1 < len(toks) and toks[i + 1] == '[':
+        raise VerilogError("%s: unpacked array port '%s'" % (where, toks[i]))
+    return ranges, toks[i]
+
+
+def parse_params(mod, toks, where, overridable):
+    """parameter [type] [range] A = x, B = y"""
+    for item in split_commas(toks):
+        if '=' not in item:
+            raise VerilogError("%s: parameter without a value '%s'" % (where, ' '.join(item)))
+        e = item.index('=')
+        lhs = [t for t in item[:e] if t not in ('parameter', 'localparam', 'integer', 'real')]
+        name = lhs[-1]
+        mod.params.append((name, item[e + 1:], overridable))
+
+
+def parse_module(toks, i, path):
+    """Parses the module whose name is at toks[i]; returns (Module, index
+    after endmodule)"""
+    where = "%s: module %s" % (path, toks[i])
+    mod = Module(toks[i], path)
+    i += 1
+    if toks[i] == '#':
+        e = matching(toks, i + 1)
+        local = False
+        for item in split_commas(toks[i + 2:e]):
+            if item and item[0] in ('parameter', 'localparam'):
+                local = item[0] == 'localparam'
+            parse_params(mod, item, where, not local)
+        i = e + 1
+
+    names = []
+    if toks[i] == '(':
+        e = matching(toks, i)
+        direction, decl = None, None
+        for item in split_commas(toks[i + 1:e]):
+            if item[0] in ('input', 'output', 'inout'):
+                direction = item[0]
+                decl = item[1:]
+            elif direction is None:
+                # Non-ANSI:  declared in the body
+                names.append(item[-1])
+                continue
+            elif len(item) == 1:
+                # Another name with the previous declaration's type:
+                decl = decl[:-1] + item
+            else:
+                decl = item
+            ranges, name = parse_decl(decl, where)
+            mod.ports.append(Port(direction, name, ranges))
+            decl = decl[:decl.index(name) + 1]
+        i = e + 1
+    if toks[i] != ';':
+        raise VerilogError("%s: expected ';' after the ports" % where)
+
+    body_ports = {}
+    while i < len(toks) and toks[i] not in ('endmodule', 'module'):
+        t = toks[i]
+        if t in SKIP_BLOCKS:
+            i = toks.index(SKIP_BLOCKS[t], i) + 1
+            continue
+        if t in ('parameter', 'localparam', 'input', 'output', 'inout'):
+            e = toks.index(';', i)
+            if t in ('parameter', 'localparam'):
+                parse_params(mod, toks[i + 1:e], where, t == 'parameter')
+            else:
+                decl = None
+                for item in split_commas(toks[i + 1:e]):
+                    decl = item if decl is None or len(item) > 1 else decl[:-1] + item
+                    ranges, name = parse_decl(decl, where)
+                    body_ports[name] = Port(t, name, ranges)
+                    decl = decl[:decl.index(name) + 1]
+            i = e
+        i += 1
+    if i >= len(toks) or toks[i] != 'endmodule':
+        raise VerilogError("%s: no endmodule" % where)
+    for n in names:
+        if n not in body_ports:
+            raise VerilogError("%s: port %s not declared" % (where, n))
+        mod.ports.append(body_ports[n])
+    return mod, i + 1
+
+
+def parse_modules(toks, path):
+    mods = []
+    i = 0
+    while i < len(toks):
+        if toks[i] in ('module', 'macromodule'):
+            m, i = parse_module(toks, i + 1, path)
+            mods.append(m)
+        else:
+            i += 1
+    return mods
 
-f = read_file_chomp(input_file)
 
-# Objective:  Find the module definition and generate a list of inputs and outputs:
-# Join into one huge line, then re-split lines at ';'
-longline = " ".join(f)
-# Remove /* .. */ comments:
-longline = re.sub('/\*.*?\*/', '', longline)
-a = longline.split(';')
+def read_modules(path, incdirs=(INC_PATH,), defines=None):
+    """Preprocesses, tokenises and parses a file's modules"""
+    pp = Preprocessor(incdirs, defines)
+    return parse_modules(tokenize(pp.file(path), path), path)
 
-(module, inputs, outputs) = find_module_decl(a)
 
-if not module:
-    print("Boohoo, didn't find a module declaration!");
-    sys.exit(1)
+################################################################################
+# Harness
+
+def gen_harness(module, input_list, output_list, top='toplevel', overrides=None):
+    """The wrapper's RTL, given [(name, size)] lists of inputs and outputs"""
+    got_clk = any(name == clk_net_name for (name, size) in input_list)
+    total_input_size = sum(size for (name, size) in input_list if name != clk_net_name)
+    total_output_size = sum(size for (name, size) in output_list)
+
+    rtl = "module %s(input wire clk, input wire shift_clk, input wire shift_en, input wire shift_in, output wire obit);\n\n" % top
+
+    # The clock does not come from the shift reg, it comes from a dedicated (fast) input:
+    if total_input_size > 1:
+        rtl += "    reg [%s:0] input_sreg_a;\n" % (total_input_size-1)
+        rtl += "    reg [%s:0] input_sreg;\n\n" % (total_input_size-1)
+        rtl += "    always @(posedge shift_clk) begin\n"
+        rtl += "        if (shift_en) input_sreg_a[%s:0] <= {input_sreg_a[%s:0], shift_in};\n" % (total_input_size-1, total_input_size-2)
+        rtl += "    end\n\n"
+        rtl += "    always @(posedge clk) begin\n"
+        rtl += "        input_sreg <= input_sreg_a;\n"
+        rtl += "    end\n\n"
+    elif total_input_size == 1:
+        rtl += "    reg input_sreg_a;\n"
+        rtl += "    reg input_sreg;\n\n"
+        rtl += "    always @(posedge shift_clk) begin\n"
+        rtl += "        if (shift_en) input_sreg_a <= shift_in;\n"
+        rtl += "    end\n\n"
+        rtl += "    always @(posedge clk) begin\n"
+        rtl += "        input_sreg <= input_sreg_a;\n"
+        rtl += "    end\n\n"
+    else:
+        # No inputs.  Weird but whatever.
+        rtl += "    // No inputs!\n\n"
 
-# OK, now we have a list of inputs/outputs.  Count bits in 'em:
-(total_input_size, input_list) = count_signals(inputs)
+    if total_output_size > 0:
+        rtl += "    wire [%s:0] oval;\n" % (total_output_size-1)
+        rtl += "    reg [%s:0] output_reg;\n\n" % (total_output_size-1)
+        rtl += "    always @(posedge clk) begin\n" # Note, fast clock
+        rtl += "        output_reg[%s:0] <= oval[%s:0];\n" % (total_output_size-1, total_output_size-1)
+        rtl += "    end\n\n"
 
-if total_input_size == None:
-    print("*** Gone wrong, damn.")
-    sys.exit(1)
+        rtl += "    assign obit = ^output_reg;\n\n"
+    else:
+        # Again, this would be weird...
+        rtl += "    // No outputs!\n\n"
 
-got_clk = False
-# Look for special nets (clk):
-for i in input_list:
-    (name, size) = i
-    if name == clk_net_name:
-        got_clk = True
-        break
+    if overrides:
+        rtl += "    %s #(%s) DUT(\n" % (module, ', '.join('.%s(%d)' % kv for kv in
+                                                      sorted(overrides.items())))
+    else:
+        rtl += "    %s DUT(\n" % (module)
+
+    # Wire up inputs:
+    current_bit = 0
+    comma = False
+    if got_clk:
+        rtl += "        .%s(%s)" % (clk_net_name, clk_net_name)
+        comma = True
+
+    for (name, size) in input_list:
+        # Special nets generated above
+        if name == clk_net_name:
+            continue
+
+        if size == 1:
+            rtl += "%s        .%s(input_sreg%s)" % \
+                (',\n' if comma else '', name, '[%d]' % current_bit if total_input_size > 1 else '')
+        else:
+            rtl += "%s        .%s(input_sreg[%s:%s])" % \
+                (',\n' if comma else '', name, current_bit + size - 1, current_bit)
+        comma = True
+        current_bit += size
+
+    # Wire up outputs:
+    current_bit = 0
+    for (name, size) in output_list:
+        if size == 1:
+            rtl += "%s        .%s(oval[%s])" % \
+                (',\n' if comma else '', name, current_bit)
+        else:
+            rtl += "%s        .%s(oval[%s:%s])" % \
+                (',\n' if comma else '', name, current_bit + size - 1, current_bit)
+        comma = True
+        current_bit += size
+
+    rtl += "\n        );\n\n"
+
+    rtl += "endmodule\n"
+    return rtl
+
+
+def harness_for(mod, top, overrides=None):
+    """(RTL, manifest entry) for a Module"""
+    params, ports = mod.resolve(overrides)
+    inouts = [n for (d, n, w) in ports if d == 'inout']
+    if inouts:
+        raise VerilogError("%s: inout ports (%s) can't be harnessed" %
+                           (mod.name, ', '.join(inouts)))
+    inputs = [(n, w) for (d, n, w) in ports if d == 'input']
+    outputs = [(n, w) for (d, n, w) in ports if d == 'output']
+    rtl = gen_harness(mod.name, inputs, outputs, top, overrides)
+    return rtl, {'module': mod.name, 'source': os.path.relpath(mod.path, TOP), 'top': top,
+                 'params': params, 'overrides': dict(overrides or {}),
+                 'input_bits': sum(w for (n, w) in inputs if n != clk_net_name),
+                 'output_bits': sum(w for (n, w) in outputs),
+                 'clock': any(n == clk_net_name for (n, w) in inputs)}
+
+
+def parse_sweep(specs):
+    """['cache:L2SIZE=12,13', ...] to {module: [(parameter, [values])]}"""
+    sweeps = {}
+    for spec in specs:
+        mod, _, axis = spec.partition(':')
+        k, _, vals = axis.partition('=')
+        if not mod or not k or not vals:
+            raise ValueError("Bad sweep '%s' (want <module>:<parameter>=<v>[,<v>...])" % spec)
+        mod, k = mod.strip(), k.strip()
+        vals = [int(v, 0) for v in vals.split(',')]
+        allowed = SWEEP_ALLOWED.get(mod, {}).get(k)
+        bad = [v for v in vals if allowed is not None and v not in allowed]
+        if bad:
+            raise ValueError("Bad sweep '%s':  %s can't be built with %s=%s (only %s)" %
+                             (spec, mod, k, ','.join(str(v) for v in bad),
+                              ','.join(str(v) for v in allowed)))
+        sweeps.setdefault(mod, []).append((k, vals))
+    return sweeps
+
+
+def read_sweep(path):
+    """A sweep file's specs:  "<module> <parameter>=<v>[,<v>...] ..." lines"""
+    specs = []
+    with open(path, 'r') as f:
+        for l in f:
+            p = l.split('#', 1)[0].split()
+            if len(p) == 1:
+                raise ValueError("%s: no parameters for %s" % (path, p[0]))
+            specs += ['%s:%s' % (p[0], a) for a in p[1:]]
+    return specs
+
+
+def sweep_points(axes):
+    """The cross product of [(parameter, [values])], as override dicts"""
+    names = [k for k, _ in axes]
+    return [dict(zip(names, c)) for c in itertools.product(*[v for _, v in axes])]
+
+
+def point_label(overrides):
+    return '_'.join('%s%d' % (k, overrides[k]) for k in sorted(overrides))
+
+
+def harness_file(args):
+    """Pool worker:  harnesses for every module in a file, one per point of
+    the module's sweep if it has one; returns manifest entries"""
+    (path, out_dir, incdirs, defines, sweeps) = args
+    try:
+        mods = read_modules(path, incdirs, defines)
+    except (OSError, VerilogError) as e:
+        return [{'source': os.path.relpath(path, TOP), 'error': str(e)}]
+    entries = []
+    for m, ov in [(m, ov) for m in mods for ov in
+                  (sweep_points(sweeps[m.name]) if m.name in sweeps else [None])]:
+        top = 'harness_%s' % m.name + ('__' + point_label(ov) if ov else '')
+        try:
+            rtl, ent = harness_for(m, top, ov)
+        except VerilogError as e:
+            entries.append({'module': m.name, 'source': os.path.relpath(path, TOP),
+                            'overrides': ov or {}, 'error': str(e)})
+            continue
+        if not ent['output_bits']:
+            ent['skipped'] = "%s has no outputs, so synthesises to nothing" % top
+            entries.append(ent)
+            continue
+        ent['harness'] = top + '.v'
+        with open(os.path.join(out_dir, ent['harness']), 'w') as f:
+            f.write("// Generated by tools/mk_harness.py from %s\n\n" % ent['source'])
+            f.write(rtl)
+        entries.append(ent)
+    return entries
+
+
+def harness_all(paths, out_dir, incdirs=(INC_PATH,), defines=None, jobs=None, sweeps=None):
+    """Harnesses every module in paths into out_dir (sweeps as from
+    parse_sweep), writing its manifest; returns the manifest"""
+    sweeps = sweeps or {}
+    os.makedirs(out_dir, exist_ok=True)
+    work = [(os.path.abspath(p), out_dir, list(incdirs), defines, sweeps) for p in paths]
+    with multiprocessing.Pool(jobs) as pool:
+        entries = [e for es in pool.map(harness_file, work) for e in es]
+    seen = {}
+    for e in entries:
+        if 'module' in e and 'error' not in e:
+            if e['top'] in seen:
+                e['error'] = "module %s also in %s" % (e['module'], seen[e['top']])
+            seen[e['top']] = e['source']
+    found = set(e.get('module') for e in entries)
+    for m in sorted(set(sweeps) - found):
+        entries.append({'module': m, 'error': "Swept module %s not found" % m})
+    manifest = {'sources': [os.path.relpath(os.path.abspath(p), TOP) for p in paths],
+                'include': [os.path.relpath(os.path.abspath(d), TOP) for d in incdirs],
+                'defines': defines or {},
+                'sweeps': sweeps,
+                'harnesses': entries}
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+def read_manifest(out_dir=OUT_PATH):
+    with open(os.path.join(out_dir, MANIFEST), 'r') as f:
+        return json.load(f)
 
-if got_clk:
-    print("Found %s" % clk_net_name)
-    total_input_size -= 1
 
-(total_output_size, output_list) = count_signals(outputs)
+################################################################################
 
-if total_output_size == None:
-    print("*** Gone wrong, damn.")
+def usage():
+    print("Syntax:\n\t %s [-I <include dir>] [-D <define>[=<value>]] [-m <module>] "
+          "<input.v> <output_toplevel.v>\n"
+          "\t %s -a [-o <output dir>] [-I <include dir>] [-D <define>[=<value>]] "
+          "[-j <jobs>] [-s <module>:<parameter>=<v>[,<v>...]] ... [-S <sweep file>] "
+          "[<input.v> ...]" % (sys.argv[0], sys.argv[0]))
+    print("\t-a:  Every module in the inputs (default src/*.v), and a manifest")
+    print("\t-s/-S:  Harness a module for each point of a parameter sweep")
     sys.exit(1)
 
-print("Total inputs %d bits;  total outputs %d bits" % (total_input_size, total_output_size))
-
-
-# Let's generate us some verilog.
-
-rtl = "module toplevel(input wire clk, input wire shift_clk, input wire shift_en, input wire shift_in, output wire obit);\n\n"
-
-# The clock does not come from the shift reg, it comes from a dedicated (fast) input:
-if total_input_size > 1:
-    rtl += "    reg [%s:0] input_sreg_a;\n" % (total_input_size-1)
-    rtl += "    reg [%s:0] input_sreg;\n\n" % (total_input_size-1)
-    rtl += "    always @(posedge shift_clk) begin\n"
-    rtl += "        if (shift_en) input_sreg_a[%s:0] <= {input_sreg_a[%s:0], shift_in};\n" % (total_input_size-1, total_input_size-2)
-    rtl += "    end\n\n"
-    rtl += "    always @(posedge clk) begin\n"
-    rtl += "        input_sreg <= input_sreg_a;\n"
-    rtl += "    end\n\n"
-elif total_input_size == 1:
-    rtl += "    reg input_sreg_a;\n"
-    rtl += "    reg input_sreg;\n\n"
-    rtl += "    always @(posedge shift_clk) begin\n"
-    rtl += "        if (shift_en) input_sreg_a <= shift_in;\n"
-    rtl += "    end\n\n"
-    rtl += "    always @(posedge clk) begin\n"
-    rtl += "        input_sreg <= input_sreg_a;\n"
-    rtl += "    end\n\n"
-else:
-    # No inputs.  Weird but whatever.
-    rtl += "    // No inputs!"
-
-if total_output_size > 0:
-    rtl += "    wire [%s:0] oval;\n" % (total_output_size-1)
-    rtl += "    reg [%s:0] output_reg;\n\n" % (total_output_size-1)
-    rtl += "    always @(posedge clk) begin\n" # Note, fast clock
-    rtl += "        output_reg[%s:0] <= oval[%s:0];\n" % (total_output_size-1, total_output_size-1)
-    rtl += "    end\n\n"
-
-    rtl += "    assign obit = ^output_reg;\n\n"
-else:
-    # Again, this would be weird...
-    rtl += "    // No outputs!"
-
-rtl += "    %s DUT(\n" % (module)
-
-# Wire up inputs:
-current_bit = 0
-comma = False
-if got_clk:
-    rtl += "        .%s(%s),\n" % (clk_net_name, clk_net_name)
-
-for i in input_list:
-    (name, size) = i
-
-    # Special nets generated above
-    if name == clk_net_name:
-        continue
-
-    if size == 1:
-        rtl += "    %s    .%s(input_sreg[%s])\n" % \
-            (',' if comma else '', name, current_bit)
-    else:
-        rtl += "    %s    .%s(input_sreg[%s:%s])\n" % \
-            (',' if comma else '', name, current_bit + size - 1, current_bit)
-    comma = True
-    current_bit += size
-
-# Wire up outputs:
-current_bit = 0
-for i in output_list:
-    (name, size) = i
-    if size == 1:
-        rtl += "    %s    .%s(oval[%s])\n" % \
-            (',' if comma else '', name, current_bit)
-    else:
-        rtl += "    %s    .%s(oval[%s:%s])\n" % \
-            (',' if comma else '', name, current_bit + size - 1, current_bit)
-    comma = True
-    current_bit += size
-
-rtl += "        );\n\n"
-
-# Condense outputs
-rtl += "endmodule"
 
-with open(output_file, "w") as output:
-    output.write(rtl)
-
-print("Success lol -- created %s" % output_file)
+if __name__ == '__main__':
+    batch = False
+    out_dir = OUT_PATH
+    incdirs = [INC_PATH]
+    defines = {}
+    module = None
+    jobs = None
+    sweep_specs = []
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ao:I:D:m:j:s:S:h')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    for o, a in opts:
+        if o == '-a':
+            batch = True
+        elif o == '-o':
+            out_dir = a
+        elif o == '-I':
+            incdirs.append(a)
+        elif o == '-D':
+            k, _, v = a.partition('=')
+            defines[k] = v or '1'
+        elif o == '-m':
+            module = a
+        elif o == '-j':
+            jobs = int(a)
+        elif o == '-s':
+            sweep_specs.append(a)
+        elif o == '-S':
+            try:
+                sweep_specs += read_sweep(a)
+            except (OSError, ValueError) as e:
+                print(e)
+                sys.exit(1)
+        else:
+            usage()
+
+    try:
+        sweeps = parse_sweep(sweep_specs)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    if sweeps and not batch:
+        usage()
+
+    if batch:
+        paths = args or sorted(glob.glob(os.path.join(SRC_PATH, '*.v')))
+        manifest = harness_all(paths, out_dir, incdirs, defines, jobs, sweeps)
+        failed = 0
+        skipped = 0
+        for e in manifest['harnesses']:
+            if 'error' in e:
+                print("*** %s" % e['error'])
+                failed += 1
+            elif 'skipped' in e:
+                print("--- %s" % e['skipped'])
+                skipped += 1
+            else:
+                print("%-40s %6d in %6d out%s" % (e['top'], e['input_bits'], e['output_bits'],
+                                                  '' if e['clock'] else '  (no clock)'))
+        print("%d harnesses, %d failed, %d skipped; manifest %s" %
+              (len(manifest['harnesses']) - failed - skipped, failed, skipped,
+               os.path.join(out_dir, MANIFEST)))
+        sys.exit(1 if failed else 0)
+
+    if len(args) != 2:
+        usage()
+    input_file, output_file = args
+
+    try:
+        mods = read_modules(input_file, incdirs, defines)
+        if module:
+            mods = [m for m in mods if m.name == module]
+        if not mods:
+            print("Boohoo, didn't find a module declaration!")
+            sys.exit(1)
+        mod = mods[0]
+        print("Found module '%s':" % mod.name)
+        rtl, ent = harness_for(mod, 'toplevel')
+    except (OSError, VerilogError) as e:
+        print("*** Gone wrong, damn:  %s" % e)
+        sys.exit(1)
+
+    for (d, n, w) in mod.resolve()[1]:
+        print("Signal %s\t size %d (%s)" % (n, w, d))
+    if ent['clock']:
+        print("Found %s" % clk_net_name)
+    print("Total inputs %d bits;  total outputs %d bits" % (ent['input_bits'], ent['output_bits']))
+
+    with open(output_file, "w") as output:
+        output.write(rtl)
+
+    print("Success lol -- created %s" % output_file)
@@ -0,0 +1,1106 @@
+#!/usr/bin/env python3
+#
+# Constrained-random instruction stream generator, producing ready-to-load
+# memory images for fuzzing the RTL against a reference model:
+#
+#   ./tools/mk_random.py -n 10000 -j 8 -o rand/
+#   ./tools/mk_random.py -s 5000 -S deps,shadow -w Memory=40,Branch=20 -o rand/
+#   ./tools/mk_random.py -s 1234 -S page -U -l
+#   ./verilator/obj_dir/Vwrapper_top +INPUT_FILE=rand/rand_1234.hex
+#
+# A program is a function of its seed and the options, so a failure is
+# reproduced from the seed alone.
+#
+# The instructions come from PPC.csv:  each row the RTL decodes is a template,
+# its operand fields filled in according to its In/Out columns, and templates
+# are chosen by class weight (-w Class=weight,...; the classes are PPC.csv's,
+# plus "Illegal" for words that don't decode).  Rows whose results aren't
+# architecturally defined or depend on timing, or which would break the
+# test's own environment, are left out (EXCLUDE, SPR_READ/SPR_WRITE).
+# Privileged rows are generated too; with -U the program runs in user mode and
+# they fault.
+#
+# Operands are constrained so that programs terminate and are deterministic:
+# - r1 holds the data area's base and is never written.  Loads/stores/cache
+#   ops address the (initialised) data area through a pointer set up by a
+#   preceding addi, so the memory templates are short sequences.
+# - Branches only go forwards, to the start of a later template; bclr/bcctr
+#   are preceded by a sequence loading LR/CTR with the target.
+# - Divisors are forced positive and non-zero.
+# - Exceptions (traps, sc, illegal/privileged instructions, DSI, ISI,
+#   alignment) are logged (vector, SRR0, SRR1, DAR, DSISR), and the handler
+#   resumes after the faulting instruction (or, for an ISI, at the next page).
+#
+# The program ends with an sc at a known address; the handler then stores the
+# GPRs, CR, XER, LR, CTR and exception count to a signature area, prints a
+# checksum of the signature, exception log and data area ("SIG xxxxxxxx") and
+# exits through the debug SPR, which dumps the registers.  The RTL and the
+# reference should agree on all of it.  Unexpected exceptions exit with the
+# vector number as the status.
+#
+# Stress modes (-S, comma-separated), after docs/test_plan.txt:
+#   deps     Sources are mostly the results of the previous few instructions
+#            (scoreboard/bypass)
+#   loaduse  Each load is immediately followed by a consumer of its result
+#   shadow   The instruction after a branch, isync, sc, trap or illegal
+#            instruction is a load, store, cache op, trap or illegal
+#            instruction
+#   page     Translation on:  the code is in segments which end at a page
+#            boundary (with a branch/sc/trap/memory op in the last slot)
+#            followed by an unmapped page, and the data area has an unmapped
+#            page which memory ops are biased to either side of
+#   align    Some loads/stores cross an 8-byte boundary (alignment exception)
+#
+# Output is $readmemh hex in mk_hex.py's format, with @ addresses so that only
+# the used parts of memory are written, or with -b a flat binary from address
+# 0 (for a reference model).
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import mr_hex
+import mr_isa
+from mr_isa import tokens
+
+
+# Memory layout.  Everything the runtime touches is below 0x8000, so it can
+# be addressed absolutely (RA=0).
+PAGE = 0x1000
+RESET = 0x100
+COMMON = 0x1000                 # Exception handler, prologue, finish
+SAVE = 0x2000                   # Handler save area and per-program parameters
+SIG = 0x2100                    # Signature:  GPRs, CR, XER, LR, CTR, log, count
+INIT = 0x2200                   # Initial GPRs, CR, XER, LR, CTR
+LOG = 0x3000                    # Exception log, wrapping, 32 bytes per entry
+LOG_SIZE = 0x1000
+BODY = 0x4000
+HTAB = 0xe0000                  # 64KB, minimum size
+TOP = 0xe0000                   # Code and data must fit below the HTAB
+
+S_R4 = SAVE + 0
+S_R5 = SAVE + 4
+S_CR = SAVE + 8
+S_LOGP = SAVE + 12
+S_NEXC = SAVE + 16
+S_EXIT = SAVE + 20              # Address after the final sc
+S_ENTRY = SAVE + 24
+S_MSR = SAVE + 28
+S_SDR1 = SAVE + 32
+S_SUMS = SAVE + 0x40            # (address, words) pairs to checksum, 0-ended
+SIG_WORDS = 38
+
+SPR_XER = 1
+SPR_LR = 8
+SPR_CTR = 9
+SPR_DSISR = 18
+SPR_DAR = 19
+SPR_SDR1 = 25
+SPR_SRR0 = 26
+SPR_SRR1 = 27
+SPR_SPRG0 = 272
+SPR_DEBUG = 1023
+
+MSR_PR = 0x4000
+MSR_ME = 0x1000
+MSR_IR_DR = 0x30
+PTE_RC_RW = 0x182               # R, C, WIMG=0, PP=10
+
+HANDLED_VECTORS = (0x300, 0x400, 0x600, 0x700, 0xc00)
+
+# Not generated:  undefined results (dcba, dcbi discarding dirty lines),
+# timing (mftb), or they'd upset the environment (MSR, rfi, the debug op;
+# lwarx/stwcx. as the reservation can be lost to an exception).
+EXCLUDE = ('DEBUG', 'rfi', 'mtmsr', 'mftb', 'dcba', 'dcbi', 'lwarx', 'stwcx')
+# SPRs the random stream may access:  not the timebase/DEC, PVR/HID0,
+# BATs, DABR, SDR1 writes or the debug/cache-maintenance SPRs.
+SPR_READ = (1, 8, 9, 18, 19, 25, 26, 27, 272, 273, 274, 275)
+SPR_WRITE = (1, 8, 9, 18, 19, 26, 27, 272, 273, 274, 275)
+# SR writes would change translation under the page stress mode
+EXCLUDE_MMU = ('mtsr', 'mtsrin')
+
+CLASSES = ('Arithmetic', 'Logical', 'Compare', 'CondReg', 'Branch', 'Memory',
+           'Cache', 'Special', 'Trap', 'Illegal')
+DEFAULT_WEIGHTS = {'Arithmetic': 20, 'Logical': 20, 'Compare': 6,
+                   'CondReg': 4, 'Branch': 10, 'Memory': 25, 'Cache': 3,
+                   'Special': 6, 'Trap': 3, 'Illegal': 1}
+STRESS_MODES = ('deps', 'loaduse', 'shadow', 'page', 'align')
+
+# Template kinds, and the number of words each generates
+K_GEN = 0                       # Fields straight from In/Out
+K_DIV = 1                       # Divisor fixup, then K_GEN
+K_MEM_D = 2                     # addi rP,r1,e-d; op rT,d(rP)
+K_MEM_X = 3                     # li rP,e; op rT,r1,rP
+K_MEM_UX = 4                    # addi rP,r1,e-k; li rQ,k; op rT,rP,rQ
+K_MULT = 5                      # addi rP,r1,e; lmw/stmw rT,0(rP)
+K_CACHE = 6                     # li rP,e; op r1,rP
+K_B = 7
+K_BC = 8
+K_BCLR = 9                      # lis/ori rX; mtlr rX; bclr
+K_BCCTR = 10                    # lis/ori rX; mtctr rX; bcctr
+K_ILL = 11
+KIND_LEN = (1, 3, 2, 2, 3, 2, 2, 1, 1, 4, 4, 1)
+
+WRITABLE = np.array([0] + list(range(2, 32)))
+POINTERS = np.array(range(2, 32))
+P_DEP = 0.7                     # deps:  probability a source is a recent result
+P_LK = 0.3
+P_RC = 0.5
+P_OE = 0.3
+P_UNALIGNED = 0.1
+P_EDGE = 0.3                    # page:  probability of an access at the hole
+MAX_SKIP = 8                    # Branches skip up to this many templates
+MAX_SEG = 48                    # page:  templates per code segment
+DATA_PAGES = 4
+
+# Fields the K_GEN templates fill, and the random value each takes
+GEN_FIELDS = (('RT', 21, 5), ('RS', 21, 5), ('RA', 16, 5), ('RB', 11, 5),
+              ('BF', 23, 3), ('BFA', 18, 3), ('BT', 21, 5), ('BA', 16, 5),
+              ('BB', 11, 5), ('TO', 21, 5), ('SH', 11, 5), ('MB', 6, 5),
+              ('ME', 1, 5), ('SI', 0, 16), ('UI', 0, 16), ('FXM', 12, 8),
+              ('SR', 16, 4), ('Rc', 0, 1), ('OE', 10, 1))
+V_DST, V_SRC0, V_SRC1, V_SRC2, V_IMM, V_U5A, V_U5B, V_U5C, V_U3A, V_U3B, \
+    V_U8, V_U4, V_RC, V_OE = range(14)
+FIXED_ROLES = {'SI': V_IMM, 'UI': V_IMM, 'SH': V_U5A, 'MB': V_U5B,
+               'ME': V_U5C, 'BT': V_U5A, 'BA': V_U5B, 'BB': V_U5C,
+               'TO': V_U5A, 'BF': V_U3A, 'BFA': V_U3B, 'FXM': V_U8,
+               'SR': V_U4}
+# Operands which are always zero here
+ZERO_TOKENS = ('L', 'E', 'EH', 'TH', 'CT', 'LEV', 'BH', 'spr')
+
+IMM_SPECIAL = np.array([0, 1, 2, 0x7fff, 0x8000, 0xffff, 0xfffe, 0x8001])
+GPR_SPECIAL = np.array([0, 1, 0xffffffff, 0x7fffffff, 0x80000000,
+                        0x0000ffff, 0xffff0000, 0x80000001])
+
+# Primary opcodes which are reserved, or 64-bit only, for generating
+# illegal instructions
+ILLEGAL_OPS = (0, 1, 2, 4, 6, 9, 22, 30, 56, 57, 58, 60, 61, 62)
+
+
+################################################################################
+# Encoding, from PPC.csv
+
+FIELDS = {'RT': (21, 5), 'RS': (21, 5), 'BO': (21, 5), 'BT': (21, 5),
+          'TO': (21, 5), 'RA': (16, 5), 'BI': (16, 5), 'BA': (16, 5),
+          'RB': (11, 5), 'BB': (11, 5), 'SH': (11, 5), 'MB': (6, 5),
+          'ME': (1, 5), 'BF': (23, 3), 'BFA': (18, 3), 'SR': (16, 4),
+          'FXM': (12, 8), 'SI': (0, 16), 'UI': (0, 16), 'D': (0, 16),
+          'AA': (1, 1), 'LK': (0, 1), 'Rc': (0, 1), 'OE': (10, 1)}
+
+
+def field(name, v):
+    if name == 'BD':
+        return v & 0xfffc
+    if name == 'LI':
+        return v & 0x3fffffc
+    (shift, width) = FIELDS[name]
+    return (v & ((1 << width) - 1)) << shift
+
+
+def field_spr(spr):
+    return ((spr & 0x1f) << 16) | ((spr >> 5) << 11)
+
+
+def base_word(row):
+    """Opcode, extended opcode and any fixed Rc bit of a PPC.csv row."""
+    w = int(row['Opcode']) << 26
+    if row['XO'] != '':
+        w |= int(row['XO']) << 1
+    if row['Rc'] == 'A':
+        w |= 1
+    return w
+
+
+class Encoder:
+    """Assembles instructions from PPC.csv rows, by name and fields."""
+    def __init__(self, isa):
+        self.rows = {}
+        for r in isa.rows.values():
+            self.rows.setdefault(r['Name'], []).append(r)
+
+    def row(self, name, sub=None):
+        """The row for name; sub is the spr/BO value for sub-decoded rows."""
+        rows = self.rows[name]
+        if len(rows) == 1:
+            return rows[0]
+        for r in rows:
+            if 'match' in r:
+                (_, val, mask) = r['match']
+                if (sub & ~mask) == val:
+                    return r
+        raise ValueError("No row for %s %s" % (name, sub))
+
+    def __call__(self, name, spr=None, **f):
+        if spr is not None:
+            w = base_word(self.row(name, spr)) | field_spr(spr)
+        else:
+            w = base_word(self.row(name, f.get('BO')))
+        for (k, v) in f.items():
+            w |= field(k, v)
+        return w
+
+
+class Asm:
+    """Just enough of an assembler for the runtime:  a run of words at an
+    address, with labels for branches."""
+    def __init__(self, enc, addr):
+        self.enc = enc
+        self.addr = addr
+        self.words = []
+        self.labels = {}
+        self.fixups = []
+
+    def here(self):
+        return self.addr + 4 * len(self.words)
+
+    def __call__(self, name, spr=None, **f):
+        self.words.append(self.enc(name, spr, **f))
+
+    def label(self, l):
+        self.labels[l] = self.here()
+
+    def b(self, l, name='b', **f):
+        self.fixups.append((len(self.words), l, name, f))
+        self.words.append(0)
+
+    def beq(self, l):
+        self.b(l, 'bc', BO=0b01100, BI=2)
+
+    def bne(self, l):
+        self.b(l, 'bc', BO=0b00100, BI=2)
+
+    def blt(self, l):
+        self.b(l, 'bc', BO=0b01100, BI=0)
+
+    def words_array(self):
+        for (i, l, name, f) in self.fixups:
+            off = self.labels[l] - (self.addr + 4 * i)
+            f = dict(f)
+            f['LI' if name == 'b' else 'BD'] = off
+            self.words[i] = self.enc(name, **f)
+        return np.array(self.words, dtype=np.uint32)
+
+
+def build_runtime(enc):
+    """The vectors, exception handler, prologue and finish, which are the same
+    for every program.  Returns [(address, words)]."""
+    segs = []
+    for v in range(0x100, 0x1000, 0x100):
+        a = Asm(enc, v)
+        if v == RESET:
+            a.labels['prologue'] = COMMON + 0x400
+            a.b('prologue')
+        elif v in HANDLED_VECTORS:
+            a('mtspr', SPR_SPRG0, RS=3)
+            a('addi', RT=3, RA=0, SI=v)
+            a.labels['common'] = COMMON
+            a.b('common')
+        else:
+            a('addi', RT=3, RA=0, SI=v >> 8)
+            a('mtspr', SPR_DEBUG, RS=3)
+        segs.append((v, a.words_array()))
+
+    # Common handler:  r3 = vector, SPRG0 = r3
+    a = Asm(enc, COMMON)
+    a('stw', RS=4, RA=0, D=S_R4)
+    a('stw', RS=5, RA=0, D=S_R5)
+    a('mfcr', RT=4)
+    a('stw', RS=4, RA=0, D=S_CR)
+    a('lwz', RT=4, RA=0, D=S_LOGP)
+    a('stw', RS=3, RA=4, D=0)
+    for (i, spr) in enumerate((SPR_SRR0, SPR_SRR1, SPR_DAR, SPR_DSISR)):
+        a('mfspr', spr, RT=5)
+        a('stw', RS=5, RA=4, D=4 + 4 * i)
+    a('addi', RT=4, RA=4, SI=32)
+    a('rlwinm', RS=4, RA=4, SH=0, MB=20, ME=26)
+    a('ori', RS=4, RA=4, UI=LOG)
+    a('stw', RS=4, RA=0, D=S_LOGP)
+    a('lwz', RT=5, RA=0, D=S_NEXC)
+    a('addi', RT=5, RA=5, SI=1)
+    a('stw', RS=5, RA=0, D=S_NEXC)
+    a('mfspr', SPR_SRR0, RT=5)
+    a('cmpi', BF=0, RA=3, SI=0xc00)
+    a.bne('not_sc')
+    a('lwz', RT=4, RA=0, D=S_EXIT)
+    a('cmpl', BF=0, RA=5, RB=4)
+    a.beq('finish')
+    a.b('resume')
+    a.label('not_sc')
+    a('cmpi', BF=0, RA=3, SI=0x400)
+    a.bne('skip')
+    # ISI:  carry on after the unmapped page
+    a('rlwinm', RS=5, RA=5, SH=0, MB=0, ME=19)
+    a('addi', RT=5, RA=5, SI=PAGE)
+    a.b('set_srr0')
+    a.label('skip')
+    a('addi', RT=5, RA=5, SI=4)
+    a.label('set_srr0')
+    a('mtspr', SPR_SRR0, RS=5)
+    a.label('resume')
+    a('lwz', RT=4, RA=0, D=S_MSR)
+    a('mtspr', SPR_SRR1, RS=4)
+    a('lwz', RT=4, RA=0, D=S_CR)
+    a('mtcrf', FXM=0xff, RS=4)
+    a('lwz', RT=4, RA=0, D=S_R4)
+    a('lwz', RT=5, RA=0, D=S_R5)
+    a('mfspr', SPR_SPRG0, RT=3)
+    a('rfi')
+
+    # The program's final sc:  store the signature, checksum and exit
+    a.label('finish')
+    a('lwz', RT=4, RA=0, D=S_CR)
+    a('mtcrf', FXM=0xff, RS=4)
+    a('lwz', RT=4, RA=0, D=S_R4)
+    a('lwz', RT=5, RA=0, D=S_R5)
+    a('mfspr', SPR_SPRG0, RT=3)
+    for r in range(32):
+        a('stw', RS=r, RA=0, D=SIG + 4 * r)
+    a('mfcr', RT=3)
+    a('stw', RS=3, RA=0, D=SIG + 128)
+    for (i, spr) in enumerate((SPR_XER, SPR_LR, SPR_CTR)):
+        a('mfspr', spr, RT=3)
+        a('stw', RS=3, RA=0, D=SIG + 132 + 4 * i)
+    a('lwz', RT=3, RA=0, D=S_LOGP)
+    a('stw', RS=3, RA=0, D=SIG + 144)
+    a('lwz', RT=3, RA=0, D=S_NEXC)
+    a('stw', RS=3, RA=0, D=SIG + 148)
+    # Rotate-and-xor over each (address, words) in S_SUMS
+    a('addi', RT=3, RA=0, SI=0)
+    a('addi', RT=7, RA=0, SI=S_SUMS - 8)
+    a.label('sum_next')
+    a('lwzu', RT=4, RA=7, D=8)
+    a('lwz', RT=5, RA=7, D=4)
+    a('cmpi', BF=0, RA=5, SI=0)
+    a.beq('sum_done')
+    a('mtspr', SPR_CTR, RS=5)
+    a('addi', RT=4, RA=4, SI=-4)
+    a.label('sum_loop')
+    a('lwzu', RT=6, RA=4, D=4)
+    a('rlwinm', RS=3, RA=3, SH=1, MB=0, ME=31)
+    a('xor', RS=3, RA=3, RB=6)
+    a.b('sum_loop', 'bc', BO=0b10000, BI=0)
+    a.b('sum_next')
+    a.label('sum_done')
+    for c in b'SIG ':
+        a('addi', RT=4, RA=0, SI=0x100 | c)
+        a('mtspr', SPR_DEBUG, RS=4)
+    a('addi', RT=4, RA=0, SI=8)
+    a('mtspr', SPR_CTR, RS=4)
+    a.label('hex_loop')
+    a('rlwinm', RS=3, RA=3, SH=4, MB=0, ME=31)
+    a('andi_rc', RS=3, RA=4, UI=15)
+    a('cmpi', BF=0, RA=4, SI=10)
+    a.blt('hex_digit')
+    a('addi', RT=4, RA=4, SI=ord('a') - ord('0') - 10)
+    a.label('hex_digit')
+    a('addi', RT=4, RA=4, SI=0x100 | ord('0'))
+    a('mtspr', SPR_DEBUG, RS=4)
+    a.b('hex_loop', 'bc', BO=0b10000, BI=0)
+    a('addi', RT=4, RA=0, SI=0x100 | ord('\n'))
+    a('mtspr', SPR_DEBUG, RS=4)
+    a('addi', RT=3, RA=0, SI=0)
+    a('mtspr', SPR_DEBUG, RS=3)
+    assert a.here() <= COMMON + 0x400
+    segs.append((COMMON, a.words_array()))
+
+    # Prologue:  SDR1 and SRs, initial registers, rfi to the program
+    a = Asm(enc, COMMON + 0x400)
+    a('lwz', RT=3, RA=0, D=S_SDR1)
+    a('mtspr', SPR_SDR1, RS=3)
+    a('addi', RT=3, RA=0, SI=0)
+    a('addi', RT=4, RA=0, SI=0)
+    a('addi', RT=5, RA=0, SI=16)
+    a('mtspr', SPR_CTR, RS=5)
+    a.label('sr_loop')
+    a('mtsrin', RS=3, RB=4)
+    a('addi', RT=3, RA=3, SI=1)
+    a('addis', RT=4, RA=4, SI=0x1000)
+    a.b('sr_loop', 'bc', BO=0b10000, BI=0)
+    a('sync')
+    a('isync')
+    a('lwz', RT=3, RA=0, D=S_ENTRY)
+    a('mtspr', SPR_SRR0, RS=3)
+    a('lwz', RT=3, RA=0, D=S_MSR)
+    a('mtspr', SPR_SRR1, RS=3)
+    a('lwz', RT=3, RA=0, D=INIT + 128)
+    a('mtcrf', FXM=0xff, RS=3)
+    for (i, spr) in enumerate((SPR_XER, SPR_LR, SPR_CTR)):
+        a('lwz', RT=3, RA=0, D=INIT + 132 + 4 * i)
+        a('mtspr', spr, RS=3)
+    for r in range(32):
+        a('lwz', RT=r, RA=0, D=INIT + 4 * r)
+    a('rfi')
+    segs.append((COMMON + 0x400, a.words_array()))
+
+    segs.append((LOG, np.zeros(LOG_SIZE // 4, dtype=np.uint32)))
+    return segs
+
+
+################################################################################
+# Templates
+
+class Templates:
+    """The PPC.csv rows to generate, as arrays indexed by template number."""
+    def __init__(self, isa, enc, weights, mmu):
+        self.names = []
+        base = []
+        kind = []
+        cls = []
+        roles = []
+        size = []
+        load = []
+        bo = []
+
+        for (name, rows) in sorted(enc.rows.items()):
+            if name in EXCLUDE or (mmu and name in EXCLUDE_MMU):
+                continue
+            for r in rows:
+                if (r['Subdec'] == '0' or r['Class'] not in CLASSES or
+                    'FC_ILL' in r['DE_OP']):
+                    continue
+                w = base_word(r)
+                if name in mr_isa.SUBDEC_SPR:
+                    (spr, mask) = mr_isa.parse_match(r['spr'])
+                    ok = SPR_READ if name == 'mfspr' else SPR_WRITE
+                    if mask != 0 or spr not in ok:
+                        continue
+                    w |= field_spr(spr)
+                (k, rl) = self.classify(r)
+                self.names.append(name)
+                base.append(w)
+                kind.append(k)
+                cls.append(CLASSES.index(r['Class']))
+                roles.append(rl)
+                mem = [m for m in tokens(r['MEM_OP'].replace(';', ','))
+                       if re.match(r'[LS]\d', m)]
+                mem = mem[0] if mem and r['Class'] == 'Memory' else ''
+                size.append(int(mem[1:].split('_')[0] or 0) // 8)
+                load.append(mem.startswith('L'))
+                bo.append(r['match'][1:] if k in (K_BC, K_BCLR, K_BCCTR)
+                          else (0, 0))
+
+        self.names.append('.long')
+        base.append(0)
+        kind.append(K_ILL)
+        cls.append(CLASSES.index('Illegal'))
+        roles.append([-1] * len(GEN_FIELDS))
+        size.append(0)
+        load.append(False)
+        bo.append((0, 0))
+
+        self.base = np.array(base, dtype=np.int64)
+        self.kind = np.array(kind)
+        self.cls = np.array(cls)
+        self.roles = np.array(roles, dtype=np.int8)
+        self.size = np.array(size)
+        self.load = np.array(load)
+        self.bo_val = np.array([b[0] for b in bo])
+        self.bo_mask = np.array([b[1] for b in bo])
+        self.length = np.array(KIND_LEN)[self.kind]
+        self.count = len(self.names)
+        self.p = self.probabilities(weights)
+        self.cdf = cdf(self.p)
+
+        # For the shadow and page modes
+        name = np.array(self.names)
+        self.trigger = ((self.cls == CLASSES.index('Branch')) |
+                        (self.kind == K_ILL) |
+                        np.isin(name, ('isync', 'sc', 'tw', 'twi')))
+        shadow = ((self.kind == K_MEM_D) | (self.kind == K_MEM_X) |
+                  (self.kind == K_CACHE) | (self.kind == K_ILL) |
+                  np.isin(name, ('tw', 'twi')))
+        self.shadow_ids = np.flatnonzero(shadow)
+        self.shadow_cdf = cdf(self.p[shadow])
+        boundary = (self.trigger | shadow) & (self.length <= 2) & \
+            (self.kind != K_MULT)
+        self.boundary = {}
+        for l in (1, 2):
+            ids = np.flatnonzero(boundary & (self.length == l))
+            if len(ids):
+                self.boundary[l] = ids
+
+        self.illegal = illegal_words(isa)
+
+    @staticmethod
+    def classify(r):
+        """Kind of template, and for K_GEN/K_DIV the V_* role of each
+        GEN_FIELDS field (or -1)."""
+        ins = tokens(r['In'])
+        outs = tokens(r['Out'])
+        name = r['Name']
+        rl = [-1] * len(GEN_FIELDS)
+        fields = [f[0] for f in GEN_FIELDS]
+
+        if r['Class'] == 'Memory':
+            if name in ('lmw', 'stmw'):
+                return (K_MULT, rl)
+            if r['Form'] == 'D':
+                return (K_MEM_D, rl)
+            return ((K_MEM_UX if 'RA' in outs else K_MEM_X), rl)
+        if r['Class'] == 'Cache':
+            return (K_CACHE, rl)
+        if r['Class'] == 'Branch':
+            return ({'b': K_B, 'bc': K_BC, 'bclr': K_BCLR,
+                     'bcctr': K_BCCTR}[name], rl)
+
+        src = V_SRC0
+        for t in ins + outs:
+            f = 'RA' if t == 'RA0' else t
+            if f in ('RT', 'RA', 'RS', 'RB'):
+                if rl[fields.index(f)] != -1:
+                    continue
+                if t in outs:
+                    rl[fields.index(f)] = V_DST
+                else:
+                    rl[fields.index(f)] = src
+                    src += 1
+            elif f in FIXED_ROLES:
+                rl[fields.index(f)] = FIXED_ROLES[f]
+            elif f not in ZERO_TOKENS:
+                raise ValueError("%s: Unknown operand %s" % (name, t))
+        if r['Rc'] == '1':
+            rl[fields.index('Rc')] = V_RC
+        if r['Form'] == 'XO' and r['SO'] == '1':
+            rl[fields.index('OE')] = V_OE
+        return ((K_DIV if 'div_' in r['EXE_OP'] else K_GEN), rl)
+
+    def probabilities(self, weights):
+        """Each class gets its weight, shared equally between the names in
+        it and then between a name's rows."""
+        names = np.array(self.names)
+        p = np.zeros(self.count)
+        for (c, cname) in enumerate(CLASSES):
+            in_cls = self.cls == c
+            cnames = set(names[in_cls])
+            for n in cnames:
+                rows = in_cls & (names == n)
+                p[rows] = weights.get(cname, 0) / len(cnames) / rows.sum()
+        if p.sum() == 0:
+            raise ValueError("All class weights are zero")
+        return p / p.sum()
+
+
+def cdf(p):
+    c = np.cumsum(p)
+    return c / c[-1]
+
+
+def choice(rng, a, m):
+    """rng.choice(a, m), but quicker for small m."""
+    return a[rng.integers(0, len(a), m)]
+
+
+def illegal_words(isa, count=256):
+    rng = np.random.default_rng(0)
+    ops = rng.choice(ILLEGAL_OPS, count * 2)
+    low = rng.integers(0, 1 << 26, count * 2)
+    w = [int(o) << 26 | int(l) for (o, l) in zip(ops, low)]
+    return np.array([x for x in w if isa.find_row(x) is None][:count],
+                    dtype=np.int64)
+
+
+################################################################################
+# Generation
+
+class Program:
+    """A generated program:  memory as [(address, words)], plus the layout."""
+    def __init__(self, seed):
+        self.seed = seed
+        self.segs = []
+        self.entry = 0
+        self.exit = 0
+        self.code = []          # (start, end) address of each code segment
+        self.words = None       # Code, from BODY
+
+
+class Generator:
+    def __init__(self, length=1000, weights=DEFAULT_WEIGHTS, stress=(),
+                 user=False):
+        self.length = length
+        self.stress = set(stress)
+        self.mmu = 'page' in self.stress
+        self.user = user
+        self.isa = mr_isa.ISA()
+        self.enc = Encoder(self.isa)
+        self.t = Templates(self.isa, self.enc, weights, self.mmu)
+        self.runtime = build_runtime(self.enc)
+        e = self.enc
+        self.w_addi = e('addi')
+        self.w_addis = e('addis')
+        self.w_ori = e('ori')
+        self.w_rlwinm = e('rlwinm')
+        self.w_mtlr = e('mtspr', SPR_LR)
+        self.w_mtctr = e('mtspr', SPR_CTR)
+        self.w_b = e('b')
+        self.w_sc = e('sc')
+
+    def generate(self, seed):
+        rng = np.random.default_rng(seed)
+        t = self.t
+        n = self.length
+        prog = Program(seed)
+
+        tid = np.searchsorted(t.cdf, rng.random(n), 'right')
+        if 'shadow' in self.stress:
+            idx = np.flatnonzero(t.trigger[tid[:-1]]) + 1
+            r = rng.random(len(idx))
+            tid[idx] = t.shadow_ids[np.searchsorted(t.shadow_cdf, r, 'right')]
+
+        addr = self.layout(rng, tid, prog)
+        code_end = int(addr.max()) + 4
+        nwords = (code_end - BODY) // 4
+        words = np.zeros(nwords, dtype=np.int64)
+        for (start, end) in prog.code:
+            if start % PAGE:
+                page = start & ~(PAGE - 1)
+                words[(page - BODY) // 4] = self.w_b | field('LI',
+                                                             start - page)
+
+        # Data area, above the code, with a hole in the page mode
+        data = (code_end + 2 * PAGE - 1) & ~(PAGE - 1)
+        pages = list(range(DATA_PAGES + (1 if self.mmu else 0)))
+        hole = None
+        if self.mmu:
+            hole = DATA_PAGES // 2
+            pages.remove(hole)
+        data_end = data + PAGE * (DATA_PAGES + (1 if self.mmu else 0))
+        if data_end > TOP:
+            raise ValueError("Program too large (%d templates)" % n)
+
+        # Registers:  destinations, and up to three sources
+        dst = choice(rng, WRITABLE, n)
+        src = rng.integers(0, 32, (3, n))
+        if 'deps' in self.stress:
+            back = np.arange(n) - rng.integers(1, 4, (3, n))
+            dep = (back >= 0) & (rng.random((3, n)) < P_DEP)
+            src = np.where(dep, dst[np.maximum(back, 0)], src)
+        if 'loaduse' in self.stress:
+            idx = np.flatnonzero(t.load[tid[:-1]]) + 1
+            src[0, idx] = dst[idx - 1]
+
+        kind = t.kind[tid]
+        at = (addr[:n] - BODY) // 4
+        ea = EAPicker(rng, pages, hole, 'align' in self.stress)
+
+        sel = np.flatnonzero((kind == K_GEN) | (kind == K_DIV))
+        if len(sel):
+            self.gen_fields(rng, words, at, tid, sel, dst, src)
+        for (k, fn) in ((K_MEM_D, self.gen_mem_d), (K_MEM_X, self.gen_mem_x),
+                        (K_MEM_UX, self.gen_mem_ux), (K_MULT, self.gen_mult),
+                        (K_CACHE, self.gen_cache)):
+            sel = np.flatnonzero(kind == k)
+            if len(sel):
+                fn(rng, words, at[sel], tid[sel], dst[sel], src[0, sel], ea)
+        for k in (K_B, K_BC, K_BCLR, K_BCCTR):
+            sel = np.flatnonzero(kind == k)
+            if len(sel):
+                self.gen_branch(rng, words, addr, tid, sel, dst, k)
+        sel = np.flatnonzero(kind == K_ILL)
+        words[at[sel]] = choice(rng, t.illegal, len(sel))
+        words[(addr[n] - BODY) // 4] = self.w_sc
+        words = words.astype(np.uint32)
+
+        prog.words = words
+        for (start, end) in prog.code:
+            # The branch at the start of the page, unless it's close enough
+            # to write the page from the start
+            page = start & ~(PAGE - 1)
+            if start - page > 64:
+                prog.segs.append((page, words[(page - BODY) // 4:][:1]))
+            else:
+                start = page
+            prog.segs.append((start, words[(start - BODY) // 4:
+                                           (end - BODY) // 4]))
+
+        # Data, page table and parameters
+        sums = [(SIG, SIG_WORDS), (LOG, LOG_SIZE // 4)]
+        for p in pages:
+            a = data + p * PAGE
+            prog.segs.append((a, rng.integers(0, 1 << 32, PAGE // 4,
+                                              dtype=np.uint32)))
+            sums.append((a, PAGE // 4))
+        if self.mmu:
+            holes = [end for (_, end) in prog.code] + [data + hole * PAGE]
+            self.page_table(prog, data_end, holes)
+
+        prog.entry = int(addr[0])
+        prog.exit = int(addr[n]) + 4
+        msr = (MSR_ME | (MSR_PR if self.user else 0) |
+               (MSR_IR_DR if self.mmu else 0))
+        params = np.zeros(0x40 // 4 + 2 * len(sums) + 2, dtype=np.uint32)
+        params[(S_LOGP - SAVE) // 4] = LOG
+        params[(S_EXIT - SAVE) // 4] = prog.exit
+        params[(S_ENTRY - SAVE) // 4] = prog.entry
+        params[(S_MSR - SAVE) // 4] = msr
+        params[(S_SDR1 - SAVE) // 4] = HTAB if self.mmu else 0
+        params[(S_SUMS - SAVE) // 4:][:2 * len(sums)] = np.array(sums).ravel()
+        prog.segs.append((SAVE, params))
+
+        init = np.zeros(36, dtype=np.uint32)
+        init[:32] = np.where(rng.random(32) < 0.25,
+                             choice(rng, GPR_SPECIAL, 32),
+                             rng.integers(0, 1 << 32, 32, dtype=np.uint32))
+        init[1] = data
+        init[32] = rng.integers(0, 1 << 32, dtype=np.uint32)
+        init[33] = rng.integers(0, 1 << 32, dtype=np.uint32) & 0xe000007f
+        init[34:] = rng.integers(0, 1 << 32, 2, dtype=np.uint32)
+        prog.segs.append((INIT, init))
+        prog.segs.append((SIG, np.zeros(SIG_WORDS, dtype=np.uint32)))
+        return prog
+
+    def layout(self, rng, tid, prog):
+        """Addresses of each template, plus one for the final sc.  In the page
+        mode the code is split into segments, each ending at the end of a page
+        followed by an unmapped page, and the last template of each is made a
+        branch/trap/sc/memory op of the same length."""
+        t = self.t
+        n = len(tid)
+        length = np.append(t.length[tid], 1)
+        if not self.mmu:
+            addr = BODY + 4 * np.concatenate(([0], np.cumsum(length[:-1])))
+            prog.code = [(BODY, int(addr[-1]) + 4)]
+            return addr
+
+        addr = np.zeros(n + 1, dtype=np.int64)
+        page = BODY
+        i = 0
+        while i <= n:
+            j = min(i + int(rng.integers(4, MAX_SEG)), n + 1)
+            l = length[i:j]
+            start = page + PAGE - 4 * int(l.sum())
+            addr[i:j] = start + 4 * (np.cumsum(l) - l)
+            last = j - 1
+            if last < n and int(l[-1]) in t.boundary:
+                tid[last] = rng.choice(t.boundary[int(l[-1])])
+            prog.code.append((start, page + PAGE))
+            page += 2 * PAGE
+            i = j
+        return addr
+
+    def page_table(self, prog, top, holes):
+        """Identity-map every page below top except the holes:  one PTE in
+        the first slot of page p's primary PTEG (VSID 0, so HTAB + p*64), and
+        empty PTEGs for the holes."""
+        npages = top // PAGE
+        hole_p = set(h // PAGE for h in holes)
+        pte = np.zeros((npages, 2), dtype=np.uint32)
+        pte[:, 0] = 0x80000000
+        pte[:, 1] = (np.arange(npages) << 12) | PTE_RC_RW
+        mapped = np.array([p not in hole_p for p in range(npages)])
+        ptegs = np.zeros((npages, 16), dtype=np.uint32)
+        ptegs[:, :2] = pte
+        ptegs[~mapped] = 0
+        prog.segs.append((HTAB, ptegs.ravel()))
+        for h in hole_p:
+            prog.segs.append((HTAB + (~h & 0x3ff) * 64,
+                              np.zeros(16, dtype=np.uint32)))
+
+    def gen_fields(self, rng, words, at, tid, sel, dst, src):
+        """K_GEN/K_DIV:  each field from the V_* value of its role."""
+        t = self.t
+        tt = tid[sel]
+        m = len(sel)
+        kind = t.kind[tt]
+        div = kind == K_DIV
+        s = src[:, sel].copy()
+        # Divisors are writable:  fixed up to be positive and non-zero
+        s[1] = np.where(div & (s[1] == 1), 2, s[1])
+        imm = np.where(rng.random(m) < 0.5,
+                       rng.integers(0, 1 << 16, m),
+                       np.where(rng.random(m) < 0.5,
+                                rng.integers(-16, 17, m) & 0xffff,
+                                choice(rng, IMM_SPECIAL, m)))
+        v = np.stack((dst[sel], s[0], s[1], s[2], imm,
+                      rng.integers(0, 32, m), rng.integers(0, 32, m),
+                      rng.integers(0, 32, m), rng.integers(0, 8, m),
+                      rng.integers(0, 8, m), rng.integers(0, 256, m),
+                      rng.integers(0, 16, m), rng.random(m) < P_RC,
+                      rng.random(m) < P_OE)).astype(np.int64)
+        w = t.base[tt].copy()
+        cols = np.arange(m)
+        for (i, (_, shift, width)) in enumerate(GEN_FIELDS):
+            role = t.roles[tt, i]
+            has = role >= 0
+            if not has.any():
+                continue
+            val = v[np.maximum(role, 0), cols]
+            w |= np.where(has, (val & ((1 << width) - 1)) << shift, 0)
+        a = at[sel]
+        words[a + t.length[tt] - 1] = w
+        if div.any():
+            # rlwinm rB,rB,0,1,31; ori rB,rB,1
+            rb = s[1][div] << 21 | s[1][div] << 16
+            words[a[div]] = self.w_rlwinm | rb | 1 << 6 | 31 << 1
+            words[a[div] + 1] = self.w_ori | rb | 1
+
+    def gen_mem_d(self, rng, words, at, tid, dst, src, ea):
+        t = self.t
+        m = len(at)
+        size = t.size[tid]
+        e = ea.pick(size, size)
+        d = rng.integers(-64, 64, m) & ~(np.maximum(size, 1) - 1)
+        (rp, rt) = self.pointer(rng, m, dst, src, tid)
+        words[at] = self.w_addi | rp << 21 | 1 << 16 | ((e - d) & 0xffff)
+        words[at + 1] = t.base[tid] | rt << 21 | rp << 16 | (d & 0xffff)
+
+    def gen_mem_x(self, rng, words, at, tid, dst, src, ea):
+        t = self.t
+        m = len(at)
+        size = t.size[tid]
+        e = ea.pick(size, size)
+        rp = choice(rng, POINTERS, m)
+        rt = np.where(t.load[tid], dst, src)
+        words[at] = self.w_addi | rp << 21 | (e & 0xffff)
+        words[at + 1] = t.base[tid] | rt << 21 | 1 << 16 | rp << 11
+
+    def gen_mem_ux(self, rng, words, at, tid, dst, src, ea):
+        t = self.t
+        m = len(at)
+        size = t.size[tid]
+        e = ea.pick(size, size)
+        k = rng.integers(-64, 64, m) & ~(size - 1)
+        (rp, rt) = self.pointer(rng, m, dst, src, tid)
+        rq = choice(rng, WRITABLE, m)
+        rq = np.where(rq == rp, np.where(rp == 31, 2, rp + 1), rq)
+        words[at] = self.w_addi | rp << 21 | 1 << 16 | ((e - k) & 0xffff)
+        words[at + 1] = self.w_addi | rq << 21 | (k & 0xffff)
+        words[at + 2] = t.base[tid] | rt << 21 | rp << 16 | rq << 11
+
+    def gen_mult(self, rng, words, at, tid, dst, src, ea):
+        """lmw/stmw of mostly a few registers, with the base below the first
+        one loaded (so it isn't in the range)."""
+        t = self.t
+        m = len(at)
+        rt = np.where(rng.random(m) < 0.8, rng.integers(24, 32, m),
+                      rng.integers(3, 32, m))
+        rp = rng.integers(2, rt)
+        e = ea.pick(np.full(m, 4), 4 * (32 - rt), edges=False,
+                    unaligned=False)
+        words[at] = self.w_addi | rp << 21 | 1 << 16 | (e & 0xffff)
+        words[at + 1] = t.base[tid] | rt << 21 | rp << 16
+
+    def gen_cache(self, rng, words, at, tid, dst, src, ea):
+        t = self.t
+        m = len(at)
+        e = ea.pick(np.full(m, 1), 1, unaligned=False)
+        rp = choice(rng, POINTERS, m)
+        words[at] = self.w_addi | rp << 21 | (e & 0xffff)
+        words[at + 1] = t.base[tid] | 1 << 16 | rp << 11
+
+    def pointer(self, rng, m, dst, src, tid):
+        """Pointer register, and RT (a load's destination, which mustn't be
+        the pointer for update forms) or RS."""
+        t = self.t
+        rp = choice(rng, POINTERS, m)
+        load = t.load[tid]
+        rt = np.where(load, dst, src)
+        clash = load & (rt == rp)
+        rt = np.where(clash, np.where(rp == 31, 0, rp + 1), rt)
+        return (rp, rt)
+
+    def gen_branch(self, rng, words, addr, tid, sel, dst, k):
+        """Forwards, to the start of one of the next MAX_SKIP templates (or
+        the final sc)."""
+        t = self.t
+        n = len(tid)
+        m = len(sel)
+        tt = tid[sel]
+        target = addr[np.minimum(sel + rng.integers(1, MAX_SKIP + 1, m), n)]
+        lk = (rng.random(m) < P_LK).astype(np.int64)
+        bo = t.bo_val[tt] | (rng.integers(0, 32, m) & t.bo_mask[tt])
+        bi = rng.integers(0, 32, m)
+        at = (addr[sel] - BODY) // 4
+        if k == K_B:
+            words[at] = t.base[tt] | ((target - addr[sel]) & 0x3fffffc) | lk
+            return
+        if k == K_BC:
+            words[at] = (t.base[tt] | bo << 21 | bi << 16 |
+                         ((target - addr[sel]) & 0xfffc) | lk)
+            return
+        rx = dst[sel]
+        mt = self.w_mtlr if k == K_BCLR else self.w_mtctr
+        words[at] = self.w_addis | rx << 21 | (target >> 16)
+        words[at + 1] = self.w_ori | rx << 21 | rx << 16 | (target & 0xffff)
+        words[at + 2] = mt | rx << 21
+        words[at + 3] = t.base[tt] | bo << 21 | bi << 16 | lk
+
+
+class EAPicker:
+    """Offsets into the data area (from r1) for accesses of a size."""
+    def __init__(self, rng, pages, hole, align):
+        self.rng = rng
+        self.pages = np.array(pages)
+        self.hole = hole
+        self.align = align
+
+    def pick(self, size, span, edges=True, unaligned=True):
+        rng = self.rng
+        m = len(size)
+        size = np.maximum(size, 1)
+        page = choice(rng, self.pages, m)
+        off = rng.integers(0, PAGE - np.maximum(span, size) + 1,
+                           m) & ~(size - 1)
+        # Unaligned accesses within a doubleword are done by the RTL; beyond,
+        # they're an alignment exception
+        u = (rng.random(m) < P_UNALIGNED) & (size > 1) & unaligned
+        shifted = off + 1 + rng.integers(0, 4, m) % np.maximum(size - 1, 1)
+        ok = ((shifted & 7) + size <= 8) | self.align
+        off = np.where(u & ok & (shifted + size <= PAGE), shifted, off)
+        e = page * PAGE + off
+        if self.hole is not None and edges:
+            h = self.hole * PAGE
+            edge = rng.random(m) < P_EDGE
+            where = rng.integers(0, 3, m)
+            e = np.where(edge, np.choose(where, (h - size, h, h + PAGE)), e)
+        return e
+
+
+################################################################################
+# Output
+
+def to_bin(segs):
+    top = max(a + 4 * len(w) for (a, w) in segs)
+    mem = np.zeros(top // 4, dtype=np.uint32)
+    for (addr, w) in segs:
+        mem[addr // 4:addr // 4 + len(w)] = w
+    return mem.astype('>u4').tobytes()
+
+
+def listing(isa, prog):
+    lines = []
+    for (start, end) in prog.code:
+        for a in range(start, end, 4):
+            w = int(prog.words[(a - BODY) // 4])
+            lines.append("%08x: %08x  %s" % (a, w, isa.mnemonic(w)))
+        lines.append("")
+    return '\n'.join(lines)
+
+
+generator = None
+runtime_hex = None
+
+
+def init_worker(args):
+    global generator, runtime_hex
+    generator = Generator(*args)
+    runtime_hex = mr_hex.to_hex(generator.runtime)
+
+
+def write_one(job):
+    (seed, outdir, binary) = job
+    prog = generator.generate(seed)
+    path = os.path.join(outdir, 'rand_%d.%s' % (seed,
+                                                'bin' if binary else 'hex'))
+    with open(path, 'wb') as f:
+        if binary:
+            f.write(to_bin(generator.runtime + prog.segs))
+        else:
+            f.write(runtime_hex)
+            f.write(mr_hex.to_hex(prog.segs))
+    return path
+
+
+def usage():
+    print("Syntax:\n\t %s [-n <count>] [-s <first seed>] [-L <templates>] "
+          "[-w <Class=weight,...>] [-S <%s>] [-U] [-b] [-o <outdir>] "
+          "[-j <jobs>] [-l]" % (sys.argv[0], '|'.join(STRESS_MODES)))
+    print("\t -l lists the code of each program instead of writing it")
+    print("\t Classes: %s" % ', '.join(CLASSES))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "n:s:L:w:S:Ubo:j:lh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    count = 1
+    first = 0
+    length = 1000
+    weights = dict(DEFAULT_WEIGHTS)
+    stress = []
+    user = False
+    binary = False
+    outdir = '.'
+    jobs = 1
+    list_only = False
+    for (o, a) in opts:
+        if o == '-n':
+            count = int(a)
+        elif o == '-s':
+            first = int(a, 0)
+        elif o == '-L':
+            length = int(a)
+        elif o == '-w':
+            for kv in a.split(','):
+                (k, v) = kv.split('=')
+                if k not in CLASSES:
+                    print("Unknown class '%s'" % k)
+                    usage()
+                weights[k] = float(v)
+        elif o == '-S':
+            stress = a.split(',')
+            for s in stress:
+                if s not in STRESS_MODES:
+                    print("Unknown stress mode '%s'" % s)
+                    usage()
+        elif o == '-U':
+            user = True
+        elif o == '-b':
+            binary = True
+        elif o == '-o':
+            outdir = a
+        elif o == '-j':
+            jobs = int(a)
+        elif o == '-l':
+            list_only = True
+        else:
+            usage()
+    if args:
+        usage()
+
+    gen_args = (length, weights, stress, user)
+    seeds = range(first, first + count)
+    if list_only:
+        g = Generator(*gen_args)
+        for s in seeds:
+            print("# seed %d" % s)
+            print(listing(g.isa, g.generate(s)))
+        sys.exit(0)
+
+    os.makedirs(outdir, exist_ok=True)
+    jobs_list = ((s, outdir, binary) for s in seeds)
+    t0 = time.time()
+    if jobs > 1:
+        with multiprocessing.Pool(jobs, init_worker, (gen_args,)) as pool:
+            for _ in pool.imap_unordered(write_one, jobs_list, chunksize=16):
+                pass
+    else:
+        init_worker(gen_args)
+        for j in jobs_list:
+            write_one(j)
+    t = time.time() - t0
+    sys.stderr.write("%d programs in %.2fs (%.0f/s)\n" %
+                     (count, t, count / t if t else 0))
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+#
+# Disassembler that agrees with MR's decoder, for annotating traces:
+#
+#   make tools/auto_disasm.py
+#   ./tools/mr_disasm.py 7c632214 4bfffff1 7c0004ac
+#   ./tools/mr_disasm.py -b testprog.bin -a 0x0
+#
+# The instruction table, tools/auto_disasm.py, is generated by mk_decode.py
+# from tools/PPC.csv alongside the RTL's decoder:  the decode tree (primary
+# opcode, extended opcode, then BO/spr sub-decode) expanded to one lookup per
+# level, in the RTL's match order.  So words the RTL doesn't decode (e.g. an
+# mfspr of an SPR MR hasn't got, or an unsupported BO) come out as .long, and
+# those it decodes only to fault (FC_ILL_HYP, e.g. lswi or the bodge_out
+# list) are marked.  Mnemonics carry the ./o/l/a suffixes the Suffix column
+# allows for the word's Rc/OE/LK/AA bits; operands are in assembler order.
+#
+# disasm_batch() takes a NumPy array of words (e.g. a commit trace's 'instr'
+# column):  the table lookup is vectorised, and each distinct word (or, for
+# relative branches given PCs, word and PC) is formatted once, so traces,
+# being mostly loops, go at millions of words per second.  mnemonics()
+# returns just the mnemonics, entirely vectorised.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+try:
+    from auto_disasm import DIS_RC, DIS_OE, DIS_LK, DIS_AA, DIS_UNIMPL, \
+        ENTRIES, TREE
+except ImportError:
+    raise ImportError("No disassembly table; generate it with 'make tools/auto_disasm.py'")
+
+UNIMPL_NOTE = "\t# faults in MR"
+
+SPR_NAMES = {1: 'xer', 8: 'lr', 9: 'ctr', 18: 'dsisr', 19: 'dar', 22: 'dec',
+             25: 'sdr1', 26: 'srr0', 27: 'srr1', 268: 'tbl', 269: 'tbu',
+             272: 'sprg0', 273: 'sprg1', 274: 'sprg2', 275: 'sprg3',
+             284: 'tbl', 285: 'tbu', 287: 'pvr', 1008: 'hid0', 1013: 'dabr'}
+for n in range(4):
+    SPR_NAMES[528 + 2 * n] = 'ibat%du' % n
+    SPR_NAMES[529 + 2 * n] = 'ibat%dl' % n
+    SPR_NAMES[536 + 2 * n] = 'dbat%du' % n
+    SPR_NAMES[537 + 2 * n] = 'dbat%dl' % n
+
+
+################################################################################
+# Operand fields
+
+def _simm(w):
+    v = w & 0xffff
+    return v - 0x10000 if v & 0x8000 else v
+
+
+def _ra0(w):
+    ra = (w >> 16) & 31
+    return 'r%d' % ra if ra else '0'
+
+
+def _target(w, pc, off, bits):
+    if off & (1 << (bits - 1)):
+        off -= 1 << bits
+    if w & 2:
+        return '0x%x' % (off & 0xffffffff)
+    if pc is None:
+        return '.%+d' % off
+    return '0x%x' % ((pc + off) & 0xffffffff)
+
+
+def _field(shift, mask, fmt='%d'):
+    return lambda w, pc: fmt % ((w >> shift) & mask)
+
+
+def _optional(shift, mask):
+    """Fields the assembler lets you leave out when 0 (e.g. sync's L)"""
+    return lambda w, pc: ('%d' % ((w >> shift) & mask)) if (w >> shift) & mask else None
+
+
+def _spr(w, pc):
+    n = ((w >> 16) & 0x1f) | ((w >> 6) & 0x3e0)
+    return SPR_NAMES.get(n, '%d' % n)
+
+
+OPERANDS = {
+    'RT':       _field(21, 31, 'r%d'),
+    'RS':       _field(21, 31, 'r%d'),
+    'RA':       _field(16, 31, 'r%d'),
+    'RA0':      lambda w, pc: _ra0(w),
+    'RB':       _field(11, 31, 'r%d'),
+    'SI':       lambda w, pc: '%d' % _simm(w),
+    'UI':       _field(0, 0xffff, '0x%x'),
+    'D(RA)':    lambda w, pc: '%d(r%d)' % (_simm(w), (w >> 16) & 31),
+    'D(RA0)':   lambda w, pc: '%d(%s)' % (_simm(w), _ra0(w)),
+    'BD':       lambda w, pc: _target(w, pc, w & 0xfffc, 16),
+    'LI':       lambda w, pc: _target(w, pc, w & 0x3fffffc, 26),
+    'BO':       _field(21, 31),
+    'BI':       _field(16, 31),
+    'BT':       _field(21, 31),
+    'BA':       _field(16, 31),
+    'BB':       _field(11, 31),
+    'BF':       _field(23, 7, 'cr%d'),
+    'BFA':      _field(18, 7, 'cr%d'),
+    'TO':       _field(21, 31),
+    'SH':       _field(11, 31),
+    'MB':       _field(6, 31),
+    'ME':       _field(1, 31),
+    'NB':       _field(11, 31),
+    'SR':       _field(16, 15),
+    'FXM':      _field(12, 0xff, '0x%02x'),
+    'spr':      _spr,
+    'BH':       _optional(11, 3),
+    'EH':       _optional(0, 1),
+    'TH':       _optional(21, 31),
+    'CT':       _optional(21, 15),
+    'L':        _optional(21, 3),
+    'E':        _optional(16, 15),
+    'LEV':      _optional(5, 0x7f),
+}
+
+
+################################################################################
+# Tables
+
+def variant(w):
+    """Index of a word's suffix variant:  Rc/LK, OE and AA bits"""
+    return (w & 1) | ((w >> 9) & 2) | ((w << 1) & 4)
+
+
+def _mnemonic(name, flags, v):
+    if flags & DIS_OE and v & 2:
+        name += 'o'
+    if flags & DIS_RC and v & 1:
+        name += '.'
+    if flags & DIS_LK and v & 1:
+        name += 'l'
+    if flags & DIS_AA and v & 4:
+        name += 'a'
+    return name
+
+
+def _flatten(tree):
+    """The decode tree as arrays, for decode():  level i looks up
+    FLAT[BASE[i] + ((w >> SHIFT[i]) & MASK[i])], giving an entry index, or
+    -1 - the next level's index."""
+    shift, mask, base, flat = [], [], [], []
+
+    def level(node):
+        (st, ln, nodes) = node
+        i = len(shift)
+        shift.append(st)
+        mask.append((1 << ln) - 1)
+        base.append(len(flat))
+        flat.extend([0] * len(nodes))
+        for v, n in enumerate(nodes):
+            flat[base[i] + v] = n if not isinstance(n, tuple) else -1 - level(n)
+        return i
+
+    level(tree)
+    return (np.array(shift, dtype=np.int64), np.array(mask, dtype=np.int64),
+            np.array(base, dtype=np.int64), np.array(flat, dtype=np.int32))
+
+
+SHIFT, MASK, BASE, FLAT = _flatten(TREE)
+MNEMONICS = np.array([_mnemonic(name, flags, v)
+                      for (name, flags, _, _) in ENTRIES for v in range(8)],
+                     dtype=object)
+REL_BRANCH = np.array([('BD' in ops or 'LI' in ops) for (_, _, ops, _) in ENTRIES])
+UNIMPL = np.array([bool(flags & DIS_UNIMPL) for (_, flags, _, _) in ENTRIES])
+
+
+################################################################################
+# Single words
+
+def decode_one(w):
+    """Returns the entry index of a word (0 if it's not decoded)"""
+    node = TREE
+    while isinstance(node, tuple):
+        node = node[2][(w >> node[0]) & ((1 << node[1]) - 1)]
+    return node
+
+
+def disasm(w, pc=None):
+    """Disassembles a word; branch targets are absolute if pc is given,
+    otherwise relative to '.'"""
+    e = decode_one(w)
+    if e == 0:
+        return '.long 0x%08x' % w
+    (_, flags, ops, _) = ENTRIES[e]
+    args = [a for a in (OPERANDS[op](w, pc) for op in ops) if a is not None]
+    s = MNEMONICS[e * 8 + variant(w)]
+    if args:
+        s = '%-7s %s' % (s, ','.join(args))
+    return s + UNIMPL_NOTE if flags & DIS_UNIMPL else s
+
+
+################################################################################
+# Arrays of words
+
+def decode(words):
+    """Returns entry indices for an array of words"""
+    w = np.asarray(words, dtype=np.uint32).astype(np.int64)
+    ids = np.empty(w.shape, dtype=np.int32)
+    todo = np.arange(w.size)
+    w = w.ravel()
+    lvl = np.zeros(w.size, dtype=np.int64)
+    flat_ids = ids.reshape(-1)
+    while todo.size:
+        v = FLAT[BASE[lvl] + ((w[todo] >> SHIFT[lvl]) & MASK[lvl])]
+        leaf = v >= 0
+        flat_ids[todo[leaf]] = v[leaf]
+        todo = todo[~leaf]
+        lvl = -1 - v[~leaf].astype(np.int64)
+    return ids
+
+
+def mnemonics(words):
+    """Returns an array of mnemonics (with suffixes) for an array of words"""
+    w = np.asarray(words, dtype=np.uint32)
+    return MNEMONICS[decode(w) * 8 + variant(w.astype(np.int64))]
+
+
+def disasm_batch(words, pcs=None):
+    """Disassembles an array of words, returning an array of strings (objects);
+    pcs, the same shape, gives absolute branch targets."""
+    w = np.asarray(words, dtype=np.uint32)
+    key = w.astype(np.uint64)
+    if pcs is not None:
+        rel = REL_BRANCH[decode(w)] & ((w & 2) == 0)
+        key[rel] |= np.asarray(pcs, dtype=np.uint64)[rel] << np.uint64(32)
+    uniq, inv = np.unique(key, return_inverse=True)
+    text = np.empty(uniq.size, dtype=object)
+    for i, k in enumerate(uniq.tolist()):
+        text[i] = disasm(k & 0xffffffff, (k >> 32) if pcs is not None else None)
+    return text[inv.reshape(w.shape)]
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s <hex word> [<hex word> ...]\n"
+          "\t %s -b <big-endian binary> [-a <load address>]" % (sys.argv[0], sys.argv[0]))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    binary = None
+    addr = 0
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'b:a:h')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    for o, a in opts:
+        if o == '-b':
+            binary = a
+        elif o == '-a':
+            addr = int(a, 0)
+        else:
+            usage()
+
+    if binary:
+        with open(binary, 'rb') as f:
+            data = f.read()
+        words = np.frombuffer(data[:len(data) & ~3], dtype='>u4')
+    elif args:
+        try:
+            words = np.array([int(a, 16) for a in args], dtype=np.uint32)
+        except ValueError as e:
+            print(e)
+            usage()
+    else:
+        usage()
+
+    pcs = addr + 4 * np.arange(len(words), dtype=np.uint64)
+    for pc, wd, s in zip(pcs.tolist(), words.tolist(), disasm_batch(words, pcs)):
+        print("%08x:  %08x  %s" % (pc, wd, s))
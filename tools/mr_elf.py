@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# Minimal ELF32 reader, enough to symbolise addresses and to pull
+# instructions out of a workload's text sections.  (Avoids depending on
+# binutils/pyelftools for what the analysis tools need.)
+#
+# Run by itself, lists function symbols.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import struct
+import sys
+
+import numpy as np
+
+
+SHT_SYMTAB = 2
+SHT_NOBITS = 8
+SHT_DYNSYM = 11
+SHF_EXECINSTR = 4
+STT_NOTYPE = 0
+STT_FUNC = 2
+
+
+class ELF:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        d = self.data
+        if d[:4] != b'\x7fELF':
+            raise ValueError("%s: not an ELF file" % path)
+        if d[4] != 1:
+            raise ValueError("%s: not ELF32" % path)
+        self.e = '>' if d[5] == 2 else '<'
+
+        (self.e_type, self.e_machine, _, self.entry, _, shoff, _, _, _, _,
+         shentsize, shnum, shstrndx) = struct.unpack(self.e + "HHIIIIIHHHHHH",
+                                                     d[16:52])
+        self.sections = []
+        for i in range(shnum):
+            (name, stype, flags, addr, off, size, link, info, align, entsize) = \
+                struct.unpack(self.e + "IIIIIIIIII",
+                              d[shoff + i * shentsize:shoff + i * shentsize + 40])
+            self.sections.append({'name_off': name, 'type': stype,
+                                  'flags': flags, 'addr': addr, 'offset': off,
+                                  'size': size, 'link': link, 'entsize': entsize})
+        if shstrndx < len(self.sections):
+            strtab = self.sections[shstrndx]
+            for s in self.sections:
+                s['name'] = self._str(strtab, s['name_off'])
+        self._load_symbols()
+
+    def _str(self, strtab, off):
+        start = strtab['offset'] + off
+        end = self.data.index(b'\0', start)
+        return self.data[start:end].decode('latin-1')
+
+    def _load_symbols(self):
+        syms = {}
+        for s in self.sections:
+            if s['type'] not in (SHT_SYMTAB, SHT_DYNSYM):
+                continue
+            strtab = self.sections[s['link']]
+            for i in range(s['size'] // 16):
+                o = s['offset'] + i * 16
+                (name, value, size, info, other, shndx) = \
+                    struct.unpack(self.e + "IIIBBH", self.data[o:o + 16])
+                stype = info & 0xf
+                if name == 0 or shndx == 0 or stype not in (STT_FUNC, STT_NOTYPE):
+                    continue
+                n = self._str(strtab, name)
+                # NOTYPE covers asm labels; skip local/mapping-ish noise.
+                if stype == STT_NOTYPE and (n.startswith('.L') or n.startswith('$')):
+                    continue
+                if value not in syms or (stype == STT_FUNC and syms[value][2] != STT_FUNC):
+                    syms[value] = (n, size, stype)
+        addrs = sorted(syms.keys())
+        self.sym_addrs = np.array(addrs, dtype=np.uint64)
+        self.sym_names = [syms[a][0] for a in addrs]
+        self.sym_sizes = np.array([syms[a][1] for a in addrs], dtype=np.uint64)
+
+    def text_sections(self):
+        return [s for s in self.sections
+                if (s['flags'] & SHF_EXECINSTR) and s['type'] != SHT_NOBITS]
+
+    def symbolise(self, addrs):
+        """Vectorised:  returns (index into sym_names or -1, offset) per address.
+
+        An address past the end of a sized symbol gets -1.
+        """
+        addrs = np.asarray(addrs, dtype=np.uint64)
+        idx = np.searchsorted(self.sym_addrs, addrs, side='right').astype(np.int64) - 1
+        ok = idx >= 0
+        off = np.zeros(len(addrs), dtype=np.uint64)
+        off[ok] = addrs[ok] - self.sym_addrs[idx[ok]]
+        sized = np.zeros(len(addrs), dtype=bool)
+        sized[ok] = self.sym_sizes[idx[ok]] != 0
+        outside = np.zeros(len(addrs), dtype=bool)
+        outside[ok] = sized[ok] & (off[ok] >= self.sym_sizes[idx[ok]])
+        idx[~ok | outside] = -1
+        return (idx, off)
+
+    def name_of(self, addr):
+        (idx, off) = self.symbolise([addr])
+        if idx[0] < 0:
+            return "%08x" % addr
+        if off[0] == 0:
+            return self.sym_names[idx[0]]
+        return "%s+0x%x" % (self.sym_names[idx[0]], off[0])
+
+    def read_word(self, addr):
+        """Returns the 32-bit word at a (virtual) address, or None."""
+        for s in self.text_sections():
+            if s['addr'] <= addr and addr + 4 <= s['addr'] + s['size']:
+                o = s['offset'] + addr - s['addr']
+                return struct.unpack(self.e + "I", self.data[o:o + 4])[0]
+        return None
+
+    def text_words(self, section):
+        """Returns (addresses, words) for a text section, as arrays."""
+        dt = np.dtype(self.e + 'u4')
+        n = section['size'] // 4
+        words = np.frombuffer(self.data, dtype=dt, count=n,
+                              offset=section['offset']).astype(np.uint32)
+        addrs = section['addr'] + 4 * np.arange(n, dtype=np.uint32)
+        return (addrs, words)
+
+
+################################################################################
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Syntax:\n\t %s <elf>" % sys.argv[0])
+        sys.exit(1)
+
+    elf = ELF(sys.argv[1])
+    for (a, n, sz) in zip(elf.sym_addrs, elf.sym_names, elf.sym_sizes):
+        print("%08x %6d %s" % (a, sz, n))
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+#
+# $readmemh image writer shared by the tools that build test images
+# (mk_random.py, pack_tests.py, linux_boot.py), in the format mk_hex.py
+# writes and the testbench RAMs read:  64-bit words, one per line, the bytes
+# of each doubleword last first, with @ doubleword addresses.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np
+
+
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def to_hex(segs):
+    """$readmemh text (as bytes) for [(address, array of 32-bit words)],
+    64-bit words as mk_hex.py writes them:  the bytes of each doubleword,
+    last first."""
+    out = []
+    for (addr, w) in segs:
+        pad = (addr & 7) // 4
+        w = np.concatenate((np.zeros(pad, dtype=np.uint32), w,
+                            np.zeros((pad + len(w)) & 1, dtype=np.uint32)))
+        b = np.frombuffer(w.astype('>u4').tobytes(),
+                          dtype=np.uint8).reshape(-1, 8)[:, ::-1]
+        lines = np.empty((len(b), 17), dtype=np.uint8)
+        lines[:, 0:16:2] = HEX_DIGITS[b >> 4]
+        lines[:, 1:16:2] = HEX_DIGITS[b & 15]
+        lines[:, 16] = ord('\n')
+        out.append(b'@%x\n' % (addr >> 3))
+        out.append(lines.tobytes())
+    return b''.join(out)
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+#
+# Instruction decode for the analysis tools, driven by tools/PPC.csv (the same
+# table mk_decode.py generates the RTL decoder from), so that tools agree with
+# the RTL about what an instruction reads and writes.  Words are decoded with
+# mr_disasm.py's lookup of the generated table, tools/auto_disasm.py (make
+# build_deps), which also carries the decoded PPC.csv rows:  so both decode
+# exactly what the RTL does, and mnemonics are mr_disasm's.
+#
+# An instruction word decodes to an Insn, giving the resources it reads and
+# writes as DE's scoreboard sees them:  GPRs, the combined XER/CR ("XERCR",
+# which is locked and bypassed as one), and the individually-locked SPRs (LR,
+# CTR, SPRG0-3).  Other SPRs, SRs etc. use the generic lock (the "Lock"
+# column).  Each write also says where the result is first available:  from
+# EXE (bypassed), from WB (load data, and results carried in R1), or only from
+# the register file (SPRs, which don't bypass).
+#
+# Run by itself, decodes the hex words given on the command line.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import re
+import sys
+
+import mr_disasm
+from auto_disasm import ENTRIES, ROWS
+
+# Scoreboarded resources:  r0-r31 are 0-31
+R_XERCR = 32
+R_LR = 33
+R_CTR = 34
+R_SPRG0 = 35                    # ... SPRG3 = 38
+NR_RES = 39
+RES_NAMES = (['r%d' % i for i in range(32)] +
+             ['xercr', 'lr', 'ctr', 'sprg0', 'sprg1', 'sprg2', 'sprg3'])
+
+# Where a written result first becomes available to DE
+AVAIL_EXE = 0                   # Bypassed from EXE/MEM
+AVAIL_WB = 1                    # Forwarded from WB (load data, R1 results)
+AVAIL_REGFILE = 2               # Not bypassed; readable after WB
+
+# Multi-cycle EXE units
+EXE_SINGLE = 0
+EXE_MUL = 1
+EXE_DIV = 2
+
+# Architectural SPR numbers with their own scoreboard entries (or bypass)
+SPR_RES = {1: R_XERCR, 8: R_LR, 9: R_CTR,
+           272: R_SPRG0, 273: R_SPRG0 + 1, 274: R_SPRG0 + 2, 275: R_SPRG0 + 3}
+IMPL_RES = {'CA': R_XERCR, 'CR': R_XERCR, 'XER': R_XERCR,
+            'LR': R_LR, 'CTR': R_CTR}
+
+FORMS_XO10 = ('X', 'XL', 'XFX')
+SUBDEC_SPR = ('mfspr', 'mtspr', 'mftb')
+
+
+def field_rt(w):
+    return (w >> 21) & 0x1f
+
+
+def field_ra(w):
+    return (w >> 16) & 0x1f
+
+
+def field_rb(w):
+    return (w >> 11) & 0x1f
+
+
+def field_spr(w):
+    """Architectural SPR number (the instruction has the halves swapped)."""
+    return ((w >> 16) & 0x1f) | (((w >> 11) & 0x1f) << 5)
+
+
+def field_bo(w):
+    return (w >> 21) & 0x1f
+
+
+def field_lk(w):
+    return w & 1
+
+
+def field_oe(w):
+    return (w >> 10) & 1
+
+
+def parse_match(s):
+    """Returns (value, dontcare_mask) for a Subdec spr/BO value:  a number,
+    or 0b[01x]+."""
+    try:
+        return (int(s, 0), 0)
+    except ValueError:
+        if not re.match(r"0b[01x]+$", s):
+            raise ValueError("Bad subdecode value '%s'" % s)
+        return (int(s.replace('x', '0'), 0),
+                int(s.replace('1', '0').replace('x', '1'), 0))
+
+
+def tokens(s):
+    return [t.strip() for t in s.split(',') if t.strip()]
+
+
+class Insn:
+    """A decoded instruction.  Used as a struct."""
+    __slots__ = ('name', 'row', 'reads', 'writes', 'exe', 'genlock',
+                 'ends_block', 'load', 'store', 'multiple')
+
+    def __init__(self, name, row):
+        self.name = name
+        self.row = row
+        self.reads = []         # Resources
+        self.writes = []        # (resource, AVAIL_*)
+        self.exe = EXE_SINGLE
+        self.genlock = False
+        self.ends_block = False
+        self.load = False
+        self.store = False
+        self.multiple = None    # lmw/stmw:  list of GPRs loaded/stored
+
+    def __repr__(self):
+        return "%s %s <- %s" % (self.name,
+                                ",".join(RES_NAMES[r] for (r, _) in self.writes),
+                                ",".join(RES_NAMES[r] for r in self.reads))
+
+
+class ISA:
+    def __init__(self):
+        self.rows = {}          # PPC.csv row number -> row, in CSV order
+        self.cache = {}
+
+        for (n, r) in sorted(ROWS.items()):
+            row = dict(r)
+            if row['Subdec'] == '1':
+                if row['Name'] in SUBDEC_SPR:
+                    row['match'] = (field_spr,) + parse_match(row['spr'])
+                else:
+                    row['match'] = (field_bo,) + parse_match(row['BO'])
+            self.rows[n] = row
+
+    def find_row(self, w):
+        """Returns the PPC.csv row an instruction word decodes to, or None."""
+        e = mr_disasm.decode_one(w)
+        return self.rows[ENTRIES[e][3]] if e else None
+
+    def mnemonic(self, w):
+        return mr_disasm.MNEMONICS[mr_disasm.decode_one(w) * 8 +
+                                   mr_disasm.variant(w)]
+
+    def decode(self, w):
+        """Returns an Insn for a word (cached), or None if it doesn't decode."""
+        w = int(w)
+        if w in self.cache:
+            return self.cache[w]
+        row = self.find_row(w)
+        i = None if row is None else self._decode_row(w, row)
+        self.cache[w] = i
+        return i
+
+    def _decode_row(self, w, row):
+        i = Insn(self.mnemonic(w), row)
+        ins = tokens(row['In'])
+        outs = tokens(row['Out'])
+        mem = row['MEM_OP']
+        exe = row['EXE_OP']
+
+        i.load = re.search(r"\bL(8|16|32)\b", mem) is not None
+        i.store = re.search(r"\bS(8|16|32)", mem) is not None
+        i.genlock = row['Lock'] == '1'
+        i.ends_block = re.search(r"\bbr", exe) is not None or row['Form'] == 'SC'
+        if 'mul_' in exe:
+            i.exe = EXE_MUL
+        elif 'div_' in exe:
+            i.exe = EXE_DIV
+
+        if row['Name'] in ('lmw', 'stmw'):
+            i.multiple = list(range(field_rt(w), 32))
+            if field_ra(w) != 0:
+                i.reads.append(field_ra(w))
+            if row['Name'] == 'lmw':
+                i.writes = [(r, AVAIL_WB) for r in i.multiple]
+            else:
+                i.reads += i.multiple
+            return i
+
+        gpr = {'RA': field_ra, 'RA0': field_ra, 'RB': field_rb,
+               'RS': field_rt, 'RT': field_rt}
+        for t in ins:
+            if t in gpr:
+                r = gpr[t](w)
+                if not (t == 'RA0' and r == 0):
+                    i.reads.append(r)
+            elif t == 'spr':
+                res = SPR_RES.get(field_spr(w))
+                if res is not None:
+                    if 'RS' in ins:
+                        i.writes.append((res, AVAIL_EXE if res == R_XERCR
+                                         else AVAIL_REGFILE))
+                    else:
+                        i.reads.append(res)
+        # Only R0 results are bypassed; load data and R1 results come from WB.
+        for t in outs:
+            if t in gpr:
+                late = ((t == 'RT' and (i.load or 'SR_READ' in mem)) or
+                        re.search(r"\b%s=R1\b" % t, row['WB_OP']) is not None)
+                i.writes.append((gpr[t](w), AVAIL_WB if late else AVAIL_EXE))
+
+        for t in tokens(row['InImpl']):
+            if t in IMPL_RES:
+                i.reads.append(IMPL_RES[t])
+        for t in tokens(row['OutImpl']):
+            r = re.match(r"(\w+) if (\w+)$", t)
+            if r:
+                if r.group(2) != 'LK' or not field_lk(w):
+                    continue
+                t = r.group(1)
+            if t in IMPL_RES:
+                res = IMPL_RES[t]
+                if res == R_XERCR:
+                    i.writes.append((res, AVAIL_WB if 'RSV' in mem else AVAIL_EXE))
+                else:
+                    i.writes.append((res, AVAIL_REGFILE))
+
+        # Record forms write CR0 (reading XER.SO); OE forms write XER.
+        if ((row['Rc'] == '1' and (w & 1)) or 'RC=RcA' in exe or
+            (row['Form'] == 'XO' and row['SO'] == '1' and field_oe(w))):
+            i.reads.append(R_XERCR)
+            i.writes.append((R_XERCR, AVAIL_EXE))
+
+        # De-duplicate, keeping the latest-available write of each resource
+        i.reads = sorted(set(i.reads))
+        wr = {}
+        for (r, a) in i.writes:
+            wr[r] = max(a, wr.get(r, a))
+        i.writes = sorted(wr.items())
+        return i
+
+
+################################################################################
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Syntax:\n\t %s <hex instruction word> ..." % sys.argv[0])
+        sys.exit(1)
+
+    isa = ISA()
+    for a in sys.argv[1:]:
+        w = int(a, 16)
+        i = isa.decode(w)
+        if i is None:
+            print("%08x: (does not decode)" % w)
+            continue
+        print("%08x: %-10s reads %-16s writes %-16s%s%s%s" %
+              (w, i.name, ",".join(RES_NAMES[r] for r in i.reads) or "-",
+               ",".join("%s%s" % (RES_NAMES[r], ["", "(wb)", "(rf)"][a])
+                        for (r, a) in i.writes) or "-",
+               " mul" if i.exe == EXE_MUL else " div" if i.exe == EXE_DIV else "",
+               " genlock" if i.genlock else "",
+               " end" if i.ends_block else ""))
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+#
+# Readers for traces produced by the Verilator harness (verilator/main.cpp).
+#
+# This is imported by the other analysis tools, but can be run by itself to
+# print a summary of (or dump) a commit trace.
+#
+# A commit trace is written with "Vwrapper_top -c <file>", and has one record
+# per instruction/fault reaching WB; see verilator/commit_trace.h for the
+# layout, which is mirrored by COMMIT_DTYPE below.
+#
+# A "functional run" trace, e.g. from an ISS, is just text with one hex PC per
+# line (anything after the PC is ignored, so "pc instr" lines are fine too).
+#
+# PC samples are written with "Vwrapper_top -p <file>"; see
+# verilator/pc_sampler.h.
+#
+# Cache access traces are written with "Vwrapper_top -a <file>"; see
+# verilator/cache_trace.h.
+#
+# MMU traces are written with "Vwrapper_top -m <file>"; see
+# verilator/mmu_trace.h.
+#
+# Perf counter totals are written with "Vwrapper_top -C <file>"; see
+# verilator/pctr_totals.h.
+#
+# Pipeline occupancy traces are written with "Vwrapper_top -o <file>"; see
+# verilator/pipe_trace.h.
+#
+# Bus transaction traces are written with "Vwrapper_top -b <file>"; see
+# verilator/bus_trace.h.
+#
+# Coverage counters are written with "Vwrapper_top -V <file>"; see
+# verilator/coverage.h.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import os
+import sys
+
+import numpy as np
+
+
+COMMIT_TRACE_MAGIC = 0x5443524d      # "MRCT"
+COMMIT_TRACE_VERSION = 1
+
+COMMIT_HDR_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'),
+                             ('rec_size', '<u4'), ('reserved', '<u4')])
+
+COMMIT_DTYPE = np.dtype([('cycle', '<u8'),
+                         ('pc', '<u4'),
+                         ('instr', '<u4'),
+                         ('msr', '<u4'),
+                         ('ea', '<u4'),
+                         ('fault', '<u4'),
+                         ('reserved', '<u4')])
+
+PC_SAMPLE_MAGIC = 0x5350524d         # "MRPS"
+PC_SAMPLE_VERSION = 1
+
+PC_SAMPLE_HDR_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'),
+                                ('rec_size', '<u4'), ('period', '<u4'),
+                                ('stage', '<u4'), ('reserved', '<u4')])
+
+PC_SAMPLE_DTYPE = np.dtype([('cycle', '<u8'),
+                            ('pc', '<u4'),
+                            ('pctrs', '<u2'),
+                            ('flags', 'u1'),
+                            ('reserved', 'u1')])
+
+PC_SAMPLE_STAGES = ['DE', 'WB']
+PC_SAMPLE_FLAG_VALID = 1
+
+CACHE_TRACE_MAGIC = 0x4143524d       # "MRCA"
+CACHE_TRACE_VERSION = 3
+
+CACHE_HDR_DTYPE = COMMIT_HDR_DTYPE
+
+CACHE_DTYPE = np.dtype([('cycle', '<u8'),
+                        ('address', '<u4'),
+                        ('cache', 'u1'),
+                        ('event', 'u1'),
+                        ('req', 'u1'),
+                        ('info', 'u1')])
+
+CACHE_I = 0
+CACHE_D = 1
+CACHE_EV_LOOKUP = 0
+CACHE_EV_ALLOC = 1
+CACHE_EV_CANCEL = 2
+CACHE_LOOKUP_HIT = 1                 # LOOKUP info flags
+CACHE_LOOKUP_NEW = 2
+
+# Request types, from include/cache_defs.vh
+C_REQ_UC_READ = 0
+C_REQ_UC_WRITE = 1
+C_REQ_C_READ = 2
+C_REQ_C_WRITE = 3
+C_REQ_INV = 4
+C_REQ_CLEAN_INV = 5
+C_REQ_CLEAN = 6
+C_REQ_ZERO = 7
+C_REQ_INV_SET = 8
+C_REQ_NAMES = ['uc_read', 'uc_write', 'read', 'write', 'inv', 'clean_inv',
+               'clean', 'zero', 'inv_set']
+
+MMU_TRACE_MAGIC = 0x544d524d         # "MRMT"
+MMU_TRACE_VERSION = 1
+
+MMU_HDR_DTYPE = COMMIT_HDR_DTYPE
+
+MMU_DTYPE = np.dtype([('cycle', '<u8'),
+                      ('ea', '<u4'),
+                      ('data', '<u4'),
+                      ('mmu', 'u1'),
+                      ('event', 'u1'),
+                      ('flags', 'u1'),
+                      ('info', 'u1'),
+                      ('reserved', '<u4')])
+
+MMU_I = 0
+MMU_D = 1
+MMU_EV_LOOKUP = 0
+MMU_EV_WALK = 1
+MMU_EV_INSERT = 2
+MMU_EV_TLBI = 3
+MMU_EV_SR = 4
+MMU_EV_SPR = 5
+MMU_EV_TOTALS = 6
+
+MMU_F_PRIV = 1
+MMU_F_READ = 2
+MMU_F_BAT_HIT = 4
+MMU_F_TLB_HIT = 8
+MMU_F_PTW = 16
+
+# SPR numbering in MMU_EV_SPR:  SDR1, then IBAT0U/L..IBAT3U/L, DBAT0U/L..DBAT3U/L
+MMU_SPR_SDR1 = 0
+MMU_SPR_IBAT = 1
+MMU_SPR_DBAT = 9
+NR_BATS = 4
+
+# PTW fault codes, from include/decode_enums.vh
+PTW_FAULT_NONE = 0
+PTW_FAULT_TF = 2
+PTW_FAULT_PF = 3
+
+PIPE_TRACE_MAGIC = 0x5650524d        # "MRPV"
+PIPE_TRACE_VERSION = 1
+
+PIPE_HDR_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'),
+                           ('rec_size', '<u4'), ('max_life', '<u4')])
+
+PIPE_DTYPE = np.dtype([('start', '<u8'),
+                       ('pc', '<u4'),
+                       ('instr', '<u4'),
+                       ('stage', '<u2', (4,)),
+                       ('end', '<u2'),
+                       ('flags', 'u1'),
+                       ('reserved', 'u1'),
+                       ('id', '<u4')])
+
+PIPE_STAGES = ['IF', 'DE', 'EXE', 'MEM', 'WB']
+PIPE_NO_STAGE = 0xffff
+PIPE_FLAG_SQUASHED = 1
+PIPE_FLAG_FAULT = 2
+PIPE_FLAG_SUBOP = 4
+
+BUS_TRACE_MAGIC = 0x5542524d         # "MRBU"
+BUS_TRACE_VERSION = 1
+
+BUS_HDR_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'),
+                          ('rec_size', '<u4'), ('reserved', '<u4'),
+                          ('cycles', '<u8')])
+
+BUS_DTYPE = np.dtype([('cycle', '<u8'),
+                      ('address', '<u4'),
+                      ('first', '<u4'),
+                      ('last', '<u4'),
+                      ('requester', 'u1'),
+                      ('write', 'u1'),
+                      ('size', 'u1'),
+                      ('beats', 'u1'),
+                      ('bws', 'u1'),
+                      ('reserved', 'u1', (7,))])
+
+BUS_I = 0
+BUS_D = 1
+BUS_SIZE_CL = 3
+BUS_BEAT_BYTES = 8
+
+COVER_MAGIC = 0x5643524d             # "MRCV"
+COVER_VERSION = 1
+
+COVER_HDR_DTYPE = np.dtype([('magic', '<u4'), ('version', '<u4'),
+                            ('nr_leaves', '<u4'), ('nr_corners', '<u4'),
+                            ('nr_faults', '<u4'), ('nr_pctrs', '<u4'),
+                            ('name_len', '<u4'), ('reserved', '<u4'),
+                            ('runs', '<u8'), ('cycles', '<u8'), ('records', '<u8')])
+
+# Instruction kinds of the decoder leaves (mk_decode.py's COV_*)
+COV_BRANCH = 1
+COV_LOAD = 2
+COV_STORE = 4
+COV_ISYNC = 8
+COV_SYNC = 16
+COV_ICBI = 32
+COV_TLBI = 64
+COV_MTMSR = 128
+
+# Bit positions of the events in mr_cpu_top's pctrs output (these match the
+# ctrs[] indices in mr_pctrs.v).
+PCTR_NAMES = ['mem_cacheable_unaligned_CL',        # 0
+              'mem_cacheable_unaligned_8B',
+              'mem_mmu_ptws',
+              'mem_access_fault',
+              'mem_access',
+              'de_stall_operands',                 # 5
+              'if_mmu_ptws',
+              'if_valid_instr',
+              'if_fetching_stalled',
+              'if_fetching',
+              'decode_stall',                      # 10
+              'exe_stall',
+              'mem_stall',
+              'fault',
+              'inst_commit']                       # 14
+PCTR_BIT = dict((n, i) for (i, n) in enumerate(PCTR_NAMES))
+
+MSR_PR = 0x00004000
+MSR_IR = 0x00000020
+MSR_DR = 0x00000010
+
+
+def read_commit_trace(path, commits_only=False):
+    """Returns a (memmapped) structured array of COMMIT_DTYPE records.
+
+    With commits_only, records for faults (which don't commit) are dropped;
+    this makes a copy.
+    """
+    hdr = np.fromfile(path, dtype=COMMIT_HDR_DTYPE, count=1)
+    if len(hdr) != 1 or hdr['magic'][0] != COMMIT_TRACE_MAGIC:
+        raise ValueError("%s: not a commit trace" % path)
+    if hdr['version'][0] != COMMIT_TRACE_VERSION or \
+       hdr['rec_size'][0] != COMMIT_DTYPE.itemsize:
+        raise ValueError("%s: unsupported commit trace version %d/size %d" %
+                         (path, hdr['version'][0], hdr['rec_size'][0]))
+
+    t = np.memmap(path, dtype=COMMIT_DTYPE, mode='r',
+                  offset=COMMIT_HDR_DTYPE.itemsize)
+    if commits_only:
+        t = t[t['fault'] == 0]
+    return t
+
+
+def _read_simple(path, magic, version, hdr_dtype, dtype, what):
+    hdr = np.fromfile(path, dtype=hdr_dtype, count=1)
+    if len(hdr) != 1 or hdr['magic'][0] != magic:
+        raise ValueError("%s: not a %s" % (path, what))
+    if hdr['version'][0] != version or hdr['rec_size'][0] != dtype.itemsize:
+        raise ValueError("%s: unsupported %s version %d/size %d" %
+                         (path, what, hdr['version'][0], hdr['rec_size'][0]))
+    return (hdr[0], np.memmap(path, dtype=dtype, mode='r',
+                              offset=hdr_dtype.itemsize))
+
+
+def read_cache_trace(path):
+    """Returns a (memmapped) structured array of CACHE_DTYPE records."""
+    return _read_simple(path, CACHE_TRACE_MAGIC, CACHE_TRACE_VERSION,
+                        CACHE_HDR_DTYPE, CACHE_DTYPE, "cache trace")[1]
+
+
+def read_mmu_trace(path):
+    """Returns a (memmapped) structured array of MMU_DTYPE records."""
+    return _read_simple(path, MMU_TRACE_MAGIC, MMU_TRACE_VERSION,
+                        MMU_HDR_DTYPE, MMU_DTYPE, "MMU trace")[1]
+
+
+def read_pc_samples(path):
+    """Returns (header, samples) for a PC sample file."""
+    return _read_simple(path, PC_SAMPLE_MAGIC, PC_SAMPLE_VERSION,
+                        PC_SAMPLE_HDR_DTYPE, PC_SAMPLE_DTYPE, "PC sample file")
+
+
+def read_pipe_trace(path):
+    """Returns (header, records) for a pipeline occupancy trace."""
+    return _read_simple(path, PIPE_TRACE_MAGIC, PIPE_TRACE_VERSION,
+                        PIPE_HDR_DTYPE, PIPE_DTYPE, "pipeline trace")
+
+
+def read_bus_trace(path):
+    """Returns (header, records) for a bus transaction trace."""
+    return _read_simple(path, BUS_TRACE_MAGIC, BUS_TRACE_VERSION,
+                        BUS_HDR_DTYPE, BUS_DTYPE, "bus trace")
+
+
+def cover_leaf_dtype(name_len):
+    return np.dtype([('csv_row', '<i4'), ('kind', '<u4'), ('name', 'S%d' % name_len)])
+
+
+def read_coverage(path):
+    """Returns a dict of a coverage counter file's sections:  'hdr', 'leaves'
+    (the decoder leaves' csv_row/kind/name), 'corner_names', and the
+    counters 'leaf_counts', 'corners', 'faults' and 'pctrs' (copies, so a
+    file still being written can be read)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    hdr = np.frombuffer(data, dtype=COVER_HDR_DTYPE, count=1) \
+        if len(data) >= COVER_HDR_DTYPE.itemsize else []
+    if len(hdr) != 1 or hdr['magic'][0] != COVER_MAGIC:
+        raise ValueError("%s: not a coverage file" % path)
+    hdr = hdr[0]
+    if hdr['version'] != COVER_VERSION:
+        raise ValueError("%s: unsupported coverage version %d" % (path, hdr['version']))
+
+    ldt = cover_leaf_dtype(int(hdr['name_len']))
+    nl, nc = int(hdr['nr_leaves']), int(hdr['nr_corners'])
+    nf, npc = int(hdr['nr_faults']), int(hdr['nr_pctrs'])
+    off = COVER_HDR_DTYPE.itemsize
+    leaves = np.frombuffer(data, dtype=ldt, count=nl, offset=off)
+    off += ldt.itemsize * nl
+    cnames = np.frombuffer(data, dtype='S%d' % hdr['name_len'], count=nc, offset=off)
+    off += cnames.itemsize * nc
+    counts = np.frombuffer(data, dtype='<u8', count=nl + nc + nf + npc, offset=off).copy()
+    return {'hdr': hdr.copy(), 'leaves': leaves.copy(),
+            'corner_names': [n.decode() for n in cnames],
+            'leaf_counts': counts[:nl], 'corners': counts[nl:nl + nc],
+            'faults': counts[nl + nc:nl + nc + nf], 'pctrs': counts[nl + nc + nf:]}
+
+
+def read_pctr_totals(path):
+    """Returns a dict of event name -> count (plus 'cycles') from a perf
+    counter totals file."""
+    totals = {}
+    with open(path, 'r') as f:
+        for line in f:
+            p = line.split()
+            if len(p) == 2:
+                totals[p[0]] = int(p[1])
+    if 'cycles' not in totals:
+        raise ValueError("%s: not a perf counter totals file" % path)
+    return totals
+
+
+def read_pctr_snapshots(path):
+    """Returns [(tag, {event name -> count, plus 'cycles'})] from a
+    Vwrapper_top -R file, in order; the running totals at each snapshot, so
+    a region's events are the difference between its two."""
+    snaps = []
+    names = None
+    with open(path, 'r') as f:
+        for line in f:
+            p = line.split()
+            if line.startswith('# MR pctr snapshots:'):
+                names = ['cycles'] + p[6:]
+            elif p and p[0] == 'S' and names and len(p) == len(names) + 2:
+                snaps.append((int(p[1]), dict(zip(names, (int(x) for x in p[2:])))))
+            elif p:
+                raise ValueError("%s: not a perf counter snapshot file" % path)
+    return snaps
+
+
+def pctr_bit(pctrs, name):
+    """Vectorised:  True where event <name> is set in a pctrs value."""
+    return ((pctrs >> PCTR_BIT[name]) & 1).astype(bool)
+
+
+def read_pc_trace(path):
+    """Reads a text PC trace (one hex PC per line) into a uint32 array."""
+    pcs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            pcs.append(int(line.split()[0], 16))
+    return np.array(pcs, dtype=np.uint32)
+
+
+def read_pcs(path):
+    """Returns committed PCs from either sort of trace, sniffing the format."""
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if len(magic) == 4 and int.from_bytes(magic, 'little') == COMMIT_TRACE_MAGIC:
+        return np.asarray(read_commit_trace(path, commits_only=True)['pc'])
+    return read_pc_trace(path)
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options] <commit trace>\n" % sys.argv[0])
+    print("\tSummarises a commit trace (Vwrapper_top -c)\n")
+    print("\t-d\t\tDisassemble each record instead")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "dh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    do_disasm = False
+    for (o, a) in opts:
+        if o == '-d':
+            do_disasm = True
+        else:
+            usage()
+
+    if len(args) != 1:
+        usage()
+    if not os.path.isfile(args[0]):
+        print("No commit trace %s" % args[0])
+        sys.exit(1)
+
+    t = read_commit_trace(args[0])
+
+    if do_disasm:
+        # Needs tools/auto_disasm.py (make build_deps)
+        import mr_disasm
+        dis = mr_disasm.disasm_batch(t['instr'], t['pc'])
+        for r, d in zip(t, dis):
+            print("%12d %08x %08x msr %08x ea %08x%s  %s" %
+                  (r['cycle'], r['pc'], r['instr'], r['msr'], r['ea'],
+                   (" FAULT %d" % r['fault']) if r['fault'] else "", d))
+    else:
+        nf = np.count_nonzero(t['fault'])
+        ncyc = int(t['cycle'][-1] - t['cycle'][0]) + 1 if len(t) else 0
+        print("%d records: %d commits, %d faults, over %d cycles" %
+              (len(t), len(t) - nf, nf, ncyc))
+        if ncyc:
+            print("IPC %.3f" % ((len(t) - nf) / ncyc))
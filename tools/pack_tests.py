@@ -0,0 +1,697 @@
+#!/usr/bin/env python3
+#
+# Packed multi-test images:  links many independent test images into one, run
+# by a small dispatcher, so a regression of thousands of short tests pays the
+# simulator's startup (model construction, $readmemh, reset) once rather than
+# per test:
+#
+#   ./tools/pack_tests.py -o packed.hex rand/*.hex          # Pack
+#   ./tools/pack_tests.py -o packed.hex -s bench/suite.txt  # A suite's workloads
+#   ./tools/pack_tests.py -r -o packed.hex rand/*.hex       # Pack, run & report
+#   ./verilator/obj_dir/Vwrapper_top +INPUT_FILE=packed.hex > packed.log
+#   ./tools/pack_tests.py -u packed.json packed.log         # Report a run
+#
+# Tests are $readmemh images (mk_hex.py/mk_random.py's format) or flat
+# binaries from address 0, linked for low vectors and below PACK_BASE (1MB),
+# with a branch at the reset vector to their start, as the bench/*.S
+# workloads and mk_random.py's programs are.  Above PACK_BASE the packed image
+# holds the dispatcher, a table of tests, each test's image (staged) and a
+# results area; it needs a build with at least 2MB of RAM (the manifest gives
+# the MEMSIZEL2, for tools/vbuild.py).
+#
+# The dispatcher runs from the reset vector.  For each test in turn it:
+#   - invalidates the caches (by set) and TLBs, and zeroes the SRs, BATs,
+#     SDR1, SPRGs, DEC and the user registers, so the test starts as from
+#     reset, with any memory below -z's bound zeroed
+#   - copies the test's image into place, its reset vector patched to
+#     branch back to the dispatcher
+# Real mode is cacheable and the D-cache write-back, so the caches are
+# invalidated before the dispatcher stores anything, and its stores (the
+# results, the copied image) are flushed with dcbf, the image's lines also
+# invalidated in the I-cache with icbi.
+#   - prints "PT <index>" and arms a simulator services run (RUN, with the
+#     test's cycle limit; verilator/simsvc.h) and rfi's to the test
+# The test's exit (a debug SPR exit, a simulator services EXIT, a branch to
+# self or its cycle limit) then resets the CPU rather than ending the
+# simulation, back into the dispatcher, which stores the run's status, how it
+# ended, cycles and instructions in the results area.  A test passes if it
+# exited with status 0, or reached its limit if its suite entry runs for a
+# fixed number of cycles.  At the end the dispatcher prints the results area
+# ("PR <index> <words>" lines) and exits with the number of failures.
+#
+# The unpacker (-u, or after -r) takes the run's output and the manifest
+# written alongside the image (.json) and reports each test:  result, status,
+# cycles, instructions and a digest of its console output (as bench.py
+# digests a workload's).  The exit status is 1 if any test failed.
+#
+# Caveats:  tests run in real mode with MSR zero, the main memory's contents
+# being whatever earlier tests left outside their own image (use -z to
+# clear it, at a cost in cycles per test); the debug SPR exit's register
+# dump isn't printed, so a test checked by its dump needs its own signature
+# (mk_random.py's "SIG" line).
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import hashlib
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import bench
+import mk_random
+import mr_hex
+import mr_isa
+from mk_random import Asm, SPR_CTR, SPR_DEBUG, SPR_LR, SPR_SRR0, SPR_SRR1, SPR_XER
+
+RESET = 0x100
+PACK_BASE = 0x100000            # Tests below, the dispatcher and tables above
+TABLE = PACK_BASE + 0x1000      # Header, then per-test entries
+MIN_MEMSIZEL2 = 21
+MAX_TESTS = 0x7fff              # Compared with cmpi
+CACHE_BYTES = 16384
+LIMIT = 10000000
+SIMSVC_BASE = 0xf0000000
+
+# Simulator services registers (verilator/simsvc.h)
+SIMSVC_EXIT = 0x00
+SIMSVC_RUN = 0x20
+SIMSVC_RUN_STATUS = 0x24
+SIMSVC_RUN_END = 0x28
+SIMSVC_RUN_CYCLES = 0x2c
+SIMSVC_RUN_INSTRS = 0x30
+RUN_ENDS = ('none', 'exit', 'debug', 'b_self', 'limit')
+RUN_LIMIT = 4
+
+# Header
+H_CUR = 0                       # Test just run, -1 at the start
+H_NTESTS = 4
+H_FAILS = 8
+HEADER = 32
+# Test entries
+T_SEGS = 0                      # Segment table
+T_NSEGS = 4
+T_ENTRY = 8
+T_LIMIT = 12
+T_FLAGS = 16
+T_SIZE = 32
+TF_LIMIT_OK = 1                 # Runs for a fixed number of cycles
+# Segment table entries
+S_DEST = 0
+S_SRC = 4
+S_WORDS = 8
+S_LINES = 12                    # Cache lines the destination spans
+S_SIZE = 16
+# Results
+R_FLAGS = 0
+R_END = 4
+R_STATUS = 8
+R_CYCLES = 12
+R_INSTRS = 16
+R_SIZE = 32
+RF_RAN = 1
+RF_PASS = 2
+
+SPR_SDR1 = 25
+SPR_DEC = 22
+SPR_DSISR = 18
+SPR_DAR = 19
+SPR_SPRGS = (272, 273, 274, 275)
+SPR_BATS = range(528, 544)
+SPR_IC_INV_SET = 1021
+SPR_DC_INV_SET = 1022
+
+PT_RE = re.compile(r'^PT ([0-9a-f]{8})$')
+PR_RE = re.compile(r'^PR ([0-9a-f]{8})((?: [0-9a-f]{8}){8})$')
+
+
+################################################################################
+# Packing
+
+class Test:
+    def __init__(self, name, path, limit, limit_ok):
+        self.name = name
+        self.path = path
+        self.limit = limit
+        self.limit_ok = limit_ok
+        self.segs = None
+        self.entry = None
+
+
+def read_hex(path):
+    """A $readmemh image (64-bit words, the bytes of each last first, with
+    optional @ doubleword addresses) as [(address, bytearray)]"""
+    segs = []
+    addr = 0
+    cur = None
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('//')[0].strip()
+            if line == '':
+                continue
+            if line[0] == '@':
+                addr = int(line[1:], 16) * 8
+                cur = None
+                continue
+            if cur is None:
+                cur = bytearray()
+                segs.append((addr, cur))
+            cur += int(line, 16).to_bytes(8, 'little')
+            addr += 8
+    return [(a, b) for (a, b) in segs if b]
+
+
+def read_image(path):
+    if path.endswith('.hex'):
+        return read_hex(path)
+    with open(path, 'rb') as f:
+        return [(0, bytearray(f.read()))]
+
+
+def load(t, enc):
+    """Reads a test's image, finds its entry from the branch at the reset
+    vector, and patches that to branch to the dispatcher."""
+    segs = read_image(t.path)
+    top = max(a + len(b) for (a, b) in segs)
+    if top > PACK_BASE:
+        raise ValueError("%s: image (to 0x%x) overlaps the dispatcher at 0x%x" %
+                         (t.path, top, PACK_BASE))
+    for (a, b) in segs:
+        if a <= RESET and RESET + 4 <= a + len(b):
+            o = RESET - a
+            w = int.from_bytes(b[o:o + 4], 'big')
+            if w >> 26 != 18 or w & 1:
+                raise ValueError("%s: no branch at the reset vector (0x%08x)" %
+                                 (t.path, w))
+            li = w & 0x3fffffc
+            if li & 0x2000000:
+                li -= 0x4000000
+            t.entry = (li if w & 2 else RESET + li) & 0xffffffff
+            b[o:o + 4] = enc('b', LI=PACK_BASE, AA=1).to_bytes(4, 'big')
+            break
+    else:
+        raise ValueError("%s: no reset vector" % t.path)
+    t.segs = [(a, np.frombuffer(bytes(b) + b'\0' * (-len(b) & 3), dtype='>u4')
+               .astype(np.uint32)) for (a, b) in segs]
+
+
+def align(v, n):
+    return (v + n - 1) & ~(n - 1)
+
+
+def dispatcher(enc, n, results, tests, zero_bytes, cache_bytes):
+    a = Asm(enc, PACK_BASE)
+
+    def li32(r, v):
+        a('addis', RT=r, RA=0, SI=v >> 16)
+        a('ori', RS=r, RA=r, UI=v & 0xffff)
+
+    def putch(c):
+        a('addi', RT=4, RA=0, SI=0x100 | c)
+        a('mtspr', SPR_DEBUG, RS=4)
+
+    def bge(l):
+        a.b(l, 'bc', BO=0b00100, BI=0)
+
+    def bdnz(l):
+        a.b(l, 'bc', BO=0b10000, BI=0)
+
+    # r20 = table, r21 = test index, r23 = simulator services, r24 = entry
+    li32(20, TABLE)
+    li32(23, SIMSVC_BASE)
+
+    # Caches and TLBs, before anything's stored:  real mode is cacheable and
+    # the D-cache is write-back, so the test's dirty lines (which the next
+    # copy replaces) are dropped, and every dispatcher store is flushed
+    a('tlbia')
+    a('addi', RT=3, RA=0, SI=0)
+    li32(4, cache_bytes >> 5)
+    a('mtspr', SPR_CTR, RS=4)
+    a.label('inv')
+    a('mtspr', SPR_IC_INV_SET, RS=3)
+    a('mtspr', SPR_DC_INV_SET, RS=3)
+    a('addi', RT=3, RA=3, SI=32)
+    bdnz('inv')
+    a('sync')
+    a('isync')
+
+    a('lwz', RT=21, RA=20, D=H_CUR)
+    a('cmpi', BF=0, RA=21, SI=0)
+    a.blt('next')
+
+    # The test that's just run:  its results, and whether it passed
+    a('rlwinm', RS=21, RA=24, SH=5, MB=0, ME=26)
+    li32(25, results)
+    a('add', RT=24, RA=24, RB=25)
+    for (r, reg, off) in ((3, SIMSVC_RUN_STATUS, R_STATUS), (4, SIMSVC_RUN_END, R_END),
+                          (5, SIMSVC_RUN_CYCLES, R_CYCLES), (6, SIMSVC_RUN_INSTRS, R_INSTRS)):
+        a('lwz', RT=r, RA=23, D=reg)
+        a('stw', RS=r, RA=24, D=off)
+    a('rlwinm', RS=21, RA=25, SH=5, MB=0, ME=26)
+    li32(26, tests)
+    a('add', RT=25, RA=25, RB=26)
+    a('lwz', RT=8, RA=25, D=T_FLAGS)
+    a('cmpi', BF=0, RA=3, SI=0)
+    a.bne('fail')
+    a('cmpi', BF=0, RA=4, SI=0)
+    a.beq('fail')
+    a('cmpi', BF=0, RA=4, SI=RUN_LIMIT)
+    a.bne('pass')
+    a('andi_rc', RS=8, RA=8, UI=TF_LIMIT_OK)
+    a.beq('fail')
+    a.label('pass')
+    a('addi', RT=7, RA=0, SI=RF_RAN | RF_PASS)
+    a.b('record')
+    a.label('fail')
+    a('addi', RT=7, RA=0, SI=RF_RAN)
+    a('lwz', RT=8, RA=20, D=H_FAILS)
+    a('addi', RT=8, RA=8, SI=1)
+    a('stw', RS=8, RA=20, D=H_FAILS)
+    a.label('record')
+    a('stw', RS=7, RA=24, D=R_FLAGS)
+    a('dcbf', RA=0, RB=24)              # A result is a line
+
+    a.label('next')
+    a('addi', RT=21, RA=21, SI=1)
+    a('stw', RS=21, RA=20, D=H_CUR)
+    a('dcbf', RA=0, RB=20)              # As is the header
+    a('sync')
+    a('cmpi', BF=0, RA=21, SI=n)
+    bge('done')
+
+    for c in b'\nPT ':
+        putch(c)
+    a('or', RS=21, RA=3, RB=21)
+    a.b('hex', LK=1)
+    putch(ord('\n'))
+
+    if zero_bytes:
+        a('addi', RT=4, RA=0, SI=0)
+        li32(5, zero_bytes >> 5)
+        a('mtspr', SPR_CTR, RS=5)
+        a.label('zero')
+        a('dcbz', RA=0, RB=4)
+        a('dcbf', RA=0, RB=4)
+        a('addi', RT=4, RA=4, SI=32)
+        bdnz('zero')
+
+    # The test's segments, each copied then flushed to memory by line, with
+    # the I-cache's lines invalidated too
+    a('rlwinm', RS=21, RA=24, SH=5, MB=0, ME=26)
+    li32(25, tests)
+    a('add', RT=24, RA=24, RB=25)
+    a('lwz', RT=26, RA=24, D=T_SEGS)
+    a('lwz', RT=27, RA=24, D=T_NSEGS)
+    a.label('seg')
+    a('lwz', RT=4, RA=26, D=S_DEST)
+    a('lwz', RT=5, RA=26, D=S_SRC)
+    a('lwz', RT=6, RA=26, D=S_WORDS)
+    a('mtspr', SPR_CTR, RS=6)
+    a('addi', RT=4, RA=4, SI=-4)
+    a('addi', RT=5, RA=5, SI=-4)
+    a.label('copy')
+    a('lwzu', RT=7, RA=5, D=4)
+    a('stwu', RS=7, RA=4, D=4)
+    bdnz('copy')
+    a('lwz', RT=4, RA=26, D=S_DEST)
+    a('rlwinm', RS=4, RA=4, SH=0, MB=0, ME=26)
+    a('lwz', RT=6, RA=26, D=S_LINES)
+    a('mtspr', SPR_CTR, RS=6)
+    a.label('flush')
+    a('dcbf', RA=0, RB=4)
+    a('icbi', RA=0, RB=4)
+    a('addi', RT=4, RA=4, SI=32)
+    bdnz('flush')
+    a('addi', RT=26, RA=26, SI=S_SIZE)
+    a('addi', RT=27, RA=27, SI=-1)
+    a('cmpi', BF=0, RA=27, SI=0)
+    a.bne('seg')
+    a('sync')
+    a('isync')
+
+    # Architectural state as from reset
+    a('addi', RT=3, RA=0, SI=0)
+    a('addi', RT=4, RA=0, SI=0)
+    a('addi', RT=5, RA=0, SI=16)
+    a('mtspr', SPR_CTR, RS=5)
+    a.label('sr')
+    a('mtsrin', RS=3, RB=4)
+    a('addis', RT=4, RA=4, SI=0x1000)
+    bdnz('sr')
+    for spr in (tuple(SPR_BATS) + (SPR_SDR1, SPR_DEC, SPR_DAR, SPR_DSISR) +
+                SPR_SPRGS + (SPR_XER, SPR_LR, SPR_CTR)):
+        a('mtspr', spr, RS=3)
+    a('mtcrf', FXM=0xff, RS=3)
+    a('isync')
+
+    # Arm the run, and go
+    a('lwz', RT=5, RA=24, D=T_LIMIT)
+    a('lwz', RT=3, RA=24, D=T_ENTRY)
+    a('mtspr', SPR_SRR0, RS=3)
+    a('addi', RT=3, RA=0, SI=0)
+    a('mtspr', SPR_SRR1, RS=3)
+    a('stw', RS=5, RA=23, D=SIMSVC_RUN)
+    a('sync')
+    for r in range(32):
+        a('addi', RT=r, RA=0, SI=0)
+    a('isync')
+    a('rfi')
+
+    # All run:  print the results, and exit with the number of failures
+    a.label('done')
+    putch(ord('\n'))
+    li32(24, results)
+    a('addi', RT=21, RA=0, SI=0)
+    a.label('dump')
+    for c in b'PR ':
+        putch(c)
+    a('or', RS=21, RA=3, RB=21)
+    a.b('hex', LK=1)
+    a('addi', RT=26, RA=0, SI=R_SIZE // 4)
+    a.label('dump_word')
+    putch(ord(' '))
+    a('lwz', RT=3, RA=24, D=0)
+    a.b('hex', LK=1)
+    a('addi', RT=24, RA=24, SI=4)
+    a('addi', RT=26, RA=26, SI=-1)
+    a('cmpi', BF=0, RA=26, SI=0)
+    a.bne('dump_word')
+    putch(ord('\n'))
+    a('addi', RT=21, RA=21, SI=1)
+    a('cmpi', BF=0, RA=21, SI=n)
+    a.blt('dump')
+    a('lwz', RT=3, RA=20, D=H_FAILS)
+    a('stw', RS=3, RA=23, D=SIMSVC_EXIT)
+    a.label('hang')                     # Not a branch to self (EXIT_B_SELF)
+    a('sync')
+    a.b('hang')
+
+    # r3 as 8 hex digits; clobbers r3, r4, CTR
+    a.label('hex')
+    a('addi', RT=4, RA=0, SI=8)
+    a('mtspr', SPR_CTR, RS=4)
+    a.label('hex_loop')
+    a('rlwinm', RS=3, RA=3, SH=4, MB=0, ME=31)
+    a('andi_rc', RS=3, RA=4, UI=15)
+    a('cmpi', BF=0, RA=4, SI=10)
+    a.blt('hex_digit')
+    a('addi', RT=4, RA=4, SI=ord('a') - ord('0') - 10)
+    a.label('hex_digit')
+    a('addi', RT=4, RA=4, SI=0x100 | ord('0'))
+    a('mtspr', SPR_DEBUG, RS=4)
+    bdnz('hex_loop')
+    a('bclr', BO=0b10100, BI=0)
+
+    if a.here() > TABLE:
+        raise ValueError("Dispatcher too big (%d bytes)" % (a.here() - PACK_BASE))
+    return a.words_array()
+
+
+def pack(tests, out, zero_bytes, cache_bytes):
+    """Writes the packed image and its manifest; returns the manifest"""
+    if not tests:
+        raise ValueError("No tests")
+    if len(tests) > MAX_TESTS:
+        raise ValueError("Too many tests (%d, %d max)" % (len(tests), MAX_TESTS))
+    if zero_bytes > PACK_BASE or zero_bytes & 31:
+        raise ValueError("The zeroed region must be whole cache lines below 0x%x" %
+                         PACK_BASE)
+    if cache_bytes < 32:
+        raise ValueError("The cache size must be at least a line")
+    enc = mk_random.Encoder(mr_isa.ISA())
+    for t in tests:
+        load(t, enc)
+
+    n = len(tests)
+    tests_at = TABLE + HEADER
+    results = align(tests_at + n * T_SIZE, 32)
+    segtab = results + n * R_SIZE
+    stage = align(segtab + S_SIZE * sum(len(t.segs) for t in tests), 8)
+
+    table = np.zeros((results - TABLE) // 4, dtype=np.uint32)
+    table[H_CUR // 4] = 0xffffffff
+    table[H_NTESTS // 4] = n
+    segs = []
+    staged = []
+    at = stage
+    for (i, t) in enumerate(tests):
+        e = (tests_at - TABLE + i * T_SIZE) // 4
+        table[e + T_SEGS // 4] = segtab + 4 * len(segs)
+        table[e + T_NSEGS // 4] = len(t.segs)
+        table[e + T_ENTRY // 4] = t.entry
+        table[e + T_LIMIT // 4] = t.limit
+        table[e + T_FLAGS // 4] = TF_LIMIT_OK if t.limit_ok else 0
+        for (a, w) in t.segs:
+            segs += [a, at, len(w), ((a + 4 * len(w) - 1) >> 5) - (a >> 5) + 1]
+            staged.append(w)
+            at = align(at + 4 * len(w), 8)
+    top = at
+    memsizel2 = max(MIN_MEMSIZEL2, (top - 1).bit_length())
+    if memsizel2 > 30:
+        raise ValueError("The packed image (to 0x%x) is too big" % top)
+
+    code = dispatcher(enc, n, results, tests_at, zero_bytes, cache_bytes)
+    image = [(RESET, np.array([enc('b', LI=PACK_BASE, AA=1)], dtype=np.uint32)),
+             (PACK_BASE, code), (TABLE, table),
+             (results, np.zeros(n * R_SIZE // 4, dtype=np.uint32)),
+             (segtab, np.array(segs, dtype=np.uint32))]
+    at = stage
+    for w in staged:
+        image.append((at, w))
+        at = align(at + 4 * len(w), 8)
+    with open(out, 'wb') as f:
+        f.write(mr_hex.to_hex(image))
+
+    manifest = {'image': out, 'memsizel2': memsizel2, 'top': top,
+                'zero_bytes': zero_bytes, 'cache_bytes': cache_bytes,
+                'tests': [{'name': t.name, 'path': t.path,
+                           'hash': bench.file_hash(t.path), 'entry': t.entry,
+                           'limit': t.limit, 'limit_ok': t.limit_ok,
+                           'bytes': sum(4 * len(w) for (_, w) in t.segs)}
+                          for t in tests]}
+    with open(manifest_path(out), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def manifest_path(image):
+    return os.path.splitext(image)[0] + '.json'
+
+
+################################################################################
+# Running and unpacking
+
+def build(memsizel2):
+    import vbuild
+
+    cfg = vbuild.Config({'MEMSIZEL2': memsizel2, 'TRACE': 0})
+    err = cfg.check()
+    if err:
+        raise ValueError(err)
+    for r in vbuild.build_matrix([cfg], jobs=1):
+        if not r['ok']:
+            raise RuntimeError("%s: build FAILED, see %s" % (r['label'], r['log']))
+        return r['exe']
+
+
+def run(exe, image):
+    """Returns (harness output, wall seconds)"""
+    # The exit status is the dispatcher's failure count, reported by unpack()
+    (stdout, _, wall) = bench.run_sim([exe, '+INPUT_FILE=' + image])
+    return (stdout, wall)
+
+
+def unpack(stdout, n):
+    """Splits a packed run's output:  returns ([console text] per test,
+    {index: [result words]}, total cycles or None)"""
+    consoles = [None] * n
+    results = {}
+    cur = None
+    lines = []
+    for line in stdout.splitlines():
+        m = PT_RE.match(line)
+        r = PR_RE.match(line)
+        if m or r or line.startswith('*** Simulator exit'):
+            if cur is not None:
+                if lines and lines[-1] == '':
+                    lines.pop()
+                consoles[cur] = '\n'.join(lines)
+            cur = int(m.group(1), 16) if m else None
+            if cur is not None and cur >= n:
+                raise ValueError("Test %d in the output, but only %d packed" % (cur, n))
+            lines = []
+            if r:
+                results[int(r.group(1), 16)] = [int(w, 16) for w in r.group(2).split()]
+        elif cur is not None:
+            lines.append(line)
+    m = bench.COMPLETE_RE.search(stdout)
+    return (consoles, results, int(m.group(3)) if m else None)
+
+
+def report(manifest, stdout, wall, verbose):
+    """Prints the per-test report; returns the number of failures"""
+    tests = manifest['tests']
+    (consoles, results, total) = unpack(stdout, len(tests))
+    fails = 0
+    in_tests = 0
+    rows = []
+    for (i, t) in enumerate(tests):
+        r = results.get(i)
+        if r is None or not r[R_FLAGS // 4] & RF_RAN:
+            fails += 1
+            rows.append((i, t['name'], 'NOT RUN', '', '', '', '', '', ''))
+            continue
+        passed = r[R_FLAGS // 4] & RF_PASS
+        fails += not passed
+        end = r[R_END // 4]
+        cycles = r[R_CYCLES // 4]
+        instrs = r[R_INSTRS // 4]
+        in_tests += cycles
+        out = consoles[i] or ''
+        rows.append((i, t['name'], 'PASS' if passed else 'FAIL',
+                     r[R_STATUS // 4],
+                     RUN_ENDS[end] if end < len(RUN_ENDS) else str(end),
+                     cycles, instrs, '%.3f' % (instrs / cycles) if cycles else '-',
+                     hashlib.sha1(out.encode()).hexdigest()[:8]))
+
+    w = max([4] + [len(t['name']) for t in tests])
+    print("%5s  %-*s  %-7s  %6s  %-6s  %12s  %12s  %6s  %s" %
+          ('#', w, 'Test', 'Result', 'Status', 'End', 'Cycles', 'Instrs', 'IPC', 'Output'))
+    for row in rows:
+        print("%5d  %-*s  %-7s  %6s  %-6s  %12s  %12s  %6s  %s" %
+              ((row[0], w) + row[1:]))
+        if verbose and consoles[row[0]]:
+            for line in consoles[row[0]].splitlines():
+                print("       | %s" % line)
+
+    print("\n%d tests, %d failed" % (len(tests), fails))
+    if total:
+        print("%d cycles, %d in tests (dispatcher %.1f%%)" %
+              (total, in_tests, 100.0 * (total - in_tests) / total))
+    if wall:
+        print("%.1fs wall, %.0f cycles/s" % (wall, total / wall if total else 0))
+    return fails
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s -o <packed .hex> [-s <suite file>] [-n <cycle limit>] "
+          "[-z <bytes>] [-C <cache bytes>]\n\t\t[-r [-e <exe>]] [-v] [<test image> ...]\n"
+          "\t %s -u <manifest .json> <run output> [-v]" % (sys.argv[0], sys.argv[0]))
+    print("\t-s:  Pack a suite's workloads (bench.py's format), with their limits")
+    print("\t-n:  Cycle limit per test (default %d, 0 for none)" % LIMIT)
+    print("\t-z:  Zero memory below this (whole cache lines) before each test (default 0)")
+    print("\t-C:  Cache size to invalidate, per cache (default %d)" % CACHE_BYTES)
+    print("\t-r:  Run the image (with -e, or a build of the RAM size it needs) and report")
+    print("\t-v:  Print each test's console output")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    out = None
+    suite_path = None
+    limit = LIMIT
+    zero_bytes = 0
+    cache_bytes = CACHE_BYTES
+    do_run = False
+    exe = None
+    manifest_in = None
+    verbose = False
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'o:s:n:z:C:re:u:vh')
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+
+    for o, a in opts:
+        if o == '-o':
+            out = a
+        elif o == '-s':
+            suite_path = a
+        elif o == '-n':
+            limit = int(float(a))
+        elif o == '-z':
+            zero_bytes = int(a, 0)
+        elif o == '-C':
+            cache_bytes = int(a, 0)
+        elif o == '-r':
+            do_run = True
+        elif o == '-e':
+            exe = a
+        elif o == '-u':
+            manifest_in = a
+        elif o == '-v':
+            verbose = True
+        else:
+            usage()
+
+    if manifest_in:
+        if out or suite_path or do_run or len(args) != 1:
+            usage()
+        try:
+            with open(manifest_in, 'r') as f:
+                manifest = json.load(f)
+            with open(args[0], 'r', errors='replace') as f:
+                stdout = f.read()
+            fails = report(manifest, stdout, None, verbose)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(1 if fails else 0)
+
+    if out is None or (not args and not suite_path):
+        usage()
+
+    tests = []
+    try:
+        if suite_path:
+            for w in bench.read_suite(suite_path):
+                if not os.path.exists(w.image):
+                    print("%s: no image %s, skipped" % (w.name, w.image))
+                    continue
+                tests.append(Test(w.name, w.image, w.max_cycles or limit,
+                                  w.max_cycles != 0))
+        for path in args:
+            name = os.path.splitext(os.path.basename(path))[0]
+            tests.append(Test(name, path, limit, False))
+        manifest = pack(tests, out, zero_bytes, cache_bytes)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    print("Packed %d tests into %s (to 0x%x; needs MEMSIZEL2 >= %d), manifest %s" %
+          (len(tests), out, manifest['top'], manifest['memsizel2'], manifest_path(out)))
+
+    if not do_run:
+        sys.exit(0)
+    try:
+        if exe is None:
+            print("Building (MEMSIZEL2=%d)" % manifest['memsizel2'])
+            exe = build(manifest['memsizel2'])
+        (stdout, wall) = run(exe, out)
+        log = os.path.splitext(out)[0] + '.log'
+        with open(log, 'w') as f:
+            f.write(stdout)
+        print("Output in %s\n" % log)
+        fails = report(manifest, stdout, wall, verbose)
+    except (OSError, ValueError, RuntimeError) as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(1 if fails else 0)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+#
+# Hot-spot report from PC samples taken by the Verilator harness:
+#
+#   ./verilator/obj_dir/Vwrapper_top -p samples.bin -P 1000 -S wb
+#   ./tools/pc_profile.py -e workload.elf samples.bin
+#
+# Each sample is a PC in DE or WB, plus the perf event bits active that cycle.
+# Samples are symbolised against the workload's ELF and reported as hot
+# functions and hot instructions, with estimated cycles (samples * period)
+# split by stall reason.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+import mr_elf
+import mr_trace
+
+
+# A sample is put into exactly one bucket, the first of these whose event is
+# set.  Stalls nearer WB win, since they hold up everything behind them.
+STALL_REASONS = [('mem_ptw',     'mem_mmu_ptws'),
+                 ('mem_stall',   'mem_stall'),
+                 ('exe_stall',   'exe_stall'),
+                 ('de_operands', 'de_stall_operands'),
+                 ('de_stall',    'decode_stall'),
+                 ('if_ptw',      'if_mmu_ptws'),
+                 ('if_miss',     'if_fetching_stalled'),
+                 ('commit',      'inst_commit')]
+OTHER = 'other'
+REASONS = [r[0] for r in STALL_REASONS] + [OTHER]
+
+
+def classify(pctrs):
+    """Returns a reason index (into REASONS) for each sample."""
+    reason = np.full(len(pctrs), len(STALL_REASONS), dtype=np.int64)
+    for (i, (_, ev)) in reversed(list(enumerate(STALL_REASONS))):
+        reason[mr_trace.pctr_bit(pctrs, ev)] = i
+    return reason
+
+
+def table(keys, reason, nsamples, period, label, top, names):
+    """Prints the top entries of a key -> (reason breakdown) table."""
+    (ukeys, inv) = np.unique(keys, return_inverse=True)
+    counts = np.zeros((len(ukeys), len(REASONS)), dtype=np.int64)
+    np.add.at(counts, (inv, reason), 1)
+    totals = counts.sum(axis=1)
+    order = np.argsort(-totals, kind='stable')[:top]
+
+    print("%-32s %8s %6s %12s  " % (label, "Samples", "%", "Est.cycles") +
+          " ".join("%11s" % r for r in REASONS))
+    for i in order:
+        print("%-32s %8d %6.2f %12d  " %
+              (names(ukeys[i])[:32], totals[i], 100.0 * totals[i] / nsamples,
+               totals[i] * period) +
+              " ".join("%10.1f%%" % (100.0 * c / totals[i]) for c in counts[i]))
+
+
+def usage():
+    print("Syntax:\n\t %s [options] <PC sample file>\n" % sys.argv[0])
+    print("\t-e <elf>\tWorkload ELF, for symbols and instruction words")
+    print("\t-n <n>\t\tShow top <n> functions/instructions (default 20)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "e:n:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    elf_path = None
+    top = 20
+    for (o, a) in opts:
+        if o == '-e':
+            elf_path = a
+        elif o == '-n':
+            top = int(a, 0)
+        else:
+            usage()
+    if len(args) != 1:
+        usage()
+
+    (hdr, samples) = mr_trace.read_pc_samples(args[0])
+    n = len(samples)
+    if n == 0:
+        print("No samples!")
+        sys.exit(1)
+
+    period = int(hdr['period'])
+    pcs = np.asarray(samples['pc'])
+    reason = classify(np.asarray(samples['pctrs']))
+    bubbles = np.count_nonzero((samples['flags'] & mr_trace.PC_SAMPLE_FLAG_VALID) == 0)
+
+    print("%d samples every %d cycles at %s (~%d cycles); %.1f%% taken on bubbles\n" %
+          (n, period, mr_trace.PC_SAMPLE_STAGES[hdr['stage']], n * period,
+           100.0 * bubbles / n))
+
+    print("Overall:")
+    for (i, r) in enumerate(REASONS):
+        c = np.count_nonzero(reason == i)
+        print("  %-12s %8d %6.2f%%" % (r, c, 100.0 * c / n))
+    print("")
+
+    elf = mr_elf.ELF(elf_path) if elf_path else None
+
+    if elf:
+        (sym, _) = elf.symbolise(pcs)
+        table(sym, reason, n, period, "Function", top,
+              lambda s: elf.sym_names[s] if s >= 0 else "<unknown>")
+        print("")
+
+    def insn_name(pc):
+        if not elf:
+            return "%08x" % pc
+        w = elf.read_word(int(pc))
+        return "%08x %s %s" % (pc, "--------" if w is None else "%08x" % w,
+                               elf.name_of(int(pc)))
+
+    table(pcs, reason, n, period, "Instruction", top, insn_name)
@@ -0,0 +1,837 @@
+#!/usr/bin/env python3
+#
+# Cycle-approximate model of MR's pipeline, driven by commit traces, for
+# trying out microarchitecture proposals on whole workloads without
+# re-running (or changing) the RTL:
+#
+#   ./verilator/obj_dir/Vwrapper_top -c a.trace -C a.pctrs
+#   ./tools/pipe_model.py a.trace:a.pctrs
+#   ./tools/pipe_model.py -K calib.json a.trace:a.pctrs b.trace:b.pctrs
+#   ./tools/pipe_model.py -k calib.json -F wb -b gshare:4096:12+btb:64 a.trace
+#   ./tools/pipe_model.py -k calib.json -2 64 -t 8 a.trace
+#
+# Each committed (or faulting) instruction in the trace is walked through
+# IF, DE, EXE, MEM and WB, computing the cycle it enters each stage from:
+#
+#   - Structural hazards:  one instruction per stage; a stage is free once
+#     its occupant moves on, so stalls back up the pipe.
+#   - DE's scoreboard, per mr_isa.py:  EXE results bypass (a consumer issues
+#     as the producer leaves EXE), load data and R1 results are forwarded from
+#     WB, LR/CTR/SPRGn are only readable after write-back (also for WAW), and
+#     a generic-lock instruction holds DE until it writes back.
+#   - EXE occupancy:  2 cycles for mul, ~35 for the divider.
+#   - Branch annul:  a taken branch (or isync/mtmsr/rfi/tlbsync) redirects
+#     fetch from EXE, faults and interrupts from WB.
+#   - I/D cache misses (cache_sim.py's model of cache.v), uncached accesses
+#     and TLB misses (tlb_replay.py's TLB), costing latencies which are fitted
+#     to the RTL's perf counters; fills, spills and uncached accesses queue
+#     for the one EMI port.
+#   - lmw/stmw, which DE cracks into one sub-op per register (one commit
+#     record each).
+#
+# The model counts the same events as mr_cpu_top's pctrs (stall cycles by
+# stage, walks, accesses), so given the whole-run totals from Vwrapper_top's
+# -C option the two can be compared event by event.  -K fits the latencies
+# to one or more traces' totals (least-squares, with weak priors for the
+# latencies a small benchmark set can't pin down) and writes them to a JSON
+# file, which -k loads.  The taken-branch redirect is set from the commit gap
+# measured after taken branches, as bp_eval.py does.
+#
+# Proposals, compared against the baseline (RTL) configuration:
+#
+#   -F wb       Forward WB results (loads, R1) to EXE a cycle earlier
+#   -F spr      Bypass LR/CTR/SPRGn like GPRs
+#   -b <spec>   A branch predictor, as bp_eval.py's schemes
+#   -2 <n>      An <n>-entry L2 TLB (hit latency -L)
+#   -t <n>      I/D TLB entries
+#   -i/-d <g>   I/D cache geometry, <size>:<ways>:<line>
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import collections
+import getopt
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+import bp_eval
+import cache_sim
+import mr_isa
+import mr_trace
+import tlb_replay
+from mr_isa import AVAIL_EXE, AVAIL_WB, AVAIL_REGFILE, EXE_MUL, EXE_DIV, \
+    R_LR, field_ra, field_rt
+from mr_trace import C_REQ_C_READ, C_REQ_C_WRITE, C_REQ_INV, \
+    C_REQ_CLEAN_INV, C_REQ_CLEAN, C_REQ_ZERO, C_REQ_INV_SET, MSR_IR, MSR_DR
+
+
+# Latencies (cycles); those in CALIBRATED are fitted by -K.
+DEFAULT_PARAMS = collections.OrderedDict([
+    ('fill', 10),               # Cache line fill over the EMI
+    ('spill', 8),               # Dirty line write-back
+    ('uncached', 6),            # Uncached access
+    ('ptw', 20),                # TLB miss page-table walk
+    ('redirect', 2),            # Branch in EXE to fetching its target
+    ('exception', 3),           # Fault/interrupt at WB to fetching the vector
+    ('l2tlb', 2),               # Proposed L2 TLB hit
+])
+CALIBRATED = ['fill', 'spill', 'uncached', 'ptw']
+PRIOR_WEIGHT = 0.05             # Relative pull of the defaults in the fit
+FIT_ITERATIONS = 3
+
+EXE_CYCLES = {mr_isa.EXE_SINGLE: 1, EXE_MUL: 2, EXE_DIV: 35}
+
+CHUNK = 1 << 20                 # Records per chunk
+PREFIX = 32                     # Records of context carried between chunks
+INTERVAL = 100000               # Records per interval, for interval error
+
+IO_REGION = 3                   # EA[31:30] of the uncached region
+
+# How fetch is redirected after an instruction
+RD_NONE = 0
+RD_EXE = 1                      # Annulled from EXE
+RD_DE = 2                       # Predicted taken, redirected from DE
+RD_WB = 3                       # Fault or interrupt
+
+# Dependency source stage:  the consumer may enter EXE at T[p] + add
+DEP_MEM = 0
+DEP_WB = 1
+
+# Per-record event counts from the memory system pass
+MEM_EVENTS = ['i_fill', 'i_uc', 'i_walk', 'i_l2', 'd_access', 'd_fill',
+              'd_spill', 'd_uc', 'd_walk', 'd_l2', 'd_cross']
+
+# Model events reported against the RTL's pctrs
+EVENTS = ['inst_commit', 'fault', 'mem_access', 'mem_cacheable_unaligned_CL',
+          'if_mmu_ptws', 'mem_mmu_ptws', 'if_fetching_stalled',
+          'de_stall_operands', 'decode_stall', 'exe_stall', 'mem_stall']
+
+Config = collections.namedtuple('Config', ['icache', 'dcache', 'tlb', 'l2tlb',
+                                           'forward', 'scheme'])
+
+
+def rtl_config():
+    g = (cache_sim.RTL_SIZE, cache_sim.RTL_WAYS, cache_sim.RTL_LINE)
+    return Config(g, g, tlb_replay.RTL_TLB_ENTRIES, 0, (), None)
+
+
+################################################################################
+# Static decode, per chunk
+
+class Decoded:
+    """Per-unique-word decode, as arrays for gathering by record."""
+
+    MAX_READS = 4
+    MAX_WRITES = 4
+
+    def __init__(self, isa, words):
+        n = len(words)
+        self.reads = np.full((n, self.MAX_READS), -1, dtype=np.int64)
+        self.writes = np.full((n, self.MAX_WRITES), -1, dtype=np.int64)
+        self.avail = np.zeros((n, self.MAX_WRITES), dtype=np.int64)
+        self.exe = np.ones(n, dtype=np.int64)
+        self.genlock = np.zeros(n, dtype=bool)
+        self.annul = np.zeros(n, dtype=bool)     # Unconditional br_annul
+        self.branch = np.zeros(n, dtype=bool)
+        self.multiple = np.zeros(n, dtype=np.int8)   # 1 lmw, 2 stmw
+        self.dreq = np.full(n, -1, dtype=np.int64)   # D-side C_REQ_*
+        self.size = np.zeros(n, dtype=np.int64)
+        self.tlbi = np.zeros(n, dtype=np.int8)       # 1 tlbie, 2 flush all
+        self.ireq = np.full(n, -1, dtype=np.int64)   # I-side CMO
+
+        for (u, w) in enumerate(words.tolist()):
+            i = isa.decode(w)
+            if i is None:
+                continue
+            row = i.row
+            mem = row['MEM_OP']
+            self.exe[u] = EXE_CYCLES[i.exe]
+            self.genlock[u] = i.genlock
+            self.branch[u] = row['Name'] in ('b', 'bc', 'bclr', 'bcctr')
+            self.annul[u] = not self.branch[u] and i.ends_block and \
+                row['Form'] != 'SC'
+            if i.multiple:
+                self.multiple[u] = 1 if i.load else 2
+            else:
+                self.reads[u, :len(i.reads)] = i.reads
+                self.writes[u, :len(i.writes)] = [r for (r, _) in i.writes]
+                self.avail[u, :len(i.writes)] = [a for (_, a) in i.writes]
+
+            m = re.search(r"\b([LS])(8|16|32)", mem)
+            if m:
+                self.dreq[u] = C_REQ_C_READ if m.group(1) == 'L' else C_REQ_C_WRITE
+                self.size[u] = int(m.group(2)) // 8
+            for (op, req) in (('DC_BZ', C_REQ_ZERO), ('DC_CINV', C_REQ_CLEAN_INV),
+                              ('DC_INV_SET', C_REQ_INV_SET), ('DC_INV', C_REQ_INV),
+                              ('DC_CLEAN', C_REQ_CLEAN)):
+                if re.search(r"\b%s\b" % op, mem):
+                    self.dreq[u] = req
+                    break
+            if re.search(r"\bIC_INV_SET\b", mem):
+                self.ireq[u] = C_REQ_INV_SET
+            elif re.search(r"\bIC_INV\b", mem):
+                self.ireq[u] = C_REQ_INV
+            if 'TLBIA' in mem:
+                self.tlbi[u] = 2
+            elif 'TLBI_R0' in mem:
+                self.tlbi[u] = 1
+
+
+class Chunk:
+    """A window of trace records (PREFIX records of context, then the chunk
+    proper) with everything the timing loop needs that doesn't depend on
+    timing.  Record j of the window is trace record base + j."""
+
+    def __init__(self, isa, trace, start, end, cfg):
+        self.base = max(start - PREFIX, 0)
+        self.first_j = start - self.base
+        t = trace[self.base:min(end + 1, len(trace))]
+        n = end - self.base
+        self.n = n
+        pc = np.asarray(t['pc']).astype(np.int64)
+        instr = np.asarray(t['instr'])
+        fault = np.asarray(t['fault']) != 0
+        self.pc = pc[:n]
+        self.ea = np.asarray(t['ea'])[:n].astype(np.int64)
+        self.msr = np.asarray(t['msr'])[:n]
+        self.cycle = np.asarray(t['cycle'])[:n].astype(np.int64)
+        self.fault = fault[:n]
+
+        (words, inv) = np.unique(instr[:n], return_inverse=True)
+        d = Decoded(isa, words)
+        self.exe = d.exe[inv]
+        self.dreq = d.dreq[inv]
+        self.size = d.size[inv]
+        self.ireq = d.ireq[inv]
+        self.tlbi = d.tlbi[inv]
+        multiple = d.multiple[inv]
+
+        # lmw/stmw sub-ops:  consecutive records of the same instruction
+        idx = np.arange(n)
+        same = np.zeros(n, dtype=bool)
+        same[1:] = (multiple[1:] != 0) & (pc[1:n] == pc[:n - 1]) & \
+            (instr[1:n] == instr[:n - 1]) & ~fault[:n - 1]
+        self.sub = idx - np.maximum.accumulate(np.where(same, 0, idx))
+        self.first = self.sub == 0
+        # Whether the next record is a further sub-op
+        nxt_same = np.zeros(n, dtype=bool)
+        nxt_same[:-1] = same[1:]
+        if len(t) > n:
+            nxt_same[-1] = multiple[-1] != 0 and pc[n] == pc[n - 1] and \
+                instr[n] == instr[n - 1] and not fault[n - 1]
+        self.more = nxt_same
+
+        self._deps(d, inv, multiple, instr[:n], cfg)
+        self._redirects(d, inv, pc, instr, fault, cfg)
+
+    def _deps(self, d, inv, multiple, instr, cfg):
+        n = self.n
+        reads = d.reads[inv]
+        writes = d.writes[inv]
+        avail = d.avail[inv]
+
+        mul = np.nonzero(multiple)[0]
+        if len(mul):
+            rt = np.minimum(field_rt(instr[mul]).astype(np.int64) +
+                            self.sub[mul], 31)
+            ra = field_ra(instr[mul]).astype(np.int64)
+            ra = np.where((self.sub[mul] == 0) & (ra != 0), ra, -1)
+            ld = multiple[mul] == 1
+            reads[mul, 0] = ra
+            reads[mul, 1] = np.where(ld, -1, rt)
+            writes[mul, 0] = np.where(ld, rt, -1)
+            avail[mul, 0] = AVAIL_WB
+        # Faults don't write anything.
+        writes[self.fault] = -1
+
+        spr_bypass = 'spr' in cfg.forward
+        # Non-bypassed SPRs also wait for an earlier write (WAW).
+        waw = (writes >= R_LR) & (avail == AVAIL_REGFILE) & (not spr_bypass)
+        (rp, rc) = np.nonzero(reads >= 0)
+        (wwp, wwc) = np.nonzero(waw)
+        rpos = np.concatenate([rp, wwp])
+        rres = np.concatenate([reads[rp, rc], writes[wwp, wwc]])
+        (wp, wc) = np.nonzero(writes >= 0)
+        wres = writes[wp, wc]
+        wav = avail[wp, wc]
+
+        # Producer of each read:  the last write of the resource before it
+        key_w = wres * (n + 1) + wp
+        order = np.argsort(key_w, kind='stable')
+        key_w = key_w[order]
+        key_r = rres * (n + 1) + rpos
+        k = np.searchsorted(key_w, key_r) - 1
+        ok = k >= 0
+        k = np.maximum(k, 0)
+        ok &= (key_w[k] // (n + 1)) == rres
+        cons = rpos[ok]
+        prod = wp[order][k[ok]]
+        a = wav[order][k[ok]]
+
+        stage = np.where(a == AVAIL_EXE, DEP_MEM, DEP_WB)
+        add = np.where(a == AVAIL_WB, 1, np.where(a == AVAIL_REGFILE, 2, 0))
+        if 'wb' in cfg.forward:
+            add = np.where(a == AVAIL_WB, 0, add)
+        if spr_bypass:
+            stage = np.where(a == AVAIL_REGFILE, DEP_MEM, stage)
+            add = np.where(a == AVAIL_REGFILE, 0, add)
+
+        # The generic lock holds the next instruction until write-back
+        gl = np.nonzero(d.genlock[inv][:-1] & ~self.fault[:-1])[0]
+        cons = np.concatenate([cons, gl + 1])
+        prod = np.concatenate([prod, gl])
+        stage = np.concatenate([stage, np.full(len(gl), DEP_WB)])
+        add = np.concatenate([add, np.full(len(gl), 2)])
+
+        # Only dependencies which can bind:  anything further back than a
+        # few instructions has written back by the time the consumer issues.
+        keep = (cons - prod <= 8) & (cons >= self.first_j)
+        order = np.argsort(cons[keep], kind='stable')
+        cons = cons[keep][order]
+        deps = list(zip(prod[keep][order].tolist(), stage[keep][order].tolist(),
+                        add[keep][order].tolist()))
+        self.deps = [()] * n
+        bounds = np.searchsorted(cons, np.arange(n + 1))
+        for j in np.nonzero(bounds[1:] != bounds[:-1])[0].tolist():
+            self.deps[j] = tuple(deps[bounds[j]:bounds[j + 1]])
+
+    def _redirects(self, d, inv, pc, instr, fault, cfg):
+        n = self.n
+        nxt = pc[1:n + 1]
+        have_next = len(nxt)
+        nonseq = np.zeros(n, dtype=bool)
+        nonseq[:have_next] = nxt != pc[:have_next] + 4
+        nonseq &= ~self.more
+        branch = d.branch[inv] & ~self.fault
+        rk = np.where(nonseq, np.where(branch | d.annul[inv], RD_EXE, RD_WB),
+                      np.where(d.annul[inv], RD_EXE, RD_NONE))
+        rk[self.fault] = RD_WB
+        self.after_redirect = np.zeros(n, dtype=bool)
+        self.after_redirect[1:] = nonseq[:-1] | self.fault[:-1]
+
+        if cfg.scheme is not None and have_next:
+            sel = np.nonzero(branch[:have_next])[0]
+            sel = sel[sel >= self.first_j]
+            (_, kind, cond, link, target) = bp_eval.decode_branches(
+                pc[sel].astype(np.uint32), instr[sel])
+            taken = nonseq[sel]
+            to = nxt[sel]
+            # Interrupted direct branches stay as they are
+            ok = (kind != bp_eval.BR_DIRECT) | ~taken | (to == target)
+            sel = sel[ok]
+            br = bp_eval.Branches(pc[sel].astype(np.uint32), kind[ok], cond[ok],
+                                  link[ok], target[ok], taken[ok],
+                                  to[ok].astype(np.uint32))
+            (mis, at_de) = cfg.scheme.outcomes(br)
+            rk[sel] = np.where(mis, RD_EXE, np.where(at_de, RD_DE, RD_NONE))
+        self.redirect = rk
+
+
+################################################################################
+# Memory system:  caches, TLBs and their miss counts per record
+
+class MemSystem:
+    def __init__(self, cfg):
+        self.icache = cache_sim.CacheModel(*cfg.icache)
+        self.dcache = cache_sim.CacheModel(*cfg.dcache)
+        self.iline = cfg.icache[2]
+        self.dline = cfg.dcache[2]
+        self.itlb = tlb_replay.TLB(cfg.tlb)
+        self.dtlb = tlb_replay.TLB(cfg.tlb)
+        self.l2 = tlb_replay.TLB(cfg.l2tlb) if cfg.l2tlb else None
+
+    def _translate(self, tlb, page, cycle, fault):
+        """Returns (walked, L2 hit)."""
+        if tlb.lookup(page):
+            return (0, 0)
+        if self.l2 is not None and self.l2.lookup(page):
+            if not fault:
+                tlb.insert(page, cycle)
+            return (0, 1)
+        if not fault:
+            tlb.insert(page, cycle)
+            if self.l2 is not None:
+                self.l2.insert(page, cycle)
+        return (1, 0)
+
+    def _flush(self, tlbi, ea):
+        for t in (self.itlb, self.dtlb, self.l2):
+            if t is None:
+                continue
+            if tlbi == 2:
+                t.flush()
+            else:
+                t.remove(ea >> 12)
+
+    def run(self, c):
+        """Returns a dict of MEM_EVENTS count arrays for a chunk's records."""
+        n = c.n
+        ev = dict((e, np.zeros(n, dtype=np.int64)) for e in MEM_EVENTS)
+        j0 = c.first_j
+
+        ln = c.pc >> (self.iline.bit_length() - 1)
+        iuc = (c.pc >> 30) == IO_REGION
+        need_i = np.zeros(n, dtype=bool)
+        need_i[1:] = (ln[1:] != ln[:-1]) | c.after_redirect[1:]
+        need_i |= iuc
+        need_i &= c.first
+        need_i[:j0] = False
+        need_d = (c.dreq >= 0) | (c.ireq >= 0) | (c.tlbi > 0)
+        need_d[:j0] = False
+        if j0 == 0 and n:
+            need_i[0] = True
+
+        ic = self.icache
+        dc = self.dcache
+        dst = dc.stats
+        (i_fill, i_uc, i_walk, i_l2) = ([0] * n, [0] * n, [0] * n, [0] * n)
+        (d_acc, d_fill, d_spill, d_uc, d_walk, d_l2, d_cross) = \
+            ([0] * n for _ in range(7))
+        pcs = c.pc.tolist()
+        eas = c.ea.tolist()
+        msrs = c.msr.tolist()
+        cycles = c.cycle.tolist()
+        faults = c.fault.tolist()
+        dreqs = c.dreq.tolist()
+        ireqs = c.ireq.tolist()
+        sizes = c.size.tolist()
+        tlbis = c.tlbi.tolist()
+        dmask = self.dline - 1
+
+        for j in np.nonzero(need_i | need_d)[0].tolist():
+            cyc = cycles[j]
+            flt = faults[j]
+            if need_i[j]:
+                pc = pcs[j]
+                if msrs[j] & MSR_IR:
+                    (i_walk[j], i_l2[j]) = self._translate(self.itlb, pc >> 12,
+                                                           cyc, flt)
+                if (pc >> 30) == IO_REGION:
+                    i_uc[j] = 1
+                elif not ic.access(cyc, pc, C_REQ_C_READ):
+                    i_fill[j] = 1
+            if not need_d[j]:
+                continue
+            ea = eas[j]
+            if tlbis[j]:
+                self._flush(tlbis[j], ea)
+            if ireqs[j] >= 0 and not flt:
+                ic.access(cyc, ea, ireqs[j])
+            req = dreqs[j]
+            if req < 0:
+                continue
+            d_acc[j] = 1
+            if msrs[j] & MSR_DR and req != C_REQ_INV_SET:
+                (d_walk[j], d_l2[j]) = self._translate(self.dtlb, ea >> 12,
+                                                       cyc, flt)
+            if flt:
+                continue
+            if (ea >> 30) == IO_REGION:
+                if req in (C_REQ_C_READ, C_REQ_C_WRITE):
+                    d_uc[j] = 1
+                continue
+            addrs = [ea]
+            if req in (C_REQ_C_READ, C_REQ_C_WRITE) and \
+               (ea & dmask) + sizes[j] > self.dline:
+                addrs.append((ea | dmask) + 1)
+                d_cross[j] = 1
+            for a in addrs:
+                (fills, spills) = (dst['fills'], dst['spills'])
+                dc.access(cyc, a, req)
+                d_fill[j] += dst['fills'] - fills
+                d_spill[j] += dst['spills'] - spills
+
+        for (name, v) in (('i_fill', i_fill), ('i_uc', i_uc), ('i_walk', i_walk),
+                          ('i_l2', i_l2), ('d_access', d_acc), ('d_fill', d_fill),
+                          ('d_spill', d_spill), ('d_uc', d_uc),
+                          ('d_walk', d_walk), ('d_l2', d_l2),
+                          ('d_cross', d_cross)):
+            ev[name] = np.array(v, dtype=np.int64)
+        return ev
+
+
+################################################################################
+# Timing
+
+def emi_slot(busy, t, length, low):
+    """Books the EMI for <length> cycles from the first gap at or after t
+    in busy (a sorted list of (start, end)); returns the end.  Bookings
+    ending by <low>, the earliest any later request can be made, are dropped.
+    """
+    while busy and busy[0][1] <= low:
+        busy.pop(0)
+    for (s, e) in busy:
+        if t + length <= s:
+            break
+        if e > t:
+            t = e
+    bisect.insort(busy, (t, t + length))
+    return t + length
+
+
+class Model:
+    """Runs traces through the pipeline with given latencies and config."""
+
+    def __init__(self, isa, params, cfg):
+        self.isa = isa
+        self.params = params
+        self.cfg = cfg
+
+    def run(self, trace):
+        """Returns (stats, per-record WB cycles)."""
+        p = self.params
+        cfg = self.cfg
+        if cfg.scheme is not None:
+            cfg = cfg._replace(scheme=bp_eval.Scheme(cfg.scheme))
+        mem = MemSystem(cfg)
+        n = len(trace)
+        st = collections.Counter()
+        wb_all = np.zeros(n, dtype=np.int64)
+
+        # Carried state:  the last PREFIX records' stage times
+        (DE, X, M, W) = ([0] * PREFIX, [0] * PREFIX, [0] * PREFIX, [0] * PREFIX)
+        emi = []
+        redir = 0
+        if_free = 0
+
+        R = p['redirect']
+        RDE = bp_eval.DECODE_REDIRECT
+        EXC = p['exception']
+        for start in range(0, n, CHUNK):
+            end = min(start + CHUNK, n)
+            c = Chunk(self.isa, trace, start, end, cfg)
+            ev = mem.run(c)
+            j0 = c.first_j
+            ipre = (ev['i_walk'] * p['ptw'] + ev['i_l2'] * p['l2tlb']).tolist()
+            iemi = (ev['i_fill'] * p['fill'] + ev['i_uc'] * p['uncached']).tolist()
+            dpre = (ev['d_walk'] * p['ptw'] + ev['d_l2'] * p['l2tlb'] +
+                    ev['d_cross']).tolist()
+            demi = (ev['d_fill'] * p['fill'] + ev['d_spill'] * p['spill'] +
+                    ev['d_uc'] * p['uncached']).tolist()
+            exe = c.exe.tolist()
+            first = c.first.tolist()
+            rkind = c.redirect.tolist()
+            deps = c.deps
+
+            # Times for the window, primed with the carried-over records
+            DE = DE[PREFIX - j0:] + [0] * (c.n - j0)
+            X = X[PREFIX - j0:] + [0] * (c.n - j0)
+            M = M[PREFIX - j0:] + [0] * (c.n - j0)
+            W = W[PREFIX - j0:] + [0] * (c.n - j0)
+            ST = [0] * c.n
+            FS = [0] * c.n
+            (xp, mp, wp) = (X[j0 - 1], M[j0 - 1], W[j0 - 1]) if j0 else (0, 0, 0)
+
+            for j in range(j0, c.n):
+                if first[j]:
+                    fe = if_free if if_free > redir else redir
+                    t = fe + ipre[j]
+                    if iemi[j]:
+                        t = emi_slot(emi, t, iemi[j], min(fe, mp))
+                    FS[j] = t - fe
+                    d = t + 1
+                    if xp > d:
+                        d = xp
+                    if_free = d
+                else:
+                    d = xp
+                s = d + 1
+                if mp > s:
+                    s = mp
+                x = s
+                for (q, stage, add) in deps[j]:
+                    v = (W[q] if stage else M[q]) + add
+                    if v > x:
+                        x = v
+                m = x + exe[j]
+                if wp > m:
+                    m = wp
+                t = m + dpre[j]
+                if demi[j]:
+                    t = emi_slot(emi, t, demi[j], min(if_free, m))
+                w = t + 1
+
+                rk = rkind[j]
+                if rk == RD_EXE:
+                    redir = x + R
+                elif rk == RD_DE:
+                    redir = d + RDE
+                elif rk == RD_WB:
+                    redir = w + EXC
+                DE[j] = d
+                X[j] = x
+                M[j] = m
+                W[j] = w
+                ST[j] = s
+                (xp, mp, wp) = (x, m, w)
+
+            self._count(st, c, ev, DE, X, M, W, ST, FS)
+            wb_all[start:end] = W[j0:]
+            (DE, X, M, W) = (DE[-PREFIX:], X[-PREFIX:], M[-PREFIX:], W[-PREFIX:])
+            if len(DE) < PREFIX:
+                pad = [0] * (PREFIX - len(DE))
+                (DE, X, M, W) = (pad + DE, pad + X, pad + M, pad + W)
+
+        if n:
+            st['cycles'] = int(wb_all[-1] - wb_all[0])
+        return (st, wb_all)
+
+    def _count(self, st, c, ev, DE, X, M, W, ST, FS):
+        j0 = c.first_j
+        (de, x, m, w, s) = (np.array(v, dtype=np.int64)
+                            for v in (DE, X, M, W, ST))
+        # The previous record's times (zero before the first)
+        (xp, mp, wp) = (np.concatenate([[0], v[:-1]]) for v in (x, m, w))
+        (de, x, m, w, s, xp, mp, wp) = (v[j0:] for v in
+                                        (de, x, m, w, s, xp, mp, wp))
+        more = c.more[j0:].astype(np.int64)
+        fault = c.fault[j0:]
+        st['inst_commit'] += int(np.count_nonzero(~fault))
+        st['fault'] += int(np.count_nonzero(fault))
+        for e in MEM_EVENTS:
+            st[e] += int(ev[e][j0:].sum())
+        st['mem_access'] += int(ev['d_access'][j0:].sum())
+        st['mem_cacheable_unaligned_CL'] += int(ev['d_cross'][j0:].sum())
+        st['if_mmu_ptws'] += int(ev['i_walk'][j0:].sum())
+        st['mem_mmu_ptws'] += int(ev['d_walk'][j0:].sum())
+        st['if_fetching_stalled'] += int(sum(FS[j0:]))
+        st['de_stall_operands'] += int((x - s).sum())
+        st['mem_stall'] += int((w - m - 1).sum())
+        # A stage is stalled for all but the last cycle of its occupant (and
+        # DE for every cycle of an lmw/stmw but the last sub-op's).  As the
+        # pctrs, a stall counts only against the furthest stage stalled; an
+        # instruction's stall in one stage can only coincide with that of
+        # the one ahead of it in the next.
+        exe_held = m - 1 - x
+        exe_under_mem = np.maximum(np.minimum(m, wp) - 1 - x, 0)
+        st['exe_stall'] += int((exe_held - exe_under_mem).sum())
+        de_end = x - 1 + more
+        de_held = np.maximum(de_end - de, 0)
+        de_under_exe = np.maximum(np.minimum(de_end, mp - 1) - de, 0)
+        st['decode_stall'] += int((de_held - de_under_exe).sum())
+
+
+################################################################################
+# Reporting and calibration
+
+def load(spec):
+    """<trace>[:<pctr totals>] -> (name, trace, totals or None)"""
+    (path, _, pctrs) = spec.partition(':')
+    return (path, mr_trace.read_commit_trace(path),
+            mr_trace.read_pctr_totals(pctrs) if pctrs else None)
+
+
+def measured_redirect(trace):
+    gaps = [np.zeros(bp_eval.GAP_HIST + 1, dtype=np.int64) for _ in range(2)]
+    for _ in bp_eval.branch_chunks(trace, gaps):
+        pass
+    pen = bp_eval.measured_penalty(gaps)
+    return None if pen is None else max(pen - 1, 0)
+
+
+def interval_error(trace, wb):
+    """Mean and max absolute % error of cycles per INTERVAL records."""
+    n = len(trace)
+    if n <= INTERVAL:
+        return None
+    idx = np.arange(0, n, INTERVAL)
+    real = np.diff(np.asarray(trace['cycle'])[idx].astype(np.int64))
+    model = np.diff(wb[idx])
+    err = 100.0 * np.abs(model - real) / np.maximum(real, 1)
+    return (err.mean(), err.max())
+
+
+def report(name, trace, totals, st, wb, secs):
+    n = len(trace)
+    real = int(trace['cycle'][-1] - trace['cycle'][0]) if n else 0
+    print("%s: %d records, model %d cycles, trace %d (%+.1f%%); %.0f records/s" %
+          (name, n, st['cycles'], real,
+           100.0 * (st['cycles'] - real) / max(real, 1), n / max(secs, 1e-9)))
+    ie = interval_error(trace, wb)
+    if ie is not None:
+        print("Error in cycles per %d records:  mean %.1f%%, max %.1f%%" %
+              (INTERVAL, ie[0], ie[1]))
+    print("%-28s %14s %14s %8s" % ("Event", "Model", "RTL", "Error"))
+    rows = EVENTS
+    if totals is not None:
+        # The pctr totals cover the whole run, including before the first commit
+        rows = ['cycles'] + EVENTS
+        st = dict(st)
+        st['cycles'] += int(trace['cycle'][0]) if n else 0
+    for e in rows:
+        if totals is not None and e in totals:
+            r = totals[e]
+            print("%-28s %14d %14d %+7.1f%%" % (e, st[e], r,
+                                               100.0 * (st[e] - r) / max(r, 1)))
+        else:
+            print("%-28s %14d" % (e, st[e]))
+    print("")
+
+
+def calibrate(isa, params, runs, out):
+    """Fits CALIBRATED latencies to the traces' pctr totals; writes JSON."""
+    runs = [r for r in runs if r[2] is not None]
+    if not runs:
+        print("Calibration needs <trace>:<pctr totals> pairs")
+        sys.exit(1)
+
+    reds = [r for r in (measured_redirect(t) for (_, t, _) in runs) if r is not None]
+    if reds:
+        params['redirect'] = int(np.median(reds))
+
+    # Stall cycles are the latencies times the event counts, plus waiting
+    # for the EMI and fixed costs, which the model itself estimates:
+    #
+    #   if_fetching_stalled = fill * i_fill + uncached * i_uc + ptw * i_walk
+    #   mem_stall = fill * d_fill + spill * d_spill + uncached * d_uc + ptw * d_walk
+    cols = CALIBRATED
+    eqs = [('if_fetching_stalled', {'fill': 'i_fill', 'uncached': 'i_uc',
+                                    'ptw': 'i_walk'}),
+           ('mem_stall', {'fill': 'd_fill', 'spill': 'd_spill',
+                          'uncached': 'd_uc', 'ptw': 'd_walk'})]
+    prior = np.array([DEFAULT_PARAMS[k] for k in cols], dtype=np.float64)
+    for it in range(FIT_ITERATIONS):
+        A = []
+        b = []
+        for (_, trace, totals) in runs:
+            (st, _) = Model(isa, params, rtl_config()).run(trace)
+            for (ev, terms) in eqs:
+                row = np.array([st[terms[k]] if k in terms else 0 for k in cols],
+                               dtype=np.float64)
+                modelled = sum(row[i] * params[k] for (i, k) in enumerate(cols))
+                extra = st[ev] - modelled
+                scale = 1.0 / max(totals[ev], 1)
+                A.append(row * scale)
+                b.append((totals[ev] - extra) * scale)
+        # Weak priors for latencies the data can't separate
+        for (i, k) in enumerate(cols):
+            r = np.zeros(len(cols))
+            r[i] = PRIOR_WEIGHT / prior[i]
+            A.append(r)
+            b.append(PRIOR_WEIGHT)
+        (x, _, _, _) = np.linalg.lstsq(np.array(A), np.array(b), rcond=None)
+        if it:
+            # Damped:  the EMI contention estimate moves with the latencies
+            x = (x + np.array([params[k] for k in cols])) / 2
+        for (i, k) in enumerate(cols):
+            params[k] = max(int(round(x[i])), 1)
+        print("Fit %d: %s" % (it + 1, ", ".join("%s %d" % (k, params[k])
+                                                for k in cols)))
+
+    with open(out, 'w') as f:
+        json.dump(params, f, indent=1)
+    print("Wrote %s\n" % out)
+
+
+def parse_geometry(s):
+    (size, ways, line) = s.split(':')
+    return (cache_sim.parse_size(size), int(ways, 0), int(line, 0))
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options] <commit trace>[:<pctr totals>] ...\n" % sys.argv[0])
+    print("\t-k <file>\tLoad latencies from a JSON file (from -K)")
+    print("\t-K <file>\tCalibrate latencies against pctr totals, writing them to <file>")
+    print("\t-P <name>=<n>\tSet a latency (repeatable):  %s" %
+          ", ".join(DEFAULT_PARAMS.keys()))
+    print("\t-F <what>\tProposal:  forward 'wb' results a cycle earlier, or bypass 'spr's (repeatable)")
+    print("\t-b <scheme>\tProposal:  branch predictor, as bp_eval.py's -s")
+    print("\t-2 <entries>\tProposal:  L2 TLB of <entries> (hit latency from -P l2tlb=<n>)")
+    print("\t-t <entries>\tProposal:  I/D TLB entries (default %d)" % tlb_replay.RTL_TLB_ENTRIES)
+    print("\t-i <geometry>\tProposal:  I-cache <size>:<ways>:<line> (default %d:%d:%d)" %
+          (cache_sim.RTL_SIZE, cache_sim.RTL_WAYS, cache_sim.RTL_LINE))
+    print("\t-d <geometry>\tProposal:  D-cache <size>:<ways>:<line>")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "k:K:P:F:b:2:t:i:d:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    params = collections.OrderedDict(DEFAULT_PARAMS)
+    cal_out = None
+    cfg = rtl_config()
+    sets = []
+    try:
+        for (o, a) in opts:
+            if o == '-k':
+                with open(a, 'r') as f:
+                    params.update(json.load(f))
+            elif o == '-K':
+                cal_out = a
+            elif o == '-P':
+                (k, _, v) = a.partition('=')
+                if k not in DEFAULT_PARAMS:
+                    usage()
+                sets.append((k, int(v, 0)))
+            elif o == '-F':
+                if a not in ('wb', 'spr'):
+                    usage()
+                cfg = cfg._replace(forward=cfg.forward + (a,))
+            elif o == '-b':
+                bp_eval.Scheme(a)       # Check it parses
+                cfg = cfg._replace(scheme=a)
+            elif o == '-2':
+                cfg = cfg._replace(l2tlb=int(a, 0))
+            elif o == '-t':
+                cfg = cfg._replace(tlb=int(a, 0))
+            elif o == '-i':
+                cfg = cfg._replace(icache=parse_geometry(a))
+            elif o == '-d':
+                cfg = cfg._replace(dcache=parse_geometry(a))
+            else:
+                usage()
+    except ValueError as e:
+        print(e)
+        usage()
+    if not args:
+        usage()
+    params.update(sets)
+
+    isa = mr_isa.ISA()
+    runs = [load(a) for a in args]
+
+    if cal_out:
+        calibrate(isa, params, runs, cal_out)
+    print("Latencies:  %s\n" % ", ".join("%s %d" % kv for kv in params.items()))
+
+    proposal = cfg != rtl_config()
+    for (name, trace, totals) in runs:
+        t0 = time.time()
+        (st, wb) = Model(isa, params, rtl_config()).run(trace)
+        report(name, trace, totals, st, wb, time.time() - t0)
+        if proposal:
+            (pst, _) = Model(isa, params, cfg).run(trace)
+            saved = st['cycles'] - pst['cycles']
+            print("Proposal %s:  %d cycles, %d fewer (%.2f%%, speedup %.3f)" %
+                  (", ".join("%s=%s" % kv for kv in cfg._asdict().items()
+                             if kv[1] != getattr(rtl_config(), kv[0])),
+                   pst['cycles'], saved, 100.0 * saved / max(st['cycles'], 1),
+                   st['cycles'] / max(pst['cycles'], 1)))
+            print("%-28s %14s %14s" % ("Event", "Baseline", "Proposal"))
+            for e in EVENTS[1:] + ['i_l2', 'd_l2']:
+                if st[e] != pst[e]:
+                    print("%-28s %14d %14d" % (e, st[e], pst[e]))
+            print("")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+#
+# Pipeline occupancy trace viewer/exporter:  summarises a trace written by
+# "Vwrapper_top -o <file>", and extracts any cycle range of it for a pipeline
+# viewer, without reading the rest:
+#
+#   ./verilator/obj_dir/Vwrapper_top -o pipe.bin
+#   ./tools/pipe_view.py pipe.bin
+#   ./tools/pipe_view.py -r 1200000+500 -k slow.kanata pipe.bin
+#   ./tools/pipe_view.py -r 1200000:1300000 -l 20 pipe.bin
+#   ./tools/pipe_view.py -r 5000+200 -g o3.trace pipe.bin
+#
+# Outputs are Konata's "Kanata" log format (-k; open it in Konata) and gem5's
+# O3PipeView format (-g; view with util/o3-pipeview.py, ticks being cycles x
+# TICKS_PER_CYCLE).  MR's IF/DE/EXE/MEM/WB are mapped onto O3PipeView's
+# fetch/decode(+rename)/dispatch(+issue)/complete/retire.  Squashed
+# instructions (annulled in DE/EXE, or flushed by a fault/interrupt) are shown
+# as flushed; lmw/stmw sub-ops are labelled as such.
+#
+# Records are written as instructions leave the pipeline, so the file is
+# sorted by end cycle, and no instruction lives longer than the header's
+# max_life.  A cycle range is found by binary search on the memmapped file:
+# the first record ending after the range start, up to the first ending
+# max_life after the range end.  So only the range's records (and a few
+# pages for the search) are ever read.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import sys
+
+import numpy as np
+
+import mr_isa
+import mr_trace
+from mr_trace import PIPE_STAGES, PIPE_NO_STAGE, PIPE_FLAG_SQUASHED, \
+    PIPE_FLAG_FAULT, PIPE_FLAG_SUBOP
+
+
+TICKS_PER_CYCLE = 1000
+DEFAULT_RANGE = 1000            # Cycles, if -r gives only a start
+
+
+################################################################################
+# Finding a cycle range
+
+def end_cycle(t, i):
+    return int(t['start'][i]) + int(t['end'][i])
+
+
+def first_ending_after(t, cycle):
+    """Index of the first record whose end cycle is > cycle."""
+    (lo, hi) = (0, len(t))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if end_cycle(t, mid) <= cycle:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def select(hdr, t, first, last):
+    """Returns the records (a copy) in the pipeline at any time in cycles
+    [first, last), in order of IF entry."""
+    lo = first_ending_after(t, first)
+    hi = first_ending_after(t, last + int(hdr['max_life']))
+    r = np.array(t[lo:hi])
+    r = r[r['start'] < last]
+    return r[np.argsort(r['start'], kind='stable')]
+
+
+def stage_cycles(r):
+    """Returns an (n, 5) array of the cycles entering IF/DE/EXE/MEM/WB, -1
+    where a stage wasn't reached, and an array of end cycles."""
+    start = r['start'].astype(np.int64)
+    st = r['stage'].astype(np.int64)
+    cyc = np.where(st == PIPE_NO_STAGE, -1, st + start[:, None])
+    return (np.concatenate([start[:, None], cyc], axis=1),
+            start + r['end'].astype(np.int64))
+
+
+def stage_exits(cyc, end):
+    """The cycle each stage was left:  the next stage reached, or the end."""
+    ex = np.empty_like(cyc)
+    nxt = end.copy()
+    for s in range(cyc.shape[1] - 1, -1, -1):
+        ex[:, s] = np.where(cyc[:, s] >= 0, nxt, -1)
+        nxt = np.where(cyc[:, s] >= 0, cyc[:, s], nxt)
+    return ex
+
+
+def label(isa, pc, instr, flags):
+    s = "%08x: %s" % (pc, isa.mnemonic(instr))
+    if flags & PIPE_FLAG_SUBOP:
+        s += " (sub-op)"
+    if flags & PIPE_FLAG_FAULT:
+        s += " (fault)"
+    return s
+
+
+################################################################################
+# Exporters
+
+def write_kanata(f, isa, r):
+    cyc, end = stage_cycles(r)
+    ex = stage_exits(cyc, end)
+    # (cycle, order within cycle, text); ends before starts, as Konata likes
+    ev = []
+    for i in range(len(r)):
+        ev.append((cyc[i, 0], 1, i, "I\t%d\t%d\t0" % (i, r['id'][i])))
+        ev.append((cyc[i, 0], 2, i, "L\t%d\t0\t%s" %
+                   (i, label(isa, int(r['pc'][i]), int(r['instr'][i]),
+                             int(r['flags'][i])))))
+        for s in range(len(PIPE_STAGES)):
+            if cyc[i, s] < 0:
+                continue
+            ev.append((cyc[i, s], 3, i, "S\t%d\t0\t%s" % (i, PIPE_STAGES[s])))
+            ev.append((ex[i, s], 0, i, "E\t%d\t0\t%s" % (i, PIPE_STAGES[s])))
+        flushed = 1 if r['flags'][i] & PIPE_FLAG_SQUASHED else 0
+        ev.append((end[i], 0, i, "R\t%d\t%d\t%d" % (i, i, flushed)))
+    ev.sort()
+
+    f.write("Kanata\t0004\n")
+    if not ev:
+        return
+    now = ev[0][0]
+    f.write("C=\t%d\n" % now)
+    for (c, _, _, text) in ev:
+        if c != now:
+            f.write("C\t%d\n" % (c - now))
+            now = c
+        f.write(text + "\n")
+
+
+def write_o3pipeview(f, isa, r):
+    cyc, end = stage_cycles(r)
+    t = np.where(cyc >= 0, cyc * TICKS_PER_CYCLE, 0)
+    for i in range(len(r)):
+        (fe, de, exe, mem, wb) = t[i].tolist()
+        f.write("O3PipeView:fetch:%d:0x%08x:0:%d:%s\n" %
+                (fe, r['pc'][i], r['id'][i],
+                 label(isa, int(r['pc'][i]), int(r['instr'][i]),
+                       int(r['flags'][i])).split(": ", 1)[1]))
+        f.write("O3PipeView:decode:%d\n" % de)
+        f.write("O3PipeView:rename:%d\n" % de)
+        f.write("O3PipeView:dispatch:%d\n" % exe)
+        f.write("O3PipeView:issue:%d\n" % exe)
+        f.write("O3PipeView:complete:%d\n" % mem)
+        f.write("O3PipeView:retire:%d:store:0\n" % wb)
+
+
+################################################################################
+# Reports
+
+def summary(hdr, t):
+    n = len(t)
+    if n == 0:
+        print("Empty trace")
+        return
+    fl = np.asarray(t['flags'])
+    sq = np.count_nonzero(fl & PIPE_FLAG_SQUASHED)
+    print("%d records ending in cycles %d-%d:  %d retired (%d faults, "
+          "%d sub-ops), %d squashed; longest %d cycles" %
+          (n, end_cycle(t, 0), end_cycle(t, n - 1), n - sq,
+           np.count_nonzero(fl & PIPE_FLAG_FAULT),
+           np.count_nonzero(fl & PIPE_FLAG_SUBOP), sq, hdr['max_life']))
+
+
+def residency(r):
+    """Prints cycles spent in each stage, and where squashes happened."""
+    cyc, end = stage_cycles(r)
+    ex = stage_exits(cyc, end)
+    ret = (r['flags'] & PIPE_FLAG_SQUASHED) == 0
+    reached = cyc >= 0
+    furthest = reached.shape[1] - 1 - np.argmax(reached[:, ::-1], axis=1)
+    squashed = np.bincount(furthest[~ret], minlength=len(PIPE_STAGES))
+    print("%-6s %12s %8s %8s %10s" % ("Stage", "Entered", "Mean", "Max", "Squashed"))
+    for s in range(len(PIPE_STAGES)):
+        d = (ex[:, s] - cyc[:, s])[reached[:, s] & ret]
+        print("%-6s %12d %8.2f %8d %10d" %
+              (PIPE_STAGES[s], np.count_nonzero(reached[:, s]),
+               d.mean() if len(d) else 0.0, d.max() if len(d) else 0,
+               squashed[s]))
+
+
+def slowest(isa, r, top):
+    """Lists the <top> longest-lived retired instructions."""
+    cyc, end = stage_cycles(r)
+    ex = stage_exits(cyc, end)
+    life = end - cyc[:, 0]
+    life = np.where(r['flags'] & PIPE_FLAG_SQUASHED, -1, life)
+    order = np.argsort(-life, kind='stable')[:top]
+    print("\n%12s %6s  %-36s " % ("IF cycle", "Life", "Instruction") +
+          " ".join("%5s" % s for s in PIPE_STAGES))
+    for i in order:
+        if life[i] < 0:
+            break
+        print("%12d %6d  %-36s " % (cyc[i, 0], life[i],
+                                    label(isa, int(r['pc'][i]), int(r['instr'][i]),
+                                          int(r['flags'][i]))[:36]) +
+              " ".join("%5s" % ((ex[i, s] - cyc[i, s]) if cyc[i, s] >= 0 else "-")
+                       for s in range(len(PIPE_STAGES))))
+
+
+################################################################################
+
+def parse_range(s):
+    """<first>:<last> or <first>+<cycles>; returns (first, last)."""
+    if ':' in s:
+        (a, b) = s.split(':')
+        return (int(a, 0), int(b, 0))
+    if '+' in s:
+        (a, b) = s.split('+')
+        return (int(a, 0), int(a, 0) + int(b, 0))
+    return (int(s, 0), int(s, 0) + DEFAULT_RANGE)
+
+
+def usage():
+    print("Syntax:\n\t %s [options] <pipeline trace>\n" % sys.argv[0])
+    print("\t-r <range>\tCycles <first>:<last> or <first>+<n> (default: whole trace)")
+    print("\t-k <file>\tWrite the range as a Konata (Kanata 0004) log")
+    print("\t-g <file>\tWrite the range in gem5 O3PipeView format")
+    print("\t-l <n>\t\tList the <n> longest-lived instructions in the range")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "r:k:g:l:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    rng = None
+    kanata = None
+    o3 = None
+    top = 0
+    try:
+        for (o, a) in opts:
+            if o == '-r':
+                rng = parse_range(a)
+            elif o == '-k':
+                kanata = a
+            elif o == '-g':
+                o3 = a
+            elif o == '-l':
+                top = int(a, 0)
+            else:
+                usage()
+    except ValueError as e:
+        print(e)
+        usage()
+    if len(args) != 1:
+        usage()
+
+    (hdr, t) = mr_trace.read_pipe_trace(args[0])
+    summary(hdr, t)
+    if len(t) == 0:
+        sys.exit(0)
+    if rng is None:
+        rng = (0, end_cycle(t, len(t) - 1) + 1)
+    r = select(hdr, t, rng[0], rng[1])
+    print("Cycles %d-%d:  %d instructions\n" % (rng[0], rng[1], len(r)))
+    residency(r)
+
+    isa = mr_isa.ISA()
+    if top:
+        slowest(isa, r, top)
+    if kanata:
+        with open(kanata, 'w') as f:
+            write_kanata(f, isa, r)
+        print("\nWrote %s" % kanata)
+    if o3:
+        with open(o3, 'w') as f:
+            write_o3pipeview(f, isa, r)
+        print("\nWrote %s" % o3)
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+#
+# Cached, parallel runner for the iverilog unit testbenches (tb/tb_*.v):
+# compiles each bench only if its sources have changed, runs the benches
+# concurrently without VCD dumping, and summarises PASS/FAIL (optionally as
+# JUnit XML for CI):
+#
+#   ./tools/run_unit.py                     # All benches
+#   ./tools/run_unit.py cache plc           # Benches matching 'cache', 'plc'
+#   ./tools/run_unit.py -v tb_ifetch2       # ...writing tb_ifetch2.vcd
+#   ./tools/run_unit.py -x unit.xml -j 8
+#   ./tools/run_unit.py -l                  # List benches and their sources
+#
+# A bench's sources are the prerequisites of its tb_X.vvp rule in the
+# Makefile (or just tb/tb_X.v if there isn't one), plus everything they pull
+# in through `include or by instantiating a module found in a -y directory,
+# found by scanning the sources.  The compiled .vvp is cached (in .unit_cache,
+# or -c) under a hash of the contents of those files, the compiler flags and
+# the iverilog version, so editing one module rebuilds only the benches that
+# use it, and switching back to a previous version of a file reuses the old
+# build.  As the scan is approximate, each entry also records iverilog's own
+# (-M) list of the files it read, and a hit is only used if those are
+# unchanged too.
+#
+# A bench passes if it exits with status 0, prints a line "PASS" and prints
+# no FAIL, FATAL or ERROR (as $fatal and $error do).  Benches with no "PASS"
+# in their source (i.e. tb_top, which needs a testprog.hex and runs for
+# millions of cycles) are only run if named, and then only need the exit
+# status and the absence of errors.
+# The flags and paths are read from the Makefile's IVFLAGS, DEFS and PATHS.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+TOP = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+MAKEFILE = os.path.join(TOP, 'Makefile')
+DEF_CACHE = os.path.join(TOP, '.unit_cache')
+GENERATED = ['include/auto_decoder.vh', 'include/auto_decoder_signals.vh']
+KEEP_BUILDS = 4                 # Cached builds kept per bench
+
+DEF_VARS = {'IVERILOG': 'iverilog',
+            'IVFLAGS': '-g2009',
+            'PATHS': '-y include -y src -y tb -I include -I tb',
+            'DEFS': '-DSIM'}
+
+re_var = re.compile(r'^(\w+)\s*[:?]?=\s*(.*)$')
+re_rule = re.compile(r'^(tb_\w+)\.vvp\s*:\s*(.*)$')
+re_comment = re.compile(r'//[^\n]*|/\*.*?\*/', re.S)
+re_include = re.compile(r'`include\s+"([^"]+)"')
+re_module = re.compile(r'^\s*module\s+(\w+)', re.M)
+# mod [#(params)] inst ( -- near enough; names are checked against the files
+re_inst = re.compile(r'\b([A-Za-z_]\w*)\s*(?:#\s*\((?:[^()]|\([^()]*\))*\)\s*)?'
+                     r'[A-Za-z_]\w*\s*(?:\[[^\]]*\]\s*)?\(')
+re_fail = re.compile(r'\b(FAIL|FATAL|ERROR)\b')
+
+
+class Bench:
+    def __init__(self, name, srcs, has_pass):
+        self.name = name
+        self.srcs = srcs        # Files given to iverilog, relative to TOP
+        self.has_pass = has_pass
+        self.closure = []       # From the scan
+
+
+def read_makefile():
+    """Returns (variables, {bench: [prerequisite .v files]}) from the
+    Makefile.  Only the simple assignments and tb_*.vvp rules matter here.
+    """
+    mvars = dict(DEF_VARS)
+    rules = {}
+    with open(MAKEFILE, 'r') as f:
+        for l in f:
+            l = l.rstrip('\n')
+            m = re_var.match(l)
+            if m and m.group(1) in DEF_VARS:
+                mvars[m.group(1)] = m.group(2).strip()
+                continue
+            m = re_rule.match(l)
+            if m:
+                rules[m.group(1)] = [d for d in m.group(2).split() if d.endswith('.v')]
+    return (mvars, rules)
+
+
+def strip_comments(path):
+    with open(os.path.join(TOP, path), 'r', errors='replace') as f:
+        return re_comment.sub('', f.read())
+
+
+def discover(rules):
+    """Finds the top-level benches:  tb/tb_*.v files whose modules aren't
+    instantiated by another tb file (such as tb_mr_cpu_top).
+    """
+    files = sorted(glob.glob(os.path.join(TOP, 'tb', 'tb_*.v')))
+    texts = {os.path.relpath(f, TOP): strip_comments(os.path.relpath(f, TOP)) for f in files}
+    used = set()
+    for (p, t) in texts.items():
+        own = set(re_module.findall(t))
+        used |= set(m for m in re_inst.findall(t) if m not in own)
+    benches = []
+    for (p, t) in texts.items():
+        name = os.path.splitext(os.path.basename(p))[0]
+        if name in used or set(re_module.findall(t)) & used:
+            continue
+        srcs = rules.get(name) or [p]
+        benches.append(Bench(name, srcs, '"PASS"' in t))
+    return benches
+
+
+def lib_dirs(paths):
+    """-y and -I directories from PATHS"""
+    (y, i) = ([], [])
+    words = shlex.split(paths)
+    for (n, w) in enumerate(words):
+        for (flag, l) in (('-y', y), ('-I', i)):
+            if w == flag and n + 1 < len(words):
+                l.append(words[n + 1])
+            elif w.startswith(flag) and len(w) > 2:
+                l.append(w[2:])
+    return (y, i)
+
+
+def scan_closure(srcs, ydirs, idirs):
+    """Approximates the set of files iverilog will read for srcs:  follows
+    includes and instantiations of modules that -y would find.
+    """
+    modfiles = {}
+    for d in reversed(ydirs):
+        for f in glob.glob(os.path.join(TOP, d, '*.v')):
+            modfiles[os.path.splitext(os.path.basename(f))[0]] = os.path.relpath(f, TOP)
+    seen = set()
+    todo = list(srcs)
+    while todo:
+        p = todo.pop()
+        if p in seen or not os.path.isfile(os.path.join(TOP, p)):
+            continue
+        seen.add(p)
+        t = strip_comments(p)
+        for inc in re_include.findall(t):
+            for d in [os.path.dirname(p)] + idirs:
+                c = os.path.normpath(os.path.join(d, inc))
+                if os.path.isfile(os.path.join(TOP, c)):
+                    todo.append(c)
+                    break
+        own = set(re_module.findall(t))
+        for m in set(re_inst.findall(t)) - own:
+            if m in modfiles:
+                todo.append(modfiles[m])
+    return sorted(seen)
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    try:
+        with open(os.path.join(TOP, path), 'rb') as f:
+            h.update(f.read())
+    except OSError:
+        h.update(b'<missing>')
+    return h.hexdigest()
+
+
+def iverilog_version(iverilog):
+    try:
+        r = subprocess.run([iverilog, '-V'], stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, universal_newlines=True)
+        return r.stdout.splitlines()[0] if r.stdout else ''
+    except OSError:
+        return None
+
+
+def build_key(bench, cmd, version):
+    h = hashlib.sha256()
+    h.update((' '.join(cmd) + '\n' + version + '\n').encode())
+    for p in bench.closure:
+        h.update(('%s %s\n' % (p, file_hash(p))).encode())
+    return h.hexdigest()[:20]
+
+
+def deps_ok(depfile):
+    """Checks the files iverilog actually read are as they were"""
+    try:
+        with open(depfile, 'r') as f:
+            deps = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return all(file_hash(p) == h for (p, h) in deps.items())
+
+
+def prune(cachedir, name):
+    builds = sorted(glob.glob(os.path.join(cachedir, name + '-*.vvp')),
+                    key=os.path.getmtime, reverse=True)
+    for b in builds[KEEP_BUILDS:]:
+        for f in (b, b[:-4] + '.deps'):
+            try:
+                os.unlink(f)
+            except OSError:
+                pass
+
+
+def build(bench, cmd, version, cachedir, force):
+    """Returns (vvp path, was cached, error output or None)"""
+    key = build_key(bench, cmd, version)
+    vvp = os.path.join(cachedir, '%s-%s.vvp' % (bench.name, key))
+    depfile = vvp[:-4] + '.deps'
+    if not force and os.path.isfile(vvp) and deps_ok(depfile):
+        os.utime(vvp)
+        return (vvp, True, None)
+    (fd, tmp) = tempfile.mkstemp(dir=cachedir, prefix=bench.name + '.', suffix='.tmp')
+    os.close(fd)
+    mfile = tmp + '.M'
+    try:
+        r = subprocess.run(cmd + ['-M', mfile, '-o', tmp] + bench.srcs, cwd=TOP,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           universal_newlines=True)
+        if r.returncode != 0:
+            return (None, False, r.stdout)
+        deps = {}
+        with open(mfile, 'r') as f:
+            for l in f:
+                l = l.strip()
+                if l:
+                    p = os.path.relpath(os.path.join(TOP, l), TOP)
+                    deps[p] = file_hash(p)
+        with open(depfile, 'w') as f:
+            json.dump(deps, f, indent=1, sort_keys=True)
+        os.replace(tmp, vvp)
+    finally:
+        for f in (tmp, mfile):
+            if os.path.exists(f):
+                os.unlink(f)
+    prune(cachedir, bench.name)
+    return (vvp, False, None)
+
+
+def verdict(bench, rc, out):
+    """Returns (status, message):  status is 'pass' or 'fail'"""
+    lines = out.splitlines()
+    bad = [l for l in lines if re_fail.search(l)]
+    if bad:
+        return ('fail', bad[0].strip())
+    if rc != 0:
+        return ('fail', "Exit status %d" % rc)
+    if bench.has_pass and not any(l.strip() == 'PASS' for l in lines):
+        return ('fail', "No PASS")
+    return ('pass', '')
+
+
+def run_one(args):
+    (bench, cmd, version, cachedir, force, vcd, timeout) = args
+    res = {'name': bench.name, 'cached': False, 'build_time': 0.0, 'run_time': 0.0,
+           'output': '', 'message': ''}
+    t0 = time.time()
+    (vvp, res['cached'], err) = build(bench, cmd, version, cachedir, force)
+    res['build_time'] = time.time() - t0
+    if vvp is None:
+        res['status'] = 'error'
+        res['message'] = "Compile failed"
+        res['output'] = err
+        return res
+    argv = ['vvp', '-n', vvp] + ([] if vcd else ['+NO_VCD=1'])
+    t0 = time.time()
+    try:
+        r = subprocess.run(argv, cwd=TOP, stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, universal_newlines=True,
+                           errors='replace', timeout=timeout)
+        res['output'] = r.stdout
+        (res['status'], res['message']) = verdict(bench, r.returncode, r.stdout)
+    except subprocess.TimeoutExpired as e:
+        out = e.stdout or ''
+        res['output'] = out.decode(errors='replace') if isinstance(out, bytes) else out
+        res['status'] = 'fail'
+        res['message'] = "Timeout after %ds" % timeout
+    res['run_time'] = time.time() - t0
+    return res
+
+
+def write_junit(path, results, wall):
+    suite = ET.Element('testsuite', name='unit', tests=str(len(results)),
+                       failures=str(sum(r['status'] == 'fail' for r in results)),
+                       errors=str(sum(r['status'] == 'error' for r in results)),
+                       time='%.3f' % wall)
+    for r in results:
+        tc = ET.SubElement(suite, 'testcase', classname='tb', name=r['name'],
+                           time='%.3f' % (r['build_time'] + r['run_time']))
+        if r['status'] != 'pass':
+            e = ET.SubElement(tc, 'failure' if r['status'] == 'fail' else 'error',
+                              message=r['message'])
+            e.text = r['output']
+        ET.SubElement(tc, 'system-out').text = r['output']
+    ET.ElementTree(suite).write(path, encoding='utf-8', xml_declaration=True)
+
+
+def usage():
+    print("Syntax:\n\t %s [-j <jobs>] [-t <timeout secs>] [-x <junit.xml>] "
+          "[-c <cache dir>] [-f] [-v] [-N] [-l] [-q] [bench ...]" % (sys.argv[0]))
+    print("\t-f:  Rebuild, ignoring the cache (and replace its entries)")
+    print("\t-v:  Write VCDs (don't pass +NO_VCD)")
+    print("\t-N:  Don't run make for the generated includes first")
+    print("\t-l:  List the benches and their source closures, then exit")
+    print("\t-q:  Only print failures and the summary")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    jobs = os.cpu_count() or 1
+    timeout = 300
+    junit = None
+    cachedir = DEF_CACHE
+    force = False
+    vcd = False
+    make_gen = True
+    listing = False
+    quiet = False
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "j:t:x:c:fvNlqh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    for (o, a) in opts:
+        if o == '-j':
+            jobs = int(a)
+        elif o == '-t':
+            timeout = int(a)
+        elif o == '-x':
+            junit = a
+        elif o == '-c':
+            cachedir = a
+        elif o == '-f':
+            force = True
+        elif o == '-v':
+            vcd = True
+        elif o == '-N':
+            make_gen = False
+        elif o == '-l':
+            listing = True
+        elif o == '-q':
+            quiet = True
+        else:
+            usage()
+
+    (mvars, rules) = read_makefile()
+    benches = discover(rules)
+    if args:
+        want = [os.path.splitext(os.path.basename(a))[0] for a in args]
+        benches = [b for b in benches if any(w in b.name for w in want)]
+        if not benches:
+            print("No benches match %s" % ' '.join(args))
+            sys.exit(1)
+    else:
+        benches = [b for b in benches if b.has_pass]
+
+    (ydirs, idirs) = lib_dirs(mvars['PATHS'])
+    for b in benches:
+        b.closure = scan_closure(b.srcs, ydirs, idirs)
+
+    if listing:
+        for b in benches:
+            print("%s:\n\t%s" % (b.name, '\n\t'.join(b.closure)))
+        sys.exit(0)
+
+    if make_gen:
+        r = subprocess.run(['make', '-s'] + GENERATED, cwd=TOP)
+        if r.returncode != 0 and not all(os.path.isfile(os.path.join(TOP, g)) for g in GENERATED):
+            print("Couldn't make the generated includes")
+            sys.exit(1)
+
+    version = iverilog_version(mvars['IVERILOG'])
+    if version is None:
+        print("Can't run %s" % mvars['IVERILOG'])
+        sys.exit(1)
+    cmd = ([mvars['IVERILOG']] + shlex.split(mvars['IVFLAGS']) +
+           shlex.split(mvars['DEFS']) + shlex.split(mvars['PATHS']))
+    os.makedirs(cachedir, exist_ok=True)
+
+    t0 = time.time()
+    work = [(b, cmd, version, cachedir, force, vcd, timeout) for b in benches]
+    results = []
+    with multiprocessing.Pool(max(1, min(jobs, len(work)))) as pool:
+        for r in pool.imap_unordered(run_one, work):
+            results.append(r)
+            if r['status'] != 'pass' or not quiet:
+                print("%-20s %-5s %s %6.2fs  %s" %
+                      (r['name'], r['status'].upper(), 'cached' if r['cached'] else 'built ',
+                       r['build_time'] + r['run_time'], r['message']))
+            if r['status'] != 'pass' and not quiet:
+                print("\t" + "\n\t".join(r['output'].splitlines()[-20:]))
+    wall = time.time() - t0
+    results.sort(key=lambda r: r['name'])
+
+    npass = sum(r['status'] == 'pass' for r in results)
+    print("\n%d/%d passed, %d built, %.1fs" %
+          (npass, len(results), sum(not r['cached'] for r in results), wall))
+    if junit:
+        write_junit(junit, results, wall)
+    sys.exit(0 if npass == len(results) else 1)
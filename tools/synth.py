@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+#
+# Synthesis and place-and-route of each module's harness (tools/mk_harness.py)
+# with a local yosys/nextpnr ECP5 flow, recording area and Fmax in a SQLite
+# database keyed by module, parameter point and git revision:
+#
+#   ./tools/synth.py                        # Every module in src/, in parallel
+#   ./tools/synth.py -w cache,tlb,execute_mul -j 8
+#   ./tools/synth.py -w cache -s cache:L2SIZE=12,13,14
+#   ./tools/synth.py -y -w decode           # Synthesis only:  area, no Fmax
+#   ./tools/synth.py -c v1.0                # Compare the tree's results to v1.0's
+#   ./tools/synth.py -t -w execute_mul      # Fmax trend over the history
+#   ./tools/synth.py -t -m lut -w cache
+#
+# The harnesses (regenerated into synth/harness, with any -s/-S sweep points
+# as mk_harness.py takes them) register every input and output, so each
+# module's Fmax is that of its own paths, register to register, plus the
+# input and output registers:  which module caps the CPU's clock, and by how
+# much.  Each runs in synth/work/<top>:
+#
+#   yosys:    read_verilog -defer (so parameters are evaluated for the
+#             instance), synth_ecp5 and stat for LUT (LUT4s plus two per
+#             CCU2C carry), FF, BRAM (DP16KD/PDPW16KD), DSP (MULT18X18D/
+#             ALU54B) and distributed RAM (TRELLIS_DPR16X4) counts
+#   nextpnr:  nextpnr-ecp5 on the device/package (-d, -P) at a target (-f,
+#             MHz; --timing-allow-fail) for the achieved Fmax of clk
+#
+# BUILD_ECP5 is defined, as for the ECP5 CPU build (dp_ram.v's DP16KDs).
+# Results are keyed like bench.py's, by HEAD plus a hash of uncommitted
+# changes; a run is shown against the nearest earlier results (-c for a
+# given revision), and -t shows a metric per revision.  P&R is seeded (-e);
+# Fmax moves a few percent between seeds, so changes within -T percent
+# (default 3) aren't flagged.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import time
+
+import bench
+import mk_harness
+
+TOP = bench.TOP
+SYNTH_PATH = os.path.join(TOP, 'synth')
+DB_PATH = os.path.join(SYNTH_PATH, 'results.db')
+WORK_PATH = os.path.join(SYNTH_PATH, 'work')
+TABLE = 'synth'                 # In the results DB, as bench.py's runs
+
+DEVICE = '85k'
+PACKAGE = 'CABGA381'
+FREQ = 50.0                     # MHz
+SEED = 1
+FMAX_THRESHOLD = 3.0            # Percent
+DEFINES = {'BUILD_ECP5': '1'}
+
+METRICS = ('fmax', 'lut', 'ff', 'bram', 'dsp', 'lutram')
+
+# Cells of synth_ecp5's netlist counted as each resource:  (metric, weight)
+CELLS = {'LUT4': ('lut', 1), 'CCU2C': ('lut', 2),
+         'TRELLIS_FF': ('ff', 1),
+         'DP16KD': ('bram', 1), 'PDPW16KD': ('bram', 1),
+         'MULT18X18D': ('dsp', 1), 'ALU54B': ('dsp', 1),
+         'TRELLIS_DPR16X4': ('lutram', 1)}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS synth (
+    id INTEGER PRIMARY KEY,
+    rev TEXT NOT NULL,
+    dirty TEXT NOT NULL,
+    commit_time INTEGER,
+    subject TEXT,
+    module TEXT NOT NULL,
+    point TEXT NOT NULL,
+    params TEXT,
+    device TEXT,
+    tools TEXT,
+    host TEXT,
+    started REAL,
+    status TEXT,
+    lut INTEGER,
+    ff INTEGER,
+    bram INTEGER,
+    dsp INTEGER,
+    lutram INTEGER,
+    fmax REAL,
+    wall REAL
+);
+CREATE INDEX IF NOT EXISTS synth_rev ON synth (rev, dirty, module, point);
+"""
+
+STAT_RE = [re.compile(r'^\s+(\$?[A-Za-z_][\w$]*)\s+(\d+)\s*$'),   # Older stat
+           re.compile(r'^\s+(\d+)\s+(?:\S+\s+)?(\$?[A-Za-z_][\w$]*)\s*$')]
+FMAX_RE = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz")
+
+
+################################################################################
+# Running
+
+def tool_versions(synth_only):
+    v = []
+    for t in ['yosys'] + ([] if synth_only else ['nextpnr-ecp5']):
+        p = subprocess.run([t, '--version'], stdout=subprocess.PIPE,
+                           stderr=subprocess.STDOUT, universal_newlines=True)
+        v.append(p.stdout.strip().splitlines()[0] if p.stdout.strip() else t)
+    return '; '.join(v)
+
+
+def parse_stat(path):
+    """Resource counts from yosys' stat output (the last module's table is
+    the top's, hierarchy flattened)"""
+    counts = dict((m, 0) for m in METRICS if m != 'fmax')
+    with open(path, 'r') as f:
+        lines = f.read().splitlines()
+    for l in lines:
+        for i, r in enumerate(STAT_RE):
+            m = r.match(l)
+            if m:
+                (cell, n) = (m.group(1), m.group(2)) if i == 0 else (m.group(2), m.group(1))
+                if cell in CELLS:
+                    metric, weight = CELLS[cell]
+                    counts[metric] += int(n) * weight
+                break
+    return counts
+
+
+def is_clk(name):
+    """nextpnr's name for the harness's clk net, e.g. "$glbnet$clk" or
+    "clk$TRELLIS_IO_IN", not shift_clk's"""
+    return mk_harness.clk_net_name in name.split('$')
+
+
+def parse_fmax(log_path, report_path):
+    if os.path.isfile(report_path):
+        try:
+            with open(report_path, 'r') as f:
+                fm = json.load(f).get('fmax', {})
+            v = [c['achieved'] for n, c in fm.items() if is_clk(n)]
+            if v:
+                return min(v)
+        except (ValueError, KeyError):
+            pass
+    # The log gives it after each timing analysis; the last is post-routing:
+    last = {}
+    with open(log_path, 'r', errors='replace') as f:
+        for m in FMAX_RE.finditer(f.read()):
+            last[m.group(1)] = float(m.group(2))
+    v = [f for n, f in last.items() if is_clk(n)]
+    return min(v) if v else None
+
+
+def run_one(args):
+    """Synthesises (and places and routes) one harness; returns a result
+    dict, with 'status' 'ok' or the failure"""
+    (ent, hdir, manifest, device, package, freq, seed, synth_only) = args
+    top = ent['top']
+    work = os.path.join(WORK_PATH, top)
+    shutil.rmtree(work, ignore_errors=True)
+    os.makedirs(work)
+    res = {'module': ent['module'], 'point': mk_harness.point_label(ent['overrides']),
+           'params': ent['params'], 'top': top, 'work': work, 'fmax': None}
+    started = time.time()
+
+    srcs = [os.path.join(TOP, s) for s in manifest['sources']]
+    script = os.path.join(work, 'synth.ys')
+    with open(script, 'w') as f:
+        f.write("read_verilog -defer %s %s %s %s\n" %
+                (' '.join('-D%s=%s' % kv for kv in sorted(manifest['defines'].items())),
+                 ' '.join('-I%s' % os.path.join(TOP, d) for d in manifest['include']),
+                 ' '.join(srcs), os.path.join(hdir, ent['harness'])))
+        f.write("synth_ecp5 -top %s -json %s\n" % (top, os.path.join(work, 'netlist.json')))
+        f.write("tee -q -o %s stat\n" % os.path.join(work, 'stat.txt'))
+
+    p = subprocess.run(['yosys', '-q', '-l', os.path.join(work, 'yosys.log'), '-s', script],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    if p.returncode != 0:
+        res['status'] = 'yosys failed, see %s' % os.path.join(work, 'yosys.log')
+        return res
+    res.update(parse_stat(os.path.join(work, 'stat.txt')))
+
+    if not synth_only:
+        log = os.path.join(work, 'nextpnr.log')
+        report = os.path.join(work, 'report.json')
+        p = subprocess.run(['nextpnr-ecp5', '--%s' % device, '--package', package,
+                            '--json', os.path.join(work, 'netlist.json'),
+                            '--freq', '%g' % freq, '--seed', str(seed),
+                            '--lpf-allow-unconstrained', '--timing-allow-fail',
+                            '--report', report, '--quiet', '-l', log],
+                           stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        if p.returncode != 0:
+            res['status'] = 'nextpnr failed, see %s' % log
+            return res
+        res['fmax'] = parse_fmax(log, report)
+    res['status'] = 'ok'
+    res['wall'] = time.time() - started
+    return res
+
+
+def harnesses(modules, sweeps, jobs):
+    """Regenerates the harnesses; returns (manifest, [entries] to run)"""
+    hdir = os.path.join(SYNTH_PATH, 'harness')
+    manifest = mk_harness.harness_all(sorted(glob.glob(os.path.join(mk_harness.SRC_PATH, '*.v'))),
+                                      hdir, [mk_harness.INC_PATH], DEFINES, jobs, sweeps)
+    ents = []
+    for e in manifest['harnesses']:
+        if modules and e.get('module') not in modules:
+            continue
+        if 'error' in e:
+            print("*** %s" % e['error'])
+            continue
+        if 'skipped' in e:
+            print("--- %s" % e['skipped'])
+            continue
+        ents.append(e)
+    return hdir, manifest, ents
+
+
+def run_all(db, ents, hdir, manifest, device, package, freq, seed, synth_only, jobs):
+    (rev, dirty, ct, subject) = bench.current_rev()
+    tools = tool_versions(synth_only)
+    host = platform.node()
+    dev = '%s/%s' % (device, package) + ('' if synth_only else ' @%gMHz seed %d' % (freq, seed))
+    print("Synthesising %d harnesses at %s (%s)\n" % (len(ents), bench.label(rev, dirty), tools))
+    started = time.time()
+    failed = 0
+    with multiprocessing.Pool(jobs) as pool:
+        for r in pool.imap_unordered(run_one, [(e, hdir, manifest, device, package, freq, seed,
+                                                synth_only) for e in ents]):
+            if r['status'] != 'ok':
+                print("*** %s: %s" % (r['top'], r['status']))
+                failed += 1
+                continue
+            db.execute("INSERT INTO synth (rev, dirty, commit_time, subject, module, point, "
+                       "params, device, tools, host, started, status, lut, ff, bram, dsp, "
+                       "lutram, fmax, wall) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (rev, dirty, ct, subject, r['module'], r['point'],
+                        json.dumps(r['params'], sort_keys=True), dev, tools, host, started,
+                        r['status'], r['lut'], r['ff'], r['bram'], r['dsp'], r['lutram'],
+                        r['fmax'], r['wall']))
+            db.commit()
+            print("%-40s %7d LUT %7d FF %3d BRAM %3d DSP %s" %
+                  (r['top'], r['lut'], r['ff'], r['bram'], r['dsp'],
+                   '%7.2f MHz' % r['fmax'] if r['fmax'] else ''))
+    return (rev, dirty, failed)
+
+
+################################################################################
+# Results
+
+def load(db, rev, dirty=''):
+    """{(module, point): row} for a revision, the latest run of each"""
+    res = {}
+    for r in bench.select(db, rev, dirty, TABLE):
+        if r['status'] == 'ok':
+            res[(r['module'], r['point'])] = r
+    return res
+
+
+def name(key):
+    return key[0] + ('[%s]' % key[1] if key[1] else '')
+
+
+def report(new, base, new_label, base_label, thresh, modules):
+    """The results, slowest first, against a baseline's"""
+    keys = sorted((k for k in new if not modules or k[0] in modules),
+                  key=lambda k: (new[k]['fmax'] is None, new[k]['fmax'] or 0, k))
+    print("\n%s%s\n" % (new_label, (" against %s" % base_label) if base is not None else ''))
+    print("%-40s %8s %8s %5s %5s %9s %9s" %
+          ('Module', 'LUT', 'FF', 'BRAM', 'DSP', 'Fmax', 'Change'))
+    flagged = []
+    for k in keys:
+        n = new[k]
+        b = base.get(k) if base else None
+        ch = ''
+        if b is not None and n['fmax'] and b['fmax']:
+            d = bench.pct(n['fmax'], b['fmax'])
+            ch = '%+8.1f%%' % d
+            if abs(d) > thresh:
+                flagged.append("%s: Fmax %.2f -> %.2f MHz (%+.1f%%)" % (name(k), b['fmax'],
+                                                                       n['fmax'], d))
+        print("%-40s %8d %8d %5d %5d %9s %9s" %
+              (name(k)[:40], n['lut'], n['ff'], n['bram'], n['dsp'],
+               '%.2f' % n['fmax'] if n['fmax'] else '-', ch))
+        if b is not None:
+            for m in ('lut', 'ff', 'bram', 'dsp'):
+                if n[m] != b[m]:
+                    print("%42s %-6s %d -> %d (%+.1f%%)" % ('', m, b[m], n[m],
+                                                          bench.pct(n[m], b[m]) if b[m] else 0))
+    timed = [k for k in keys if new[k]['fmax']]
+    if timed:
+        print("\nSlowest:  %s, %.2f MHz" % (name(timed[0]), new[timed[0]]['fmax']))
+    for m in flagged:
+        print("Note:  " + m)
+
+
+def trend(db, metric, modules, count):
+    """<metric> per module/point for the revisions on HEAD's first-parent
+    history with results, oldest first"""
+    revs = [r for r in bench.git('rev-list', '--first-parent', '--max-count=10000',
+                                 'HEAD').split()
+            if bench.has_results(db, r, '', TABLE)][:count]
+    revs.reverse()
+    results = [(r, '', load(db, r)) for r in revs]
+    (rev, dirty, _, _) = bench.current_rev()
+    if dirty and bench.has_results(db, rev, dirty, TABLE):
+        results.append((rev, dirty, load(db, rev, dirty)))
+    if not results:
+        print("No results on this branch")
+        return
+    keys = sorted(set(k for (_, _, res) in results for k in res
+                      if not modules or k[0] in modules))
+    print("%s per revision\n" % metric)
+    print("%-17s %-28s " % ("Revision", "Subject") +
+          " ".join("%14s" % name(k)[:14] for k in keys))
+    for (rev, dirty, res) in results:
+        subject = "(uncommitted changes)" if dirty else \
+            db.execute("SELECT subject FROM synth WHERE rev = ? LIMIT 1", (rev, )).fetchone()[0]
+        cols = []
+        for k in keys:
+            v = res[k][metric] if k in res else None
+            cols.append("%14s" % ('-' if v is None else
+                                  ('%.2f' % v if metric == 'fmax' else '%d' % v)))
+        print("%-17s %-28s " % (bench.label(rev, dirty), (subject or '')[:28]) + " ".join(cols))
+
+
+################################################################################
+
+def usage():
+    print("Syntax:\n\t %s [options]\n" % sys.argv[0])
+    print("\t-w <modules>\tComma-separated modules (default all in src/)")
+    print("\t-s <module>:<param>=<v>[,<v>...]\tParameter sweep, as mk_harness.py")
+    print("\t-S <file>\tSweep file, as mk_harness.py")
+    print("\t-y\t\tSynthesis only (area; no place and route or Fmax)")
+    print("\t-d <device>\tECP5 device for nextpnr-ecp5 (default %s)" % DEVICE)
+    print("\t-P <package>\tPackage (default %s)" % PACKAGE)
+    print("\t-f <MHz>\tTarget frequency (default %g)" % FREQ)
+    print("\t-e <seed>\tnextpnr seed (default %d)" % SEED)
+    print("\t-j <jobs>\tParallel runs (default one per CPU)")
+    print("\t-c <rev>\tShow results against <rev>'s, without running")
+    print("\t-R <rev>\tRevision to show (default: the working tree)")
+    print("\t-t\t\tTrend over HEAD's history, without running")
+    print("\t-m <metric>\tTrend metric:  %s (default fmax)" % ', '.join(METRICS))
+    print("\t-l <n>\t\tTrend over the last <n> revisions with results (default 30)")
+    print("\t-T <pct>\tFmax change to note (default %.1f)" % FMAX_THRESHOLD)
+    print("\t-D <file>\tResults database (default synth/results.db)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "w:s:S:yd:P:f:e:j:c:R:tm:l:T:D:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    modules = None
+    sweep_specs = []
+    synth_only = False
+    device = DEVICE
+    package = PACKAGE
+    freq = FREQ
+    seed = SEED
+    jobs = None
+    base_rev = None
+    new_rev = None
+    do_trend = False
+    metric = 'fmax'
+    count = 30
+    thresh = FMAX_THRESHOLD
+    db_path = DB_PATH
+    try:
+        for (o, a) in opts:
+            if o == '-w':
+                modules = a.split(',')
+            elif o == '-s':
+                sweep_specs.append(a)
+            elif o == '-S':
+                sweep_specs += mk_harness.read_sweep(a)
+            elif o == '-y':
+                synth_only = True
+            elif o == '-d':
+                device = a
+            elif o == '-P':
+                package = a
+            elif o == '-f':
+                freq = float(a)
+            elif o == '-e':
+                seed = int(a, 0)
+            elif o == '-j':
+                jobs = int(a, 0)
+            elif o == '-c':
+                base_rev = a
+            elif o == '-R':
+                new_rev = a
+            elif o == '-t':
+                do_trend = True
+            elif o == '-m':
+                metric = a
+            elif o == '-l':
+                count = int(a, 0)
+            elif o == '-T':
+                thresh = float(a)
+            elif o == '-D':
+                db_path = a
+            else:
+                usage()
+        sweeps = mk_harness.parse_sweep(sweep_specs)
+    except (OSError, ValueError) as e:
+        print(e)
+        usage()
+    if args or metric not in METRICS:
+        usage()
+
+    os.makedirs(SYNTH_PATH, exist_ok=True)
+    db = sqlite3.connect(db_path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+
+    fails = 0
+    if do_trend:
+        trend(db, metric, modules, count)
+    elif base_rev or new_rev:
+        if new_rev:
+            (rev, dirty) = (bench.resolve(new_rev), '')
+        else:
+            (rev, dirty, _, _) = bench.current_rev()
+        base = bench.resolve(base_rev) if base_rev else None
+        for (r, d) in [(base, ''), (rev, dirty)]:
+            if r is not None and not bench.has_results(db, r, d, TABLE):
+                print("No results for %s" % bench.label(r, d))
+                sys.exit(1)
+        report(load(db, rev, dirty), load(db, base) if base else None,
+               bench.label(rev, dirty), bench.label(base, '') if base else '', thresh, modules)
+    else:
+        missing = [t for t in ['yosys'] + ([] if synth_only else ['nextpnr-ecp5'])
+                   if shutil.which(t) is None]
+        if missing:
+            print("%s not installed" % ' and '.join(missing))
+            sys.exit(1)
+        hdir, manifest, ents = harnesses(modules, sweeps, jobs)
+        if not ents:
+            print("Nothing to synthesise")
+            sys.exit(1)
+        (rev, dirty, fails) = run_all(db, ents, hdir, manifest, device, package, freq, seed,
+                                      synth_only, jobs)
+        base = bench.find_baseline(db, rev, dirty, TABLE)
+        report(load(db, rev, dirty), load(db, base) if base else None,
+               bench.label(rev, dirty), bench.label(base, '') if base else '', thresh,
+               modules)
+
+    db.close()
+    sys.exit(1 if fails else 0)
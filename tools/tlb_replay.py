@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+#
+# Trace-driven replay of the MMUs (mmu.v, tlb.v, mmu_bat.v), for exploring TLB
+# sizes and a combined L2 TLB against the page table walks an RTL run made:
+#
+#   ./verilator/obj_dir/Vwrapper_top -m mmu.bin
+#   ./tools/tlb_replay.py -v mmu.bin
+#   ./tools/tlb_replay.py -i 16,32,64 -d 16,32,64 -2 0,128,256 -W 4 mmu.bin
+#
+# The trace gives the I and D translation streams (lookups with translation
+# on), TLB invalidations, and changes to the SRs, SDR1 and BATs.  Each lookup
+# is replayed through:
+# - The BATs, matched as mmu_bat_match.v does (-B ignores them, so that every
+#   translation goes through the TLBs).
+# - An L1 TLB per side, tagged by EA page (as tlb.v is; an SR change flushes
+#   it via TLBIA).  The "rtl" policy replaces the entry at tlb.v's
+#   free-running idx, i.e. depends on the cycle of the insert.
+# - Optionally, a combined L2 TLB tagged by VSID and page index (from the SRs
+#   in force), with a fixed hit latency.
+# - Otherwise a page table walk.  Walks aren't simulated:  the hashed page
+#   table isn't in the trace, so mmu_ptw.v's PTEG searches can't be redone.
+#   A walk's cost and outcome are replayed from the RTL's walk of that
+#   VSID/page nearest in time (the mean walk time, without a fault, for
+#   pages the RTL never walked).  So the walk costs include the RTL's D$
+#   behaviour and waits for the other side's walks, and only the TLB side of
+#   the configuration can be varied, not the page table.  The PTEGs column
+#   counts the distinct primary PTEGs (from SDR1, as mmu_ptw.v) walked.
+#
+# -v replays the trace with the RTL's configuration and checks the model's
+# BAT/TLB hits, walks and inserts against the RTL's, and its walk counts
+# against the pctr_if_mmu_ptws/pctr_mem_mmu_ptws perf counter totals.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import bisect
+import collections
+import getopt
+import itertools
+import multiprocessing
+import random
+import sys
+
+import numpy as np
+
+import mr_trace
+from mr_trace import MMU_I, MMU_D, MMU_EV_LOOKUP, MMU_EV_WALK, \
+    MMU_EV_INSERT, MMU_EV_TLBI, MMU_EV_SR, MMU_EV_SPR, MMU_EV_TOTALS, \
+    MMU_F_PRIV, MMU_F_BAT_HIT, MMU_F_TLB_HIT, MMU_F_PTW, \
+    MMU_SPR_SDR1, MMU_SPR_IBAT, MMU_SPR_DBAT, NR_BATS, PTW_FAULT_NONE
+
+
+# The RTL's configuration (mmu.v/tlb.v TLB_ENTRIES)
+RTL_TLB_ENTRIES = 16
+
+# tlb.v's idx is held at 0 through the harness' 4 reset ticks, then counts
+# every cycle; an entry inserted in the tick after the INSERT record at cycle
+# N goes into slot (N - 4) % TLB_ENTRIES.
+IDX_RESET_TICKS = 4
+
+POLICIES = ['rtl', 'fifo', 'lru', 'random']
+
+Config = collections.namedtuple('Config', ['itlb', 'dtlb', 'l2', 'l2ways',
+                                           'policy', 'bats', 'l2_latency',
+                                           'keep_l2'])
+
+STATS = ['lookups', 'bat_hits', 'l1_hits', 'l2_hits', 'walks_i', 'walks_d',
+         'faults', 'walk_cycles', 'l2_cycles', 'ptegs']
+
+
+def bat_match(bats, ea, priv):
+    """As mmu_bat_match.v, given a list of (BATU, BATL) pairs."""
+    for (u, _) in bats:
+        bepi = u >> 17
+        bl = (u >> 2) & 0x7ff
+        if (ea >> 28) == (bepi >> 11) and \
+           ((ea >> 17) & 0x7ff & ~bl) == (bepi & 0x7ff) and \
+           (((u >> 1) & 1 and priv) or (u & 1 and not priv)):
+            return True
+    return False
+
+
+def pteg_addr(sdr1, vsid, pidx):
+    """Primary PTEG address, as mmu_ptw.v."""
+    h = (vsid & 0x7ffff) ^ pidx
+    return (sdr1 & 0xffff0000) | (((sdr1 & 0x1ff) & (h >> 10)) << 16) | \
+        ((h & 0x3ff) << 6)
+
+
+class TLB:
+    """A TLB of <entries> entries, <ways>-way set-associative (0 = fully)."""
+
+    def __init__(self, entries, ways=0, policy='rtl', seed=0):
+        self.ways = ways if ways else entries
+        nsets = entries // self.ways
+        if nsets < 1 or nsets & (nsets - 1):
+            raise ValueError("Bad TLB geometry %d/%d" % (entries, ways))
+        self.mask = nsets - 1
+        self.policy = policy
+        self.rng = random.Random(seed)
+        self.flush()
+
+    def flush(self):
+        # Per set: key -> slot (in use order, for LRU), and slot contents
+        n = self.mask + 1
+        self.where = [dict() for _ in range(n)]
+        self.slots = [[None] * self.ways for _ in range(n)]
+        self.fifo = [0] * n
+
+    def lookup(self, key):
+        d = self.where[key & self.mask]
+        if key in d:
+            if self.policy == 'lru':
+                d[key] = d.pop(key)
+            return True
+        return False
+
+    def insert(self, key, cycle):
+        """Returns the slot used."""
+        s = key & self.mask
+        d = self.where[s]
+        slots = self.slots[s]
+        if self.policy == 'rtl':
+            # tlb.v ignores validity:  whatever idx points at goes.
+            slot = (cycle - IDX_RESET_TICKS) % self.ways
+        elif len(d) < self.ways:
+            slot = slots.index(None)
+        elif self.policy == 'lru':
+            slot = d[next(iter(d))]
+        elif self.policy == 'fifo':
+            slot = self.fifo[s]
+            self.fifo[s] = (slot + 1) % self.ways
+        else:
+            slot = self.rng.randrange(self.ways)
+        old = slots[slot]
+        if old is not None:
+            del d[old]
+        slots[slot] = key
+        d[key] = slot
+        return slot
+
+    def remove(self, key):
+        s = key & self.mask
+        slot = self.where[s].pop(key, None)
+        if slot is not None:
+            self.slots[s][slot] = None
+
+
+class RTLWalks:
+    """Walks observed in the trace, for costing the model's walks."""
+
+    def __init__(self, events):
+        srs = [0] * 16
+        start = [None, None]
+        walks = {}
+        durations = []
+        self.cycles = 0
+        self.inserts = [[], []]
+        self.ptw_lookups = [0, 0]
+        self.pctr_ptws = None
+        for (cycle, ea, data, mmu, ev, flags, info) in events:
+            if ev == MMU_EV_SR:
+                srs[info] = data
+            elif ev == MMU_EV_LOOKUP and flags & MMU_F_PTW:
+                start[mmu] = (cycle, ea, srs[ea >> 28] & 0xffffff)
+                self.ptw_lookups[mmu] += 1
+            elif ev == MMU_EV_WALK and start[mmu] is not None:
+                (c0, ea0, vsid) = start[mmu]
+                key = (vsid << 16) | ((ea0 >> 12) & 0xffff)
+                walks.setdefault(key, []).append((c0, cycle - c0, info))
+                self.cycles += cycle - c0
+                if info == PTW_FAULT_NONE:
+                    durations.append(cycle - c0)
+                start[mmu] = None
+            elif ev == MMU_EV_INSERT:
+                self.inserts[mmu].append(cycle)
+            elif ev == MMU_EV_TOTALS:
+                self.pctr_ptws = (ea, data)
+        self.walks = walks
+        self.starts = dict((k, [w[0] for w in v]) for (k, v) in walks.items())
+        self.mean = int(round(np.mean(durations))) if durations else 0
+        self.nwalks = sum(len(v) for v in walks.values())
+
+    def cost(self, key, cycle):
+        """Returns (cycles, fault) for a walk of key at cycle."""
+        w = self.walks.get(key)
+        if w is None:
+            return (self.mean, PTW_FAULT_NONE)
+        i = max(bisect.bisect_right(self.starts[key], cycle) - 1, 0)
+        return w[i][1:]
+
+
+def simulate(events, rtl, cfg, check=None):
+    """Replays the trace under cfg; returns a stats dict.
+
+    If check is a list, (mmu, cycle, ea, bat_hit, tlb_hit, walked) is
+    appended to it for every lookup.  stats['inserts'] holds the cycle of
+    each L1 insert, per side.
+    """
+    st = dict((s, 0) for s in STATS)
+    l1 = [TLB(cfg.itlb, 0, cfg.policy), TLB(cfg.dtlb, 0, cfg.policy)]
+    # There's no RTL L2 to mirror, so "rtl" gives it LRU.
+    l2 = TLB(cfg.l2, cfg.l2ways, 'lru' if cfg.policy == 'rtl' else cfg.policy) \
+        if cfg.l2 else None
+    srs = [0] * 16
+    sdr1 = 0
+    bats = [[(0, 0)] * NR_BATS, [(0, 0)] * NR_BATS]
+    ptegs = set()
+    walks = ['walks_i', 'walks_d']
+    inserts = [[], []]
+
+    for (cycle, ea, data, mmu, ev, flags, info) in events:
+        if ev == MMU_EV_LOOKUP:
+            st['lookups'] += 1
+            priv = flags & MMU_F_PRIV
+            if cfg.bats and bat_match(bats[mmu], ea, priv):
+                st['bat_hits'] += 1
+                if check is not None:
+                    check.append((mmu, cycle, ea, True, False, False))
+                continue
+            page = ea >> 12
+            if l1[mmu].lookup(page):
+                st['l1_hits'] += 1
+                if check is not None:
+                    check.append((mmu, cycle, ea, False, True, False))
+                continue
+            vsid = srs[ea >> 28] & 0xffffff
+            pidx = page & 0xffff
+            key = (vsid << 16) | pidx
+            if l2 and l2.lookup(key):
+                st['l2_hits'] += 1
+                st['l2_cycles'] += cfg.l2_latency
+                inserts[mmu].append(cycle + cfg.l2_latency + 1)
+                l1[mmu].insert(page, inserts[mmu][-1])
+                continue
+            st[walks[mmu]] += 1
+            (dur, fault) = rtl.cost(key, cycle)
+            st['walk_cycles'] += dur
+            ptegs.add(pteg_addr(sdr1, vsid, pidx))
+            if check is not None:
+                check.append((mmu, cycle, ea, False, False, True))
+            if fault != PTW_FAULT_NONE:
+                st['faults'] += 1
+                continue
+            if l2:
+                l2.insert(key, cycle)
+            # mmu.v: ack at cycle+dur, INSERT the cycle after, load at the
+            # following edge.
+            inserts[mmu].append(cycle + dur + 1)
+            l1[mmu].insert(page, inserts[mmu][-1])
+
+        elif ev == MMU_EV_TLBI:
+            if info:
+                l1[mmu].flush()
+            else:
+                l1[mmu].remove(ea >> 12)
+            # An invalidation goes to both sides; act on the L2 once.
+            if l2 and mmu == MMU_D:
+                if not info:
+                    l2.remove(((srs[ea >> 28] & 0xffffff) << 16) |
+                              ((ea >> 12) & 0xffff))
+                elif not cfg.keep_l2:
+                    l2.flush()
+
+        elif ev == MMU_EV_SR:
+            srs[info] = data
+        elif ev == MMU_EV_SPR:
+            if info == MMU_SPR_SDR1:
+                sdr1 = data
+            else:
+                side = MMU_I if info < MMU_SPR_DBAT else MMU_D
+                n = info - (MMU_SPR_IBAT if side == MMU_I else MMU_SPR_DBAT)
+                (u, l) = bats[side][n // 2]
+                bats[side] = list(bats[side])
+                bats[side][n // 2] = (data, l) if n % 2 == 0 else (u, data)
+
+    st['ptegs'] = len(ptegs)
+    st['inserts'] = inserts
+    return st
+
+
+def rtl_config(bats=True):
+    return Config(RTL_TLB_ENTRIES, RTL_TLB_ENTRIES, 0, 0, 'rtl', bats, 0, False)
+
+
+def validate(events, rtl):
+    check = []
+    st = simulate(events, rtl, rtl_config(), check)
+    ok = True
+
+    print("%d lookups:  %d BAT hits, %d TLB hits; model walks I %d, D %d" %
+          (st['lookups'], st['bat_hits'], st['l1_hits'], st['walks_i'],
+           st['walks_d']))
+    print("RTL:  walks started I %d, D %d; %d walks completed, mean %d cycles" %
+          (rtl.ptw_lookups[MMU_I], rtl.ptw_lookups[MMU_D], rtl.nwalks,
+           rtl.mean))
+    if rtl.pctr_ptws is not None:
+        print("RTL pctrs:  if_mmu_ptws %d, mem_mmu_ptws %d" % rtl.pctr_ptws)
+        ok = ok and tuple(rtl.pctr_ptws) == (st['walks_i'], st['walks_d'])
+    else:
+        print("RTL pctrs:  (no totals; trace not closed cleanly?)")
+    ok = ok and (st['walks_i'], st['walks_d']) == tuple(rtl.ptw_lookups)
+
+    # Per-lookup comparison against the RTL's flags
+    lk = [e for e in events if e[4] == MMU_EV_LOOKUP]
+    mism = []
+    for (e, c) in zip(lk, check):
+        flags = e[5]
+        # The TLB is looked up alongside the BATs, which take priority.
+        bat = bool(flags & MMU_F_BAT_HIT)
+        rtl_hit = (bat, bool(flags & MMU_F_TLB_HIT) and not bat,
+                   bool(flags & MMU_F_PTW))
+        if rtl_hit != c[3:]:
+            mism.append((e, c))
+    for mmu in (MMU_I, MMU_D):
+        n = min(len(st['inserts'][mmu]), len(rtl.inserts[mmu]))
+        bad = sum(1 for (a, b) in zip(st['inserts'][mmu], rtl.inserts[mmu])
+                  if a != b)
+        print("%s inserts:  model %d, RTL %d, %d at different cycles/slots" %
+              ("ID"[mmu], len(st['inserts'][mmu]), len(rtl.inserts[mmu]), bad))
+        ok = ok and bad == 0 and n == len(rtl.inserts[mmu]) == \
+            len(st['inserts'][mmu])
+    print("%d lookup mismatches (BAT/TLB hit/walk)" % len(mism))
+    for (e, c) in mism[:10]:
+        print("    cycle %d %s %08x: RTL bat %d tlb %d ptw %d, model %d %d %d" %
+              ((e[0], "ID"[e[3]], e[1]) +
+               tuple(int(bool(e[5] & f)) for f in
+                     (MMU_F_BAT_HIT, MMU_F_TLB_HIT, MMU_F_PTW)) +
+               tuple(int(x) for x in c[3:])))
+    return ok and not mism
+
+
+################################################################################
+# Sweeps run in a pool of workers, which inherit the trace through fork.
+
+_sweep_events = None
+_sweep_rtl = None
+
+
+def _sweep_one(cfg):
+    try:
+        return (cfg, simulate(_sweep_events, _sweep_rtl, cfg))
+    except ValueError:
+        return (cfg, None)
+
+
+def print_header():
+    print("%5s %5s %5s %4s %-6s %4s %10s %8s %8s %8s %12s %12s %8s" %
+          ("ITLB", "DTLB", "L2", "L2W", "Policy", "BATs", "Lookups",
+           "Walks I", "Walks D", "L2 hits", "Est.cycles", "vs RTL", "PTEGs"))
+
+
+def l2_ways(cfg):
+    if not cfg.l2:
+        return "-"
+    return str(cfg.l2ways) if cfg.l2ways else "full"
+
+
+def print_row(cfg, st, base):
+    cyc = st['walk_cycles'] + st['l2_cycles']
+    print("%5d %5d %5d %4s %-6s %4s %10d %8d %8d %8d %12d %+11.1f%% %8d" %
+          (cfg.itlb, cfg.dtlb, cfg.l2, l2_ways(cfg), cfg.policy,
+           "on" if cfg.bats else "off", st['lookups'], st['walks_i'],
+           st['walks_d'], st['l2_hits'], cyc,
+           100.0 * (cyc - base) / base if base else 0.0, st['ptegs']))
+
+
+def usage():
+    print("Syntax:\n\t %s [options] <MMU trace>\n" % sys.argv[0])
+    print("\tReplays the trace's TLB lookups; walk costs are replayed from the")
+    print("\tRTL's walks in the trace, not simulated.\n")
+    print("\t-v\t\tValidate the model against the RTL and its perf counters")
+    print("\t-i <sizes>\tComma-separated ITLB sizes (default %d)" % RTL_TLB_ENTRIES)
+    print("\t-d <sizes>\tComma-separated DTLB sizes (default %d)" % RTL_TLB_ENTRIES)
+    print("\t-2 <sizes>\tComma-separated combined L2 TLB sizes, 0 for none (default 0)")
+    print("\t-W <ways>\tL2 TLB associativity, 0 for fully-associative (default 0)")
+    print("\t-L <cycles>\tL2 TLB hit latency (default 2)")
+    print("\t-k\t\tKeep L2 TLB entries over TLBIA (VSID-tagged, so SR changes needn't flush it)")
+    print("\t-p <policies>\tComma-separated of %s (default rtl)" % "/".join(POLICIES))
+    print("\t-B\t\tIgnore BATs (translate everything through the TLBs)")
+    print("\t-j <n>\t\tParallel jobs for sweeps (default: CPU count)")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "vi:d:2:W:L:kp:Bj:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    do_validate = False
+    itlbs = [RTL_TLB_ENTRIES]
+    dtlbs = [RTL_TLB_ENTRIES]
+    l2s = [0]
+    l2ways = 0
+    l2_latency = 2
+    keep_l2 = False
+    policies = ['rtl']
+    bats = True
+    jobs = None
+    for (o, a) in opts:
+        if o == '-v':
+            do_validate = True
+        elif o == '-i':
+            itlbs = [int(x, 0) for x in a.split(',')]
+        elif o == '-d':
+            dtlbs = [int(x, 0) for x in a.split(',')]
+        elif o == '-2':
+            l2s = [int(x, 0) for x in a.split(',')]
+        elif o == '-W':
+            l2ways = int(a, 0)
+        elif o == '-L':
+            l2_latency = int(a, 0)
+        elif o == '-k':
+            keep_l2 = True
+        elif o == '-p':
+            policies = a.split(',')
+            if any(p not in POLICIES for p in policies):
+                usage()
+        elif o == '-B':
+            bats = False
+        elif o == '-j':
+            jobs = int(a, 0)
+        else:
+            usage()
+    if len(args) != 1:
+        usage()
+
+    events = [tuple(int(x) for x in e) for e in
+              mr_trace.read_mmu_trace(args[0])[['cycle', 'ea', 'data', 'mmu',
+                                                'event', 'flags', 'info']]]
+    rtl = RTLWalks(events)
+
+    if do_validate:
+        sys.exit(0 if validate(events, rtl) else 1)
+
+    _sweep_events = events
+    _sweep_rtl = rtl
+    cfgs = [Config(i, d, l2, l2ways, p, bats, l2_latency, keep_l2)
+            for (i, d, l2, p) in itertools.product(itlbs, dtlbs, l2s, policies)]
+    cfgs.insert(0, rtl_config())
+
+    if len(cfgs) > 2 and jobs != 1:
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.map(_sweep_one, cfgs)
+    else:
+        results = [_sweep_one(cfg) for cfg in cfgs]
+
+    base = results[0][1]['walk_cycles']
+    print("RTL: %d walks taking %d cycles (mean %d)\n" %
+          (rtl.nwalks, rtl.cycles, rtl.mean))
+    print_header()
+    for (cfg, st) in results[1:]:
+        if st is None:
+            print("%5d %5d %5d %4s %-6s  (bad geometry)" %
+                  (cfg.itlb, cfg.dtlb, cfg.l2, l2_ways(cfg), cfg.policy))
+        else:
+            print_row(cfg, st, base)
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+#
+# Cached, incremental Verilator builds of the tb_top model, optionally for a
+# matrix of configurations built in parallel:
+#
+#   ./tools/vbuild.py                       # As make verilate_tb_top
+#   ./tools/vbuild.py -m L2SIZE=13,14,15
+#   ./tools/vbuild.py -m TLB_ENTRIES=8,16,32 -m TRACE=0 -j 3
+#   ./tools/vbuild.py -m TRACE=0 -p         # Just print the executable's path
+#   ./tools/vbuild.py -T -m TRACE=0         # With this host's tuned threading
+#   ./tools/vbuild.py -l                    # List the builds
+#
+# Matrix axes (-m, repeated; the cross product of their values is built):
+#   L2SIZE, L2WAYS      log2 of the size in bytes and the ways of both caches
+#                       (or ICACHE_L2SIZE, DCACHE_L2WAYS, etc. for one);
+#                       cache.v only does 4 ways, so L2WAYS must be 2
+#   TLB_ENTRIES         entries in both TLBs (or ITLB_ENTRIES/DTLB_ENTRIES)
+#   EXIT_B_SELF         0/1, stop on a branch-to-self (default 1, as the
+#                       Makefile)
+#   TRACE               0/1, build with --trace for VCD output (-t); default 1
+#   THREADS             Verilator --threads (default 1, single-threaded eval)
+#   MTASKS              --threads-max-mtasks, the partitioner's target number
+#                       of tasks (0, the default, leaves it to Verilator)
+#   PROF                0/1, a gprof build with --prof-cfuncs (and without
+#                       LTO/inlining), for tools/vprof.py; run it, then
+#                       vprof.py <exe> gmon.out
+#   MEMSIZEL2           log2 of the testbench RAM size in bytes (default 20,
+#                       1MB; e.g. 25 for tools/linux_boot.py)
+#
+# -T takes THREADS and MTASKS (unless given) from the best configuration
+# tools/vtune.py found for this host, recorded in verilator/tune.json.
+#
+# Each configuration gets a directory verilator/builds/<label>, holding its
+# Verilator object directory and executable.  A build is skipped if a hash of
+# the RTL and include files it reads (including include/auto_*.vh), the C++
+# harness, the configuration, flags and tool versions matches the last one.
+# Otherwise the object directory is re-verilated and rebuilt in place, so
+# make only recompiles what changed, with ccache (if installed) catching
+# compiles that produce what an earlier build of any configuration did.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import mk_harness
+import run_unit
+
+TOP = run_unit.TOP
+BUILDS = os.path.join(TOP, 'verilator', 'builds')
+EXE = 'Vwrapper_top'
+VERILATOR = os.environ.get('VERILATOR', 'verilator')
+CXX = os.environ.get('CXX', 'g++')
+TUNE_PATH = os.path.join(TOP, 'verilator', 'tune.json')
+# Generated for the harness (the RTL's are run_unit.GENERATED):
+HARNESS_GENERATED = ['verilator/auto_cover.h']
+CL_L2SIZE = 5
+
+# CPU parameters, set on wrapper_top with -G:
+PARAMS = {'ICACHE_L2SIZE': 14, 'ICACHE_L2WAYS': 2,
+          'DCACHE_L2SIZE': 14, 'DCACHE_L2WAYS': 2,
+          'ITLB_ENTRIES': 16, 'DTLB_ENTRIES': 16}
+# Axes setting both the I- and D-side parameters:
+BOTH = {'L2SIZE': ('ICACHE_L2SIZE', 'DCACHE_L2SIZE'),
+        'L2WAYS': ('ICACHE_L2WAYS', 'DCACHE_L2WAYS'),
+        'TLB_ENTRIES': ('ITLB_ENTRIES', 'DTLB_ENTRIES')}
+OPTIONS = {'EXIT_B_SELF': 1, 'TRACE': 1, 'THREADS': 1, 'MTASKS': 0, 'PROF': 0,
+           'MEMSIZEL2': 20}
+AXES = list(BOTH) + list(PARAMS) + list(OPTIONS)
+
+
+class Config:
+    """A point in the matrix:  the axis settings given, and from them the
+    full parameter/option set.
+    """
+    def __init__(self, axes):
+        self.axes = axes
+        self.params = dict(PARAMS)
+        self.opts = dict(OPTIONS)
+        for (k, v) in axes.items():
+            if k in BOTH:
+                for p in BOTH[k]:
+                    self.params[p] = v
+            elif k in PARAMS:
+                self.params[k] = v
+            else:
+                self.opts[k] = v
+
+    @property
+    def label(self):
+        if not self.axes:
+            return 'default'
+        return '_'.join('%s%d' % (k, v) for (k, v) in sorted(self.axes.items()))
+
+    def check(self):
+        for side in ('ICACHE', 'DCACHE'):
+            (size, ways) = (self.params[side + '_L2SIZE'],
+                            self.params[side + '_L2WAYS'])
+            allowed = mk_harness.SWEEP_ALLOWED['cache']['L2WAYS']
+            if ways not in allowed:
+                return '%s: cache.v only supports %s ways (L2WAYS=%s), not %d' % \
+                    (side, '/'.join(str(1 << w) for w in allowed),
+                     '/'.join(str(w) for w in allowed), 1 << ways)
+            if size - ways <= CL_L2SIZE:
+                return '%s: %d bytes in %d ways is too small (2+ sets needed)' % \
+                    (side, 1 << size, 1 << ways)
+        for t in ('ITLB_ENTRIES', 'DTLB_ENTRIES'):
+            if not 1 <= self.params[t] <= 256:
+                return '%s must be 1-256' % t
+        if self.opts['THREADS'] < 1 or self.opts['MTASKS'] < 0:
+            return 'THREADS must be 1+, MTASKS 0+'
+        if not 16 <= self.opts['MEMSIZEL2'] <= 30:
+            return 'MEMSIZEL2 must be 16-30'
+        return None
+
+    def verilator_args(self, objdir, jobs):
+        args = [VERILATOR, '-Mdir', objdir, '-Wall', '-Wno-fatal',
+                '--timescale', '1ns/1ns', '-j', str(jobs)]
+        if self.opts['TRACE']:
+            args.append('--trace')
+        if self.opts['THREADS'] > 1:
+            args += ['--threads', str(self.opts['THREADS'])]
+        if self.opts['MTASKS']:
+            args += ['--threads-max-mtasks', str(self.opts['MTASKS'])]
+        args += ['-G%s=%d' % (k, v) for (k, v) in sorted(self.params.items())]
+        if self.opts['MEMSIZEL2'] != OPTIONS['MEMSIZEL2']:
+            args.append('-DMEMSIZEL2=%d' % self.opts['MEMSIZEL2'])
+        args += ['-cc', 'tb/wrapper_top.v', '-Iinclude/', '-Isrc/', '-Itb/']
+        if self.opts['PROF']:
+            # Keep the per-statement functions separate, to be sampled:
+            args += ['--prof-cfuncs', '-CFLAGS', '-O3 -fno-inline -pg', '-LDFLAGS', '-pg']
+        else:
+            args += ['-CFLAGS', '-O3 -flto']
+        if self.opts['EXIT_B_SELF']:
+            args += ['-CFLAGS', '-DEXIT_B_SELF=1']
+        args += ['--exe', os.path.join(TOP, 'verilator', 'main.cpp')]
+        return args
+
+
+def parse_matrix(specs):
+    """['L2SIZE=13,14', 'TRACE=0'] to a list of Configs (cross product)"""
+    axes = []
+    for s in specs:
+        (k, _, vals) = s.partition('=')
+        k = k.strip().upper()
+        if k not in AXES or not vals:
+            raise ValueError("Bad axis '%s' (axes are %s)" % (s, ', '.join(AXES)))
+        axes.append([(k, int(v, 0)) for v in vals.split(',')])
+    return [Config(dict(c)) for c in itertools.product(*axes)]
+
+
+def tuned(specs):
+    """Adds this host's tuned THREADS/MTASKS to the matrix specs, unless
+    they're already there.
+    """
+    try:
+        with open(TUNE_PATH, 'r') as f:
+            best = json.load(f)[platform.node()]['best']
+    except (OSError, ValueError, KeyError):
+        print("No tuning for %s in %s (run tools/vtune.py)" % (platform.node(), TUNE_PATH))
+        return specs
+    given = set(s.partition('=')[0].strip().upper() for s in specs)
+    return specs + ['%s=%d' % (k, best[k]) for k in ('THREADS', 'MTASKS') if k not in given]
+
+
+def tool_version(argv):
+    try:
+        r = subprocess.run(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           universal_newlines=True)
+        return r.stdout.strip().splitlines()[0] if r.stdout.strip() else ''
+    except OSError:
+        return None
+
+
+def sources():
+    """Everything that goes into a build:  the RTL closure of wrapper_top
+    (as Verilator searches, -I being both include and library path) and the
+    C++ harness.
+    """
+    dirs = ['include', 'src', 'tb']
+    srcs = run_unit.scan_closure(['tb/wrapper_top.v'], dirs, dirs)
+    srcs += [g for g in run_unit.GENERATED if g not in srcs]
+    srcs += sorted(os.path.relpath(f, TOP) for f in
+                   glob.glob(os.path.join(TOP, 'verilator', '*.h')) +
+                   glob.glob(os.path.join(TOP, 'verilator', '*.cpp')))
+    return srcs
+
+
+def build_key(cfg, srcs, versions):
+    h = hashlib.sha256()
+    h.update(json.dumps([cfg.verilator_args('', 0), versions]).encode())
+    for p in srcs:
+        h.update(('%s %s\n' % (p, run_unit.file_hash(p))).encode())
+    return h.hexdigest()[:20]
+
+
+def read_stamp(d):
+    try:
+        with open(os.path.join(d, 'build.json'), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_one(args):
+    (cfg, srcs, versions, make_jobs, force, ccache) = args
+    d = os.path.join(BUILDS, cfg.label)
+    objdir = os.path.join(d, 'obj_dir')
+    exe = os.path.join(d, EXE)
+    key = build_key(cfg, srcs, versions)
+    res = {'label': cfg.label, 'exe': exe, 'key': key, 'cached': False,
+           'ok': True, 'time': 0.0, 'log': os.path.join(d, 'build.log')}
+    if not force and os.path.isfile(exe) and read_stamp(d).get('key') == key:
+        res['cached'] = True
+        return res
+
+    os.makedirs(d, exist_ok=True)
+    env = dict(os.environ)
+    make = ['make', '-C', objdir, '-f', EXE + '.mk', '-j', str(make_jobs)]
+    if ccache:
+        make.append('OBJCACHE=' + ccache)
+        # Hash paths relative to the tree, so objects are shared between the
+        # builds' object directories:
+        env.setdefault('CCACHE_BASEDIR', TOP)
+    t0 = time.time()
+    with open(res['log'], 'w') as log:
+        for argv in (cfg.verilator_args(objdir, make_jobs), make):
+            log.write('$ %s\n' % ' '.join(argv))
+            log.flush()
+            r = subprocess.run(argv, cwd=TOP, env=env, stdout=log, stderr=subprocess.STDOUT)
+            if r.returncode != 0:
+                res['ok'] = False
+                break
+    res['time'] = time.time() - t0
+    if res['ok']:
+        tmp = exe + '.tmp'
+        shutil.copy2(os.path.join(objdir, EXE), tmp)
+        os.replace(tmp, exe)
+        with open(os.path.join(d, 'build.json'), 'w') as f:
+            json.dump({'key': key, 'axes': cfg.axes, 'params': cfg.params,
+                       'opts': cfg.opts, 'versions': versions,
+                       'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'build_secs': round(res['time'], 1)}, f, indent=1)
+    return res
+
+
+def build_matrix(configs, jobs=None, make_jobs=None, force=False, use_ccache=True):
+    """Builds configs, some at once; yields build_one()'s results in order.
+    The CPUs are shared between the builds running at once.
+    """
+    versions = [tool_version([VERILATOR, '--version']), tool_version([CXX, '--version'])]
+    if versions[0] is None:
+        raise OSError("Can't run %s" % VERILATOR)
+    ccache = shutil.which('ccache') if use_ccache else None
+
+    ncpu = os.cpu_count() or 1
+    if jobs is None:
+        jobs = min(len(configs), max(1, ncpu // 4))
+    jobs = max(1, min(jobs, len(configs)))
+    if make_jobs is None:
+        make_jobs = max(1, ncpu // jobs)
+
+    srcs = sources()
+    work = [(c, srcs, versions, make_jobs, force, ccache) for c in configs]
+    with multiprocessing.Pool(jobs) as pool:
+        for r in pool.imap(build_one, work):
+            yield r
+
+
+def list_builds():
+    for d in sorted(glob.glob(os.path.join(BUILDS, '*'))):
+        st = read_stamp(d)
+        if not st:
+            continue
+        print("%-40s %s  %6.1fs  %s" % (os.path.basename(d), st.get('time', '?'),
+                                        st.get('build_secs', 0),
+                                        ' '.join('%s=%s' % kv for kv in sorted(st['axes'].items()))))
+
+
+def usage():
+    print("Syntax:\n\t %s [-m <AXIS>=<v>[,<v>...]] ... [-j <parallel builds>] "
+          "[-J <make jobs per build>] [-f] [-C] [-N] [-T] [-p] [-l]" % (sys.argv[0]))
+    print("\tAxes:  %s" % ', '.join(AXES))
+    print("\t-f:  Rebuild even if up to date")
+    print("\t-C:  Don't use ccache")
+    print("\t-N:  Don't run make for the generated includes first")
+    print("\t-T:  Use the THREADS/MTASKS tuned for this host")
+    print("\t-p:  Only print the executables' paths")
+    print("\t-l:  List existing builds")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    specs = []
+    jobs = None
+    make_jobs = None
+    force = False
+    use_ccache = True
+    make_gen = True
+    paths_only = False
+    use_tuned = False
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "m:j:J:fCNTplh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    for (o, a) in opts:
+        if o == '-m':
+            specs.append(a)
+        elif o == '-j':
+            jobs = int(a)
+        elif o == '-J':
+            make_jobs = int(a)
+        elif o == '-f':
+            force = True
+        elif o == '-C':
+            use_ccache = False
+        elif o == '-N':
+            make_gen = False
+        elif o == '-T':
+            use_tuned = True
+        elif o == '-p':
+            paths_only = True
+        elif o == '-l':
+            list_builds()
+            sys.exit(0)
+        else:
+            usage()
+
+    if use_tuned:
+        specs = tuned(specs)
+    try:
+        configs = parse_matrix(specs)
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+    for c in configs:
+        err = c.check()
+        if err:
+            print("%s: %s" % (c.label, err))
+            sys.exit(1)
+
+    if make_gen:
+        r = subprocess.run(['make', '-s'] + run_unit.GENERATED + HARNESS_GENERATED, cwd=TOP,
+                           stdout=subprocess.DEVNULL if paths_only else None)
+        if r.returncode != 0:
+            print("Couldn't make the generated includes")
+            sys.exit(1)
+
+    failed = 0
+    try:
+        for r in build_matrix(configs, jobs, make_jobs, force, use_ccache):
+            if not r['ok']:
+                failed += 1
+                print("%s: build FAILED, see %s" % (r['label'], r['log']), file=sys.stderr)
+            elif paths_only:
+                print(r['exe'])
+            else:
+                print("%-40s %s %6.1fs  %s" % (r['label'], 'cached' if r['cached'] else 'built ',
+                                               r['time'], os.path.relpath(r['exe'], TOP)))
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+    sys.exit(1 if failed else 0)
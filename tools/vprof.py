@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Attributes the Verilated model's host time to RTL modules, from a gprof
+# profile of a profiling build (--prof-cfuncs; see tools/vbuild.py's PROF):
+#
+#   ./tools/vbuild.py -m PROF=1 -m TRACE=0
+#   cd verilator/builds/PROF1_TRACE0 && ./Vwrapper_top -n 2000000 +INPUT_FILE=... && cd -
+#   ./tools/vprof.py verilator/builds/PROF1_TRACE0/Vwrapper_top verilator/builds/PROF1_TRACE0/gmon.out
+#   ./tools/vprof.py -n 30 -g flat.txt       # From saved gprof -b -p output
+#   ./tools/vprof.py -m cache <exe> gmon.out # One module's statements
+#
+# With --prof-cfuncs, Verilator puts each always block or assignment in its
+# own function, whose name ends __PROF__<module>__l<line>; the time gprof
+# samples in those is summed per module (whatever the instance), and the
+# hottest statements are listed with their source lines.  Time elsewhere is
+# put in pseudo-modules:  (scheduling) for the model's generated eval/settle
+# code, (verilated) for the Verilator runtime library, (harness) for main.cpp
+# and the trace writers, and (other) for libc and the rest.
+#
+# The profiling build isn't inlined, so it's slower than the normal build
+# and the split is approximate, but which modules dominate carries over.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import glob
+import os
+import re
+import subprocess
+import sys
+
+TOP = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+SRC_DIRS = ['src', 'tb', 'include']
+
+# A flat profile line:  %time cumulative self [calls self/call total/call] name
+re_flat = re.compile(r'^\s*([\d.]+)\s+([\d.]+)\s+([\d.]+)\s+'
+                     r'(?:(\d+)\s+([\d.]+)\s+([\d.]+)\s+)?(\S.*)$')
+re_prof = re.compile(r'__PROF__(\w+?)__l(\d+)')
+re_verilated = re.compile(r'^(VL_|vl_|Verilated|verilated|std::)|\bVerilated\w*::')
+re_harness = re.compile(r'\b(main|sc_time_stamp|TESTBENCH|[A-Z_]+_TRACE|PC_SAMPLER|'
+                        r'PCTR_TOTALS|SIM_SPEED)\b')
+re_model = re.compile(r'Vwrapper_top')
+
+
+def gprof_flat(exe, gmon):
+    r = subprocess.run(['gprof', '-b', '-p', exe, gmon], stdout=subprocess.PIPE,
+                       universal_newlines=True)
+    if r.returncode != 0:
+        raise OSError("gprof failed")
+    return r.stdout
+
+
+def parse_flat(text):
+    """Returns [(function name, self seconds, calls or None)]"""
+    funcs = []
+    for l in text.splitlines():
+        m = re_flat.match(l)
+        if m:
+            funcs.append((m.group(7).strip(), float(m.group(3)),
+                          int(m.group(4)) if m.group(4) else None))
+    return funcs
+
+
+def classify(name):
+    """Returns (module, line or None)"""
+    m = re_prof.search(name)
+    if m:
+        # Parameterised copies of a module get a __<suffix> on its name
+        return (m.group(1).split('__')[0], int(m.group(2)))
+    if re_verilated.search(name):
+        return ('(verilated)', None)
+    if re_harness.search(name):
+        return ('(harness)', None)
+    if re_model.search(name):
+        return ('(scheduling)', None)
+    return ('(other)', None)
+
+
+_sources = {}
+
+
+def module_file(module):
+    if module not in _sources:
+        _sources[module] = None
+        for d in SRC_DIRS:
+            for f in sorted(glob.glob(os.path.join(TOP, d, '*.v'))):
+                with open(f, 'r', errors='replace') as fh:
+                    if re.search(r'^\s*module\s+%s\b' % re.escape(module), fh.read(), re.M):
+                        _sources[module] = f
+                        break
+            if _sources[module]:
+                break
+    return _sources[module]
+
+
+def source_line(module, line):
+    f = module_file(module)
+    if not f:
+        return ''
+    with open(f, 'r', errors='replace') as fh:
+        lines = fh.readlines()
+    return lines[line - 1].strip() if 0 < line <= len(lines) else ''
+
+
+def report(funcs, nstmts, only):
+    total = sum(t for (_, t, _) in funcs)
+    if total == 0:
+        print("No samples (did the run exit normally, writing gmon.out?)")
+        return
+    mods = {}
+    stmts = {}
+    for (name, t, _) in funcs:
+        (mod, line) = classify(name)
+        s = mods.setdefault(mod, [0.0, 0])
+        s[0] += t
+        s[1] += 1
+        if line is not None:
+            stmts[(mod, line)] = stmts.get((mod, line), 0.0) + t
+
+    if not only:
+        print("Host time by module (%.2fs sampled):\n" % total)
+        print("  %-24s %9s %7s %6s" % ('Module', 'Self (s)', '%', 'Funcs'))
+        for (mod, (t, n)) in sorted(mods.items(), key=lambda kv: -kv[1][0]):
+            print("  %-24s %9.2f %6.1f%% %6d" % (mod, t, 100.0 * t / total, n))
+        print()
+
+    hot = sorted(((t, k) for (k, t) in stmts.items() if not only or k[0] == only),
+                 reverse=True)[:nstmts]
+    if hot:
+        print("Hottest statements:\n")
+        for (t, (mod, line)) in hot:
+            f = module_file(mod)
+            where = '%s:%d' % (os.path.relpath(f, TOP) if f else mod, line)
+            print("  %6.2fs %5.1f%%  %-28s %s" % (t, 100.0 * t / total, where,
+                                                  source_line(mod, line)[:60]))
+
+
+def usage():
+    print("Syntax:\n\t %s [-n <statements>] [-m <module>] <exe> [gmon.out]\n"
+          "\t %s [-n <statements>] [-m <module>] -g <gprof flat profile text>" %
+          (sys.argv[0], sys.argv[0]))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    nstmts = 20
+    only = None
+    flat = None
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "n:m:g:h")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    for (o, a) in opts:
+        if o == '-n':
+            nstmts = int(a)
+        elif o == '-m':
+            only = a
+        elif o == '-g':
+            flat = a
+        else:
+            usage()
+
+    if flat:
+        with open(flat, 'r') as f:
+            text = f.read()
+    elif len(args) in (1, 2):
+        gmon = args[1] if len(args) == 2 else os.path.join(os.path.dirname(args[0]) or '.',
+                                                           'gmon.out')
+        try:
+            text = gprof_flat(args[0], gmon)
+        except OSError as e:
+            print(e)
+            sys.exit(1)
+    else:
+        usage()
+
+    report(parse_flat(text), nstmts, only)
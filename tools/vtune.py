@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#
+# Tunes the multithreaded Verilator build for this host:  builds the model
+# (via tools/vbuild.py) with 1..N threads and each of the given partitioning
+# settings, times each on a reference workload, and records the fastest in
+# verilator/tune.json (per host), for vbuild.py -T to use:
+#
+#   ./tools/vtune.py                        # 1..min(CPUs, 8) threads
+#   ./tools/vtune.py -N 6 -m 0,16,64        # ...and --threads-max-mtasks
+#   ./tools/vtune.py -w bench/intkern.hex -n 5000000 -r 5
+#   ./tools/vtune.py -s                     # Show the recorded results
+#
+# The builds are made with TRACE=0 (as a VCD-writing run is I/O bound
+# anyway), then run one at a time, the repetitions interleaved so drift in
+# the host's load or clock affects all configurations alike.  The best time
+# of each configuration's runs gives its speed, in simulated kHz.  Every run
+# must simulate the same number of cycles and instructions (the model is
+# deterministic, threaded or not); a difference is reported as an error.
+#
+# Copyright 2022 Matt Evans
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import getopt
+import json
+import os
+import platform
+import sys
+import time
+
+import bench
+import vbuild
+
+TOP = vbuild.TOP
+MAX_THREADS = 8
+
+
+def cpu_model():
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for l in f:
+                if l.startswith('model name'):
+                    return l.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def run(exe, image, cycles):
+    """Returns (wall seconds, instructions, cycles)"""
+    cmd = [exe, '-n', str(cycles), '+INPUT_FILE=' + image]
+    (_, m, wall) = bench.run_sim(cmd, exe)
+    return (wall, int(m.group(1)), int(m.group(3)))
+
+
+def load_db():
+    try:
+        with open(vbuild.TUNE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def show(db):
+    for (host, t) in sorted(db.items()):
+        b = t['best']
+        print("%s (%s, %d CPUs), %s on %s:" % (host, t['cpu'], t['ncpu'], t['date'], t['workload']))
+        for r in t['results']:
+            print("\t%s threads %2d mtasks %3d  %8.1f kHz" %
+                  ('*' if (r['THREADS'], r['MTASKS']) == (b['THREADS'], b['MTASKS']) else ' ',
+                   r['THREADS'], r['MTASKS'], r['khz']))
+
+
+def usage():
+    print("Syntax:\n\t %s [-N <max threads>] [-t <t>,<t>...] [-m <mtasks>,...] "
+          "[-w <hex image>] [-n <cycles>] [-r <reps>] [-j <parallel builds>] [-s]" %
+          (sys.argv[0]))
+    print("\t-t:  Thread counts to try (default 1..N)")
+    print("\t-m:  --threads-max-mtasks values to try (default 0, Verilator's choice)")
+    print("\t-s:  Show the recorded results and exit")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    max_threads = min(os.cpu_count() or 1, MAX_THREADS)
+    threads = None
+    mtasks = [0]
+    image = os.path.join(TOP, 'testprog.hex')
+    cycles = 2000000
+    reps = 3
+    jobs = None
+
+    try:
+        (opts, args) = getopt.getopt(sys.argv[1:], "N:t:m:w:n:r:j:sh")
+    except getopt.GetoptError as e:
+        print(e)
+        usage()
+
+    for (o, a) in opts:
+        if o == '-N':
+            max_threads = int(a)
+        elif o == '-t':
+            threads = [int(x) for x in a.split(',')]
+        elif o == '-m':
+            mtasks = [int(x) for x in a.split(',')]
+        elif o == '-w':
+            image = a
+        elif o == '-n':
+            cycles = int(a)
+        elif o == '-r':
+            reps = int(a)
+        elif o == '-j':
+            jobs = int(a)
+        elif o == '-s':
+            show(load_db())
+            sys.exit(0)
+        else:
+            usage()
+
+    if threads is None:
+        threads = list(range(1, max_threads + 1))
+    if not os.path.isfile(image):
+        print("No workload image %s" % image)
+        sys.exit(1)
+
+    configs = [vbuild.Config({'THREADS': t, 'MTASKS': m, 'TRACE': 0})
+               for t in threads for m in mtasks]
+    for c in configs:
+        err = c.check()
+        if err:
+            print("%s: %s" % (c.label, err))
+            sys.exit(1)
+
+    print("Building %d configurations" % len(configs))
+    exes = {}
+    try:
+        for r in vbuild.build_matrix(configs, jobs):
+            if not r['ok']:
+                print("%s: build FAILED, see %s" % (r['label'], r['log']))
+                sys.exit(1)
+            exes[r['label']] = r['exe']
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+
+    if hasattr(os, 'getloadavg') and os.getloadavg()[0] > 0.5:
+        print("Warning:  load average %.1f; timings will be noisy" % os.getloadavg()[0])
+
+    walls = dict((c.label, []) for c in configs)
+    ref = None
+    for n in range(reps):
+        for c in configs:
+            try:
+                (wall, instrs, cyc) = run(exes[c.label], image, cycles)
+            except RuntimeError as e:
+                print(e)
+                sys.exit(1)
+            if ref is None:
+                ref = (instrs, cyc)
+            elif (instrs, cyc) != ref:
+                print("%s: ran %d instructions in %d cycles, but %s ran %d in %d" %
+                      (c.label, instrs, cyc, configs[0].label, ref[0], ref[1]))
+                sys.exit(1)
+            walls[c.label].append(wall)
+            print("  rep %d  %-30s %8.3fs" % (n, c.label, wall))
+
+    results = []
+    for c in configs:
+        best = min(walls[c.label])
+        results.append({'THREADS': c.opts['THREADS'], 'MTASKS': c.opts['MTASKS'],
+                        'khz': round(ref[1] / best / 1000, 1),
+                        'wall': [round(w, 4) for w in walls[c.label]]})
+    best = max(results, key=lambda r: r['khz'])
+    single = [r for r in results if r['THREADS'] == 1 and r['MTASKS'] == 0]
+
+    print("\n Threads  MTasks      kHz  Speedup")
+    for r in results:
+        print("%8d %7d %8.1f %7.2fx%s" %
+              (r['THREADS'], r['MTASKS'], r['khz'],
+               r['khz'] / single[0]['khz'] if single else 1.0, '  *' if r is best else ''))
+
+    db = load_db()
+    db[platform.node()] = {'cpu': cpu_model(), 'ncpu': os.cpu_count(),
+                           'verilator': vbuild.tool_version([vbuild.VERILATOR, '--version']),
+                           'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'workload': os.path.relpath(image, TOP), 'cycles': ref[1],
+                           'best': best, 'results': results}
+    with open(vbuild.TUNE_PATH, 'w') as f:
+        json.dump(db, f, indent=1, sort_keys=True)
+    print("\nBest for %s:  THREADS=%d MTASKS=%d (%.1f kHz), recorded in %s" %
+          (platform.node(), best['THREADS'], best['MTASKS'], best['khz'],
+           os.path.relpath(vbuild.TUNE_PATH, TOP)))
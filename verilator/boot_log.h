@@ -0,0 +1,123 @@
+#ifndef BOOT_LOG_H
+#define BOOT_LOG_H
+
+/* Timestamped console log:  each line a workload writes to the debug SPR
+ * console (putch, SPR 1023 with value[15:8] == 1) or the simulator services
+ * console (verilator/simsvc.h), with the cycle its newline was written at
+ * and the running perf counter totals then, so a long run (e.g. a Linux
+ * boot, tools/linux_boot.py) can be split into phases by its console
+ * messages.  Text format:
+ *
+ *   # MR boot log: cycle <pctr name> ...
+ *   C <cycle> <count> ... <line text>
+ *   ...
+ *   E <cycle> <count> ...                 (at the end of the run)
+ *
+ * A target string can also be given; the run stops once the console output
+ * ends with it (e.g. a shell prompt, which has no newline after it).
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <string>
+#include "pctr_totals.h"
+
+#define BOOT_LOG_MAX_LINE	1024
+
+class BOOT_LOG {
+	FILE		*m_f;
+	std::string	m_target;
+	std::string	m_line;
+	std::string	m_tail;
+	uint64_t	m_counts[PCTR_NR_EVENTS];
+	uint64_t	m_nr;
+
+	void	write_counts(char type, uint64_t cycle) {
+		fprintf(m_f, "%c %llu", type, (unsigned long long)cycle);
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			fprintf(m_f, " %llu", (unsigned long long)m_counts[i]);
+	}
+
+	void	flush_line(uint64_t cycle) {
+		if (m_f) {
+			write_counts('C', cycle);
+			fprintf(m_f, " %s\n", m_line.c_str());
+		}
+		m_line.clear();
+		m_nr++;
+	}
+
+public:
+	BOOT_LOG() : m_f(0), m_nr(0) {
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] = 0;
+	}
+
+	bool	open(const char *path) {
+		m_f = fopen(path, "w");
+		if (!m_f)
+			return false;
+		fprintf(m_f, "# MR boot log: cycle");
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			fprintf(m_f, " %s", pctr_names[i]);
+		fprintf(m_f, "\n");
+		return true;
+	}
+
+	void	set_target(const char *s) { m_target = s; }
+
+	bool	active() { return m_f != 0 || !m_target.empty(); }
+
+	uint64_t	count() { return m_nr; }
+
+	/* Call once per tick with the mr_pctrs event bits */
+	void	tick(uint64_t pctrs) {
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] += (pctrs >> i) & 1;
+	}
+
+	/* A console character; returns true when the console output has
+	 * reached the target string.
+	 */
+	bool	putch(uint64_t cycle, char c) {
+		if (c == '\n') {
+			flush_line(cycle);
+		} else if (c != '\r') {
+			if (m_line.size() < BOOT_LOG_MAX_LINE)
+				m_line += c;
+		}
+		if (m_target.empty())
+			return false;
+		m_tail += c;
+		if (m_tail.size() > m_target.size())
+			m_tail.erase(0, m_tail.size() - m_target.size());
+		return m_tail == m_target;
+	}
+
+	void	close(uint64_t cycle) {
+		if (!m_f)
+			return;
+		if (!m_line.empty())
+			flush_line(cycle);
+		write_counts('E', cycle);
+		fprintf(m_f, "\n");
+		fclose(m_f);
+		m_f = 0;
+	}
+};
+
+#endif
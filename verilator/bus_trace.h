@@ -0,0 +1,169 @@
+#ifndef BUS_TRACE_H
+#define BUS_TRACE_H
+
+/* Bus transaction trace, for the memory system analyser
+ * (tools/bus_analyse.py).
+ *
+ * Follows the EMI-I and EMI-D interfaces between the CPU and the testbench
+ * memory (tb_mr_cpu_top's trace_emi_* signals) each cycle.  A transaction
+ * starts when a requester raises req, and has one beat (a cycle with valid)
+ * for a 1/2/4-byte access or four for a cache line; it's finished at the last
+ * beat.  One record is written per transaction, on completion, giving the
+ * request cycle and the first/last beat cycles as deltas from it.  A request
+ * dropped before all its beats (which the caches shouldn't do) is written
+ * with the beats seen.
+ *
+ * The header's cycles, the length of the run, is filled in on close so a
+ * reader can work out utilisation.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+
+#define BUS_TRACE_MAGIC		0x5542524d	/* "MRBU" */
+#define BUS_TRACE_VERSION	1
+
+#define BUS_TRACE_I		0
+#define BUS_TRACE_D		1
+
+#define BUS_SIZE_CL		3	/* EMI size; 0-2 are 1/2/4 bytes */
+
+struct bus_trace_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	reserved;
+	uint64_t	cycles;
+};
+
+struct bus_trace_rec {
+	uint64_t	cycle;		/* Request raised */
+	uint32_t	address;
+	uint32_t	first;		/* First beat - cycle */
+	uint32_t	last;		/* Last beat - cycle */
+	uint8_t		requester;	/* BUS_TRACE_I/D */
+	uint8_t		write;
+	uint8_t		size;
+	uint8_t		beats;
+	uint8_t		bws;		/* Write byte strobes */
+	uint8_t		reserved[7];
+};
+
+class BUS_TRACE {
+	struct port {
+		bool		active;
+		uint64_t	start;
+		uint64_t	first;
+		uint32_t	address;
+		int		write;
+		int		size;
+		int		bws;
+		int		beats;
+		int		seen;
+	};
+
+	FILE		*m_f;
+	uint64_t	m_count;
+	uint64_t	m_cycle;
+	struct port	m_port[2];
+
+	void	emit(int requester, struct port *p, uint64_t last) {
+		struct bus_trace_rec r;
+
+		memset(&r, 0, sizeof(r));
+		r.cycle = p->start;
+		r.address = p->address;
+		r.first = p->seen ? p->first - p->start : 0;
+		r.last = p->seen ? last - p->start : 0;
+		r.requester = requester;
+		r.write = p->write;
+		r.size = p->size;
+		r.beats = p->seen;
+		r.bws = p->bws;
+		fwrite(&r, sizeof(r), 1, m_f);
+		m_count++;
+		p->active = false;
+	}
+public:
+	BUS_TRACE() : m_f(0), m_count(0), m_cycle(0) {
+		memset(m_port, 0, sizeof(m_port));
+	}
+
+	~BUS_TRACE() { close(); }
+
+	bool	open(const char *path) {
+		struct bus_trace_hdr h = { BUS_TRACE_MAGIC,
+					   BUS_TRACE_VERSION,
+					   sizeof(struct bus_trace_rec),
+					   0, 0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		setvbuf(m_f, NULL, _IOFBF, 1 << 20);
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			fseek(m_f, 0, SEEK_SET);
+			struct bus_trace_hdr h = { BUS_TRACE_MAGIC,
+						   BUS_TRACE_VERSION,
+						   sizeof(struct bus_trace_rec),
+						   0, m_cycle };
+			fwrite(&h, sizeof(h), 1, m_f);
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick per requester, with the EMI's signals */
+	void	sample(uint64_t cycle, int requester, bool req, bool valid,
+		       uint32_t address, int size, bool write, int bws) {
+		struct port *p = &m_port[requester];
+
+		m_cycle = cycle;
+		if (!p->active) {
+			if (!req)
+				return;
+			p->active = true;
+			p->start = cycle;
+			p->address = address;
+			p->write = write;
+			p->size = size;
+			p->bws = write ? bws : 0;
+			p->beats = (size == BUS_SIZE_CL) ? 4 : 1;
+			p->seen = 0;
+		} else if (!req) {
+			emit(requester, p, cycle - 1);
+			return;
+		}
+		if (valid) {
+			if (p->seen++ == 0)
+				p->first = cycle;
+			if (p->seen == p->beats)
+				emit(requester, p, cycle);
+		}
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
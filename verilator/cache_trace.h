@@ -0,0 +1,126 @@
+#ifndef CACHE_TRACE_H
+#define CACHE_TRACE_H
+
+/* Cache access trace, for the trace-driven cache model (tools/cache_sim.py).
+ *
+ * Watches the I- and D-side cache.v instances each cycle (via their SIM-only
+ * trace_* wires), recording two kinds of event:
+ * - LOOKUP:  an enabled cycle in the LOOKUP state; address, request type,
+ *            whether it hit and whether it accepted a new request.  A
+ *            held/retried request gives repeated lookups, only the first
+ *            flagged NEW.
+ * - ALLOC:   a line's tag is about to be written by a fill or dcbz; records
+ *            the way and the cycle_count that destination_way moves on by.
+ * - CANCEL:  the requester dropped enable part-way through the last NEW
+ *            request's fill, spill or CMO, abandoning it.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#define CACHE_TRACE_MAGIC	0x4143524d	/* "MRCA" */
+#define CACHE_TRACE_VERSION	3
+
+#define CACHE_TRACE_I		0
+#define CACHE_TRACE_D		1
+
+#define CACHE_TRACE_EV_LOOKUP	0
+#define CACHE_TRACE_EV_ALLOC	1
+#define CACHE_TRACE_EV_CANCEL	2
+
+#define CACHE_TRACE_LOOKUP_HIT	1	/* LOOKUP info flags */
+#define CACHE_TRACE_LOOKUP_NEW	2
+
+struct cache_trace_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	reserved;
+};
+
+struct cache_trace_rec {
+	uint64_t	cycle;
+	uint32_t	address;
+	uint8_t		cache;		/* CACHE_TRACE_I/D */
+	uint8_t		event;		/* CACHE_TRACE_EV_* */
+	uint8_t		req;		/* LOOKUP: C_REQ_*; ALLOC: way */
+	uint8_t		info;		/* LOOKUP: flags; ALLOC: cycle_count */
+};
+
+class CACHE_TRACE {
+	FILE		*m_f;
+	uint64_t	m_count;
+
+	void	write(uint64_t cycle, uint32_t addr, int cache, int ev,
+		      int req, int info) {
+		struct cache_trace_rec r;
+
+		r.cycle = cycle;
+		r.address = addr;
+		r.cache = cache;
+		r.event = ev;
+		r.req = req;
+		r.info = info;
+		fwrite(&r, sizeof(r), 1, m_f);
+		m_count++;
+	}
+public:
+	CACHE_TRACE() : m_f(0), m_count(0) {}
+
+	~CACHE_TRACE() { close(); }
+
+	bool	open(const char *path) {
+		struct cache_trace_hdr h = { CACHE_TRACE_MAGIC,
+					     CACHE_TRACE_VERSION,
+					     sizeof(struct cache_trace_rec),
+					     0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		setvbuf(m_f, NULL, _IOFBF, 1 << 20);
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick per cache, with the state following the edge */
+	template<class C> void	sample(uint64_t cycle, int cache, C *c) {
+		if (c->trace_lookup)
+			write(cycle, c->trace_address, cache, CACHE_TRACE_EV_LOOKUP,
+			      c->trace_request,
+			      (c->trace_hit ? CACHE_TRACE_LOOKUP_HIT : 0) |
+			      (c->trace_new ? CACHE_TRACE_LOOKUP_NEW : 0));
+		if (c->trace_alloc)
+			write(cycle, c->trace_address, cache, CACHE_TRACE_EV_ALLOC,
+			      c->trace_way, c->trace_cycle_count);
+		if (c->trace_cancel)
+			write(cycle, c->trace_address, cache, CACHE_TRACE_EV_CANCEL,
+			      0, 0);
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
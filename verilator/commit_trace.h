@@ -0,0 +1,90 @@
+#ifndef COMMIT_TRACE_H
+#define COMMIT_TRACE_H
+
+/* Binary commit trace, written from the WB stage's inputs.
+ *
+ * One record per instruction (or fault) presented to WB.  The file starts
+ * with a small header; records are fixed-size, host-endian, so the Python
+ * side (tools/mr_trace.py) can memmap the lot.  Keep the two in step!
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#define COMMIT_TRACE_MAGIC	0x5443524d	/* "MRCT" */
+#define COMMIT_TRACE_VERSION	1
+
+struct commit_trace_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	reserved;
+};
+
+struct commit_trace_rec {
+	uint64_t	cycle;
+	uint32_t	pc;
+	uint32_t	instr;
+	uint32_t	msr;
+	uint32_t	ea;		/* MEM's EA; meaningful for ld/st only */
+	uint32_t	fault;		/* FC_* value, 0 for a real commit */
+	uint32_t	reserved;
+};
+
+class COMMIT_TRACE {
+	FILE		*m_f;
+	uint64_t	m_count;
+public:
+	COMMIT_TRACE() : m_f(0), m_count(0) {}
+
+	~COMMIT_TRACE() { close(); }
+
+	bool	open(const char *path) {
+		struct commit_trace_hdr h = { COMMIT_TRACE_MAGIC,
+					      COMMIT_TRACE_VERSION,
+					      sizeof(struct commit_trace_rec),
+					      0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		/* Big buffer; this gets written every few cycles */
+		setvbuf(m_f, NULL, _IOFBF, 1 << 20);
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	void	record(uint64_t cycle, uint32_t pc, uint32_t instr,
+		       uint32_t msr, uint32_t ea, uint32_t fault) {
+		struct commit_trace_rec r = { cycle, pc, instr, msr,
+					      ea, fault, 0 };
+		fwrite(&r, sizeof(r), 1, m_f);
+		m_count++;
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
@@ -0,0 +1,301 @@
+#ifndef COVERAGE_H
+#define COVERAGE_H
+
+/* Decode and pipeline-corner coverage, for finding what a regression never
+ * exercises (tools/coverage.py merges and reports it).
+ *
+ * Each instruction or fault reaching WB is looked up in the decoder's leaves
+ * (auto_cover.h, generated by mk_decode.py -c alongside the RTL decoder), and
+ * its leaf and fault type counted.  Looking at it with the instruction before
+ * it, and at what's behind it in the pipeline latches (mr_cpu_top's
+ * trace_pipe_* signals), gives counts of the corners in docs/test_plan.txt:
+ * faults in the shadow of a branch or isync, exceptions and branches in the
+ * last words of a page, ISIs on the first word of a page, stores squashed
+ * behind a fault or a taken branch, translation changes by mtmsr, and
+ * icbi/isync and TLB invalidation/sync sequences.  The perf counter events
+ * are counted too.
+ *
+ * The counters live in a file mapped shared (e.g. under /dev/shm), so they
+ * can be read during a run; each run writes its own, and the tool sums them.
+ * The file describes itself:  a header giving the section sizes, the leaves'
+ * names and PPC.csv rows and the corner names, then the counters.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include "auto_cover.h"
+#include "pctr_totals.h"
+
+#define COVER_MAGIC		0x5643524d	/* "MRCV" */
+#define COVER_VERSION		1
+
+#define COVER_NAME_LEN		24
+#define COVER_NR_FAULTS		16		/* FC_* codes */
+#define COVER_NEAR		8		/* Commits, for icbi..isync etc. */
+
+/* include/decode_enums.vh */
+#define COVER_FC_IRQ		1
+#define COVER_FC_DEC		2
+#define COVER_FC_ISI_TF		8
+#define COVER_FC_ISI_NX		10
+#define COVER_FC_DSI_TF_R	12
+
+#define COVER_MSR_IR_DR		0x30
+
+enum {
+	CORNER_FAULT_AFTER_BRANCH_NT,	/* Fault on a not-taken branch's successor */
+	CORNER_FAULT_AT_BRANCH_TARGET,
+	CORNER_FAULT_AFTER_ISYNC,
+	CORNER_EXC_PAGE_END,		/* Exception in a page's last 4 words */
+	CORNER_BRANCH_PAGE_END,		/* Taken branch in a page's last 4 words */
+	CORNER_ISI_PAGE_START,		/* ISI running on into a page */
+	CORNER_DSI_PAGE_END,
+	CORNER_STORE_IN_EXC_SHADOW,	/* Store behind a faulting instruction */
+	CORNER_STORE_IN_BRANCH_SHADOW,	/* Store in DE as a taken branch executes */
+	CORNER_MTMSR_XLATE,		/* mtmsr changing IR/DR */
+	CORNER_ICBI_ISYNC,		/* isync soon after icbi */
+	CORNER_TLBI_SYNC,		/* sync soon after tlbie/tlbia */
+	COVER_NR_CORNERS
+};
+
+static const char *cover_corner_names[COVER_NR_CORNERS] = {
+	"fault_after_branch_nt",
+	"fault_at_branch_target",
+	"fault_after_isync",
+	"exc_page_end",
+	"branch_page_end",
+	"isi_page_start",
+	"dsi_page_end",
+	"store_in_exc_shadow",
+	"store_in_branch_shadow",
+	"mtmsr_xlate",
+	"icbi_isync",
+	"tlbi_sync",
+};
+
+struct cover_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	nr_leaves;
+	uint32_t	nr_corners;
+	uint32_t	nr_faults;
+	uint32_t	nr_pctrs;
+	uint32_t	name_len;
+	uint32_t	reserved;
+	uint64_t	runs;		/* Merged blocks sum these */
+	uint64_t	cycles;
+	uint64_t	records;	/* Reaching WB, including faults */
+};
+
+struct cover_leaf_rec {
+	int32_t		csv_row;	/* -1 for "not decoded" */
+	uint32_t	kind;		/* COV_* */
+	char		name[COVER_NAME_LEN];
+};
+
+class COVERAGE {
+	struct cover_hdr	*m_hdr;
+	size_t		m_size;
+	uint64_t	*m_leaves;
+	uint64_t	*m_corners;
+	uint64_t	*m_faults;
+	uint64_t	*m_pctrs;
+
+	/* The previous WB record */
+	bool		m_prev;
+	uint32_t	m_prev_pc;
+	uint32_t	m_prev_msr;
+	int		m_prev_kind;
+	int		m_prev_fault;
+
+	bool		m_shadow_store;	/* A store's behind the branch at */
+	uint32_t	m_shadow_pc;
+	uint64_t	m_icbi_at;	/* Record counts */
+	uint64_t	m_tlbi_at;
+
+	static bool	page_end(uint32_t pc) { return (pc & 0xfff) >= 0xff0; }
+
+	static bool	has_instr(int fault) {
+		return fault != COVER_FC_IRQ && fault != COVER_FC_DEC &&
+			!(fault >= COVER_FC_ISI_TF && fault <= COVER_FC_ISI_NX);
+	}
+
+	void	corner(int c) { m_corners[c]++; }
+
+public:
+	COVERAGE() : m_hdr(0), m_size(0), m_prev(false), m_shadow_store(false),
+		     m_icbi_at(0), m_tlbi_at(0) {}
+
+	~COVERAGE() { close(); }
+
+	bool	open(const char *path) {
+		size_t names = COVER_NR_LEAVES * sizeof(struct cover_leaf_rec) +
+			COVER_NR_CORNERS * COVER_NAME_LEN;
+		size_t counts = (COVER_NR_LEAVES + COVER_NR_CORNERS + COVER_NR_FAULTS +
+				 PCTR_NR_EVENTS) * sizeof(uint64_t);
+		int fd = ::open(path, O_RDWR | O_CREAT | O_TRUNC, 0644);
+		void *p;
+
+		if (fd < 0)
+			return false;
+		m_size = sizeof(struct cover_hdr) + names + counts;
+		if (ftruncate(fd, m_size) < 0) {
+			::close(fd);
+			return false;
+		}
+		p = mmap(0, m_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+		::close(fd);
+		if (p == MAP_FAILED)
+			return false;
+
+		m_hdr = (struct cover_hdr *)p;
+		m_hdr->version = COVER_VERSION;
+		m_hdr->nr_leaves = COVER_NR_LEAVES;
+		m_hdr->nr_corners = COVER_NR_CORNERS;
+		m_hdr->nr_faults = COVER_NR_FAULTS;
+		m_hdr->nr_pctrs = PCTR_NR_EVENTS;
+		m_hdr->name_len = COVER_NAME_LEN;
+		m_hdr->runs = 1;
+
+		struct cover_leaf_rec *l = (struct cover_leaf_rec *)(m_hdr + 1);
+		for (int i = 0; i < COVER_NR_LEAVES; i++) {
+			l[i].csv_row = cover_leaves[i].csv_row;
+			l[i].kind = cover_leaves[i].kind;
+			strncpy(l[i].name, cover_leaves[i].name, COVER_NAME_LEN - 1);
+		}
+		char *cn = (char *)(l + COVER_NR_LEAVES);
+		for (int i = 0; i < COVER_NR_CORNERS; i++)
+			strncpy(cn + i * COVER_NAME_LEN, cover_corner_names[i], COVER_NAME_LEN - 1);
+
+		m_leaves = (uint64_t *)(cn + COVER_NR_CORNERS * COVER_NAME_LEN);
+		m_corners = m_leaves + COVER_NR_LEAVES;
+		m_faults = m_corners + COVER_NR_CORNERS;
+		m_pctrs = m_faults + COVER_NR_FAULTS;
+		/* Last, so a reader sees a complete header: */
+		m_hdr->magic = COVER_MAGIC;
+		return true;
+	}
+
+	void	close() {
+		if (m_hdr) {
+			munmap(m_hdr, m_size);
+			m_hdr = 0;
+		}
+	}
+
+	bool	active() { return m_hdr != 0; }
+
+	/* Call once per tick, with the perf events, the pipeline latches (in
+	 * front of DE, EXE, MEM, WB; valid bit n for latch n) and the fault
+	 * code at WB.
+	 */
+	void	tick(uint64_t pctrs, unsigned valid, const uint32_t *pcs,
+		     const uint32_t *instrs, uint32_t wb_msr, int wb_fault) {
+		m_hdr->cycles++;
+		for (uint64_t p = pctrs & ((1ULL << PCTR_NR_EVENTS) - 1); p; p &= p - 1)
+			m_pctrs[__builtin_ctzll(p)]++;
+
+		/* A branch executing, with a store in DE behind it: */
+		if ((valid & 3) == 3 && pcs[0] == pcs[1] + 4 &&
+		    (cover_leaves[cover_decode(instrs[1])].kind & COV_BRANCH) &&
+		    (cover_leaves[cover_decode(instrs[0])].kind & COV_STORE)) {
+			m_shadow_store = true;
+			m_shadow_pc = pcs[1];
+		}
+
+		if (valid & 8)
+			record(valid, pcs, instrs, wb_msr, wb_fault);
+	}
+
+	void	record(unsigned valid, const uint32_t *pcs, const uint32_t *instrs,
+		       uint32_t msr, int fault) {
+		uint32_t pc = pcs[3];
+		int kind = 0;
+
+		m_hdr->records++;
+		if (has_instr(fault)) {
+			int leaf = cover_decode(instrs[3]);
+
+			m_leaves[leaf]++;
+			kind = cover_leaves[leaf].kind;
+		}
+		if (fault) {
+			m_faults[fault & (COVER_NR_FAULTS - 1)]++;
+			if (page_end(pc)) {
+				corner(CORNER_EXC_PAGE_END);
+				if (fault >= COVER_FC_DSI_TF_R)
+					corner(CORNER_DSI_PAGE_END);
+			}
+			for (int i = 0; i < 3; i++) {
+				if ((valid & (1 << i)) &&
+				    (cover_leaves[cover_decode(instrs[i])].kind & COV_STORE)) {
+					corner(CORNER_STORE_IN_EXC_SHADOW);
+					break;
+				}
+			}
+		}
+
+		if (m_prev) {
+			bool seq = pc == m_prev_pc + 4;
+
+			if ((m_prev_kind & COV_BRANCH) && !m_prev_fault) {
+				if (fault)
+					corner(seq ? CORNER_FAULT_AFTER_BRANCH_NT :
+					       CORNER_FAULT_AT_BRANCH_TARGET);
+				if (!seq && page_end(m_prev_pc))
+					corner(CORNER_BRANCH_PAGE_END);
+				if (!seq && m_shadow_store && m_shadow_pc == m_prev_pc)
+					corner(CORNER_STORE_IN_BRANCH_SHADOW);
+				m_shadow_store = false;
+			}
+			if (fault && (m_prev_kind & COV_ISYNC) && !m_prev_fault)
+				corner(CORNER_FAULT_AFTER_ISYNC);
+			if (fault >= COVER_FC_ISI_TF && fault <= COVER_FC_ISI_NX &&
+			    seq && (pc & 0xfff) == 0)
+				corner(CORNER_ISI_PAGE_START);
+			if ((m_prev_kind & COV_MTMSR) && !m_prev_fault &&
+			    ((msr ^ m_prev_msr) & COVER_MSR_IR_DR))
+				corner(CORNER_MTMSR_XLATE);
+		}
+
+		if (!fault) {
+			if (kind & COV_ICBI)
+				m_icbi_at = m_hdr->records;
+			if (kind & COV_TLBI)
+				m_tlbi_at = m_hdr->records;
+			if ((kind & COV_ISYNC) && m_icbi_at &&
+			    m_hdr->records - m_icbi_at <= COVER_NEAR)
+				corner(CORNER_ICBI_ISYNC);
+			if ((kind & COV_SYNC) && m_tlbi_at &&
+			    m_hdr->records - m_tlbi_at <= COVER_NEAR)
+				corner(CORNER_TLBI_SYNC);
+		}
+
+		m_prev = true;
+		m_prev_pc = pc;
+		m_prev_msr = msr;
+		m_prev_kind = kind;
+		m_prev_fault = fault;
+	}
+
+	uint64_t	records() { return m_hdr ? m_hdr->records : 0; }
+};
+
+#endif
@@ -14,10 +14,35 @@
  */
 
 #include <stdlib.h>
+#include <string.h>
 #include <unistd.h>
 #include "testbench.h"
+#include "commit_trace.h"
+#include "pc_sampler.h"
+#include "cache_trace.h"
+#include "mmu_trace.h"
+#include "pctr_totals.h"
+#include "pipe_trace.h"
+#include "bus_trace.h"
+#include "mem_model.h"
+#include "coverage.h"
+#include "sim_speed.h"
+#include "boot_log.h"
+#include "simsvc.h"
 
 TESTBENCH<Vwrapper_top> *tb;
+COMMIT_TRACE ctrace;
+PC_SAMPLER psampler;
+CACHE_TRACE catrace;
+MMU_TRACE mtrace;
+PCTR_TOTALS ptotals;
+PIPE_TRACE ptrace;
+BUS_TRACE btrace;
+MEM_MODEL mmodel;
+COVERAGE cover;
+SIM_SPEED speed;
+BOOT_LOG bootlog;
+SIMSVC simsvc;
 
 double sc_time_stamp ()
 {
@@ -26,10 +51,90 @@ double sc_time_stamp ()
 
 static void print_help(char *nom)
 {
-	fprintf(stderr, "Syntax:\n\t%s [-t <VCD filename>]\n",
+	fprintf(stderr, "Syntax:\n\t%s [-t <VCD filename>] [-c <commit trace filename>]\n"
+		"\t\t[-p <PC sample filename>] [-P <sample period>] [-S de|wb]\n"
+		"\t\t[-a <cache access trace filename>] [-m <MMU trace filename>]\n"
+		"\t\t[-C <perf counter totals filename>] [-o <pipeline trace filename>]\n"
+		"\t\t[-b <bus transaction trace filename>] [-M <memory timing file>]\n"
+		"\t\t[-V <coverage counters filename>]\n"
+		"\t\t[-L <console log filename>] [-x <console string to stop at>]\n"
+		"\t\t[-R <perf counter snapshot filename>] [-W (trace in guest windows)]\n"
+		"\t\t[-n <max cycles>] [-s <speed report interval, cycles>]\n",
 		nom);
 }
 
+/* Gives the testbench memory's stalls for the next cycle from the timing
+ * model, from the EMI requests the last cycle left.  The stalls feed the EMIs'
+ * valid combinationally, so they're settled before the clock edge.
+ */
+static void mem_model_step()
+{
+	auto *top = tb->getTop();
+	auto *tmct = top->tb_top->TMCT;
+	bool req[2] = { (bool)tmct->trace_emi_i_req, (bool)tmct->trace_emi_d_req };
+	uint32_t address[2] = { tmct->trace_emi_i_address, tmct->trace_emi_d_address };
+	int size[2] = { tmct->trace_emi_i_size, tmct->trace_emi_d_size };
+	bool write[2] = { false, !tmct->trace_emi_d_rnw };
+	bool stall[2];
+
+	mmodel.step(tb->get_tickcount() + 1, req, address, size, write, stall);
+	top->mem_stall_ext = (stall[MEM_MODEL_D] << 1) | stall[MEM_MODEL_I];
+	top->eval();
+}
+
+/* Services an access to the simulator services window, in the cycle before
+ * the edge completing it:  a read's data is set up for the edge to capture.
+ */
+static simsvc_event simsvc_step(uint32_t *wdata)
+{
+	auto *top = tb->getTop();
+	auto *tmct = top->tb_top->TMCT;
+	bool write = !tmct->trace_emi_d_rnw;
+	uint32_t rdata;
+
+	*wdata = tmct->simsvc_wdata;
+	simsvc_event ev = simsvc.access(tb->get_tickcount() + 1, tmct->simsvc_offset,
+					write, *wdata, &rdata,
+					tmct->CPU->WB->counter_instr_commit);
+	if (!write) {
+		top->simsvc_rdata = rdata;
+		top->eval();
+	}
+	return ev;
+}
+
+/* The run loop samples the cache trace after each tick, so the state
+ * following the last reset tick (the first request's lookup) is sampled here.
+ */
+static void	cache_trace_reset_sample()
+{
+	auto *cpu = tb->getTop()->tb_top->TMCT->CPU;
+
+	if (!catrace.active() || !simsvc.in_window())
+		return;
+	catrace.sample(tb->get_tickcount(), CACHE_TRACE_I, cpu->IF->ITC->ICACHE);
+	catrace.sample(tb->get_tickcount(), CACHE_TRACE_D, cpu->MEM->DTC->DCACHE);
+}
+
+/* After an armed simulator services run ends, the CPU is reset, which
+ * re-enters the packed image's dispatcher (tools/pack_tests.py).
+ */
+static void	cpu_reset()
+{
+	tb->getTop()->mem_stall_ext = 3;
+	tb->reset();
+	if (mmodel.active())
+		mmodel.reset(tb->get_tickcount());
+	cache_trace_reset_sample();
+}
+
+static void	run_reset(simsvc_run_end how, uint32_t status)
+{
+	simsvc.run_end(how, status, tb->get_tickcount(),
+		       tb->getTop()->tb_top->TMCT->CPU->WB->counter_instr_commit);
+	cpu_reset();
+}
+
 /* Tracing:
  * Since I'm using --trace on the command-line, can use $dumpfile/$dumpvars.
  *
@@ -40,11 +145,13 @@ int main(int argc, char **argv)
 {
 	char *exe_name = argv[0];
 	char ch;
+	char *psample_name = NULL;
+	uint64_t max_cycles = 0;
 
 	Verilated::commandArgs(argc, argv);
         tb = new TESTBENCH<Vwrapper_top>();
 
-	while ((ch = getopt(argc, argv, "t:h")) != -1) {
+	while ((ch = getopt(argc, argv, "t:c:p:P:S:a:m:C:o:b:M:V:L:x:R:Wn:s:h")) != -1) {
                 switch (ch) {
                         case 't':
 				printf("Writing VCD trace to %s\n", optarg);
@@ -54,6 +161,119 @@ int main(int argc, char **argv)
 				tb->opentrace(optarg);
                                 break;
 
+			case 'c':
+				if (!ctrace.open(optarg)) {
+					fprintf(stderr, "Can't open commit trace %s\n", optarg);
+					return 1;
+				}
+				printf("Writing commit trace to %s\n", optarg);
+				break;
+
+			case 'p':
+				psample_name = optarg;
+				break;
+
+			case 'P':
+				psampler.set_period(strtoull(optarg, NULL, 0));
+				break;
+
+			case 'S':
+				if (!strcmp(optarg, "de")) {
+					psampler.set_stage(PC_SAMPLE_STAGE_DE);
+				} else if (!strcmp(optarg, "wb")) {
+					psampler.set_stage(PC_SAMPLE_STAGE_WB);
+				} else {
+					print_help(exe_name);
+					return 1;
+				}
+				break;
+
+			case 'a':
+				if (!catrace.open(optarg)) {
+					fprintf(stderr, "Can't open cache trace %s\n", optarg);
+					return 1;
+				}
+				printf("Writing cache access trace to %s\n", optarg);
+				break;
+
+			case 'm':
+				if (!mtrace.open(optarg)) {
+					fprintf(stderr, "Can't open MMU trace %s\n", optarg);
+					return 1;
+				}
+				printf("Writing MMU trace to %s\n", optarg);
+				break;
+
+			case 'C':
+				if (!ptotals.open(optarg)) {
+					fprintf(stderr, "Can't open perf counter totals %s\n", optarg);
+					return 1;
+				}
+				printf("Writing perf counter totals to %s\n", optarg);
+				break;
+
+			case 'o':
+				if (!ptrace.open(optarg)) {
+					fprintf(stderr, "Can't open pipeline trace %s\n", optarg);
+					return 1;
+				}
+				printf("Writing pipeline trace to %s\n", optarg);
+				break;
+
+			case 'b':
+				if (!btrace.open(optarg)) {
+					fprintf(stderr, "Can't open bus trace %s\n", optarg);
+					return 1;
+				}
+				printf("Writing bus transaction trace to %s\n", optarg);
+				break;
+
+			case 'M':
+				if (!mmodel.load(optarg))
+					return 1;
+				printf("Memory timing from %s\n", optarg);
+				break;
+
+			case 'V':
+				if (!cover.open(optarg)) {
+					fprintf(stderr, "Can't open coverage file %s\n", optarg);
+					return 1;
+				}
+				printf("Writing coverage counters to %s\n", optarg);
+				break;
+
+			case 'L':
+				if (!bootlog.open(optarg)) {
+					fprintf(stderr, "Can't open console log %s\n", optarg);
+					return 1;
+				}
+				printf("Writing console log to %s\n", optarg);
+				break;
+
+			case 'x':
+				bootlog.set_target(optarg);
+				break;
+
+			case 'R':
+				if (!simsvc.open_snapshots(optarg)) {
+					fprintf(stderr, "Can't open snapshot file %s\n", optarg);
+					return 1;
+				}
+				printf("Writing perf counter snapshots to %s\n", optarg);
+				break;
+
+			case 'W':
+				simsvc.set_windowed();
+				break;
+
+			case 'n':
+				max_cycles = strtoull(optarg, NULL, 0);
+				break;
+
+			case 's':
+				speed.set_interval(strtoull(optarg, NULL, 0));
+				break;
+
 			case 'h':
 			default:
 				print_help(exe_name);
@@ -61,28 +281,239 @@ int main(int argc, char **argv)
 		}
 	}
 
+	// Opened after parsing, as the header records period/stage:
+	if (psample_name) {
+		if (!psampler.open(psample_name)) {
+			fprintf(stderr, "Can't open PC sample file %s\n", psample_name);
+			return 1;
+		}
+		printf("Writing PC samples to %s\n", psample_name);
+	}
+
 	//////////////////////////////////////////////////////////////////////
 
+	tb->getTop()->mem_timing_ext = mmodel.active();
+	tb->getTop()->mem_stall_ext = 3;
         tb->reset();
+	cache_trace_reset_sample();
+	speed.start(tb->get_tickcount());
+
+	// Used every tick; the model's hierarchy doesn't move
+	auto *tmct = tb->getTop()->tb_top->TMCT;
+	auto *cpu = tmct->CPU;
+	// The guest's exit status (debug SPR or simulator services EXIT)
+	uint32_t exit_status = 0;
 
 	while(!tb->done()) {
+		bool debug_exit = cpu->trace_debug_wr &&
+			((cpu->trace_debug_value >> 8) & 0xff) == 0;
+
+		// An armed run's exits, before the edge that would $finish
+		if (simsvc.armed()) {
+			if (debug_exit) {
+				run_reset(SIMSVC_RUN_DEBUG, cpu->trace_debug_value & 0xff);
+				continue;
+			}
+			if (simsvc.over_limit(tb->get_tickcount())) {
+				run_reset(SIMSVC_RUN_LIMIT, 0);
+				continue;
+			}
+		}
+		if (debug_exit)
+			exit_status = cpu->trace_debug_value & 0xff;
+		if (mmodel.active())
+			mem_model_step();
+		int svc_char = -1;
+		if (tmct->simsvc_req) {
+			uint32_t wdata;
+			simsvc_event ev = simsvc_step(&wdata);
+
+			if (ev == SIMSVC_EV_EXIT) {
+				printf("*** Simulator exit: Exiting\nEXIT = %u\n", simsvc.status());
+				exit_status = simsvc.status();
+				break;
+			} else if (ev == SIMSVC_EV_RESET) {
+				cpu_reset();
+				continue;
+			} else if (ev == SIMSVC_EV_PUTC) {
+				svc_char = wdata & 0xff;
+			}
+		}
 		tb->tick();
+		speed.tick(tb->get_tickcount());
+		bool in_window = simsvc.in_window();
+
+		if (in_window && ctrace.active()) {
+			auto *wb = cpu->WB;
+
+			if (wb->memory_valid)
+				ctrace.record(tb->get_tickcount(),
+					      wb->memory_pc, wb->memory_instr,
+					      wb->memory_msr, wb->memory_addr,
+					      wb->memory_fault);
+		}
+
+		if (in_window && psampler.active()) {
+			if (psampler.stage() == PC_SAMPLE_STAGE_WB)
+				psampler.tick(tb->get_tickcount(), tmct->pctrs,
+					      cpu->WB->memory_valid,
+					      cpu->WB->memory_pc);
+			else
+				psampler.tick(tb->get_tickcount(), tmct->pctrs,
+					      cpu->decode_valid,
+					      cpu->decode_pc);
+		}
+
+		if (in_window && catrace.active()) {
+			catrace.sample(tb->get_tickcount(), CACHE_TRACE_I,
+				       cpu->IF->ITC->ICACHE);
+			catrace.sample(tb->get_tickcount(), CACHE_TRACE_D,
+				       cpu->MEM->DTC->DCACHE);
+		}
+
+		if (in_window && mtrace.active()) {
+			auto *sprf = cpu->DE->SPRF;
+			uint32_t sprs[MMU_TRACE_NR_SPRS] = {
+				sprf->as_SDR1,
+				sprf->as_IBAT0U, sprf->as_IBAT0L,
+				sprf->as_IBAT1U, sprf->as_IBAT1L,
+				sprf->as_IBAT2U, sprf->as_IBAT2L,
+				sprf->as_IBAT3U, sprf->as_IBAT3L,
+				sprf->as_DBAT0U, sprf->as_DBAT0L,
+				sprf->as_DBAT1U, sprf->as_DBAT1L,
+				sprf->as_DBAT2U, sprf->as_DBAT2L,
+				sprf->as_DBAT3U, sprf->as_DBAT3L };
+
+			mtrace.sample_state(tb->get_tickcount(),
+					    cpu->MEM->segment, sprs);
+			mtrace.sample(tb->get_tickcount(), MMU_TRACE_I,
+				      cpu->IF->ITC->IMMU);
+			mtrace.sample(tb->get_tickcount(), MMU_TRACE_D,
+				      cpu->MEM->DTC->DMMU);
+			mtrace.count_pctrs(tmct->pctrs);
+		}
+
+		if (ptotals.active())
+			ptotals.tick(tmct->pctrs);
+
+		if (in_window && ptrace.active()) {
+			uint32_t pcs[PIPE_NR_LATCHES] = {
+				cpu->trace_pipe_pc0, cpu->trace_pipe_pc1,
+				cpu->trace_pipe_pc2, cpu->trace_pipe_pc3 };
+			uint32_t instrs[PIPE_NR_LATCHES] = {
+				cpu->trace_pipe_instr0, cpu->trace_pipe_instr1,
+				cpu->trace_pipe_instr2, cpu->trace_pipe_instr3 };
+
+			ptrace.tick(tb->get_tickcount(), cpu->trace_pipe_valid,
+				    cpu->trace_pipe_stall, pcs, instrs,
+				    cpu->trace_pipe_fault);
+		}
+
+		if (in_window && btrace.active()) {
+			btrace.sample(tb->get_tickcount(), BUS_TRACE_I,
+				      tmct->trace_emi_i_req, tmct->trace_emi_i_valid,
+				      tmct->trace_emi_i_address, tmct->trace_emi_i_size,
+				      false, 0);
+			btrace.sample(tb->get_tickcount(), BUS_TRACE_D,
+				      tmct->trace_emi_d_req, tmct->trace_emi_d_valid,
+				      tmct->trace_emi_d_address, tmct->trace_emi_d_size,
+				      !tmct->trace_emi_d_rnw, tmct->trace_emi_d_bws);
+		}
+		if (in_window && cover.active()) {
+			uint32_t pcs[PIPE_NR_LATCHES] = {
+				cpu->trace_pipe_pc0, cpu->trace_pipe_pc1,
+				cpu->trace_pipe_pc2, cpu->trace_pipe_pc3 };
+			uint32_t instrs[PIPE_NR_LATCHES] = {
+				cpu->trace_pipe_instr0, cpu->trace_pipe_instr1,
+				cpu->trace_pipe_instr2, cpu->trace_pipe_instr3 };
+
+			cover.tick(tmct->pctrs,
+				   cpu->trace_pipe_valid, pcs, instrs,
+				   cpu->WB->memory_msr, cpu->WB->memory_fault);
+		}
+		if (simsvc.counting())
+			simsvc.tick(tmct->pctrs);
+		if (svc_char >= 0)
+			putchar(svc_char);
+		if (bootlog.active()) {
+			bool reached = false;
+
+			bootlog.tick(tmct->pctrs);
+			if (cpu->trace_debug_wr && ((cpu->trace_debug_value >> 8) & 0xff) == 1)
+				reached = bootlog.putch(tb->get_tickcount(), cpu->trace_debug_value & 0xff);
+			if (svc_char >= 0)
+				reached |= bootlog.putch(tb->get_tickcount(), svc_char);
+			if (reached) {
+				printf("\n*** Console target reached: Exiting\n");
+				break;
+			}
+		}
 #ifdef EXIT_B_SELF
-		// If a valid instruction with IRQs off
-		if (tb->getTop()->tb_top->TMCT->CPU->decode_valid &&
-		    !(tb->getTop()->tb_top->TMCT->CPU->DE->decode_msr_r & 0x00008000) &&
-		    (tb->getTop()->tb_top->TMCT->CPU->DE->decode_instr_r == 0x48000000)) {
+		// If a valid instruction with IRQs off (guests can instead exit
+		// with the simulator services, and builds drop this check)
+		if (cpu->decode_valid &&
+		    !(cpu->DE->decode_msr_r & 0x00008000) &&
+		    (cpu->DE->decode_instr_r == 0x48000000)) {
+			if (simsvc.armed()) {
+				run_reset(SIMSVC_RUN_B_SELF, 0);
+				continue;
+			}
 			printf("*** Branch to self: Exiting\n");
 			break;
 		}
 #endif
+		// For workloads which don't exit (e.g. an OS boot)
+		if (max_cycles && tb->get_tickcount() >= max_cycles) {
+			printf("*** Cycle limit reached: Exiting\n");
+			break;
+		}
 	}
 
         printf("Complete:  Committed %d instructions, %d stall cycles, %lld cycles total\n",
-               tb->getTop()->tb_top->TMCT->CPU->WB->counter_instr_commit,
-               tb->getTop()->tb_top->TMCT->CPU->WB->counter_stall_cycle,
+               cpu->WB->counter_instr_commit,
+               cpu->WB->counter_stall_cycle,
                tb->get_tickcount());
+	speed.finish(tb->get_tickcount());
+	if (ctrace.active())
+		printf("Commit trace:  %lld records\n", (long long)ctrace.count());
+	ctrace.close();
+	if (psampler.active())
+		printf("PC samples:  %lld\n", (long long)psampler.count());
+	psampler.close();
+	if (catrace.active())
+		printf("Cache trace:  %lld records\n", (long long)catrace.count());
+	catrace.close();
+	if (mtrace.active()) {
+		mtrace.close();
+		printf("MMU trace:  %lld records\n", (long long)mtrace.count());
+	}
+	if (ptrace.active()) {
+		ptrace.close();
+		printf("Pipeline trace:  %lld records\n", (long long)ptrace.count());
+	}
+	if (btrace.active()) {
+		btrace.close();
+		printf("Bus trace:  %lld transactions\n", (long long)btrace.count());
+	}
+	if (mmodel.active())
+		mmodel.report();
+	if (cover.active()) {
+		printf("Coverage:  %lld records\n", (long long)cover.records());
+		cover.close();
+	}
+	if (bootlog.active()) {
+		bootlog.close(tb->get_tickcount());
+		printf("Console log:  %lld lines\n", (long long)bootlog.count());
+	}
+	if (simsvc.snapshots())
+		printf("Perf counter snapshots:  %lld\n", (long long)simsvc.snapshots());
+	if (simsvc.runs())
+		printf("Packed runs:  %lld\n", (long long)simsvc.runs());
+	simsvc.close();
+	if (!ptotals.close())
+		fprintf(stderr, "Can't write perf counter totals\n");
 
-        exit(EXIT_SUCCESS);
+	// Saturated, so that no failing status reads as success
+        exit(exit_status > 255 ? 255 : exit_status);
 }
 
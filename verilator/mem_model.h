@@ -0,0 +1,288 @@
+#ifndef MEM_MODEL_H
+#define MEM_MODEL_H
+
+/* Memory timing model, replacing tb_mr_cpu_top's random EMI stalls.
+ *
+ * The testbench memory still holds the data and keeps the EMI handshake:  a
+ * beat is transferred in each cycle its stall input is low while req is
+ * high.  This model decides those cycles for EMI-I and EMI-D, from a
+ * configuration file of "name = value" lines (see tools/mem_timing.py, which
+ * writes them):
+ *
+ * - One controller serves one transaction at a time; requests arriving
+ *   while it's busy queue (D first, or in arrival order).
+ * - A transaction's first beat comes latency cycles after it starts, plus the
+ *   array access:  t_cas if its row is open in its bank, t_rcd + t_cas if the
+ *   bank has no open row, or t_rp + t_rcd + t_cas to close another row first.
+ *   Rows are row_bytes long and interleaved across banks; with open_page 0,
+ *   every access leaves its bank closed.  banks = 0 gives a flat t_cas.
+ * - Beats follow every beat_cycles cycles (the bandwidth cap).
+ * - Switching between reads and writes costs turnaround cycles.
+ * - Every refresh_interval cycles, refresh_cycles are lost and all rows
+ *   close, once the controller's idle.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <vector>
+
+#define MEM_MODEL_I		0
+#define MEM_MODEL_D		1
+
+#define MEM_SIZE_CL		3	/* EMI size; 0-2 are 1/2/4 bytes */
+
+class MEM_MODEL {
+	enum { IDLE, QUEUED, ACTIVE, DONE };
+
+	struct port {
+		int		state;
+		uint64_t	arrive;
+		uint64_t	next_beat;
+		uint32_t	address;
+		bool		write;
+		int		beats;
+		int		granted;
+	};
+
+	struct param {
+		const char	*name;
+		unsigned	*val;
+	};
+
+	/* Configuration */
+	unsigned	m_latency;
+	unsigned	m_beat_cycles;
+	unsigned	m_banks;
+	unsigned	m_row_bytes;
+	unsigned	m_t_cas;
+	unsigned	m_t_rcd;
+	unsigned	m_t_rp;
+	unsigned	m_open_page;
+	unsigned	m_turnaround;
+	unsigned	m_refresh_interval;
+	unsigned	m_refresh_cycles;
+	unsigned	m_d_first;
+
+	bool		m_on;
+	struct port	m_port[2];
+	std::vector<int64_t>	m_open_row;	/* Per bank; -1 if closed */
+	uint64_t	m_free;		/* Controller idle from this cycle */
+	int		m_last_write;	/* -1 before the first access */
+	uint64_t	m_next_refresh;
+
+	/* Stats */
+	uint64_t	m_count[2];
+	uint64_t	m_wait[2];
+	uint64_t	m_row_hit;
+	uint64_t	m_row_empty;
+	uint64_t	m_row_conflict;
+	uint64_t	m_refreshes;
+
+	void	params(struct param *p) {
+		struct param ps[] = {
+			{ "latency", &m_latency },
+			{ "beat_cycles", &m_beat_cycles },
+			{ "banks", &m_banks },
+			{ "row_bytes", &m_row_bytes },
+			{ "t_cas", &m_t_cas },
+			{ "t_rcd", &m_t_rcd },
+			{ "t_rp", &m_t_rp },
+			{ "open_page", &m_open_page },
+			{ "turnaround", &m_turnaround },
+			{ "refresh_interval", &m_refresh_interval },
+			{ "refresh_cycles", &m_refresh_cycles },
+			{ "d_first", &m_d_first },
+			{ 0, 0 } };
+		memcpy(p, ps, sizeof(ps));
+	}
+
+	void	start(int pn, uint64_t cycle) {
+		struct port *q = &m_port[pn];
+		uint64_t first = cycle + m_latency;
+
+		if (m_banks) {
+			unsigned bank = (q->address / m_row_bytes) % m_banks;
+			int64_t row = q->address / ((uint64_t)m_row_bytes * m_banks);
+
+			if (m_open_row[bank] == row) {
+				first += m_t_cas;
+				m_row_hit++;
+			} else if (m_open_row[bank] < 0) {
+				first += m_t_rcd + m_t_cas;
+				m_row_empty++;
+			} else {
+				first += m_t_rp + m_t_rcd + m_t_cas;
+				m_row_conflict++;
+			}
+			m_open_row[bank] = m_open_page ? row : -1;
+		} else {
+			first += m_t_cas;
+		}
+		if (m_last_write >= 0 && m_last_write != (int)q->write)
+			first += m_turnaround;
+		m_last_write = q->write;
+
+		q->state = ACTIVE;
+		q->granted = 0;
+		q->next_beat = first;
+		m_free = first + (uint64_t)(q->beats - 1) * m_beat_cycles + 1;
+		m_count[pn]++;
+		m_wait[pn] += cycle - q->arrive;
+	}
+
+public:
+	MEM_MODEL() : m_latency(0), m_beat_cycles(1), m_banks(0), m_row_bytes(1024),
+		      m_t_cas(0), m_t_rcd(0), m_t_rp(0), m_open_page(1),
+		      m_turnaround(0), m_refresh_interval(0), m_refresh_cycles(0),
+		      m_d_first(1), m_on(false), m_free(0), m_last_write(-1),
+		      m_next_refresh(0), m_row_hit(0), m_row_empty(0),
+		      m_row_conflict(0), m_refreshes(0) {
+		memset(m_port, 0, sizeof(m_port));
+		m_count[0] = m_count[1] = 0;
+		m_wait[0] = m_wait[1] = 0;
+	}
+
+	/* Reads "name = value" lines ('#' comments); false on an error */
+	bool	load(const char *path) {
+		struct param ps[16];
+		char line[256];
+		int n = 0;
+		FILE *f = fopen(path, "r");
+
+		if (!f) {
+			fprintf(stderr, "Can't open memory timing file %s\n", path);
+			return false;
+		}
+		params(ps);
+		while (fgets(line, sizeof(line), f)) {
+			char name[64];
+			unsigned long long v;
+			char *hash = strchr(line, '#');
+			struct param *p;
+
+			n++;
+			if (hash)
+				*hash = 0;
+			if (sscanf(line, " %63[a-z_0-9] = %llu", name, &v) != 2) {
+				if (strspn(line, " \t\r\n") != strlen(line)) {
+					fprintf(stderr, "%s:%d: bad line\n", path, n);
+					fclose(f);
+					return false;
+				}
+				continue;
+			}
+			for (p = ps; p->name && strcmp(p->name, name); p++)
+				;
+			if (!p->name) {
+				fprintf(stderr, "%s:%d: unknown parameter '%s'\n", path, n, name);
+				fclose(f);
+				return false;
+			}
+			*p->val = v;
+		}
+		fclose(f);
+
+		if (!m_beat_cycles)
+			m_beat_cycles = 1;
+		if (!m_row_bytes)
+			m_row_bytes = 1024;
+		m_open_row.assign(m_banks, -1);
+		m_next_refresh = m_refresh_interval;
+		m_on = true;
+		return true;
+	}
+
+	bool	active() { return m_on; }
+
+	/* Call before each tick, with the EMI signals as the last tick left
+	 * them; gives the stall inputs for the coming cycle.
+	 */
+	void	step(uint64_t cycle, const bool *req, const uint32_t *address,
+		     const int *size, const bool *write, bool *stall) {
+		for (int pn = 0; pn < 2; pn++) {
+			struct port *q = &m_port[pn];
+
+			if (q->state == DONE && !req[pn])
+				q->state = IDLE;
+			if (q->state == IDLE && req[pn]) {
+				q->state = QUEUED;
+				q->arrive = cycle;
+				q->address = address[pn];
+				q->write = write[pn];
+				q->beats = (size[pn] == MEM_SIZE_CL) ? 4 : 1;
+			}
+		}
+
+		if (m_free <= cycle) {
+			if (m_refresh_interval && cycle >= m_next_refresh) {
+				m_free = cycle + m_refresh_cycles;
+				m_open_row.assign(m_banks, -1);
+				m_next_refresh += m_refresh_interval;
+				m_refreshes++;
+			} else {
+				bool qi = m_port[MEM_MODEL_I].state == QUEUED;
+				bool qd = m_port[MEM_MODEL_D].state == QUEUED;
+
+				if (qd && (!qi || m_d_first ||
+					   m_port[MEM_MODEL_D].arrive <= m_port[MEM_MODEL_I].arrive))
+					start(MEM_MODEL_D, cycle);
+				else if (qi)
+					start(MEM_MODEL_I, cycle);
+			}
+		}
+
+		for (int pn = 0; pn < 2; pn++) {
+			struct port *q = &m_port[pn];
+
+			stall[pn] = !(q->state == ACTIVE && q->next_beat == cycle);
+			if (!stall[pn]) {
+				if (++q->granted == q->beats)
+					q->state = DONE;
+				else
+					q->next_beat += m_beat_cycles;
+			}
+		}
+	}
+
+	/* The CPU's been reset (verilator/main.cpp, a packed run ending):
+	 * whatever the ports were doing is abandoned, and the memory's free.
+	 */
+	void	reset(uint64_t cycle) {
+		for (int pn = 0; pn < 2; pn++)
+			m_port[pn].state = IDLE;
+		m_free = cycle;
+	}
+
+	void	report() {
+		uint64_t n = m_count[0] + m_count[1];
+
+		printf("Memory model:  %llu transactions (I %llu, D %llu), "
+		       "mean queue wait I %.2f, D %.2f cycles\n",
+		       (unsigned long long)n, (unsigned long long)m_count[0],
+		       (unsigned long long)m_count[1],
+		       m_count[0] ? (double)m_wait[0] / m_count[0] : 0.0,
+		       m_count[1] ? (double)m_wait[1] / m_count[1] : 0.0);
+		if (m_banks)
+			printf("Memory model:  row hits %llu, empty %llu, conflicts %llu; "
+			       "%llu refreshes\n",
+			       (unsigned long long)m_row_hit, (unsigned long long)m_row_empty,
+			       (unsigned long long)m_row_conflict,
+			       (unsigned long long)m_refreshes);
+	}
+};
+
+#endif
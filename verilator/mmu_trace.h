@@ -0,0 +1,207 @@
+#ifndef MMU_TRACE_H
+#define MMU_TRACE_H
+
+/* MMU translation trace, for the TLB/BAT replay (tools/tlb_replay.py).
+ *
+ * Watches the IMMU and DMMU (via their SIM-only trace_* wires) and the
+ * translation state they depend on, recording:
+ * - LOOKUP:  a TLB/BAT lookup that's acted upon, with the RTL's BAT/TLB hit
+ *            and whether it started a PTW.  Repeated lookups of the same page
+ *            (e.g. sequential fetch) are only recorded once.
+ * - WALK:    a PTW completing, with its fault code.
+ * - INSERT:  a TLB entry being loaded.
+ * - TLBI:    an invalidation (by page, or all).
+ * - SR/SPR:  a change to a segment register, SDR1 or a BAT.
+ * - TOTALS:  at the end, the if/mem_mmu_ptws perf counter totals.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#define MMU_TRACE_MAGIC		0x544d524d	/* "MRMT" */
+#define MMU_TRACE_VERSION	1
+
+#define MMU_TRACE_I		0
+#define MMU_TRACE_D		1
+
+#define MMU_TRACE_EV_LOOKUP	0
+#define MMU_TRACE_EV_WALK	1
+#define MMU_TRACE_EV_INSERT	2
+#define MMU_TRACE_EV_TLBI	3
+#define MMU_TRACE_EV_SR		4
+#define MMU_TRACE_EV_SPR	5
+#define MMU_TRACE_EV_TOTALS	6
+
+/* LOOKUP flags */
+#define MMU_TRACE_F_PRIV	1
+#define MMU_TRACE_F_READ	2
+#define MMU_TRACE_F_BAT_HIT	4
+#define MMU_TRACE_F_TLB_HIT	8
+#define MMU_TRACE_F_PTW		16
+
+/* SPR numbering:  SDR1, then IBAT0U, IBAT0L ... IBAT3L, DBAT0U ... DBAT3L */
+#define MMU_TRACE_NR_SPRS	17
+
+/* Perf counter bits (see mr_pctrs.v) */
+#define MMU_TRACE_PCTR_MEM_PTWS	2
+#define MMU_TRACE_PCTR_IF_PTWS	6
+
+struct mmu_trace_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	reserved;
+};
+
+struct mmu_trace_rec {
+	uint64_t	cycle;
+	uint32_t	ea;		/* TOTALS: if_mmu_ptws */
+	uint32_t	data;		/* SR/SPR: value; TOTALS: mem_mmu_ptws */
+	uint8_t		mmu;		/* MMU_TRACE_I/D */
+	uint8_t		event;		/* MMU_TRACE_EV_* */
+	uint8_t		flags;		/* LOOKUP: MMU_TRACE_F_* */
+	uint8_t		info;		/* WALK: fault; TLBI: all; SR/SPR: number */
+	uint32_t	reserved;
+};
+
+class MMU_TRACE {
+	FILE		*m_f;
+	uint64_t	m_count;
+	bool		m_have_state;
+	uint32_t	m_srs[16];
+	uint32_t	m_sprs[MMU_TRACE_NR_SPRS];
+	uint32_t	m_last_page[2];
+	int		m_last_key[2];
+	uint64_t	m_if_ptws;
+	uint64_t	m_mem_ptws;
+
+	void	write(uint64_t cycle, int mmu, int ev, uint32_t ea,
+		      uint32_t data, int flags, int info) {
+		struct mmu_trace_rec r;
+
+		r.cycle = cycle;
+		r.ea = ea;
+		r.data = data;
+		r.mmu = mmu;
+		r.event = ev;
+		r.flags = flags;
+		r.info = info;
+		r.reserved = 0;
+		fwrite(&r, sizeof(r), 1, m_f);
+		m_count++;
+	}
+
+	void	forget_lookups() {
+		m_last_key[0] = m_last_key[1] = -1;
+	}
+public:
+	MMU_TRACE() : m_f(0), m_count(0), m_have_state(false),
+		      m_if_ptws(0), m_mem_ptws(0) {
+		forget_lookups();
+	}
+
+	~MMU_TRACE() { close(); }
+
+	bool	open(const char *path) {
+		struct mmu_trace_hdr h = { MMU_TRACE_MAGIC,
+					   MMU_TRACE_VERSION,
+					   sizeof(struct mmu_trace_rec),
+					   0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		setvbuf(m_f, NULL, _IOFBF, 1 << 20);
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			write(0, 0, MMU_TRACE_EV_TOTALS, (uint32_t)m_if_ptws,
+			      (uint32_t)m_mem_ptws, 0, 0);
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick, before sample(), with the SRs and the
+	 * MMU_TRACE_NR_SPRS SPR values.  Records changes.
+	 */
+	template<class A> void	sample_state(uint64_t cycle, A &srs,
+					     const uint32_t *sprs) {
+		for (int i = 0; i < 16; i++) {
+			if (!m_have_state || m_srs[i] != srs[i]) {
+				m_srs[i] = srs[i];
+				write(cycle, 0, MMU_TRACE_EV_SR, 0, m_srs[i], 0, i);
+				forget_lookups();
+			}
+		}
+		for (int i = 0; i < MMU_TRACE_NR_SPRS; i++) {
+			if (!m_have_state || m_sprs[i] != sprs[i]) {
+				m_sprs[i] = sprs[i];
+				write(cycle, 0, MMU_TRACE_EV_SPR, 0, m_sprs[i], 0, i);
+				forget_lookups();
+			}
+		}
+		m_have_state = true;
+	}
+
+	/* Call once per tick per MMU, with the state following the edge */
+	template<class M> void	sample(uint64_t cycle, int mmu, M *m) {
+		if (m->trace_inval) {
+			write(cycle, mmu, MMU_TRACE_EV_TLBI, m->trace_inval_addr,
+			      0, 0, m->trace_inval_all);
+			m_last_key[mmu] = -1;
+		}
+		if (m->trace_lookup) {
+			uint32_t page = m->trace_vaddress >> 12;
+			int flags = (m->trace_privileged ? MMU_TRACE_F_PRIV : 0) |
+				(m->trace_RnW ? MMU_TRACE_F_READ : 0) |
+				(m->trace_bat_hit ? MMU_TRACE_F_BAT_HIT : 0) |
+				(m->trace_tlb_hit ? MMU_TRACE_F_TLB_HIT : 0) |
+				(m->trace_ptw ? MMU_TRACE_F_PTW : 0);
+
+			int key = flags & (MMU_TRACE_F_PRIV | MMU_TRACE_F_READ);
+
+			if (m->trace_ptw || page != m_last_page[mmu] ||
+			    key != m_last_key[mmu]) {
+				write(cycle, mmu, MMU_TRACE_EV_LOOKUP,
+				      m->trace_vaddress, 0, flags, 0);
+				m_last_page[mmu] = page;
+				m_last_key[mmu] = key;
+			}
+		}
+		if (m->trace_walk_done)
+			write(cycle, mmu, MMU_TRACE_EV_WALK, m->trace_req_addr,
+			      0, 0, m->trace_walk_fault);
+		if (m->trace_insert)
+			write(cycle, mmu, MMU_TRACE_EV_INSERT, m->trace_req_addr,
+			      0, 0, 0);
+	}
+
+	/* Call once per tick with the mr_pctrs event bits */
+	void	count_pctrs(uint64_t pctrs) {
+		m_if_ptws += (pctrs >> MMU_TRACE_PCTR_IF_PTWS) & 1;
+		m_mem_ptws += (pctrs >> MMU_TRACE_PCTR_MEM_PTWS) & 1;
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
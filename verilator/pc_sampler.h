@@ -0,0 +1,120 @@
+#ifndef PC_SAMPLER_H
+#define PC_SAMPLER_H
+
+/* Periodic PC sampling, for hot-spot profiling (tools/pc_profile.py).
+ *
+ * Every <period> cycles, records the PC in a chosen pipeline stage (DE or WB)
+ * together with the CPU's per-cycle perf event bits (mr_cpu_top's pctrs
+ * output), so each sample can be attributed a stall reason.
+ *
+ * The pctrs output is registered, so it describes the cycle *before* the one
+ * just ticked; the stage PC is held back a cycle here so the two line up.
+ * If the stage is empty (a bubble) the last instruction seen there is blamed,
+ * and the sample is flagged as such.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#define PC_SAMPLE_MAGIC		0x5350524d	/* "MRPS" */
+#define PC_SAMPLE_VERSION	1
+
+#define PC_SAMPLE_STAGE_DE	0
+#define PC_SAMPLE_STAGE_WB	1
+
+#define PC_SAMPLE_FLAG_VALID	1	/* Stage held a live instruction */
+
+struct pc_sample_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	period;
+	uint32_t	stage;
+	uint32_t	reserved;
+};
+
+struct pc_sample_rec {
+	uint64_t	cycle;
+	uint32_t	pc;
+	uint16_t	pctrs;		/* mr_cpu_top pctrs[15:0] */
+	uint8_t		flags;
+	uint8_t		reserved;
+};
+
+class PC_SAMPLER {
+	FILE		*m_f;
+	uint64_t	m_period;
+	uint64_t	m_count;
+	int		m_stage;
+	uint32_t	m_prev_pc;
+	bool		m_prev_valid;
+	uint32_t	m_last_valid_pc;
+public:
+	PC_SAMPLER() : m_f(0), m_period(1000), m_count(0),
+		       m_stage(PC_SAMPLE_STAGE_WB), m_prev_pc(0),
+		       m_prev_valid(false), m_last_valid_pc(0) {}
+
+	~PC_SAMPLER() { close(); }
+
+	void	set_period(uint64_t p) { m_period = p ? p : 1; }
+	void	set_stage(int s) { m_stage = s; }
+	int	stage() { return m_stage; }
+
+	bool	open(const char *path) {
+		struct pc_sample_hdr h = { PC_SAMPLE_MAGIC, PC_SAMPLE_VERSION,
+					   sizeof(struct pc_sample_rec),
+					   (uint32_t)m_period, (uint32_t)m_stage,
+					   0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick, with the state following the edge */
+	void	tick(uint64_t cycle, uint64_t pctrs, bool valid, uint32_t pc) {
+		if ((cycle % m_period) == 0) {
+			struct pc_sample_rec r;
+
+			r.cycle = cycle - 1;
+			r.pc = m_prev_valid ? m_prev_pc : m_last_valid_pc;
+			r.pctrs = (uint16_t)pctrs;
+			r.flags = m_prev_valid ? PC_SAMPLE_FLAG_VALID : 0;
+			r.reserved = 0;
+			fwrite(&r, sizeof(r), 1, m_f);
+			m_count++;
+		}
+		if (m_prev_valid)
+			m_last_valid_pc = m_prev_pc;
+		m_prev_valid = valid;
+		m_prev_pc = pc;
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
@@ -0,0 +1,88 @@
+#ifndef PCTR_TOTALS_H
+#define PCTR_TOTALS_H
+
+/* Whole-run totals of the CPU's perf events (mr_cpu_top's pctrs output), for
+ * calibrating and checking the pipeline model (tools/pipe_model.py).
+ *
+ * Each event bit is summed every tick; the result is a small text file of
+ * "<name> <count>" lines, the first being the number of cycles counted.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+/* Bit positions in pctrs; keep in step with PCTR_NAMES in tools/mr_trace.py */
+#define PCTR_NR_EVENTS		15
+
+static const char *pctr_names[PCTR_NR_EVENTS] = {
+	"mem_cacheable_unaligned_CL",
+	"mem_cacheable_unaligned_8B",
+	"mem_mmu_ptws",
+	"mem_access_fault",
+	"mem_access",
+	"de_stall_operands",
+	"if_mmu_ptws",
+	"if_valid_instr",
+	"if_fetching_stalled",
+	"if_fetching",
+	"decode_stall",
+	"exe_stall",
+	"mem_stall",
+	"fault",
+	"inst_commit",
+};
+
+class PCTR_TOTALS {
+	FILE		*m_f;
+	uint64_t	m_cycles;
+	uint64_t	m_counts[PCTR_NR_EVENTS];
+public:
+	PCTR_TOTALS() : m_f(0), m_cycles(0) {
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] = 0;
+	}
+
+	/* Opened up front, so that a bad path fails before the run */
+	bool	open(const char *path) {
+		m_f = fopen(path, "w");
+		return m_f != 0;
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick with the mr_pctrs event bits */
+	void	tick(uint64_t pctrs) {
+		m_cycles++;
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] += (pctrs >> i) & 1;
+	}
+
+	bool	close() {
+		if (!m_f)
+			return true;
+		fprintf(m_f, "cycles %llu\n", (unsigned long long)m_cycles);
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			fprintf(m_f, "%s %llu\n", pctr_names[i],
+				(unsigned long long)m_counts[i]);
+		bool ok = !ferror(m_f);
+		if (fclose(m_f) != 0)
+			ok = false;
+		m_f = 0;
+		return ok;
+	}
+};
+
+#endif
@@ -0,0 +1,262 @@
+#ifndef PIPE_TRACE_H
+#define PIPE_TRACE_H
+
+/* Pipeline occupancy trace, for viewing in a pipeline viewer
+ * (tools/pipe_view.py converts to Konata or O3PipeView format).
+ *
+ * Each cycle, the pipeline latches in front of DE, EXE, MEM and WB
+ * (mr_cpu_top's trace_pipe_* signals) are followed to work out when each
+ * instruction entered each stage.  A latch loads if the stall holding it was
+ * clear the cycle before; what it loads comes from the latch behind it (or,
+ * for DE's, is a newly-fetched instruction).  DE's lmw/stmw sub-ops appear as
+ * further instructions loaded into EXE's latch from the same DE instruction.
+ * Anything which vanishes from the latches without moving on was squashed
+ * (branch annul from EXE, or a fault/interrupt from WB).
+ *
+ * IF entry isn't visible in the latches; it's taken as the cycle the previous
+ * instruction entered DE, or the squash that redirected fetch.
+ *
+ * One record is written per instruction as it leaves the pipeline (retired or
+ * squashed), so records are in order of their end cycle.  Stage entries are
+ * deltas from the IF cycle.  The header's max_life, the longest any
+ * instruction was in the pipeline, lets a reader bound a search by cycle;
+ * it's filled in on close.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#define PIPE_TRACE_MAGIC	0x5650524d	/* "MRPV" */
+#define PIPE_TRACE_VERSION	1
+
+#define PIPE_NR_LATCHES		4	/* In front of DE, EXE, MEM, WB */
+#define PIPE_NO_STAGE		0xffff
+
+#define PIPE_FLAG_SQUASHED	1
+#define PIPE_FLAG_FAULT		2	/* Reached WB with a fault */
+#define PIPE_FLAG_SUBOP		4	/* lmw/stmw sub-op generated by DE */
+
+struct pipe_trace_hdr {
+	uint32_t	magic;
+	uint32_t	version;
+	uint32_t	rec_size;
+	uint32_t	max_life;
+};
+
+struct pipe_trace_rec {
+	uint64_t	start;		/* Cycle entering IF */
+	uint32_t	pc;
+	uint32_t	instr;
+	uint16_t	stage[PIPE_NR_LATCHES];	/* DE/EXE/MEM/WB entry - start */
+	uint16_t	end;		/* Cycle left the pipeline - start */
+	uint8_t		flags;
+	uint8_t		reserved;
+	uint32_t	id;		/* Sequence number */
+};
+
+class PIPE_TRACE {
+	/* Enough for everything in flight, plus an lmw's sub-ops */
+	static const int	SLOTS = 16;
+	static const uint64_t	NONE = ~0ULL;
+
+	struct inflight {
+		uint64_t	id;
+		uint64_t	start;
+		uint64_t	stage[PIPE_NR_LATCHES];
+		uint32_t	pc;
+		uint32_t	instr;
+		uint8_t		flags;
+	};
+
+	FILE		*m_f;
+	uint64_t	m_count;
+	uint64_t	m_next_id;
+	uint64_t	m_if_from;
+	uint64_t	m_cycle;
+	uint32_t	m_max_life;
+	unsigned int	m_prev_stall;
+	uint64_t	m_latch[PIPE_NR_LATCHES];
+	struct inflight	m_insn[SLOTS];
+
+	struct inflight	*find(uint64_t id) {
+		for (int i = 0; i < SLOTS; i++)
+			if (m_insn[i].id == id)
+				return &m_insn[i];
+		return 0;
+	}
+
+	uint64_t	create(uint64_t start, uint32_t pc, uint32_t instr,
+			       uint8_t flags) {
+		struct inflight *n = find(NONE);
+		if (!n) {
+			/* Lost track; shouldn't happen.  Drop the oldest. */
+			n = &m_insn[0];
+			for (int i = 1; i < SLOTS; i++)
+				if (m_insn[i].id < n->id)
+					n = &m_insn[i];
+			emit(n, m_cycle);
+		}
+		n->id = m_next_id++;
+		n->start = start;
+		for (int i = 0; i < PIPE_NR_LATCHES; i++)
+			n->stage[i] = NONE;
+		n->pc = pc;
+		n->instr = instr;
+		n->flags = flags;
+		return n->id;
+	}
+
+	static uint16_t	delta(uint64_t c, uint64_t start) {
+		if (c == NONE)
+			return PIPE_NO_STAGE;
+		return (c - start) >= PIPE_NO_STAGE ? PIPE_NO_STAGE - 1 : c - start;
+	}
+
+	void	emit(struct inflight *n, uint64_t cycle) {
+		struct pipe_trace_rec r;
+		uint64_t end;
+
+		if (n->stage[PIPE_NR_LATCHES - 1] != NONE) {
+			end = n->stage[PIPE_NR_LATCHES - 1] + 1;
+		} else {
+			end = cycle;
+			n->flags |= PIPE_FLAG_SQUASHED;
+		}
+		r.start = n->start;
+		r.pc = n->pc;
+		r.instr = n->instr;
+		for (int i = 0; i < PIPE_NR_LATCHES; i++)
+			r.stage[i] = delta(n->stage[i], n->start);
+		r.end = delta(end, n->start);
+		r.flags = n->flags;
+		r.reserved = 0;
+		r.id = (uint32_t)n->id;
+		fwrite(&r, sizeof(r), 1, m_f);
+		m_count++;
+		if (end - n->start > m_max_life)
+			m_max_life = end - n->start;
+		n->id = NONE;
+	}
+
+public:
+	PIPE_TRACE() : m_f(0), m_count(0), m_next_id(0), m_if_from(0),
+		       m_cycle(0), m_max_life(0), m_prev_stall(0) {
+		for (int i = 0; i < PIPE_NR_LATCHES; i++)
+			m_latch[i] = NONE;
+		for (int i = 0; i < SLOTS; i++)
+			m_insn[i].id = NONE;
+	}
+
+	~PIPE_TRACE() { close(); }
+
+	bool	open(const char *path) {
+		struct pipe_trace_hdr h = { PIPE_TRACE_MAGIC,
+					    PIPE_TRACE_VERSION,
+					    sizeof(struct pipe_trace_rec),
+					    0 };
+
+		m_f = fopen(path, "wb");
+		if (!m_f)
+			return false;
+		setvbuf(m_f, NULL, _IOFBF, 1 << 20);
+		fwrite(&h, sizeof(h), 1, m_f);
+		return true;
+	}
+
+	void	close() {
+		if (m_f) {
+			/* Flush what's still in flight, then fill in max_life */
+			for (int i = 0; i < SLOTS; i++)
+				if (m_insn[i].id != NONE)
+					emit(&m_insn[i], m_cycle);
+			fseek(m_f, 0, SEEK_SET);
+			struct pipe_trace_hdr h = { PIPE_TRACE_MAGIC,
+						    PIPE_TRACE_VERSION,
+						    sizeof(struct pipe_trace_rec),
+						    m_max_life };
+			fwrite(&h, sizeof(h), 1, m_f);
+			fclose(m_f);
+			m_f = 0;
+		}
+	}
+
+	bool	active() { return m_f != 0; }
+
+	/* Call once per tick with the trace_pipe_* signals */
+	void	tick(uint64_t cycle, unsigned int valid, unsigned int stall,
+		     const uint32_t *pc, const uint32_t *instr, bool fault) {
+		uint64_t l[PIPE_NR_LATCHES];
+
+		m_cycle = cycle;
+		for (int k = PIPE_NR_LATCHES - 1; k >= 0; k--) {
+			bool v = (valid >> k) & 1;
+
+			if ((m_prev_stall >> k) & 1) {
+				/* Held; if it's gone invalid, annulled */
+				l[k] = v ? m_latch[k] : NONE;
+				continue;
+			}
+			if (!v) {
+				l[k] = NONE;
+				continue;
+			}
+			uint64_t src = (k == 0) ? NONE : m_latch[k - 1];
+			struct inflight *n = (src == NONE) ? 0 : find(src);
+
+			if (k == 0) {
+				uint64_t start = (m_if_from < cycle) ? m_if_from : cycle - 1;
+				l[k] = create(start, pc[k], instr[k], 0);
+				m_if_from = cycle;
+			} else if (n && n->pc == pc[k] && n->stage[k] == NONE) {
+				l[k] = src;
+			} else {
+				/* DE issuing another sub-op (or lost track) */
+				uint64_t start = n ? n->start : cycle - k - 1;
+				l[k] = create(start, pc[k], instr[k], PIPE_FLAG_SUBOP);
+				struct inflight *s = find(l[k]);
+				for (int i = 0; i < k; i++)
+					s->stage[i] = n ? n->stage[i] : NONE;
+			}
+			find(l[k])->stage[k] = cycle;
+		}
+		if (l[PIPE_NR_LATCHES - 1] != NONE && fault)
+			find(l[PIPE_NR_LATCHES - 1])->flags |= PIPE_FLAG_FAULT;
+
+		/* Anything no longer in a latch has left the pipeline */
+		for (int i = 0; i < SLOTS; i++) {
+			uint64_t id = m_insn[i].id;
+			bool present = false;
+
+			if (id == NONE)
+				continue;
+			for (int k = 0; k < PIPE_NR_LATCHES; k++)
+				present |= l[k] == id;
+			if (!present) {
+				if (m_insn[i].stage[PIPE_NR_LATCHES - 1] == NONE)
+					m_if_from = cycle;	/* Squashed; refetch */
+				emit(&m_insn[i], cycle);
+			}
+		}
+
+		for (int k = 0; k < PIPE_NR_LATCHES; k++)
+			m_latch[k] = l[k];
+		m_prev_stall = stall;
+	}
+
+	uint64_t	count() { return m_count; }
+};
+
+#endif
@@ -0,0 +1,83 @@
+#ifndef SIM_SPEED_H
+#define SIM_SPEED_H
+
+/* Host simulation speed:  simulated cycles per second of host (wall) time,
+ * reported every <interval> cycles while running (so phases that simulate
+ * slowly show up, e.g. a burst of cache misses, or tracing) and overall at
+ * the end.  Reports go to stderr, leaving the workload's console output on
+ * stdout alone:
+ *
+ *   Speed:  <cycle> cycles, <secs>s: <kHz> kHz (interval), <kHz> kHz (mean)
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <time.h>
+
+class SIM_SPEED {
+	uint64_t	m_interval;
+	uint64_t	m_next;
+	uint64_t	m_start_cycle;
+	uint64_t	m_last_cycle;
+	double		m_start;
+	double		m_last;
+
+	static double	now() {
+		struct timespec ts;
+		clock_gettime(CLOCK_MONOTONIC, &ts);
+		return ts.tv_sec + ts.tv_nsec * 1e-9;
+	}
+
+	static double	khz(uint64_t cycles, double secs) {
+		return secs > 0 ? cycles / secs / 1000.0 : 0.0;
+	}
+
+public:
+	SIM_SPEED() : m_interval(0), m_next(0), m_start_cycle(0),
+		      m_last_cycle(0), m_start(0), m_last(0) {}
+
+	/* 0 for just the final report */
+	void	set_interval(uint64_t cycles) { m_interval = cycles; }
+
+	void	start(uint64_t cycle) {
+		m_start = m_last = now();
+		m_start_cycle = m_last_cycle = cycle;
+		m_next = cycle + m_interval;
+	}
+
+	/* Call once per tick; cheap unless a report is due */
+	void	tick(uint64_t cycle) {
+		if (!m_interval || cycle < m_next)
+			return;
+		double t = now();
+		fprintf(stderr, "Speed:  %llu cycles, %.1fs: %.1f kHz (interval), "
+			"%.1f kHz (mean)\n", (unsigned long long)cycle,
+			t - m_start, khz(cycle - m_last_cycle, t - m_last),
+			khz(cycle - m_start_cycle, t - m_start));
+		m_last = t;
+		m_last_cycle = cycle;
+		m_next = cycle + m_interval;
+	}
+
+	void	finish(uint64_t cycle) {
+		double t = now();
+		fprintf(stderr, "Speed:  %llu cycles in %.3fs, %.1f kHz\n",
+			(unsigned long long)(cycle - m_start_cycle), t - m_start,
+			khz(cycle - m_start_cycle, t - m_start));
+	}
+};
+
+#endif
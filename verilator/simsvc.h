@@ -0,0 +1,256 @@
+#ifndef SIMSVC_H
+#define SIMSVC_H
+
+/* Simulator services:  the harness side of tb_mr_cpu_top's MMIO window (at
+ * physical 0xf0000000, accessed uncached with stw/lwz), so guest code can
+ * end a run the moment it's done and mark its own regions of interest:
+ *
+ *   0x00  EXIT       W   Exit the simulation, with a status ("EXIT = <n>")
+ *   0x04  PUTC       W   Console:  write the low byte
+ *   0x08  TIME       R   Host time since the start, microseconds; reading
+ *   0x0c  TIME_HI    R     TIME latches the high word for TIME_HI
+ *   0x10  CYCLES     R   Simulated cycles; reading CYCLES latches CYCLES_HI
+ *   0x14  CYCLES_HI  R
+ *   0x18  SNAP       W   Perf counter snapshot, tagged with the value
+ *   0x1c  TRACE      W   1 opens the trace window, 0 closes it
+ *   0x20  RUN        W   Arm a run, with a cycle limit (0 for none)
+ *   0x24  RUN_STATUS R   How the last run ended:  its exit status,
+ *   0x28  RUN_END    R     the way it ended (enum simsvc_run_end),
+ *   0x2c  RUN_CYCLES R     the cycles and instructions from the RUN write
+ *   0x30  RUN_INSTRS R     to its end
+ *
+ * Other offsets read as 0 and ignore writes.  Snapshots go to a text file,
+ * the running perf counter totals at the write, with the differences
+ * between two tags giving a region's events (tools/mr_trace.py,
+ * read_pctr_snapshots()):
+ *
+ *   # MR pctr snapshots: tag cycle <pctr name> ...
+ *   S <tag> <cycle> <count> ...
+ *
+ * With trace windows on, the harness' traces (commit, PC sample, cache,
+ * MMU, pipeline, bus, coverage) record only while a window is open; it
+ * starts closed.
+ *
+ * Runs are for packed multi-test images (tools/pack_tests.py):  while a run
+ * is armed, the next exit (an EXIT write, a debug SPR exit, a branch to self
+ * or the cycle limit) ends the run and resets the CPU instead of ending the
+ * simulation, and the image's dispatcher, re-entered from the reset vector,
+ * reads back how it went.  Memory isn't touched by the reset.
+ *
+ * Copyright 2022 Matt Evans
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <time.h>
+#include "pctr_totals.h"
+
+#define SIMSVC_EXIT		0x00
+#define SIMSVC_PUTC		0x04
+#define SIMSVC_TIME		0x08
+#define SIMSVC_TIME_HI		0x0c
+#define SIMSVC_CYCLES		0x10
+#define SIMSVC_CYCLES_HI	0x14
+#define SIMSVC_SNAP		0x18
+#define SIMSVC_TRACE		0x1c
+#define SIMSVC_RUN		0x20
+#define SIMSVC_RUN_STATUS	0x24
+#define SIMSVC_RUN_END		0x28
+#define SIMSVC_RUN_CYCLES	0x2c
+#define SIMSVC_RUN_INSTRS	0x30
+
+/* What an access asks of the harness, besides its read data */
+enum simsvc_event {
+	SIMSVC_EV_NONE,
+	SIMSVC_EV_EXIT,
+	SIMSVC_EV_PUTC,
+	SIMSVC_EV_RESET,	/* An armed run's EXIT:  reset the CPU */
+};
+
+/* How a run ended (RUN_END) */
+enum simsvc_run_end {
+	SIMSVC_RUN_NONE,
+	SIMSVC_RUN_EXIT,	/* EXIT write */
+	SIMSVC_RUN_DEBUG,	/* Debug SPR exit */
+	SIMSVC_RUN_B_SELF,	/* Branch to self */
+	SIMSVC_RUN_LIMIT,	/* Cycle limit */
+};
+
+class SIMSVC {
+	FILE		*m_snap;
+	uint64_t	m_counts[PCTR_NR_EVENTS];
+	uint64_t	m_nr_snaps;
+	bool		m_windowed;
+	bool		m_window;
+	uint32_t	m_time_hi;
+	uint32_t	m_cycles_hi;
+	uint32_t	m_status;
+	double		m_start;
+	bool		m_armed;
+	uint32_t	m_run_limit;
+	uint64_t	m_run_cycle;
+	uint32_t	m_run_instrs;
+	uint32_t	m_run_end[4];	/* STATUS, END, CYCLES, INSTRS */
+	uint64_t	m_nr_runs;
+
+	static double	now() {
+		struct timespec ts;
+		clock_gettime(CLOCK_MONOTONIC, &ts);
+		return ts.tv_sec + ts.tv_nsec * 1e-9;
+	}
+
+	void	snapshot(uint32_t tag, uint64_t cycle) {
+		m_nr_snaps++;
+		if (!m_snap)
+			return;
+		fprintf(m_snap, "S %u %llu", tag, (unsigned long long)cycle);
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			fprintf(m_snap, " %llu", (unsigned long long)m_counts[i]);
+		fprintf(m_snap, "\n");
+	}
+
+public:
+	SIMSVC() : m_snap(0), m_nr_snaps(0), m_windowed(false), m_window(true),
+		   m_time_hi(0), m_cycles_hi(0), m_status(0), m_start(now()),
+		   m_armed(false), m_run_limit(0), m_run_cycle(0), m_run_instrs(0),
+		   m_nr_runs(0) {
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] = 0;
+		for (int i = 0; i < 4; i++)
+			m_run_end[i] = 0;
+	}
+
+	bool	open_snapshots(const char *path) {
+		m_snap = fopen(path, "w");
+		if (!m_snap)
+			return false;
+		fprintf(m_snap, "# MR pctr snapshots: tag cycle");
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			fprintf(m_snap, " %s", pctr_names[i]);
+		fprintf(m_snap, "\n");
+		return true;
+	}
+
+	/* Traces record only in windows the guest opens */
+	void	set_windowed() { m_windowed = true; m_window = false; }
+
+	bool	windowed() { return m_windowed; }
+
+	bool	in_window() { return m_window; }
+
+	bool	counting() { return m_snap != 0; }
+
+	uint64_t	snapshots() { return m_nr_snaps; }
+
+	uint32_t	status() { return m_status; }
+
+	bool		armed() { return m_armed; }
+
+	uint64_t	runs() { return m_nr_runs; }
+
+	/* An armed run has used its cycles */
+	bool	over_limit(uint64_t cycle) {
+		return m_armed && m_run_limit && cycle - m_run_cycle >= m_run_limit;
+	}
+
+	/* Ends the armed run (the harness then resets the CPU), latching how
+	 * for the RUN_* registers; instrs is the commit count.
+	 */
+	void	run_end(simsvc_run_end how, uint32_t status, uint64_t cycle,
+			uint32_t instrs) {
+		m_run_end[0] = status;
+		m_run_end[1] = how;
+		m_run_end[2] = (uint32_t)(cycle - m_run_cycle);
+		m_run_end[3] = instrs - m_run_instrs;
+		m_armed = false;
+	}
+
+	/* Call once per tick with the mr_pctrs event bits, if counting() */
+	void	tick(uint64_t pctrs) {
+		for (int i = 0; i < PCTR_NR_EVENTS; i++)
+			m_counts[i] += (pctrs >> i) & 1;
+	}
+
+	/* Services an access (in the cycle before the edge completing it);
+	 * returns what the harness should do, and the read data.  instrs is
+	 * the commit count, for runs.
+	 */
+	simsvc_event	access(uint64_t cycle, uint32_t offset, bool write,
+			       uint32_t wdata, uint32_t *rdata, uint32_t instrs) {
+		*rdata = 0;
+		if (!write) {
+			uint64_t v;
+
+			switch (offset & ~3) {
+			case SIMSVC_TIME:
+				v = (uint64_t)((now() - m_start) * 1e6);
+				m_time_hi = v >> 32;
+				*rdata = (uint32_t)v;
+				break;
+			case SIMSVC_TIME_HI:
+				*rdata = m_time_hi;
+				break;
+			case SIMSVC_CYCLES:
+				m_cycles_hi = cycle >> 32;
+				*rdata = (uint32_t)cycle;
+				break;
+			case SIMSVC_CYCLES_HI:
+				*rdata = m_cycles_hi;
+				break;
+			case SIMSVC_RUN_STATUS:
+			case SIMSVC_RUN_END:
+			case SIMSVC_RUN_CYCLES:
+			case SIMSVC_RUN_INSTRS:
+				*rdata = m_run_end[((offset & ~3) - SIMSVC_RUN_STATUS) / 4];
+				break;
+			}
+			return SIMSVC_EV_NONE;
+		}
+
+		switch (offset & ~3) {
+		case SIMSVC_EXIT:
+			if (m_armed) {
+				run_end(SIMSVC_RUN_EXIT, wdata, cycle, instrs);
+				return SIMSVC_EV_RESET;
+			}
+			m_status = wdata;
+			return SIMSVC_EV_EXIT;
+		case SIMSVC_PUTC:
+			return SIMSVC_EV_PUTC;
+		case SIMSVC_SNAP:
+			snapshot(wdata, cycle);
+			break;
+		case SIMSVC_TRACE:
+			if (m_windowed)
+				m_window = wdata != 0;
+			break;
+		case SIMSVC_RUN:
+			m_armed = true;
+			m_run_limit = wdata;
+			m_run_cycle = cycle;
+			m_run_instrs = instrs;
+			m_nr_runs++;
+			break;
+		}
+		return SIMSVC_EV_NONE;
+	}
+
+	void	close() {
+		if (m_snap)
+			fclose(m_snap);
+		m_snap = 0;
+	}
+};
+
+#endif
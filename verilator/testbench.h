@@ -6,11 +6,24 @@
  * Alterations for MR-hw verilator build are (c) 2020 Matt Evans
  */
 
+#include <stdio.h>
 #include <stdlib.h>
 #include <inttypes.h>
 #include "Vwrapper_top.h"
 #include "verilated.h"
+#if VM_TRACE
 #include "verilated_vcd_c.h"
+#else
+/* Built without --trace (which costs some speed even when no VCD is written);
+ * a placeholder keeps the code below the same, but there's no VCD output.
+ */
+class VerilatedVcdC {
+public:
+	void	dump(vluint64_t t) {}
+	void	flush() {}
+	void	close() {}
+};
+#endif
 #include "Vwrapper_top__Syms.h"
 
 
@@ -29,11 +42,17 @@ public:
         MODULE *getTop() { return m_core; }
 
 	virtual	void	opentrace(const char *vcdname) {
+#if VM_TRACE
 		if (!m_trace) {
 			m_trace = new VerilatedVcdC;
 			m_core->trace(m_trace, 99);
 			m_trace->open(vcdname);
 		}
+#else
+		fprintf(stderr, "Built without trace support, can't write %s\n",
+			vcdname);
+		exit(1);
+#endif
 	}
 
 	// Close a trace file